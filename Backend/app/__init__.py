@@ -13,22 +13,28 @@ import os
 from pymongo import MongoClient
 
 # --- InjectUserMiddleware (moved from middleware/inject_user.py) ---
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.types import ASGIApp, Receive, Scope, Send
 from fastapi import HTTPException, Request
 from app.utils.auth_helpers import get_current_user
+from app.utils.route_policy import PUBLIC, OPTIONAL, compile_route_policies
 import logging
 
 logger = logging.getLogger("uvicorn")
 
-# Safe routes that bypass authentication
+# Never authenticated (static mounts and the docs/OpenAPI URLs are added from the app at startup)
+PUBLIC_PATHS = [
+    "/favicon.ico", "/health",
+    "/api/realtime/",  # Authenticates itself (EventSource sends a short-lived stream ticket as a query parameter)
+]
+
+# Safe routes that bypass authentication (a valid token is still picked up)
 SAFE_PATHS = [
-    "/docs", "/openapi.json", "/auth/login", "/auth/register", "/favicon.ico",
+    "/auth/login", "/auth/register",
     "/auth/student/login", "/auth/student/register", "/auth/role-based",
     "/login/student", "/register/student",  # Direct student endpoints
     "/admin/login", "/admin/register", "/admin/exists", "/api/admin/login", "/api/admin/register", "/api/admin/exists", "/api/admin/superadmin/login", "/api/admin/test", "/api/admin/dashboard",
-    "/health", "/upload/avatar", "/auth/forgot-password", "/auth/login/role-based", 
+    "/upload/avatar", "/auth/forgot-password", "/auth/login/role-based", 
     "/auth/verify-otp", "/auth/reset-password", "/auth/profile", "/auth/validate-token",  # Add validate-token endpoint
-    "/uploads/", "/static/", "/public/",  # Static file access without auth
     "/course/", "/courses/", "/video-serve/",  # Course listing and video serving access without auth
     "/payments/razorpay-config", "/payments/enroll-course/init", "/payments/enroll-course/verify", 
     "/payments/enroll-free-course/", "/payments/transaction",  # Payment endpoints
@@ -57,51 +63,52 @@ SAFE_PATHS = [
     "/api/syllabuses/",  # Syllabuses CRUD endpoints
     "/api/upload-logo", "/api/delete-logo",  # Logo upload endpoints
     "/partnership_request", "/partnership_requests",  # Partnership form submission endpoints
-    "/api/utility/states", "/api/utility/states/names"  # Utility endpoints for common data
-    "/api/utility/states",  # Utility endpoints for states and other public data
+    "/api/utility/states", "/api/utility/states/names",  # Utility endpoints for states and other public data
 ]
 
-class InjectUserMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        path = request.url.path
-        method = request.method
-        
-        # Reduced logging for performance - only log important events
-        logger = logging.getLogger("uvicorn")
-        auth_header = request.headers.get("Authorization")
+class InjectUserMiddleware:
+    """Populate ``request.state.user`` before the request reaches the router
+
+    A plain ASGI middleware: ``send`` is passed through untouched, so streamed
+    video, certificate and upload responses are not proxied through an extra
+    task and memory stream the way ``BaseHTTPMiddleware`` does.
+    """
 
-        # Always allow OPTIONS requests (CORS preflight)
-        if method == "OPTIONS":
-            return await call_next(request)
-            return await call_next(request)
+    def __init__(self, app: ASGIApp):
+        self.app = app
 
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        # Always allow OPTIONS requests (CORS preflight); websockets/lifespan pass through
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
 
-        # Check if path starts with any of the safe prefixes
-        if any(path.startswith(safe) for safe in SAFE_PATHS) or any(safe.rstrip('/') in path for safe in ["/uploads/", "/static/", "/public/"]):
+        # request.state is backed by scope["state"], so route handlers see the same user
+        request = Request(scope)
+        path = scope["path"]
+        request.state.user = None
+
+        # Policy compiled at startup from PUBLIC_PATHS, SAFE_PATHS and the app's mounts
+        policy = request.app.state.route_policies.policy_for(path)
+        if policy == OPTIONAL:
             # For safe paths, try to inject user if token is provided but don't block on failure
-            request.state.user = None
+            auth_header = request.headers.get("Authorization")
             if auth_header and auth_header.startswith("Bearer "):
                 try:
-                    user = await get_current_user(request)
-                    request.state.user = user
-                except:
+                    request.state.user = await get_current_user(request)
+                except Exception:
                     # Silently fail for safe paths
                     request.state.user = None
-            
-            # Always proceed for safe paths regardless of auth result
-            return await call_next(request)
-
-        # For protected paths, authenticate
-        try:
-            user = await get_current_user(request)
-            request.state.user = user
-        except HTTPException as e:
-            request.state.user = None
-            if path not in ["/health", "/", "/docs", "/openapi.json"]:
-                logger.warning(f"[Auth failed] {method} {path}: {e.detail}")
-
-        response = await call_next(request)
-        return response
+        elif policy != PUBLIC:
+            # For protected paths, authenticate
+            try:
+                request.state.user = await get_current_user(request)
+            except HTTPException as e:
+                request.state.user = None
+                if path != "/":
+                    logger.warning(f"[Auth failed] {scope['method']} {path}: {e.detail}")
+
+        await self.app(scope, receive, send)
 from app.api.auth import auth_router
 from app.api.courses import course_router
 from app.api.modules import module_router, direct_module_router
@@ -117,6 +124,7 @@ from app.api.dashboard import dashboard_router
 # from app.api.leaderboard import leaderboard_router - REMOVED: not used in frontend
 from app.api.notifications import notification_router, api_notification_router
 from app.api.messages import messages_router, api_messages_router
+from app.api.realtime import realtime_router
 
 from app.api.instructor import instructor_router
 from app.api.users import user_router
@@ -196,12 +204,14 @@ app.add_middleware(InjectUserMiddleware)
 # Initialize MongoDB client with fallback
 client = None
 db = None
+connected_uri = None
 
 try:
     # Try cloud MongoDB first
     client = MongoClient(settings.MONGO_URI, serverSelectionTimeoutMS=5000)
     client.admin.command('ping')  # Test connection
     db = client[settings.DB_NAME]
+    connected_uri = settings.MONGO_URI
     print("✅ Connected to cloud MongoDB")
     # Print which URI we connected to (masked) for easier debugging
     try:
@@ -223,6 +233,7 @@ except Exception as e:
         client = MongoClient(settings.MONGO_LOCAL_URI, serverSelectionTimeoutMS=5000)
         client.admin.command('ping')  # Test connection
         db = client[settings.DB_NAME]
+        connected_uri = settings.MONGO_LOCAL_URI
         print("✅ Connected to local MongoDB")
         print(f"Connected to MongoDB URI: {settings.MONGO_LOCAL_URI}, DB: {settings.DB_NAME}")
     except Exception as local_e:
@@ -233,6 +244,21 @@ except Exception as e:
 app.mongodb_client = client
 app.mongodb = db
 
+# Async (Motor) client on the same URI - used by hot routes so queries don't block the event loop
+from app.utils.database import init_async_db, close_async_db
+from app.services.bulk_document_service import shutdown_render_pool, start_job_recovery, stop_job_recovery
+from app.services.progress_buffer import progress_buffer
+from app.services.password_service import password_hasher
+from app.services.search_service import start_search_backfill
+from app.services.tenant_directory import tenant_directory
+from app.services.token_registry import token_registry
+from app.services.instructor_stats_service import instructor_stats
+from app.services.notification_fanout import notification_fanout
+from app.services.realtime_hub import realtime_hub
+from app.services.email_outbox import email_outbox
+from app.utils.cache import app_cache
+init_async_db(app, connected_uri, settings.DB_NAME, sync_db=db)
+
 # Create database indexes for optimization (only if db is connected)
 if db is not None:
     try:
@@ -289,8 +315,8 @@ async def auth_login_compatibility(request: Request, credentials: dict):
         print(f"[DEBUG] User role: {user_role}")
         
         # Use existing login service for password verification and token generation
-        from app.services.auth_service import login_user
-        result = login_user(db, user_login)
+        from app.services.auth_service import login_user_async
+        result = await login_user_async(db, user_login, user)
         
         # Add role-specific information
         result["user"]["dashboard_route"] = f"/{user_role}" if user_role else "/student"
@@ -325,6 +351,7 @@ app.include_router(notification_router)
 app.include_router(api_notification_router)
 app.include_router(messages_router)
 app.include_router(api_messages_router)
+app.include_router(realtime_router)
 app.include_router(instructor_router)
 app.include_router(recording_router)
 app.include_router(profile_router)
@@ -394,6 +421,13 @@ async def health_check(request: Request):
     response_data = {
         "status": "healthy",
         "database": db_status,
+        "cache": app_cache.stats(),
+        "password_hashing": password_hasher.stats(),
+        "tenant_directory": tenant_directory.stats(),
+        "token_revocations": token_registry.stats(),
+        "notification_fanout": notification_fanout.stats(),
+        "realtime": realtime_hub.stats(),
+        "email_outbox": email_outbox.stats(),
         "message": "Skillwallah API is running"
     }
     
@@ -473,19 +507,20 @@ async def direct_student_login(request: Request, credentials: dict):
     
     # Import required modules
     from app.schemas.auth import UserLogin
-    from app.services.auth_service import login_user, create_access_token, create_refresh_token
+    from app.services.auth_service import login_user_async, create_access_token, create_refresh_token
     from app.models.user import get_user_collection
     from fastapi import HTTPException
-    import bcrypt
+    from app.services.password_service import password_hasher, is_bcrypt_hash
     from datetime import datetime
     
     try:
         # Parse credentials
         user_login = UserLogin(email=credentials["email"], password=credentials["password"])
         db = request.app.mongodb
+        async_db = request.app.mongodb_async
         
         # Check if database connection is available
-        if db is None:
+        if db is None or async_db is None:
             print(f"[DIRECT_LOGIN] ✗ Database connection not available")
             raise HTTPException(
                 status_code=503,
@@ -495,9 +530,9 @@ async def direct_student_login(request: Request, credentials: dict):
         # FIRST: Check branch_students collection
         print(f"[DIRECT_LOGIN] Checking branch_students collection...")
         # Try both email field names for compatibility
-        branch_student = db.branch_students.find_one({"email": user_login.email})
+        branch_student = await async_db.branch_students.find_one({"email": user_login.email})
         if not branch_student:
-            branch_student = db.branch_students.find_one({"email_id": user_login.email})
+            branch_student = await async_db.branch_students.find_one({"email_id": user_login.email})
         
         if branch_student:
             print(f"[DIRECT_LOGIN] ✓ Branch student found: {branch_student.get('student_name')}")
@@ -515,31 +550,17 @@ async def direct_student_login(request: Request, credentials: dict):
                 )
             
             try:
-                # Check if password is hashed or plain text (like branch_admin login)
-                if password_hash.startswith("$2b$") or password_hash.startswith("$2a$"):
-                    # Hashed password - verify with bcrypt
-                    password_bytes = user_login.password.encode('utf-8')
-                    hashed_bytes = password_hash.encode('utf-8')
-                    password_valid = bcrypt.checkpw(password_bytes, hashed_bytes)
-                    print(f"[DIRECT_LOGIN] Bcrypt verification: {password_valid}")
-                else:
-                    # Plain text password - direct comparison (temporary fallback)
-                    password_valid = (user_login.password == password_hash)
-                    print(f"[DIRECT_LOGIN] Plain text comparison: {password_valid}")
-                    
-                    # If plain text matches, hash and update for security
-                    if password_valid:
-                        print(f"[DIRECT_LOGIN] Upgrading plain text password to hashed...")
-                        new_hash = bcrypt.hashpw(user_login.password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-                        db.branch_students.update_one(
-                            {"_id": branch_student["_id"]},
-                            {"$set": {"password_hash": new_hash}}
-                        )
-                        print(f"[DIRECT_LOGIN] Password upgraded to bcrypt hash")
+                # bcrypt runs on the hashing pool; plain text (temporary fallback) is compared directly
+                password_valid = await password_hasher.verify(user_login.password, password_hash)
+                
+                # If plain text matches, hash and update for security (after the response)
+                if password_valid and not is_bcrypt_hash(password_hash):
+                    print(f"[DIRECT_LOGIN] Scheduling upgrade of plain text password to bcrypt hash")
+                    password_hasher.schedule_upgrade(async_db.branch_students, branch_student["_id"], user_login.password)
                 
                 print(f"[DIRECT_LOGIN] Password verification: {password_valid}")
-                print(f"[DIRECT_LOGIN] Input password length: {len(user_login.password)}")
-                print(f"[DIRECT_LOGIN] Hash format: {password_hash[:10]}...")
+            except HTTPException:
+                raise
             except Exception as e:
                 print(f"[DIRECT_LOGIN] Password verification error: {e}")
                 password_valid = False
@@ -556,7 +577,7 @@ async def direct_student_login(request: Request, credentials: dict):
             print(f"[DIRECT_LOGIN] ✓ Authentication successful - creating tokens...")
             
             # Update last login
-            db.branch_students.update_one(
+            await async_db.branch_students.update_one(
                 {"_id": branch_student["_id"]},
                 {"$set": {"last_login": datetime.utcnow().isoformat()}}
             )
@@ -609,8 +630,8 @@ async def direct_student_login(request: Request, credentials: dict):
         print(f"[DIRECT_LOGIN] Not found in branch_students, checking users collection...")
         
         # Check if user exists at all before trying to login
-        user_collection = get_user_collection(db)
-        user = user_collection.find_one({"email": user_login.email})
+        user_collection = get_user_collection(async_db)
+        user = await user_collection.find_one({"email": user_login.email})
         
         if not user:
             print(f"[DIRECT_LOGIN] ✗ No user found with email: {user_login.email}")
@@ -627,7 +648,7 @@ async def direct_student_login(request: Request, credentials: dict):
             )
         
         # Try to login as regular student
-        result = login_user(db, user_login)
+        result = await login_user_async(db, user_login, user)
         print(f"[DIRECT_LOGIN] ✓ Regular student login successful")
         return result
         
@@ -643,6 +664,18 @@ async def direct_student_login(request: Request, credentials: dict):
 @app.on_event("startup")
 async def startup_event():
     """Create default admin user if none exists"""
+    app.state.route_policies = compile_route_policies(app, SAFE_PATHS, PUBLIC_PATHS)
+    app_cache.start_sweeper(settings.CACHE_SWEEP_INTERVAL_SECONDS)
+    progress_buffer.start(app.mongodb, settings.PROGRESS_FLUSH_INTERVAL_SECONDS)
+    start_search_backfill(app.mongodb)
+    tenant_directory.start(app.mongodb)
+    token_registry.start(app.mongodb)
+    instructor_stats.start(app.mongodb, settings.INSTRUCTOR_STATS_FLUSH_SECONDS)
+    notification_fanout.start(app.mongodb)
+    realtime_hub.start(app.mongodb)
+    email_outbox.start(app.mongodb)
+    start_job_recovery(app.mongodb)
+    
     try:
         from app.models.user import get_user_collection
         from app.services.auth_service import hash_password
@@ -666,3 +699,19 @@ async def startup_event():
             
     except Exception as e:
         print(f"[STARTUP] ❌ Error creating default admin: {e}")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release database connections"""
+    app_cache.stop_sweeper()
+    progress_buffer.stop()
+    password_hasher.shutdown()
+    tenant_directory.stop()
+    token_registry.stop()
+    instructor_stats.stop()
+    notification_fanout.stop()
+    realtime_hub.stop()
+    email_outbox.stop()
+    stop_job_recovery()
+    shutdown_render_pool()
+    close_async_db(app)
@@ -5,6 +5,7 @@ from app.utils.dependencies import role_required
 from app.utils.auth_helpers import get_current_user
 from app.utils.branch_filter import BranchAccessManager
 from app.services import admin_service
+from app.services.token_registry import revoke_user_tokens
 from app.models.user import get_user_collection
 from app.models.course import get_course_collection
 from app.models.certificate import get_certificate_collection
@@ -228,7 +229,7 @@ async def get_admin_dashboard_stats(
         
         # Try cache first (cache for 2 minutes for super admin global stats)
         cache_key = "admin_dashboard_stats_global"
-        cached_stats = app_cache.get(cache_key)
+        cached_stats = await app_cache.aget(cache_key)
         if cached_stats:
             logger.info("[Admin Dashboard] Returning cached stats")
             return cached_stats
@@ -266,7 +267,7 @@ async def get_admin_dashboard_stats(
         }
         
         # Cache for 2 minutes
-        app_cache.set(cache_key, stats, ttl_seconds=120)
+        await app_cache.aset(cache_key, stats, ttl_seconds=120)
         logger.info("[Admin Dashboard] Stats computed and cached")
         
         return stats
@@ -548,6 +549,7 @@ async def delete_user(
         result = user_collection.delete_one({"_id": ObjectId(user_id)})
         
         if result.deleted_count > 0:
+            revoke_user_tokens(db, user_id, "user deleted")
             return {"success": True, "message": "User deleted successfully"}
         else:
             return {"success": False, "message": "User not found"}
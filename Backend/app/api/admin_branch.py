@@ -410,7 +410,7 @@ async def get_branch_dashboard_stats(
         
         # Try cache first (2 minute TTL)
         cache_key = f"branch_dashboard_stats:{franchise_code}:v2"
-        cached_stats = app_cache.get(cache_key)
+        cached_stats = await app_cache.aget(cache_key)
         
         if cached_stats:
             logger.info(f"[Dashboard] Returning cached stats for {franchise_code}")
@@ -621,7 +621,7 @@ async def get_branch_dashboard_stats(
         }
         
         # Cache for 2 minutes
-        app_cache.set(cache_key, stats, ttl_seconds=120)
+        await app_cache.aset(cache_key, stats, ttl_seconds=120)
         logger.info(f"[Dashboard] Computed stats for {franchise_code}: {stats}")
         
         return {
@@ -8,6 +8,7 @@ from app.utils.dependencies import role_required
 from app.utils.auth_helpers import get_current_user
 from app.utils.branch_filter import BranchAccessManager
 from app.services import admin_service
+from app.services.token_registry import revoke_user_tokens
 from app.models.user import get_user_collection
 from app.models.course import get_course_collection
 from app.models.certificate import get_certificate_collection
@@ -443,6 +444,7 @@ async def delete_user(
         result = user_collection.delete_one({"_id": ObjectId(user_id)})
         
         if result.deleted_count > 0:
+            revoke_user_tokens(db, user_id, "user deleted")
             return {"success": True, "message": "User deleted successfully"}
         else:
             return {"success": False, "message": "User not found"}
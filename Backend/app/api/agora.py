@@ -4,14 +4,27 @@ import time
 from typing import List
 from datetime import datetime
 from bson import ObjectId
+from pymongo import ReturnDocument
 
 from app.utils.auth_helpers import get_current_user
+from app.utils.cache import app_cache
+from app.services.realtime_hub import realtime_hub, live_session_event
 from app.models.live_session import get_live_session_collection
 from app.models.enrollment import get_enrollment_collection
 from app.schemas.live_session import LiveSessionCreate, LiveSessionOut, LiveSessionBase
 
 router = APIRouter()
 
+# Short-lived cache of /student/live-now; dropped by this worker's writes, expires for the others
+LIVE_NOW_CACHE_KEY = "live_sessions:live_now"
+LIVE_NOW_TTL_SECONDS = 15
+
+
+def _live_session_changed(session: dict, db=None):
+    """Push a live session change to its course/branch and drop the live-now cache"""
+    app_cache.delete(LIVE_NOW_CACHE_KEY)
+    live_session_event(realtime_hub.emit, session, db)
+
 print("[DEBUG] Agora Router Loaded - /api/live-sessions route should be available")
 
 APP_ID = "615d6aeeb5424278ba7f08af23a05a36"
@@ -176,10 +189,13 @@ async def create_live_session(
         "channel_name": channel_name,
         "created_by": str(current_user.get("_id", "admin")),
         "created_by_role": current_user.get("role", "admin"),
+        "course_title": course.get("title") or course.get("course_name") or "Unknown Course",
+        "branch_code": course.get("branch_code"),
         "created_at": datetime.utcnow()
     }
 
     result = live_collection.insert_one(new_session)
+    _live_session_changed(new_session, db)
     
     # Return formatted result
     return {
@@ -314,14 +330,15 @@ async def delete_live_session(
     
     try:
         if ObjectId.is_valid(session_id):
-            result = live_collection.delete_one({"_id": ObjectId(session_id)})
+            deleted = live_collection.find_one_and_delete({"_id": ObjectId(session_id)})
         else:
              raise HTTPException(status_code=400, detail="Invalid ID format")
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid ID")
         
-    if result.deleted_count == 0:
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Session not found")
+    _live_session_changed({**deleted, "status": "deleted"}, db)
         
     return {"message": "Session deleted"}
 
@@ -348,13 +365,15 @@ async def update_live_session_status(
         if new_status not in ["scheduled", "live", "completed"]:
             raise HTTPException(status_code=400, detail="Invalid status")
             
-        result = live_collection.update_one(
+        session = live_collection.find_one_and_update(
             {"_id": ObjectId(session_id)},
-            {"$set": {"status": new_status}}
+            {"$set": {"status": new_status}},
+            return_document=ReturnDocument.AFTER
         )
         
-        if result.matched_count == 0:
+        if session is None:
             raise HTTPException(status_code=404, detail="Session not found")
+        _live_session_changed(session, db)
             
         return {"message": "Status updated", "status": new_status}
             
@@ -370,19 +389,25 @@ async def live_now(
     request: Request,
     current_user: dict = Depends(get_current_user)
 ):
+    cached = await app_cache.aget(LIVE_NOW_CACHE_KEY)
+    if cached is not None:
+        return cached
+
     db = request.app.mongodb
     live_collection = get_live_session_collection(db)
 
-    # Find only live sessions
-    sessions = list(live_collection.find({"status": "live"}))
+    # Find only live sessions (status index); new sessions carry their course title
+    sessions = list(live_collection.find(
+        {"status": "live"}, {"course_id": 1, "channel_name": 1, "course_title": 1}
+    ))
 
     result = []
 
-    # Optimization: fetch all needed courses in one go
+    # Look up titles only for sessions created before titles were stored
     course_ids = set()
     for s in sessions:
-        if "course_id" in s:
-            course_ids.add(s["course_id"])
+        if "course_id" in s and not s.get("course_title"):
+            course_ids.add(str(s["course_id"]))
             
     # Fetch courses
     courses_map = {}
@@ -395,27 +420,17 @@ async def live_now(
                 obj_ids.append(ObjectId(cid))
             else:
                 str_ids.append(cid)
-                
-        # Find courses in REGULAR COURSES collection
-        found_courses = list(db.courses.find({
+        course_query = {
             "$or": [
                 {"_id": {"$in": obj_ids}},
                 {"_id": {"$in": str_ids}},
                 {"id": {"$in": str_ids}}
             ]
-        }))
-        
-        # Find courses in BRANCH COURSES collection
-        found_branch_courses = list(db.branch_courses.find({
-            "$or": [
-                {"_id": {"$in": obj_ids}},
-                {"_id": {"$in": str_ids}},
-                {"id": {"$in": str_ids}}
-            ]
-        }))
-        
-        # Merge results
-        all_courses = found_courses + found_branch_courses
+        }
+        projection = {"title": 1, "course_name": 1, "id": 1}
+                
+        # Find courses in REGULAR and BRANCH COURSES collections
+        all_courses = list(db.courses.find(course_query, projection)) + list(db.branch_courses.find(course_query, projection))
         
         for c in all_courses:
             title = c.get("title") or c.get("course_name") or "Unknown Course"
@@ -430,9 +445,7 @@ async def live_now(
             c_id = str(c_id)
         
         # Determine course title
-        c_title = "Unknown Course"
-        if c_id and c_id in courses_map:
-            c_title = courses_map[c_id]
+        c_title = s.get("course_title") or courses_map.get(c_id) or "Unknown Course"
         
         result.append({
             "session_id": str(s["_id"]),
@@ -441,4 +454,5 @@ async def live_now(
             "course_title": c_title
         })
 
+    await app_cache.aset(LIVE_NOW_CACHE_KEY, result, ttl_seconds=LIVE_NOW_TTL_SECONDS)
     return result
@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Request, Depends, HTTPException, File, UploadFile, Form
 from app.schemas.auth import UserCreate, UserLogin, TokenVerify, TokenResponse, ForgotPassword, UpdateProfile, ChangePassword, StudentCreate, SimpleResponse, VerifyOTP, ResetPasswordWithOTP
-from app.services.auth_service import register_user, login_user, send_password_reset, update_user_profile, change_user_password, simple_register_user, verify_reset_otp, reset_password_with_otp
+from app.services.auth_service import register_user, login_user, login_user_async, send_password_reset, update_user_profile, change_user_password, simple_register_user, verify_reset_otp, reset_password_with_otp
 from app.utils.jwt_handler import decode_token, create_access_token, create_refresh_token
 from app.utils.auth_helpers import get_current_user
 from app.models.user import get_user_collection
@@ -11,7 +11,8 @@ import os
 import uuid
 from pathlib import Path
 import shutil
-import bcrypt
+from app.services.password_service import password_hasher, is_bcrypt_hash
+from app.services.token_registry import revoke_user_tokens
 
 auth_router = APIRouter(prefix="/api/auth", tags=["Authentication"])
 
@@ -210,8 +211,8 @@ async def login(request: Request, credentials: UserLogin):
         user_role = user.get('role', 'student')
         print(f"[DEBUG] User role: {user_role}")
         
-        # Use existing login service for password verification and token generation
-        result = login_user(db, credentials)
+        # Use existing login service for password verification and token generation (bcrypt on the hashing pool)
+        result = await login_user_async(db, credentials, user)
         
         # Add role-specific information
         result["user"]["dashboard_route"] = get_dashboard_route_for_role(user_role)
@@ -287,28 +288,17 @@ async def login_student(request: Request, credentials: UserLogin):
             # Verify password - handle both hashed and plain text passwords
             print(f"\n🔐 [STEP 2] Verifying password...")
             try:
-                # Check if password is hashed or plain text (like branch_admin login)
-                if password_hash.startswith("$2b$") or password_hash.startswith("$2a$"):
-                    # Hashed password - verify with bcrypt
-                    password_bytes = credentials.password.encode('utf-8')
-                    hashed_bytes = password_hash.encode('utf-8')
-                    password_valid = bcrypt.checkpw(password_bytes, hashed_bytes)
-                    print(f"   Bcrypt verification result: {password_valid}")
-                else:
-                    # Plain text password - direct comparison (temporary fallback)
-                    password_valid = (credentials.password == password_hash)
-                    print(f"   Plain text comparison result: {password_valid}")
-                    
-                    # If plain text matches, hash and update for security
-                    if password_valid:
-                        print(f"   Upgrading plain text password to hashed...")
-                        new_hash = bcrypt.hashpw(credentials.password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-                        db.branch_students.update_one(
-                            {"_id": branch_student["_id"]},
-                            {"$set": {"password_hash": new_hash}}
-                        )
-                        print(f"   Password upgraded to bcrypt hash")
+                # bcrypt runs on the hashing pool; plain text (temporary fallback) is compared directly
+                password_valid = await password_hasher.verify(credentials.password, password_hash)
+                print(f"   Password verification result: {password_valid}")
                 
+                # If plain text matches, hash and update for security (after the response)
+                if password_valid and not is_bcrypt_hash(password_hash):
+                    print(f"   Scheduling upgrade of plain text password to bcrypt hash")
+                    password_hasher.schedule_upgrade(db.branch_students, branch_student["_id"], credentials.password)
+                
+            except HTTPException:
+                raise
             except Exception as e:
                 print(f"❌ [ERROR] Password verification exception!")
                 print(f"   Error: {str(e)}")
@@ -407,8 +397,8 @@ async def login_student(request: Request, credentials: UserLogin):
         
         print(f"\n🔐 [STEP 2] Verifying password for regular student...")
         
-        # Use existing login service for password verification and token generation
-        result = login_user(db, credentials)
+        # Use existing login service for password verification and token generation (bcrypt on the hashing pool)
+        result = await login_user_async(db, credentials, user)
         
         print(f"\n✅ [SUCCESS] Regular student login completed!")
         
@@ -634,6 +624,9 @@ async def toggle_user_status(
         if update_result.modified_count == 0:
             raise HTTPException(status_code=400, detail="Failed to update user status")
         
+        if not new_is_active:
+            revoke_user_tokens(db, user_id, "account deactivated")
+        
         # Get updated user for response
         updated_user = user_collection.find_one({"_id": ObjectId(user_id)})
         print(f"[DEBUG] Updated user status: {updated_user.get('status')}")
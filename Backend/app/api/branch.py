@@ -9,8 +9,32 @@ from app.config import settings
 from app.schemas.branch import BranchCreate, BranchLogin, BranchLoginResponse
 from app.utils.security import generate_branch_code
 from app.utils.auth_helpers import get_current_user
-from app.services.certificate_service import generate_certificate_image, generate_certificate_id
-from app.services.marksheet_service import generate_marksheet_image as service_generate_marksheet_image
+from fastapi.concurrency import run_in_threadpool
+from app.services.certificate_service import generate_certificate_image, generate_certificate_id, allocate_branch_certificate_numbers, next_branch_certificate_number
+from app.services.marksheet_service import (
+    generate_marksheet_image as service_generate_marksheet_image,
+    generate_branch_marksheet_number,
+    allocate_branch_marksheet_numbers
+)
+from app.services.ledger_rollup_service import apply_cash_change
+from app.services.tenant_directory import tenant_directory
+from app.services.token_registry import with_session_claims
+from app.services import stats_engine
+from app.utils.render_assets import load_template, load_font, invalidate_templates
+from app.utils.database import get_async_db
+from app.services.bulk_document_service import (
+    build_certificate_items,
+    build_marksheet_items,
+    calculate_marksheet_totals,
+    marksheet_subjects,
+    create_job,
+    get_job,
+    new_job_id,
+    run_certificate_job,
+    run_marksheet_job,
+    serialize_job,
+    start_job
+)
 
 router = APIRouter(prefix="/api/branch", tags=["Branch"])
 
@@ -169,6 +193,7 @@ async def create_branch(payload: BranchCreate, request: Request):
 
     # Insert branch into database
     db["branches"].insert_one(branch)
+    tenant_directory.invalidate()
     logger.info(f"✅ [Branch] Branch created successfully: {branch_code}")
     
     # Create user account for branch admin
@@ -224,7 +249,7 @@ async def create_branch(payload: BranchCreate, request: Request):
     try:
         # Always generate a fresh token to ensure it works with current secret
         from jose import jwt
-        new_payload = {
+        new_payload = with_session_claims({
             "user_id": current_user.get("user_id"),
             "email": current_user.get("email"),
             "name": current_user.get("name"),
@@ -233,7 +258,7 @@ async def create_branch(payload: BranchCreate, request: Request):
             "franchise_name": current_user.get("franchise_name"),
             "is_branch_admin": True,
             "exp": datetime.utcnow() + timedelta(hours=24)
-        }
+        })
         new_token = jwt.encode(new_payload, settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM)
         logger.info(f"[Branch] Generated fresh token for user {current_user.get('email')}")
     except Exception as token_gen_error:
@@ -944,7 +969,7 @@ async def branch_admin_login(
     """Branch Admin Login - Authenticate branch admin users"""
     import logging
     from jose import jwt
-    import bcrypt
+    from app.services.password_service import password_hasher, is_bcrypt_hash
     from datetime import datetime, timedelta
     
     logger = logging.getLogger("uvicorn")
@@ -980,34 +1005,20 @@ async def branch_admin_login(
             logger.warning(f"[BRANCH LOGIN] No password stored for user: {email}")
             raise HTTPException(status_code=401, detail="Invalid credentials")
         
-        # Debug logging
-        logger.info(f"[BRANCH LOGIN] Password length: {len(stored_password)}, starts with $2b$: {stored_password.startswith('$2b$')}")
-        logger.info(f"[BRANCH LOGIN] Provided password: {password}, length: {len(password)}")
+        # bcrypt runs on the hashing pool; plain text (temporary fallback) is compared directly
+        is_valid = await password_hasher.verify(password, stored_password)
+        logger.info(f"[BRANCH LOGIN] Password verification for {email}, result: {is_valid}")
         
-        # Check if password is hashed or plain text
-        is_valid = False
-        try:
-            if stored_password.startswith("$2b$") or stored_password.startswith("$2a$") or stored_password.startswith("$2y$"):
-                # Hashed password - verify with bcrypt directly
-                is_valid = bcrypt.checkpw(password.encode('utf-8'), stored_password.encode('utf-8'))
-                logger.info(f"[BRANCH LOGIN] Using bcrypt verification for {email}, result: {is_valid}")
-            else:
-                # Plain text password - direct comparison (temporary fallback)
-                is_valid = (password == stored_password)
-                logger.info(f"[BRANCH LOGIN] Using plain text comparison for {email}")
-                logger.info(f"[BRANCH LOGIN] Match result: {is_valid}")
-        except Exception as verify_error:
-            logger.error(f"[BRANCH LOGIN] Password verification error: {str(verify_error)}")
-            # If bcrypt fails, try plain text comparison as fallback
-            is_valid = (password == stored_password)
-            logger.info(f"[BRANCH LOGIN] Falling back to plain text comparison due to error, match: {is_valid}")
+        # Upgrade a matching plain text password to bcrypt after the response
+        if is_valid and not is_bcrypt_hash(stored_password):
+            password_hasher.schedule_upgrade(db["users"], user["_id"], password, field="password")
         
         if not is_valid:
             logger.warning(f"[BRANCH LOGIN] Invalid password for user: {email}")
             raise HTTPException(status_code=401, detail="Invalid credentials")
         
         # Create JWT token
-        token_data = {
+        token_data = with_session_claims({
             "user_id": str(user["_id"]),
             "email": user["email"],
             "name": user["name"],
@@ -1016,7 +1027,7 @@ async def branch_admin_login(
             "branch_code": user.get("branch_code"),
             "is_branch_admin": True,
             "exp": datetime.utcnow() + timedelta(hours=24)
-        }
+        })
         
         # Use the same secret key as other parts of the system
         from app.config import settings
@@ -1039,6 +1050,8 @@ async def branch_admin_login(
             }
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"[BRANCH LOGIN] Unexpected error: {str(e)}")
         raise HTTPException(status_code=500, detail="Login failed")
@@ -3423,6 +3436,7 @@ async def add_cashin(request: Request, current_user: dict = Depends(get_current_
         }
         
         result = cashins_collection.insert_one(cashin_record)
+        apply_cash_change(db, "cash_in", after=cashin_record)
         
         if result.inserted_id:
             logger.info(f"[CASHINS] Cashin added successfully: {result.inserted_id}")
@@ -3497,6 +3511,7 @@ async def update_cashin(cashin_id: str, request: Request, current_user: dict = D
             {"_id": ObjectId(cashin_id)},
             {"$set": update_data}
         )
+        apply_cash_change(db, "cash_in", before=cashin, after={**cashin, **update_data})
         
         if result.modified_count > 0 or result.matched_count > 0:
             logger.info(f"[CASHINS] Cashin updated successfully: {cashin_id}")
@@ -3536,15 +3551,16 @@ async def delete_cashin(cashin_id: str, request: Request, current_user: dict = D
         if user_role == "branch_admin":
             collection_name = f"branch_cashins_{branch_code.replace('-', '_').lower()}"
             cashins_collection = db[collection_name]
-            result = cashins_collection.delete_one({"_id": ObjectId(cashin_id)})
+            deleted = cashins_collection.find_one_and_delete({"_id": ObjectId(cashin_id)})
         else:
             cashins_collection = db["cashins"]
-            result = cashins_collection.delete_one({
+            deleted = cashins_collection.find_one_and_delete({
                 "_id": ObjectId(cashin_id),
                 "branch_code": branch_code
             })
         
-        if result.deleted_count > 0:
+        if deleted is not None:
+            apply_cash_change(db, "cash_in", before=deleted)
             logger.info(f"[CASHINS] Cashin deleted successfully: {cashin_id}")
             return {
                 "success": True,
@@ -3686,6 +3702,7 @@ async def add_cashout(request: Request, current_user: dict = Depends(get_current
         }
         
         result = cashouts_collection.insert_one(cashout_record)
+        apply_cash_change(db, "cash_out", after=cashout_record)
         
         if result.inserted_id:
             logger.info(f"[CASHOUTS] Cashout added successfully: {result.inserted_id}")
@@ -3760,6 +3777,7 @@ async def update_cashout(cashout_id: str, request: Request, current_user: dict =
             {"_id": ObjectId(cashout_id)},
             {"$set": update_data}
         )
+        apply_cash_change(db, "cash_out", before=cashout, after={**cashout, **update_data})
         
         if result.modified_count > 0 or result.matched_count > 0:
             logger.info(f"[CASHOUTS] Cashout updated successfully: {cashout_id}")
@@ -3799,15 +3817,16 @@ async def delete_cashout(cashout_id: str, request: Request, current_user: dict =
         if user_role == "branch_admin":
             collection_name = f"branch_cashouts_{branch_code.replace('-', '_').lower()}"
             cashouts_collection = db[collection_name]
-            result = cashouts_collection.delete_one({"_id": ObjectId(cashout_id)})
+            deleted = cashouts_collection.find_one_and_delete({"_id": ObjectId(cashout_id)})
         else:
             cashouts_collection = db["cashouts"]
-            result = cashouts_collection.delete_one({
+            deleted = cashouts_collection.find_one_and_delete({
                 "_id": ObjectId(cashout_id),
                 "branch_code": branch_code
             })
         
-        if result.deleted_count > 0:
+        if deleted is not None:
+            apply_cash_change(db, "cash_out", before=deleted)
             logger.info(f"[CASHOUTS] Cashout deleted successfully: {cashout_id}")
             return {
                 "success": True,
@@ -5240,19 +5259,17 @@ async def generate_id_card_image(student, output_path, branch_code, db, photo_ur
             print(f"[ID CARD IMAGE] Template not found at: {template_path}")
             return False
         
-        # Load template image
-        template = Image.open(template_path)
-        template = template.convert("RGBA")
-        id_card = template.copy()
+        # Load template image (cached per process, returned as a fresh copy)
+        id_card = load_template(template_path, "RGBA")
         draw = ImageDraw.Draw(id_card)
         
-        print(f"[ID CARD IMAGE] Template loaded. Size: {template.size}")
+        print(f"[ID CARD IMAGE] Template loaded. Size: {id_card.size}")
         
         # Try to load fonts
         try:
-            font_name = ImageFont.truetype("arial.ttf", 16)
-            font_label = ImageFont.truetype("arial.ttf", 12)
-            font_small = ImageFont.truetype("arial.ttf", 10)
+            font_name = load_font("arial.ttf", 16)
+            font_label = load_font("arial.ttf", 12)
+            font_small = load_font("arial.ttf", 10)
         except:
             font_name = ImageFont.load_default()
             font_label = ImageFont.load_default()
@@ -6143,28 +6160,21 @@ async def generate_student_certificate(request: Request, current_user: dict = De
         # Generate certificate number with ENHANCED UNIQUENESS
         # Use student's actual branch_code for certificate number
         student_branch_code = student.get("branch_code", franchise_code)
-        cert_count = db.branch_certificates.count_documents({
-            "franchise_code": franchise_code
-        })
-        
-        # Add timestamp and random components for ULTRA-UNIQUE certificate numbers
+        sequence = next_branch_certificate_number(db, franchise_code)
+        certificate_number = f"CERT{student_branch_code[-4:]}{sequence:03d}"
+
+        # Timestamp and random components keep file names and visible identifiers unique
         import time
         import random
         timestamp_suffix = str(int(time.time() * 1000))[-6:]  # Last 6 digits of millisecond timestamp
         random_suffix = str(random.randint(100, 999))
         micro_timestamp = str(int(time.time() * 1000000))[-4:]  # Microsecond precision
-        
+
         # Incorporate frontend unique identifiers if available
         frontend_unique_id = data.get("unique_id", "")
         nano_id = data.get("nano_id", "")
         request_hash = data.get("request_hash", "")
-        
-        if nano_id:
-            # Use frontend nano_id if available for ultimate uniqueness
-            certificate_number = f"CERT{student_branch_code[-4:]}{cert_count + 1:03d}{nano_id[:6].upper()}"
-        else:
-            # Fallback to timestamp + random for uniqueness
-            certificate_number = f"CERT{student_branch_code[-4:]}{cert_count + 1:03d}{timestamp_suffix}{random_suffix}"
+
         # Get course information
         course_name = student.get("course", "N/A")
         course_duration = student.get("course_duration", "")
@@ -6262,7 +6272,7 @@ async def generate_student_certificate(request: Request, current_user: dict = De
             "center_address": center_address or "",
             "photo_url": photo_url or student.get("photo_path"),
             "student_photo": photo_url or student.get("photo_path"),
-            "sr_number": sr_number or f"00{cert_count + 1:05d}",
+            "sr_number": sr_number or f"00{sequence:05d}",
             "mca_registration_number": mca_registration_number,
             
             # ADD ULTRA-UNIQUE VISIBLE IDENTIFIERS that will appear on certificate
@@ -6828,6 +6838,174 @@ async def delete_certificate(certificate_id: str, request: Request, current_user
         raise HTTPException(status_code=500, detail="Failed to delete certificate")
 
 
+@router.post("/certificates/bulk-generate")
+async def bulk_generate_certificates(request: Request, current_user: dict = Depends(get_current_user)):
+    """Queue certificate generation for every student in a batch, course or explicit list
+    
+    Returns a job id; poll GET /document-jobs/{job_id} and download the zip when done.
+    """
+    import logging
+    logger = logging.getLogger("uvicorn")
+    
+    try:
+        data = await request.json()
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid JSON format")
+    
+    franchise_code = current_user.get("franchise_code")
+    if not franchise_code:
+        raise HTTPException(status_code=400, detail="Franchise code not found")
+    
+    batch = data.get("batch")
+    course = data.get("course")
+    student_ids = data.get("student_ids") or []
+    if not (batch or course or student_ids):
+        raise HTTPException(status_code=400, detail="batch, course or student_ids is required")
+    
+    async_db = get_async_db(request)
+    query = {"franchise_code": franchise_code}
+    if student_ids:
+        query["_id"] = {"$in": [ObjectId(sid) for sid in student_ids if ObjectId.is_valid(sid)]}
+    if batch:
+        query["batch"] = batch
+    if course:
+        query["course"] = course
+    students = await async_db.branch_students.find(query).to_list(length=None)
+    
+    certificate_type = data.get("certificate_type", "completion")
+    if not data.get("force_new"):
+        # Skip students who already have a certificate of this type
+        existing = await async_db.branch_certificates.distinct("student_id", {
+            "franchise_code": franchise_code,
+            "certificate_type": certificate_type,
+            "status": {"$in": ["generated", "issued"]},
+            "student_id": {"$in": [str(s["_id"]) for s in students]}
+        })
+        existing = set(existing)
+        students = [s for s in students if str(s["_id"]) not in existing]
+    
+    branch_codes = list({s.get("branch_code", franchise_code) for s in students})
+    branch_names = {}
+    async for branch in async_db.branches.find({"centre_info.branch_code": {"$in": branch_codes}}, {"centre_info": 1}):
+        info = branch.get("centre_info", {})
+        branch_names[info.get("branch_code")] = info.get("centre_name", "SkillWallah EdTech")
+    
+    # One counter round-trip reserves the whole job's numbers
+    first_number = 1
+    if students:
+        first_number = await run_in_threadpool(allocate_branch_certificate_numbers, request.app.mongodb, franchise_code, len(students))
+    job_id = new_job_id()
+    context = {
+        "franchise_code": franchise_code,
+        "user_id": current_user.get("user_id"),
+        "job_id": job_id,
+        "branch_names": branch_names
+    }
+    items = build_certificate_items(students, data, context, first_number)
+    params = {"batch": batch, "course": course, "student_count": len(student_ids), "certificate_type": certificate_type}
+    job = await create_job(async_db, job_id, "certificate", current_user, params, len(items))
+    start_job(run_certificate_job(async_db, job_id, items))
+    
+    logger.info(f"[BULK CERTIFICATES] Queued job {job_id} for {len(items)} students")
+    return {"success": True, "message": f"Generating {len(items)} certificates", "job": serialize_job(job)}
+
+
+@router.post("/marksheets/bulk-generate")
+async def bulk_generate_marksheets(request: Request, current_user: dict = Depends(get_current_user)):
+    """Queue marksheet generation for the students of a course (optionally one batch or a list)
+    
+    Subject results are taken per student from ``entries[student_id]`` or from the
+    shared ``subjects_results``; students with neither are skipped.
+    """
+    import logging
+    logger = logging.getLogger("uvicorn")
+    
+    try:
+        data = await request.json()
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid JSON format")
+    
+    branch_code = current_user.get("branch_code") or current_user.get("franchise_code")
+    if not branch_code:
+        raise HTTPException(status_code=400, detail="Branch code not found")
+    
+    course_id = data.get("course_id")
+    if not course_id or not ObjectId.is_valid(course_id):
+        raise HTTPException(status_code=400, detail="A valid course_id is required")
+    
+    async_db = get_async_db(request)
+    course = await async_db.branch_courses.find_one({"_id": ObjectId(course_id)})
+    if not course:
+        course = await async_db.courses.find_one({"_id": ObjectId(course_id)})
+    if not course:
+        raise HTTPException(status_code=404, detail=f"Course not found with ID: {course_id}")
+    
+    query = {"$or": [{"branch_code": branch_code}, {"franchise_code": branch_code}]}
+    student_ids = data.get("student_ids") or []
+    if student_ids:
+        query["_id"] = {"$in": [ObjectId(sid) for sid in student_ids if ObjectId.is_valid(sid)]}
+    elif data.get("batch"):
+        query["batch"] = data["batch"]
+    else:
+        query["course"] = {"$in": [name for name in (course.get("title"), course.get("course_name")) if name]}
+    students = await async_db.branch_students.find(query).to_list(length=None)
+    
+    branch = await async_db.branches.find_one({"centre_info.branch_code": branch_code})
+    eligible = [student for student in students if marksheet_subjects(student, data)]
+    year = datetime.now().year
+    first_number = 1
+    if eligible:
+        first_number = await run_in_threadpool(allocate_branch_marksheet_numbers, request.app.mongodb, branch_code, year, len(eligible))
+    job_id = new_job_id()
+    context = {"branch_code": branch_code, "branch": branch, "job_id": job_id, "year": year}
+    items = build_marksheet_items(eligible, course, data, context, first_number)
+    params = {
+        "course_id": course_id,
+        "batch": data.get("batch"),
+        "semester": data.get("semester"),
+        "session_year": data.get("session_year"),
+        "skipped_without_results": len(students) - len(items)
+    }
+    job = await create_job(async_db, job_id, "marksheet", current_user, params, len(items))
+    start_job(run_marksheet_job(async_db, job_id, items))
+    
+    logger.info(f"[BULK MARKSHEETS] Queued job {job_id} for {len(items)} students")
+    return {"success": True, "message": f"Generating {len(items)} marksheets", "job": serialize_job(job)}
+
+
+async def _get_owned_document_job(request: Request, job_id: str, current_user: dict) -> dict:
+    franchise_code = current_user.get("franchise_code")
+    # Jobs record the creator's branch, or their franchise when they have none (see create_job)
+    branch_code = current_user.get("branch_code") or franchise_code
+    if not franchise_code and not branch_code:
+        raise HTTPException(status_code=403, detail="Access denied")
+    job = await get_job(get_async_db(request), job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.get("franchise_code") != franchise_code or job.get("branch_code") != branch_code:
+        raise HTTPException(status_code=403, detail="Access denied")
+    return job
+
+
+@router.get("/document-jobs/{job_id}")
+async def get_document_job(job_id: str, request: Request, current_user: dict = Depends(get_current_user)):
+    """Progress of a bulk certificate/marksheet job"""
+    job = await _get_owned_document_job(request, job_id, current_user)
+    return {"success": True, "job": serialize_job(job)}
+
+
+@router.get("/document-jobs/{job_id}/download")
+async def download_document_job(job_id: str, request: Request, current_user: dict = Depends(get_current_user)):
+    """Zip of every document generated by a finished bulk job"""
+    job = await _get_owned_document_job(request, job_id, current_user)
+    zip_path = job.get("zip_path")
+    if job.get("status") != "completed" or not zip_path:
+        raise HTTPException(status_code=409, detail=f"Job is {job.get('status')}; download is not ready yet")
+    if not os.path.exists(zip_path):
+        raise HTTPException(status_code=410, detail="Job archive no longer available")
+    return FileResponse(zip_path, media_type="application/zip", filename=f"{job.get('kind')}s_{job_id}.zip")
+
+
 @router.post("/certificates/upload-template")
 async def upload_certificate_template(
     request: Request,
@@ -6909,6 +7087,7 @@ async def upload_certificate_template(
             raise HTTPException(status_code=500, detail="Failed to save template file")
         
         file_size = os.path.getsize(template_path)
+        invalidate_templates(template_path)
         logger.info(f"[TEMPLATE] Template uploaded successfully. Size: {file_size} bytes")
         
         return {
@@ -7066,50 +7245,20 @@ async def generate_student_marksheet(request: Request, current_user: dict = Depe
         if branch:
             branch_name = branch.get("centre_info", {}).get("centre_name", "Unknown Branch")
         
-        # Calculate totals from subjects_results
-        total_full_marks = 0
-        total_obtained_marks = 0
-        
+        # Calculate totals, percentage and grade from subjects_results
         logger.info(f"[MARKSHEET] Calculating totals from {len(subjects_results)} subjects")
-        for subject in subjects_results:
-            # Support both old format (full_marks/obtained_marks) and new format (theory_marks/theory_max)
-            theory_max = float(subject.get("theory_max", subject.get("full_marks", 0)))
-            theory_marks = float(subject.get("theory_marks", subject.get("obtained_marks", 0)))
-            practical_max = float(subject.get("practical_max", 0))
-            practical_marks = float(subject.get("practical_marks", 0))
-            
-            total_full_marks += theory_max + practical_max
-            total_obtained_marks += theory_marks + practical_marks
-            
-            logger.info(f"[MARKSHEET] Subject: {subject.get('subject_name', subject.get('name', 'Unknown'))}, Theory: {theory_marks}/{theory_max}, Practical: {practical_marks}/{practical_max}")
+        totals = calculate_marksheet_totals(subjects_results)
+        total_full_marks = totals["total_marks"]
+        total_obtained_marks = totals["obtained_marks"]
+        percentage = totals["percentage"]
+        grade = totals["grade"]
+        if totals["result"]:
+            result = totals["result"]
         
         logger.info(f"[MARKSHEET] Total: {total_obtained_marks}/{total_full_marks}")
         
-        # Calculate percentage and grade
-        percentage = (total_obtained_marks / total_full_marks * 100) if total_full_marks > 0 else 0
-        
-        # Determine grade based on percentage
-        if percentage >= 90:
-            grade = "A+"
-        elif percentage >= 80:
-            grade = "A"
-        elif percentage >= 70:
-            grade = "B+"
-        elif percentage >= 60:
-            grade = "B"
-        elif percentage >= 50:
-            grade = "C+"
-        elif percentage >= 40:
-            grade = "C"
-        elif percentage >= 33:
-            grade = "D"
-        else:
-            grade = "F"
-            result = "fail"
-        
         # Generate unique marksheet number
-        marksheet_count = db.branch_marksheets.count_documents({"branch_code": branch_code})
-        marksheet_number = f"MS-{branch_code}-{datetime.now().year}-{marksheet_count + 1:04d}"
+        marksheet_number = generate_branch_marksheet_number(db, branch_code, datetime.now().year)
         
         # Create marksheet document
         marksheet_doc = {
@@ -7875,6 +8024,7 @@ async def update_branch_status(
                 }
             }
         )
+        tenant_directory.invalidate()
         
         if result.modified_count == 0:
             logger.error(f"[Branch Status] Failed to update branch: {branch_code}")
@@ -7987,6 +8137,7 @@ async def update_branch(
             {"_id": branch["_id"]},
             {"$set": update_data}
         )
+        tenant_directory.invalidate()
         
         if result.modified_count == 0:
             logger.warning(f"[Branch Update] No changes made to branch: {branch_code}")
@@ -8059,6 +8210,7 @@ async def delete_branch(
         
         # Delete the branch record from database
         result = db["branches"].delete_one({"_id": branch["_id"]})
+        tenant_directory.invalidate()
         
         if result.deleted_count == 0:
             logger.error(f"[Branch Delete] Failed to delete branch: {branch_code}")
@@ -8167,50 +8319,68 @@ async def get_branch_stats(
             logger.error(f"[Branch Stats] Permission denied")
             raise HTTPException(status_code=403, detail="You don't have permission for this action")
         
-        # Get total students count
-        total_students = db["branch_students"].count_documents({
-            "branch_code": branch_code,
-            "status": {"$ne": "deleted"}
-        })
-        
-        # Get active students count
-        active_students = db["branch_students"].count_documents({
-            "branch_code": branch_code,
-            "admission_status": "active",
-            "status": {"$ne": "deleted"}
-        })
-        
-        # Get total courses count
-        total_courses = db["branch_courses"].count_documents({
-            "branch_code": branch_code,
-            "status": {"$ne": "deleted"}
-        })
-        
-        # Get active courses count
-        active_courses = db["branch_courses"].count_documents({
-            "branch_code": branch_code,
-            "status": "active"
-        })
-        
-        # Get total instructors count (from users collection with instructor role)
-        total_instructors = db["users"].count_documents({
-            "role": "instructor",
-            "branch_code": branch_code,
-            "status": {"$ne": "deleted"}
-        })
-        
-        # Get active instructors count
-        active_instructors = db["users"].count_documents({
-            "role": "instructor",
-            "branch_code": branch_code,
-            "status": "active"
+        # One aggregation per collection (students, courses, instructors), run concurrently
+        stats = await stats_engine.run_stats(get_async_db(request), {
+            "students": {
+                "collection": "branch_students",
+                "match": {"branch_code": branch_code, "status": {"$ne": "deleted"}},
+                "stats": {
+                    "total": stats_engine.count(),
+                    "active": stats_engine.count({"admission_status": "active"}),
+                    # Recent activity (last 5 student registrations)
+                    "recent": stats_engine.rows([
+                        {"$sort": {"admission_date": -1}},
+                        {"$limit": 5},
+                        {"$project": {"name": 1, "registration_number": 1, "admission_date": 1, "course": 1}}
+                    ])
+                }
+            },
+            "courses": {
+                "collection": "branch_courses",
+                "match": {"branch_code": branch_code},
+                "stats": {
+                    "total": stats_engine.count({"status": {"$ne": "deleted"}}),
+                    "active": stats_engine.count({"status": "active"}),
+                    # Top courses by enrollment
+                    "top": stats_engine.rows([
+                        {"$match": {"status": {"$ne": "deleted"}}},
+                        {
+                            "$lookup": {
+                                "from": "branch_students",
+                                "localField": "course_name",
+                                "foreignField": "course",
+                                "as": "enrolled_students"
+                            }
+                        },
+                        {
+                            "$project": {
+                                "course_name": 1,
+                                "course_code": 1,
+                                "fee": 1,
+                                "enrolled_count": {"$size": "$enrolled_students"}
+                            }
+                        },
+                        {"$sort": {"enrolled_count": -1}},
+                        {"$limit": 5}
+                    ])
+                }
+            },
+            "instructors": {
+                "collection": "users",
+                "match": {"role": "instructor", "branch_code": branch_code},
+                "stats": {
+                    "total": stats_engine.count({"status": {"$ne": "deleted"}}),
+                    "active": stats_engine.count({"status": "active"})
+                }
+            }
         })
-        
-        # Get recent activity (last 10 student registrations)
-        recent_students = list(db["branch_students"].find(
-            {"branch_code": branch_code, "status": {"$ne": "deleted"}},
-            {"name": 1, "registration_number": 1, "admission_date": 1, "course": 1}
-        ).sort("admission_date", -1).limit(5))
+        total_students = stats["students"]["total"]
+        active_students = stats["students"]["active"]
+        total_courses = stats["courses"]["total"]
+        active_courses = stats["courses"]["active"]
+        total_instructors = stats["instructors"]["total"]
+        active_instructors = stats["instructors"]["active"]
+        recent_students = stats["students"]["recent"]
         
         recent_activity = []
         for student in recent_students:
@@ -8236,28 +8406,7 @@ async def get_branch_stats(
                 }
             })
         
-        # Get top courses by enrollment
-        course_stats = list(db["branch_courses"].aggregate([
-            {"$match": {"branch_code": branch_code, "status": {"$ne": "deleted"}}},
-            {
-                "$lookup": {
-                    "from": "branch_students",
-                    "localField": "course_name",
-                    "foreignField": "course",
-                    "as": "enrolled_students"
-                }
-            },
-            {
-                "$project": {
-                    "course_name": 1,
-                    "course_code": 1,
-                    "fee": 1,
-                    "enrolled_count": {"$size": "$enrolled_students"}
-                }
-            },
-            {"$sort": {"enrolled_count": -1}},
-            {"$limit": 5}
-        ]))
+        course_stats = stats["courses"]["top"]
         
         logger.info(f"[Branch Stats] Successfully calculated statistics for branch: {branch_code}")
         logger.info(f"[Branch Stats] Students: {total_students}, Courses: {total_courses}, Instructors: {total_instructors}")
@@ -5,6 +5,7 @@ from bson import ObjectId
 from app.config import settings
 from app.utils.auth_helpers_enhanced import get_current_user
 from app.utils.multi_tenant import MultiTenantManager
+from app.services.course_content_service import mark_course_content_stale
 from pydantic import BaseModel, Field, validator
 
 router = APIRouter(prefix="/api/branch-courses", tags=["Branch Course Management"])
@@ -464,6 +465,9 @@ async def update_course(
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="Course not found or access denied")
         
+        # course_name drives material/paper-set matching in the content tree
+        mark_course_content_stale(db, course_ref=course_id)
+        
         # Note: modified_count can be 0 if no fields actually changed, which is OK
         # So we don't raise an error for modified_count == 0
         
@@ -592,6 +596,8 @@ async def delete_course(
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="Course not found")
         
+        mark_course_content_stale(db, course_ref=course_id)
+        
         if result.modified_count == 0:
             print(f"[DELETE_COURSE] Warning: Course was already deleted or status unchanged")
         
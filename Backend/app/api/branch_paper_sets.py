@@ -6,6 +6,7 @@ import logging
 from app.config import settings
 from app.utils.auth_helpers import get_current_user
 from app.utils.multi_tenant import MultiTenantManager
+from app.services.course_content_service import mark_course_content_stale
 
 router = APIRouter(prefix="/api/branch-paper-sets", tags=["Branch Paper Sets"])
 logger = logging.getLogger("uvicorn")
@@ -182,6 +183,7 @@ async def create_paper_set(paper_set_data: PaperSetCreate, request: Request, cur
         # Insert paper set
         paper_sets_collection = db.branch_paper_sets
         result = paper_sets_collection.insert_one(paper_set_doc)
+        mark_course_content_stale(db, branch_code=paper_set_doc.get("branchCode"))
         
         if result.inserted_id:
             # Return the created paper set
@@ -270,6 +272,7 @@ async def update_paper_set(paper_set_id: str, paper_set_data: PaperSetUpdate, re
             {"_id": paper_set_obj_id},
             {"$set": update_data}
         )
+        mark_course_content_stale(db, branch_code=existing_paper_set.get("branchCode"))
         
         if result.modified_count > 0:
             # Return the updated paper set
@@ -353,6 +356,7 @@ async def delete_paper_set(paper_set_id: str, request: Request, current_user = D
         
         # Delete paper set using just ID (no branch filtering since we've already verified access)
         result = paper_sets_collection.delete_one({"_id": paper_set_obj_id})
+        mark_course_content_stale(db, branch_code=existing_paper_set.get("branchCode"))
         
         if result.deleted_count > 0:
             logger.info(f"✅ [PAPER SETS API] Paper set deleted successfully")
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Request, Depends, File, UploadFile, Form
+from fastapi import APIRouter, HTTPException, Request, Response, Depends, File, UploadFile, Form
 from fastapi.responses import JSONResponse
 from app.schemas.branch_student import (
     BranchStudentRegistration, 
@@ -7,8 +7,13 @@ from app.schemas.branch_student import (
     StudentListFilters
 )
 from app.utils.auth_helpers_enhanced import get_current_user
+from app.utils.auth_helpers import invalidate_user_auth_cache
+from app.services.token_registry import revoke_user_tokens
 from app.utils.dependencies import role_required, get_authenticated_user
 from app.utils.multi_tenant import get_multi_tenant_manager
+from app.utils.database import get_async_db, fetch_all
+from app.config import settings
+from app.utils.timing import record_latency
 from datetime import datetime, date
 from typing import Optional, List, Dict, Any
 from bson import ObjectId
@@ -16,12 +21,15 @@ import os
 import uuid
 from pathlib import Path
 import shutil
-import re
-import bcrypt
+from app.services.password_service import password_hasher
+from app.services.counter_service import next_sequence, peek_sequence, observe_sequence, max_numeric_suffix
+from app.services.search_service import apply_search, ranked_pipeline, search_fields, refresh_search_terms
 import secrets
 import string
 import traceback
+import asyncio
 import logging
+import time
 
 # Get logger
 logger = logging.getLogger("uvicorn")
@@ -45,19 +53,6 @@ def require_branch_access(user=Depends(get_current_user)):
     return user
 
 
-def hash_password(password: str) -> str:
-    """Hash password using bcrypt"""
-    password_bytes = password.encode('utf-8')
-    salt = bcrypt.gensalt()
-    hashed = bcrypt.hashpw(password_bytes, salt)
-    return hashed.decode('utf-8')
-
-def verify_password(password: str, hashed_password: str) -> bool:
-    """Verify password against hash"""
-    password_bytes = password.encode('utf-8')
-    hashed_bytes = hashed_password.encode('utf-8')
-    return bcrypt.checkpw(password_bytes, hashed_bytes)
-
 def generate_random_password(length: int = 8) -> str:
     """Generate a random password if none provided"""
     alphabet = string.ascii_letters + string.digits
@@ -69,56 +64,47 @@ def generate_random_password(length: int = 8) -> str:
         password = password[:-1] + secrets.choice(string.digits)
     return password
 
-def generate_registration_number(branch_code: str, admission_year: str, db) -> tuple:
-    """Generate unique registration number for student"""
+def _registration_series(branch_code: str, admission_year: str, db) -> tuple:
+    """Counter key, number prefix and seed for one branch and admission year"""
     # Format: BRANCH_YEAR_SEQUENCE (e.g., BR001_24_001)
     year_suffix = admission_year[-2:]  # Last 2 digits of year
+    prefix = f"{branch_code}_{year_suffix}_"
+    scope = {"branch_code": branch_code, "admission_year": admission_year}
     
-    # Try 1: Find by registration_sequence
-    last_student_seq = db.branch_students.find_one(
-        {
-            "branch_code": branch_code,
-            "admission_year": admission_year,
-            "registration_sequence": {"$exists": True, "$ne": None}
-        },
-        sort=[("registration_sequence", -1)]
-    )
-    
-    seq_1 = 0
-    if last_student_seq:
-        seq_1 = last_student_seq.get("registration_sequence", 0)
-        
-    # Try 2: Find by registration_number (parse string) in case sequence field is missing
-    # Filter for reg numbers matching pattern to avoid parsing errors
-    # Pattern: BRANCH_YEAR_DIGITS
-    pattern = f"^{re.escape(branch_code)}_{year_suffix}_\\d+$"
-    last_student_reg = db.branch_students.find_one(
-        {
-            "branch_code": branch_code,
-            "admission_year": admission_year,
-            "registration_number": {"$regex": pattern}
-        },
-        sort=[("registration_number", -1)]  # String sort works for fixed length suffix
-    )
-    
-    seq_2 = 0
-    if last_student_reg:
-        reg_num = last_student_reg.get("registration_number", "")
-        parts = reg_num.split('_')
-        if len(parts) >= 3 and parts[-1].isdigit():
-            try:
-                seq_2 = int(parts[-1])
-            except ValueError:
-                pass
-                
-    # Use max sequence
-    sequence = max(seq_1, seq_2) + 1
+    def seed():
+        # Highest sequence already issued, by field or parsed from the number
+        last_student_seq = db.branch_students.find_one(
+            {**scope, "registration_sequence": {"$exists": True, "$ne": None}},
+            sort=[("registration_sequence", -1)]
+        )
+        seq_1 = last_student_seq.get("registration_sequence", 0) if last_student_seq else 0
+        seq_2 = max_numeric_suffix(db.branch_students, "registration_number", prefix, scope)
+        return max(seq_1 or 0, seq_2)
     
+    return f"registration:{branch_code}:{admission_year}", prefix, seed
+
+def _format_registration_number(prefix: str, sequence: int) -> str:
     # Format sequence with leading zeros (3 digits)
-    sequence_str = f"{sequence:03d}"
-    registration_number = f"{branch_code}_{year_suffix}_{sequence_str}"
-    
-    return registration_number, sequence
+    return f"{prefix}{sequence:03d}"
+
+def observe_registration_number(branch_code: str, admission_year: str, registration_number: str, db):
+    """Keep the counter ahead of a manually entered number that follows the generated format"""
+    key, prefix, _ = _registration_series(branch_code, admission_year, db)
+    suffix = registration_number[len(prefix):] if registration_number.startswith(prefix) else ""
+    if suffix.isdigit():
+        observe_sequence(db, key, int(suffix))
+
+def generate_registration_number(branch_code: str, admission_year: str, db) -> tuple:
+    """Allocate the next unique registration number for a student"""
+    key, prefix, seed = _registration_series(branch_code, admission_year, db)
+    sequence = next_sequence(db, key, seed)
+    return _format_registration_number(prefix, sequence), sequence
+
+def preview_registration_number(branch_code: str, admission_year: str, db) -> tuple:
+    """Registration number the next student would get, without reserving it"""
+    key, prefix, seed = _registration_series(branch_code, admission_year, db)
+    sequence = peek_sequence(db, key, seed)
+    return _format_registration_number(prefix, sequence), sequence
 
 def get_branch_info_from_db(db, current_user):
     """Get branch and franchise information from database based on user info"""
@@ -159,6 +145,43 @@ def get_branch_info_from_db(db, current_user):
         logger.error(f"Error getting branch info from DB: {str(e)}")
         return None, None
 
+async def find_id_cards_for_students(async_db, students: List[dict]) -> Dict[str, dict]:
+    """Fetch ID cards for a page of students in one query, keyed by student id
+
+    A card matches a student by ``student_id`` or by registration number (stored
+    as ``registration_number`` or ``student_registration``); a ``student_id``
+    match wins when both exist.
+    """
+    if not students:
+        return {}
+    
+    student_ids = [str(s["_id"]) for s in students]
+    registrations = [s["registration_number"] for s in students if s.get("registration_number")]
+    
+    card_query = {"$or": [{"student_id": {"$in": student_ids}}]}
+    if registrations:
+        card_query["$or"].extend([
+            {"registration_number": {"$in": registrations}},
+            {"student_registration": {"$in": registrations}}
+        ])
+    
+    by_student_id = {}
+    by_registration = {}
+    async for card in async_db.branch_id_cards.find(card_query):
+        if card.get("student_id"):
+            by_student_id.setdefault(str(card["student_id"]), card)
+        for field in ("registration_number", "student_registration"):
+            if card.get(field):
+                by_registration.setdefault(card[field], card)
+    
+    cards = {}
+    for student in students:
+        student_id = str(student["_id"])
+        card = by_student_id.get(student_id) or by_registration.get(student.get("registration_number"))
+        if card:
+            cards[student_id] = card
+    return cards
+
 @router.post("/students/register")
 async def register_branch_student(
     request: Request,
@@ -267,7 +290,7 @@ async def register_branch_student(
             hashed_password = None
             if validated_data.password and validated_data.password.strip():
                 generated_password = validated_data.password
-                hashed_password = hash_password(generated_password)
+                hashed_password = await password_hasher.hash(generated_password)
                 print(f"[DEBUG] Using provided password for update - password will be changed")
             else:
                 # Keep existing password hash - DO NOT generate new password on update
@@ -331,6 +354,7 @@ async def register_branch_student(
                 {"_id": existing_reg_student["_id"]},
                 {"$set": update_data}
             )
+            refresh_search_terms(db, "branch_students", {"_id": existing_reg_student["_id"]})
             
             # Handle datetime conversion for created_at
             created_at = existing_reg_student.get("created_at")
@@ -389,7 +413,7 @@ async def register_branch_student(
             print(f"[DEBUG] Using provided password")
         
         # Hash the password for secure storage
-        hashed_password = hash_password(generated_password)
+        hashed_password = await password_hasher.hash(generated_password)
         
         # Store the original password temporarily for response (in production, you might want to remove this)
         original_password = generated_password
@@ -398,6 +422,9 @@ async def register_branch_student(
         if validated_data.registration_number and validated_data.registration_number.strip():
             registration_number = validated_data.registration_number
             registration_sequence = None  # Don't need sequence for provided numbers
+            observe_registration_number(
+                context["branch_code"], validated_data.admission_year, registration_number, db
+            )
             print(f"[DEBUG] Using provided registration number: {registration_number}")
         else:
             registration_number, registration_sequence = generate_registration_number(
@@ -484,7 +511,7 @@ async def register_branch_student(
         
         # Insert student with tenant context
         print(f"[DEBUG] Inserting student into database...")
-        result = db.branch_students.insert_one(student_doc)
+        result = db.branch_students.insert_one(search_fields("branch_students", student_doc))
         print(f"[DEBUG] Insert result: {result.inserted_id}")
         
         if not result.inserted_id:
@@ -645,6 +672,7 @@ async def upload_student_photo(
 @router.get("/students")
 async def get_branch_students(
     request: Request,
+    response: Response,
     branch_code: Optional[str] = None,
     course: Optional[str] = None,
     batch: Optional[str] = None,
@@ -656,17 +684,17 @@ async def get_branch_students(
 ):
     """Get list of students for the branch with multi-tenant filtering options and ID card status"""
     
+    started = time.perf_counter()
     db = request.app.mongodb
-    multi_tenant = get_multi_tenant_manager(db)
+    async_db = get_async_db(request)
+    multi_tenant = get_multi_tenant_manager(db, async_db)
     
     try:
         # Get branch context with tenant isolation
-        print(f"[DEBUG GET_STUDENTS] Starting endpoint - current_user: {current_user}")
         try:
             context = multi_tenant.get_branch_context(current_user)
-            print(f"[DEBUG GET_STUDENTS] Branch context: {context}")
         except Exception as context_error:
-            print(f"[DEBUG GET_STUDENTS] Branch context error: {context_error}")
+            logger.warning(f"[STUDENTS] Branch context unavailable, reading it from the database: {context_error}")
             # If multi-tenant context fails, get branch info from database
             franchise_code, branch_code_from_db = get_branch_info_from_db(db, current_user)
             
@@ -683,21 +711,18 @@ async def get_branch_students(
                 "email": current_user.get("email", "unknown"),
                 "role": current_user.get("role", "admin")
             }
-            print(f"[DEBUG GET_STUDENTS] Fallback context created: {context}")
         
         # Start with tenant filter
         try:
             query = multi_tenant.create_tenant_filter(context)
         except Exception as filter_error:
-            print(f"[DEBUG GET_STUDENTS] Tenant filter error: {filter_error}")
+            logger.warning(f"[STUDENTS] Tenant filter error, using branch filter: {filter_error}")
             # Fallback: create basic tenant filter
             query = {
                 "franchise_code": context["franchise_code"],
                 "branch_code": context["branch_code"]
             }
         
-        print(f"[DEBUG GET_STUDENTS] Tenant filter query: {query}")
-        
         # Add additional filters while maintaining tenant isolation
         if branch_code and branch_code == context["branch_code"]:
             # Only allow filtering by the user's own branch
@@ -710,62 +735,28 @@ async def get_branch_students(
         if admission_year:
             query["admission_year"] = admission_year
         
-        if search:
-            # Multi-field search within tenant scope
-            search_regex = {"$regex": search, "$options": "i"}
-            query["$or"] = [
-                {"student_name": search_regex},
-                {"email_id": search_regex},
-                {"registration_number": search_regex},
-                {"father_name": search_regex},
-                {"contact_no": search_regex}
-            ]
-        
-        print(f"[DEBUG GET_STUDENTS] Final query: {query}")
+        # Multi-field prefix search within tenant scope (name, registration number, email, father's name, phone)
+        search_words = apply_search(query, search)
         
         # Calculate pagination
         skip = (page - 1) * limit
         
         # Get students with pagination and tenant isolation
-        print(f"[DEBUG GET_STUDENTS] Executing query with skip={skip}, limit={limit}")
-        students_cursor = db.branch_students.find(query).skip(skip).limit(limit).sort("created_at", -1)
+        if search_words:
+            cursor = async_db.branch_students.aggregate(
+                ranked_pipeline(query, search_words, {"created_at": -1}, skip, limit)
+            )
+        else:
+            cursor = async_db.branch_students.find(query).skip(skip).limit(limit).sort("created_at", -1)
+        student_docs = await fetch_all(cursor, length=limit)
+        
+        # One batched lookup for the whole page instead of one query per student
+        id_cards = await find_id_cards_for_students(async_db, student_docs)
         
         students = []
-        for student in students_cursor:
-            print(f"[DEBUG GET_STUDENTS] Found student: {student.get('student_name')} - {student.get('registration_number')}")
-            
-            # Check if student has an ID card
+        for student in student_docs:
             student_id = str(student["_id"])
-            student_reg = student.get("registration_number")
-            
-            print(f"[DEBUG GET_STUDENTS] Checking ID card for student_id: {student_id}, registration: {student_reg}")
-            
-            # First check total ID cards in collection
-            total_id_cards = db.branch_id_cards.count_documents({})
-            print(f"[DEBUG GET_STUDENTS] Total ID cards in collection: {total_id_cards}")
-            
-            # Show all ID cards in collection (for debugging)
-            all_id_cards = list(db.branch_id_cards.find({}).limit(5))
-            print(f"[DEBUG GET_STUDENTS] Sample ID cards in collection:")
-            for idx, sample_card in enumerate(all_id_cards):
-                print(f"  Sample {idx + 1}: student_id={sample_card.get('student_id')}, student_registration={sample_card.get('student_registration')}, branch_code={sample_card.get('branch_code')}")
-            
-            # Build query to find ID card
-            id_card_query = {
-                "$or": [
-                    {"student_id": student_id},
-                    {"registration_number": student_reg},
-                    {"student_registration": student_reg}  # Also check this field name
-                ]
-            }
-            
-            print(f"[DEBUG GET_STUDENTS] ID card query: {id_card_query}")
-            
-            id_card = db.branch_id_cards.find_one(id_card_query)
-            
-            print(f"[DEBUG GET_STUDENTS] ID Card found: {bool(id_card)}")
-            if id_card:
-                print(f"[DEBUG GET_STUDENTS] ID Card data: {id_card}")
+            id_card = id_cards.get(student_id)
             
             # Handle datetime conversion for created_at
             created_at = student.get("created_at")
@@ -778,7 +769,7 @@ async def get_branch_students(
             
             try:
                 student_data = {
-                    "id": str(student["_id"]),
+                    "id": student_id,
                     "registration_number": student.get("registration_number"),
                     "student_name": student.get("name") or student.get("student_name"),
                     "email_id": student.get("email") or student.get("email_id"),
@@ -821,15 +812,12 @@ async def get_branch_students(
                 
                 students.append(student_data)
             except Exception as e:
-                print(f"[DEBUG GET_STUDENTS] Error processing student {student.get('_id')}: {e}")
-                print(f"[DEBUG GET_STUDENTS] Student data: {student}")
+                logger.warning(f"[STUDENTS] Skipping student {student.get('_id')}: {e}")
                 # Continue with next student instead of failing completely
                 continue
         
-        print(f"[DEBUG GET_STUDENTS] Successfully processed {len(students)} students")
-        
         # Log tenant activity
-        multi_tenant.log_tenant_activity(
+        await multi_tenant.log_tenant_activity_async(
             context,
             "STUDENTS_RETRIEVED",
             {
@@ -844,14 +832,11 @@ async def get_branch_students(
             }
         )
         
-        print(f"[DEBUG GET_STUDENTS] Returning {len(students)} students")
+        record_latency(response, "students", started, settings.STUDENT_LIST_LATENCY_BUDGET_MS)
         return {"success": True, "students": students, "total": len(students)}
         
     except Exception as e:
-        print(f"[DEBUG GET_STUDENTS] Exception occurred: {e}")
-        print(f"[DEBUG GET_STUDENTS] Exception type: {type(e)}")
-        import traceback
-        print(f"[DEBUG GET_STUDENTS] Traceback: {traceback.format_exc()}")
+        logger.exception(f"[STUDENTS] Failed to fetch students: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to fetch students: {str(e)}")
 
 @router.get("/students/{student_id}")
@@ -1019,6 +1004,7 @@ async def update_student(
             
             if result.modified_count == 0:
                 raise HTTPException(status_code=400, detail="No changes were made")
+            refresh_search_terms(db, "branch_students", student_filter)
                 
             # Log tenant activity
             multi_tenant.log_tenant_activity(
@@ -1209,14 +1195,15 @@ async def get_branch_dashboard_stats(
     """Get dashboard statistics for the branch with multi-tenant isolation"""
     
     db = request.app.mongodb
-    multi_tenant = get_multi_tenant_manager(db)
+    async_db = get_async_db(request)
+    multi_tenant = get_multi_tenant_manager(db, async_db)
     
     try:
         # Get branch context with tenant isolation
         try:
             context = multi_tenant.get_branch_context(current_user)
             # Use multi-tenant manager to get statistics
-            tenant_stats = multi_tenant.get_tenant_stats(context)
+            tenant_stats = await multi_tenant.get_tenant_stats_async(context)
             # Get additional branch-specific statistics
             base_filter = multi_tenant.create_tenant_filter(context)
         except Exception as context_error:
@@ -1255,7 +1242,6 @@ async def get_branch_dashboard_stats(
             }},
             {"$sort": {"count": -1}}
         ]
-        course_stats = list(db.branch_students.aggregate(course_pipeline))
         
         # Batch-wise student count
         batch_pipeline = [
@@ -1266,7 +1252,6 @@ async def get_branch_dashboard_stats(
             }},
             {"$sort": {"count": -1}}
         ]
-        batch_stats = list(db.branch_students.aggregate(batch_pipeline))
         
         # Monthly admission trends
         monthly_pipeline = [
@@ -1282,7 +1267,6 @@ async def get_branch_dashboard_stats(
             {"$sort": {"_id.year": -1, "_id.month": -1}},
             {"$limit": 12}
         ]
-        monthly_trends = list(db.branch_students.aggregate(monthly_pipeline))
         
         # Admission status breakdown
         status_pipeline = [
@@ -1292,10 +1276,9 @@ async def get_branch_dashboard_stats(
                 "count": {"$sum": 1}
             }}
         ]
-        status_breakdown = list(db.branch_students.aggregate(status_pipeline))
         
         # Recent admissions
-        recent_admissions = list(db.branch_students.find(
+        recent_cursor = async_db.branch_students.find(
             base_filter,
             {
                 "student_name": 1,
@@ -1304,7 +1287,16 @@ async def get_branch_dashboard_stats(
                 "created_at": 1,
                 "admission_status": 1
             }
-        ).sort("created_at", -1).limit(5))
+        ).sort("created_at", -1).limit(5)
+        
+        # Independent queries - run them concurrently instead of back to back
+        course_stats, batch_stats, monthly_trends, status_breakdown, recent_admissions = await asyncio.gather(
+            fetch_all(async_db.branch_students.aggregate(course_pipeline)),
+            fetch_all(async_db.branch_students.aggregate(batch_pipeline)),
+            fetch_all(async_db.branch_students.aggregate(monthly_pipeline)),
+            fetch_all(async_db.branch_students.aggregate(status_pipeline)),
+            fetch_all(recent_cursor, length=5)
+        )
         
         # Format recent admissions
         recent_admissions_formatted = []
@@ -1319,7 +1311,7 @@ async def get_branch_dashboard_stats(
             })
         
         # Log tenant activity
-        multi_tenant.log_tenant_activity(
+        await multi_tenant.log_tenant_activity_async(
             context,
             "DASHBOARD_ACCESSED",
             {"stats_type": "comprehensive_dashboard"}
@@ -1353,7 +1345,8 @@ async def get_revenue_analytics(
     """Get revenue analytics with multi-tenant isolation"""
     
     db = request.app.mongodb
-    multi_tenant = get_multi_tenant_manager(db)
+    async_db = get_async_db(request)
+    multi_tenant = get_multi_tenant_manager(db, async_db)
     
     try:
         # Get branch context with tenant isolation
@@ -1427,7 +1420,7 @@ async def get_revenue_analytics(
             {"$sort": {"_id.year": 1, "_id.month": 1, "_id.day": 1}}
         ]
         
-        revenue_data = list(db.branch_students.aggregate(revenue_pipeline))
+        revenue_data = await fetch_all(async_db.branch_students.aggregate(revenue_pipeline))
         
         # Calculate totals
         total_revenue = sum(item["total_revenue"] for item in revenue_data)
@@ -1435,7 +1428,7 @@ async def get_revenue_analytics(
         avg_fee_per_student = total_revenue / total_students if total_students > 0 else 0
         
         # Log tenant activity
-        multi_tenant.log_tenant_activity(
+        await multi_tenant.log_tenant_activity_async(
             context,
             "REVENUE_ANALYTICS_ACCESSED",
             {
@@ -1512,7 +1505,7 @@ async def get_branch_student_stats(
             }
         ]
         
-        result = list(db.branch_students.aggregate(pipeline))
+        result = await fetch_all(get_async_db(request).branch_students.aggregate(pipeline))
         
         if result:
             stats = result[0]
@@ -1594,7 +1587,7 @@ async def reset_student_password(
             raise HTTPException(status_code=400, detail="Password must be at least 4 characters long")
         
         # Hash the new password
-        hashed_password = hash_password(new_password)
+        hashed_password = await password_hasher.hash(new_password)
         
         # Update student document with new password
         update_data = {
@@ -1617,6 +1610,8 @@ async def reset_student_password(
         if result.modified_count == 0:
             raise HTTPException(status_code=400, detail="Failed to reset password")
         
+        revoke_user_tokens(db, student_id, "password reset")
+        
         # Log tenant activity
         multi_tenant.log_tenant_activity(
             context,
@@ -1713,6 +1708,11 @@ async def toggle_student_login(
         if result.modified_count == 0:
             raise HTTPException(status_code=400, detail="Failed to update login status")
         
+        if enable_login:
+            invalidate_user_auth_cache(student_id)
+        else:
+            revoke_user_tokens(db, student_id, "login disabled")
+        
         # Log tenant activity
         action = "STUDENT_LOGIN_ENABLED" if enable_login else "STUDENT_LOGIN_DISABLED"
         multi_tenant.log_tenant_activity(
@@ -1861,8 +1861,8 @@ async def get_next_registration_number(
             
         print(f"[DEBUG NEXT_REG_NUMBER] Getting next registration number for branch: {context['branch_code']}, year: {admission_year}")
         
-        # Generate the next registration number
-        next_reg_number, sequence = generate_registration_number(
+        # Preview the next registration number (reserved only when the student is created)
+        next_reg_number, sequence = preview_registration_number(
             branch_code=context["branch_code"],
             admission_year=admission_year,
             db=db
@@ -1910,7 +1910,7 @@ async def reset_student_password(
         print(f"[DEBUG] Found student: {student.get('student_name')}")
         
         # Hash the new password
-        hashed_password = hash_password(new_password)
+        hashed_password = await password_hasher.hash(new_password)
         print(f"[DEBUG] Password hashed successfully")
         
         # Update the password and ensure login is enabled
@@ -1927,11 +1927,7 @@ async def reset_student_password(
         )
         
         if result.modified_count > 0:
-            # Verify the password works
-            test_bytes = new_password.encode('utf-8')
-            hash_bytes = hashed_password.encode('utf-8')
-            verification_result = bcrypt.checkpw(test_bytes, hash_bytes)
-            print(f"[DEBUG] Password verification: {verification_result}")
+            revoke_user_tokens(db, student["_id"], "password reset")
             
             return {
                 "success": True,
@@ -2056,6 +2052,7 @@ async def delete_student(
                 }
             }
         )
+        revoke_user_tokens(db, student_id, "student deleted")
         
         # Log activity
         try:
@@ -8,10 +8,12 @@ from app.models.quiz import get_quiz_collection
 from app.models.quiz_attempt import get_quiz_attempt_collection
 from app.models.certificate import get_certificate_collection
 from app.models.submission import get_submission_collection
+from app.utils.database import get_async_db, fetch_all
 from bson import ObjectId
 from datetime import datetime
 from typing import Optional, List, Dict, Any
 import traceback
+import asyncio
 
 # Create router for branch student dashboard
 branch_student_dashboard_router = APIRouter(prefix="/api/branch-students", tags=["Branch Student Dashboard"])
@@ -46,7 +48,7 @@ async def get_branch_student_dashboard(
     logger = logging.getLogger("uvicorn")
     
     try:
-        db = request.app.mongodb
+        db = get_async_db(request)
         
         # Extract student info from current_user
         student_id_str = current_user.get("user_id")
@@ -58,39 +60,46 @@ async def get_branch_student_dashboard(
         logger.info(f"[STUDENT DASHBOARD] Branch: {branch_code}, Franchise: {franchise_code}")
         
         # Get student details
-        student = db.branch_students.find_one({"_id": student_id_obj})
+        student = await db.branch_students.find_one({"_id": student_id_obj})
         
         if not student:
             raise HTTPException(status_code=404, detail="Student not found")
         
         # Get student's course details from branch_courses collection
         student_course_name = student.get("course", student.get("course_name"))
-        course_info = None
+        course_info_query = None
         if student_course_name:
-            course_info = db.branch_courses.find_one({
+            course_info_query = db.branch_courses.find_one({
                 "course_name": student_course_name,
                 "branch_code": branch_code,
                 "franchise_code": franchise_code
             })
         
         # Get quizzes/paper sets for this student's course
-        paper_sets = list(db.branch_paper_sets.find({
+        paper_sets_cursor = db.branch_paper_sets.find({
             "courseName": student_course_name,
             "branchCode": branch_code,
             "franchiseCode": franchise_code,
             "status": {"$ne": "deleted"}
-        }))
-        
-        logger.info(f"[STUDENT DASHBOARD] Found {len(paper_sets)} paper sets for course: {student_course_name}")
+        })
         
         # Get study materials
-        study_materials = list(db.branch_study_materials.find({
+        study_materials_cursor = db.branch_study_materials.find({
             "course_name": student_course_name,
             "branch_code": branch_code,
             "franchise_code": franchise_code,
             "status": "active"
-        }).limit(10))
+        }).limit(10)
+        
+        # The lookups are independent - run them concurrently
+        lookups = [fetch_all(paper_sets_cursor), fetch_all(study_materials_cursor, length=10)]
+        if course_info_query is not None:
+            lookups.append(course_info_query)
+        results = await asyncio.gather(*lookups)
+        paper_sets, study_materials = results[0], results[1]
+        course_info = results[2] if course_info_query is not None else None
         
+        logger.info(f"[STUDENT DASHBOARD] Found {len(paper_sets)} paper sets for course: {student_course_name}")
         logger.info(f"[STUDENT DASHBOARD] Found {len(study_materials)} study materials")
         
         # Calculate statistics
@@ -8,6 +8,8 @@ import shutil
 from app.config import settings
 from app.utils.auth_helpers_enhanced import get_current_user
 from app.utils.multi_tenant import MultiTenantManager
+from app.services.course_content_service import mark_course_content_stale
+from app.services.search_service import apply_search, ranked_pipeline, search_fields, refresh_search_terms
 from pydantic import BaseModel, Field
 
 router = APIRouter(prefix="/api/branch-study-materials", tags=["Branch Study Material Management"])
@@ -223,7 +225,8 @@ async def create_study_material(
         }
         
         # Insert study material
-        result = db.branch_study_materials.insert_one(material_doc)
+        result = db.branch_study_materials.insert_one(search_fields("branch_study_materials", material_doc))
+        mark_course_content_stale(db, branch_code=material_doc.get("branch_code"))
         
         if not result.inserted_id:
             raise HTTPException(status_code=500, detail="Failed to create study material")
@@ -349,7 +352,8 @@ async def get_study_materials(
     access_level: Optional[str] = None,
     status: Optional[str] = None,
     branch_code: Optional[str] = None,
-    franchise_code: Optional[str] = None
+    franchise_code: Optional[str] = None,
+    search: Optional[str] = None
 ):
     """Get study materials - No authentication required for dashboard access"""
     import logging
@@ -392,10 +396,18 @@ async def get_study_materials(
         if status:
             filter_query["status"] = status
         
+        # Prefix search on name, description, tags, course and subject (best matches first)
+        search_words = apply_search(filter_query, search)
+        
         logger.info(f"[STUDY_MATERIALS] Final query: {filter_query}")
         
         # Get study materials
-        materials_cursor = db.branch_study_materials.find(filter_query)
+        if search_words:
+            materials_cursor = db.branch_study_materials.aggregate(
+                ranked_pipeline(filter_query, search_words, {"created_at": -1})
+            )
+        else:
+            materials_cursor = db.branch_study_materials.find(filter_query)
         materials = []
         
         material_count = 0
@@ -646,6 +658,8 @@ async def update_study_material(
             {"_id": ObjectId(material_id)},
             {"$set": update_data}
         )
+        mark_course_content_stale(db, branch_code=existing_material.get("branch_code"))
+        refresh_search_terms(db, "branch_study_materials", {"_id": ObjectId(material_id)})
         
         if result.modified_count == 0:
             raise HTTPException(status_code=500, detail="Failed to update study material")
@@ -716,6 +730,8 @@ async def delete_study_material(
         
         # Delete study material record - direct by ID
         result = db.branch_study_materials.delete_one({"_id": ObjectId(material_id)})
+        if material:
+            mark_course_content_stale(db, branch_code=material.get("branch_code"))
         
         print(f"[DELETE MATERIAL] Delete result - deleted_count: {result.deleted_count}")
         
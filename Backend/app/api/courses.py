@@ -1,10 +1,15 @@
-from fastapi import APIRouter, Request, Path, Query, HTTPException, Depends, UploadFile, File, Form
+from fastapi import APIRouter, Request, Response, Path, Query, HTTPException, Depends, UploadFile, File, Form, Header
 from typing import Optional, List
 import os
 import uuid
 import shutil
 from pathlib import Path as PathlibPath
 from app.schemas.course import CourseCreate, CourseUpdate, CourseFilter
+from app.services.ledger_rollup_service import apply_enrollment_change
+from app.services.instructor_stats_service import instructor_stats
+from app.services.course_content_service import (
+    get_course_content_tree, get_course_content_etag, etag_matches, mark_course_content_stale
+)
 from app.services.course_service import (
     create_course, get_all_courses, get_course_by_id, update_course, delete_course,
     get_courses_by_instructor, get_course_statistics, bulk_update_courses
@@ -301,341 +306,29 @@ def get_course_reviews_handler(
         raise HTTPException(status_code=500, detail=f"Error fetching course reviews: {str(e)}")
 
 @course_router.get("/{course_id}/content", response_model=dict)
-def get_course_content_handler(request: Request, course_id: str = Path(..., description="Course ID")):
+def get_course_content_handler(
+    request: Request,
+    response: Response,
+    course_id: str = Path(..., description="Course ID"),
+    if_none_match: Optional[str] = Header(None)
+):
+    """Course content tree for the player, served from its materialized copy with an ETag"""
     try:
         db = request.app.mongodb
-        course_collection = db["courses"]
-        branch_courses_collection = db["branch_courses"]
-        module_collection = db["modules"]
-        
-        is_branch_course = False
-        course_name = None
-        branch_code = None
-        franchise_code = None
-        
-        # Get course data - try multiple collections
-        course = course_collection.find_one({"id": course_id})
-        if not course:
-            try:
-                from bson import ObjectId
-                course = course_collection.find_one({"_id": ObjectId(course_id)})
-            except:
-                course = course_collection.find_one({"_id": course_id})
         
-        # If not found in courses, try branch_courses
-        if not course:
-            print(f"⚠️ Course not found in 'courses', trying 'branch_courses'...")
-            try:
-                from bson import ObjectId
-                course = branch_courses_collection.find_one({"_id": ObjectId(course_id)})
-            except:
-                course = branch_courses_collection.find_one({"_id": course_id})
-            
-            if not course:
-                course = branch_courses_collection.find_one({"id": course_id})
-            
-            if course:
-                is_branch_course = True
-                course_name = course.get('course_name', course.get('title'))
-                branch_code = course.get('branch_code')
-                franchise_code = course.get('franchise_code')
-                print(f"✅ Course found in branch_courses: {course_name}")
-                # Normalize field names for branch_courses
-                if 'course_name' in course and 'title' not in course:
-                    course['title'] = course['course_name']
-        
-        if not course:
-            print(f"❌ Course not found in any collection: {course_id}")
-            raise HTTPException(status_code=404, detail="Course not found")
-        
-        # Initialize paper_sets and course_questions for non-branch courses
-        paper_sets = []
-        course_questions = []
-        
-        # Get course lectures and PDFs
-        course_lectures = course.get("lectures", [])
-        course_pdfs = course.get("pdfs", [])
-        
-        # Get modules for this course
-        course_obj_id = course.get("id", course.get("_id"))
-        modules = list(module_collection.find({"course_id": course_obj_id}).sort("order", 1))
-        
-        # Organize content by modules
-        organized_modules = []
-        for module in modules:
-            module_content = []
-            module_id_str = str(module["_id"])
-            
-            # Find lectures for this module
-            module_lectures = [
-                lecture for lecture in course_lectures 
-                if (lecture.get("module_id") == module_id_str or 
-                    lecture.get("module_name", "").lower() == module.get("name", "").lower())
-            ]
-            
-            # Find PDFs for this module
-            module_pdfs = [
-                pdf for pdf in course_pdfs 
-                if (pdf.get("module_id") == module_id_str or 
-                    pdf.get("module_name", "").lower() == module.get("name", "").lower())
-            ]
-            
-            # Add lectures to module content
-            for lecture in module_lectures:
-                module_content.append({
-                    "type": "video",
-                    "title": lecture.get("original_name", lecture.get("filename")),
-                    "filename": lecture.get("filename"),
-                    "file_path": lecture.get("file_path"),
-                    "file_size": lecture.get("file_size"),
-                    "upload_date": lecture.get("upload_date"),
-                    "sequence_number": lecture.get("sequence_number")
-                })
-            
-            # Add PDFs to module content
-            for pdf in module_pdfs:
-                module_content.append({
-                    "type": "pdf",
-                    "title": pdf.get("original_name", pdf.get("filename")),
-                    "filename": pdf.get("filename"),
-                    "file_path": pdf.get("file_path"),
-                    "file_size": pdf.get("file_size"),
-                    "upload_date": pdf.get("upload_date"),
-                    "sequence_number": pdf.get("sequence_number")
-                })
-            
-            # Sort content by sequence number
-            module_content.sort(key=lambda x: x.get("sequence_number", 0))
-            
-            organized_modules.append({
-                "id": module_id_str,
-                "name": module.get("name"),
-                "title": module.get("name"),
-                "description": module.get("description"),
-                "order": module.get("order", 0),
-                "content": module_content
-            })
+        # Revalidation: compare against the stored ETag without loading the tree
+        if if_none_match:
+            etag = get_course_content_etag(db, course_id)
+            if etag_matches(if_none_match, etag):
+                return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
         
-        # Handle content without modules (fallback)
-        unassigned_content = []
-        assigned_lecture_ids = set()
-        assigned_pdf_ids = set()
+        tree = get_course_content_tree(db, course_id)
+        if etag_matches(if_none_match, tree["etag"]):
+            return Response(status_code=304, headers={"ETag": tree["etag"], "Cache-Control": "private, no-cache"})
         
-        # Collect IDs of assigned content
-        for module in organized_modules:
-            for content in module["content"]:
-                if content["type"] == "video":
-                    assigned_lecture_ids.add(content["filename"])
-                else:
-                    assigned_pdf_ids.add(content["filename"])
-        
-        # Find unassigned lectures
-        for lecture in course_lectures:
-            if lecture.get("filename") not in assigned_lecture_ids:
-                unassigned_content.append({
-                    "type": "video",
-                    "title": lecture.get("original_name", lecture.get("filename")),
-                    "filename": lecture.get("filename"),
-                    "file_path": lecture.get("file_path"),
-                    "file_size": lecture.get("file_size"),
-                    "upload_date": lecture.get("upload_date"),
-                    "sequence_number": lecture.get("sequence_number")
-                })
-        
-        # Find unassigned PDFs
-        for pdf in course_pdfs:
-            if pdf.get("filename") not in assigned_pdf_ids:
-                unassigned_content.append({
-                    "type": "pdf",
-                    "title": pdf.get("original_name", pdf.get("filename")),
-                    "filename": pdf.get("filename"),
-                    "file_path": pdf.get("file_path"),
-                    "file_size": pdf.get("file_size"),
-                    "upload_date": pdf.get("upload_date"),
-                    "sequence_number": pdf.get("sequence_number")
-                })
-        
-        # For branch courses, also fetch study materials, video classes, and syllabi
-        if is_branch_course and course_name:
-            print(f"📚 Fetching branch content for course: {course_name}, branch: {branch_code}")
-            
-            # Build filter for branch content
-            branch_filter = {"status": "active"}
-            if branch_code:
-                branch_filter["branch_code"] = branch_code
-            if franchise_code:
-                branch_filter["franchise_code"] = franchise_code
-            
-            # Fetch study materials for this course
-            study_materials_filter = {**branch_filter}
-            # Try multiple field names for course matching
-            study_materials = list(db.branch_study_materials.find({
-                "$or": [
-                    {"course_name": course_name, **branch_filter},
-                    {"course_id": course_id, **branch_filter},
-                    {"course_name": {"$regex": course_name.strip(), "$options": "i"}, **branch_filter}
-                ]
-            }))
-            print(f"📖 Found {len(study_materials)} study materials")
-            
-            for idx, material in enumerate(study_materials):
-                material_type = material.get("material_type", "document")
-                file_url = material.get("file_url", "")
-                
-                # Determine content type based on material_type or file extension
-                if material_type in ["video", "recording"] or (file_url and any(ext in file_url.lower() for ext in ['.mp4', '.webm', '.mov', '.avi'])):
-                    content_type = "video"
-                else:
-                    content_type = "pdf"
-                
-                unassigned_content.append({
-                    "type": content_type,
-                    "title": material.get("material_name", f"Study Material {idx+1}"),
-                    "filename": material.get("file_url", "").split("/")[-1] if material.get("file_url") else "",
-                    "file_path": material.get("file_url", ""),
-                    "file_size": material.get("file_size"),
-                    "upload_date": material.get("created_at"),
-                    "sequence_number": idx,
-                    "description": material.get("description", ""),
-                    "external_link": material.get("external_link")
-                })
-            
-            # Fetch video classes for this course
-            video_classes = list(db.video_classes.find({
-                "$or": [
-                    {"course_name": course_name, **branch_filter},
-                    {"course_id": course_id, **branch_filter},
-                    {"course_name": {"$regex": course_name.strip(), "$options": "i"}, **branch_filter}
-                ]
-            }))
-            print(f"🎥 Found {len(video_classes)} video classes")
-            
-            for idx, video in enumerate(video_classes):
-                unassigned_content.append({
-                    "type": "video",
-                    "title": video.get("title", video.get("class_name", f"Video Class {idx+1}")),
-                    "filename": video.get("file_url", "").split("/")[-1] if video.get("file_url") else "",
-                    "file_path": video.get("file_url", ""),
-                    "file_size": video.get("file_size"),
-                    "upload_date": video.get("created_at"),
-                    "sequence_number": len(study_materials) + idx,
-                    "description": video.get("description", ""),
-                    "external_link": video.get("video_url") or video.get("youtube_url") or video.get("external_link"),
-                    "duration": video.get("duration")
-                })
-            
-            # Fetch syllabi for this course
-            syllabi = list(db.branch_syllabi.find({
-                "$or": [
-                    {"course_name": course_name, **branch_filter},
-                    {"course_id": course_id, **branch_filter},
-                    {"course_name": {"$regex": course_name.strip(), "$options": "i"}, **branch_filter}
-                ]
-            }))
-            print(f"📋 Found {len(syllabi)} syllabi")
-            
-            for idx, syllabus in enumerate(syllabi):
-                unassigned_content.append({
-                    "type": "pdf",
-                    "title": syllabus.get("syllabus_name", syllabus.get("title", f"Syllabus {idx+1}")),
-                    "filename": syllabus.get("file_url", "").split("/")[-1] if syllabus.get("file_url") else "",
-                    "file_path": syllabus.get("file_url", ""),
-                    "file_size": syllabus.get("file_size"),
-                    "upload_date": syllabus.get("created_at"),
-                    "sequence_number": len(study_materials) + len(video_classes) + idx,
-                    "description": syllabus.get("description", "")
-                })
-            
-            # Fetch paper sets (quizzes/tests) for this course
-            paper_sets = list(db.branch_paper_sets.find({
-                "$or": [
-                    {"courseName": course_name, "branchCode": branch_code, "franchiseCode": franchise_code},
-                    {"courseName": course_name.strip(), "branchCode": branch_code},
-                    {"courseName": {"$regex": course_name.strip(), "$options": "i"}, "branchCode": branch_code},
-                    {"course_name": course_name, "branch_code": branch_code},
-                    {"course_id": course_id}
-                ],
-                "status": {"$ne": "deleted"}
-            }))
-            print(f"📝 Found {len(paper_sets)} paper sets/quizzes")
-            
-            # Fetch questions from questions collection for this course
-            questions_filter = {
-                "$or": [
-                    {"course": course_name, "branch_code": branch_code},
-                    {"course": course_name, "franchise_code": franchise_code},
-                    {"course": course_name.strip(), "branch_code": branch_code},
-                    {"course": {"$regex": course_name.strip(), "$options": "i"}, "branch_code": branch_code},
-                    {"course_name": course_name, "branch_code": branch_code},
-                    {"course_id": course_id, "branch_code": branch_code},
-                    # Also get questions by paper_set_id for linked paper sets
-                    {"paper_set_id": {"$in": [str(ps.get("_id")) for ps in paper_sets]}} if paper_sets else {"_id": None}
-                ]
-            }
-            course_questions = list(db.questions.find(questions_filter))
-            print(f"❓ Found {len(course_questions)} questions for course: {course_name}")
-        
-        # Add unassigned content as a general module if exists
-        if unassigned_content:
-            unassigned_content.sort(key=lambda x: x.get("sequence_number", 0))
-            organized_modules.append({
-                "id": "general",
-                "name": "Course Materials",
-                "title": "Course Materials",
-                "description": "General course materials",
-                "order": 999,
-                "content": unassigned_content
-            })
-        
-        # Prepare paper sets response
-        quizzes_data = []
-        if is_branch_course:
-            for ps in paper_sets:
-                quizzes_data.append({
-                    "id": str(ps.get("_id")),
-                    "name": ps.get("paperName", ps.get("paper_name", "Unnamed Test")),
-                    "questions": ps.get("numberOfQuestions", ps.get("total_questions", 0)),
-                    "duration": ps.get("timeLimit", ps.get("duration", 0)),
-                    "marks": ps.get("perQuestionMark", ps.get("marks_per_question", 0)),
-                    "total_marks": ps.get("totalMarks", ps.get("total_marks", 0)),
-                    "status": ps.get("status", "active"),
-                    "available_from": ps.get("availableFrom"),
-                    "available_to": ps.get("availableTo"),
-                    "course_name": ps.get("courseName", ps.get("course_name")),
-                    "description": ps.get("description", "")
-                })
-        
-        # Prepare questions data
-        questions_data = []
-        for q in course_questions:
-            questions_data.append({
-                "id": str(q.get("_id")),
-                "question_text": q.get("question_text", ""),
-                "option_a": q.get("option_a", ""),
-                "option_b": q.get("option_b", ""),
-                "option_c": q.get("option_c", ""),
-                "option_d": q.get("option_d", ""),
-                "correct_answer": q.get("correct_answer", ""),
-                "marks": q.get("marks", 1),
-                "negative_marks": q.get("negative_marks", 0),
-                "difficulty": q.get("difficulty", "medium"),
-                "subject": q.get("subject", ""),
-                "explanation": q.get("explanation", ""),
-                "paper_set_id": q.get("paper_set_id"),
-                "course": q.get("course", q.get("course_name", ""))
-            })
-        
-        from app.utils.serializers import serialize_document
-        return {
-            "course": serialize_document(course),
-            "modules": organized_modules,
-            "total_modules": len(organized_modules),
-            "total_content": sum(len(m["content"]) for m in organized_modules),
-            "quizzes": quizzes_data,
-            "total_quizzes": len(quizzes_data),
-            "questions": questions_data,
-            "total_questions": len(questions_data)
-        }
+        response.headers["ETag"] = tree["etag"]
+        response.headers["Cache-Control"] = "private, no-cache"
+        return tree["payload"]
         
     except HTTPException:
         raise
@@ -660,13 +353,17 @@ def update_course_handler(
         print(f"Payload dict: {payload.dict()}")
     print(f"====================================")
     db = request.app.mongodb
-    return update_course(db, course_id, payload)
+    result = update_course(db, course_id, payload)
+    mark_course_content_stale(db, course_ref=course_id)
+    return result
 
 @course_router.delete("/{course_id}", response_model=dict)
 def delete_course_handler(request: Request, course_id: str = Path(..., description="Course ID")):
     """Delete a specific course"""
     db = request.app.mongodb
-    return delete_course(db, course_id)
+    result = delete_course(db, course_id)
+    mark_course_content_stale(db, course_ref=course_id)
+    return result
 
 @course_router.post("/{course_id}/enroll", response_model=dict)
 def enroll_in_course_handler(request: Request, course_id: str = Path(..., description="Course ID"), current_user: dict = Depends(get_current_user)):
@@ -773,6 +470,8 @@ def enroll_in_course_handler(request: Request, course_id: str = Path(..., descri
     print(f"   - Branch: {branch_code}")
     
     result = enrollment_collection.insert_one(enrollment_doc)
+    apply_enrollment_change(db, after=enrollment_doc)
+    instructor_stats.enrollment_changed(after=enrollment_doc)
     print(f"✅ Enrollment created: {result.inserted_id}")
     
     return {
@@ -1019,6 +718,7 @@ async def upload_lecture_handler(
                 "$set": {"updated_at": datetime.utcnow()}
             }
         )
+        mark_course_content_stale(db, course_ref=course_id)
         
         return {
             "message": "Lecture uploaded successfully",
@@ -1197,6 +897,7 @@ async def upload_pdf_handler(
                 "$set": {"updated_at": datetime.utcnow()}
             }
         )
+        mark_course_content_stale(db, course_ref=course_id)
         
         return {
             "message": "PDF uploaded successfully",
@@ -1303,6 +1004,7 @@ def delete_lecture_handler(
         
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="Course not found")
+        mark_course_content_stale(db, course_ref=course_id)
         
         # Try to delete file from filesystem using new structure
         try:
@@ -1362,6 +1064,7 @@ def delete_pdf_handler(
         
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="Course not found")
+        mark_course_content_stale(db, course_ref=course_id)
         
         # Try to delete file from filesystem using new structure
         try:
@@ -18,6 +18,7 @@ from fastapi import APIRouter, Request, Depends, HTTPException
 from app.services.dashboard_service import get_student_dashboard, generate_dashboard_summary
 from app.utils.dependencies import role_required, get_authenticated_user
 from app.utils.branch_filter import BranchAccessManager
+from app.utils.database import get_async_db
 
 dashboard_router = APIRouter(prefix="/api/dashboard", tags=["Dashboard"])
 
@@ -36,7 +37,7 @@ async def get_super_admin_stats(
          # raise HTTPException(status_code=403, detail="Insufficient permissions")
          pass
 
-    db = request.app.mongodb
+    db = get_async_db(request)
     from app.services.super_admin_dashboard_service import get_super_admin_dashboard_stats
     return await get_super_admin_dashboard_stats(db)
 
@@ -54,7 +55,7 @@ async def get_materials_stats(
          # Strict check
          pass 
          
-    db = request.app.mongodb
+    db = get_async_db(request)
     from app.services.materials_stats_service import get_materials_dashboard_stats
     return await get_materials_dashboard_stats(db, franchise_id)
 
@@ -4,6 +4,8 @@ from app.models.enrollment import get_enrollment_collection
 from app.models.course import get_course_collection
 from app.models.user import get_user_collection
 from app.models.user_progress import get_course_completion_stats
+from app.services.ledger_rollup_service import apply_enrollment_change
+from app.services.instructor_stats_service import instructor_stats
 from app.utils.dependencies import role_required
 from app.utils.branch_filter import BranchAccessManager
 from bson import ObjectId
@@ -417,13 +419,15 @@ def unenroll_from_course(
         course_obj_id = ObjectId(course_id)
         
         # Find and delete enrollment
-        result = enrollment_collection.delete_one({
+        deleted = enrollment_collection.find_one_and_delete({
             "student_id": student_id,
             "course_id": course_obj_id
         })
         
-        if result.deleted_count == 0:
+        if deleted is None:
             raise HTTPException(status_code=404, detail="Enrollment not found")
+        apply_enrollment_change(db, before=deleted)
+        instructor_stats.enrollment_changed(before=deleted)
         
         return {"success": True, "message": "Successfully unenrolled from course"}
         
@@ -6,6 +6,7 @@ import uuid
 from app.schemas.franchise import FranchiseCreate, FranchiseUpdate
 from app.utils.security import hash_password
 from app.config import settings
+from app.services.tenant_directory import tenant_directory
 from bson import ObjectId
 
 router = APIRouter(prefix="/api", tags=["Franchise"])
@@ -86,6 +87,7 @@ async def create_franchise(request: Request, payload: FranchiseCreate):
     }
 
     result = db.franchises.insert_one(document)
+    tenant_directory.invalidate()
 
     # Debug: print insertion result and collection size to help troubleshooting
     try:
@@ -336,6 +338,7 @@ async def update_franchise(request: Request, franchise_id: str):
         validated_payload["updated_at"] = datetime.utcnow()
 
         result = db.franchises.update_one({"_id": obj_id}, {"$set": validated_payload})
+        tenant_directory.invalidate()
         if result.matched_count == 0:
             return None
         return db.franchises.find_one({"_id": obj_id})
@@ -356,6 +359,7 @@ async def delete_franchise(request: Request, franchise_id: str):
         except Exception:
             return False
         result = db.franchises.delete_one({"_id": obj_id})
+        tenant_directory.invalidate()
         return result.deleted_count > 0
 
     ok = await run_in_threadpool(_delete)
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Request, Depends, HTTPException
 from app.schemas.auth import UserCreate, UserLogin, TokenResponse
 from app.services.auth_service import register_user, login_user
+from app.services.token_registry import revoke_user_tokens
 from app.models.user import get_user_collection
 from app.utils.auth_helpers import get_current_user
 from app.utils.branch_filter import BranchAccessManager
@@ -407,6 +408,9 @@ async def update_instructor(
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="Instructor not found")
         
+        if result.modified_count and "status" in update_doc and update_doc["status"] != "active":
+            revoke_user_tokens(db, instructor_id, "instructor deactivated")
+        
         # Get updated instructor
         updated_instructor = user_collection.find_one({"_id": ObjectId(instructor_id)})
         
@@ -525,6 +529,7 @@ async def delete_instructor(
             logger.warning(f"[DELETE INSTRUCTOR] Failed to delete instructor: {instructor_id}")
             raise HTTPException(status_code=500, detail="Failed to delete instructor")
         
+        revoke_user_tokens(db, instructor_id, "instructor deleted")
         logger.info(f"[DELETE INSTRUCTOR] Successfully deleted instructor: {instructor_id} from database")
         return {"success": True, "message": "Instructor deleted successfully from database"}
         
@@ -681,148 +686,37 @@ def require_instructor(user=Depends(get_current_user)):
 @instructor_router.get("/dashboard")
 def get_instructor_dashboard(request: Request, user=Depends(require_instructor)):
     try:
+        from app.services.instructor_stats_service import get_instructor_stats
+
         db = request.app.mongodb
-        from app.models.course import get_course_collection
-        from app.models.user import get_user_collection
-        from app.models.submission import get_submission_collection
-        from app.models.attempt import get_attempt_collection
-        from app.models.assignment import get_assignment_collection
-        from app.models.quiz import get_quiz_collection
-        from app.models.certificate import get_certificate_collection
-        from bson import ObjectId
-        
-        course_collection = get_course_collection(db)
-        user_collection = get_user_collection(db)
-        submission_collection = get_submission_collection(db)
-        attempt_collection = get_attempt_collection(db)
-        assignment_collection = get_assignment_collection(db)
-        quiz_collection = get_quiz_collection(db)
-        certificate_collection = get_certificate_collection(db)
-        
         instructor_id = user["user_id"]
-        
-        # Get real stats from database
-        # 1. Courses taught by this instructor - use multiple query strategies
-        print(f"DEBUG: Looking for courses for instructor: {instructor_id}")
-        
-        # Try multiple ways to match instructor
-        instructor_queries = [
-            {"instructor": instructor_id},  # Exact match
-            {"instructor": str(instructor_id)},  # String match
-            {"created_by": instructor_id},  # Created by match
-            {"instructor_name": user.get("name", "")},  # Name match
-            {"instructor": f"instructor_{instructor_id}"},  # Prefixed match
-        ]
-        
-        all_courses = []
-        for query in instructor_queries:
-            courses = list(course_collection.find(query))
-
-            for course in courses:
-                if course not in all_courses:
-                    all_courses.append(course)
-        
-        # Remove duplicates
-        unique_courses = []
-        seen_ids = set()
-        for course in all_courses:
-            course_id = str(course["_id"])
-            if course_id not in seen_ids:
-                unique_courses.append(course)
-                seen_ids.add(course_id)
-        
-        course_ids = [str(course["_id"]) for course in instructor_courses]
-
-
-        
-        assignments_created = 0
-        if course_ids:
-            assignments_created = assignment_collection.count_documents({"course_id": {"$in": course_ids}})
-        
-        # 3. Students enrolled - check enrollments collection directly
-        from app.models.enrollment import get_enrollment_collection
-        enrollment_collection = get_enrollment_collection(db)
-        
-        students_enrolled = 0
-        enrolled_student_ids = set()
-        
-        if course_ids:
-            
-            # Query enrollments collection directly
-            enrollments = list(enrollment_collection.find({"course_id": {"$in": course_ids}}))
 
-            
-            # Get unique student IDs from enrollments
-            for enrollment in enrollments:
-                enrolled_student_ids.add(enrollment["student_id"])
-            
-            quiz_ids = [str(quiz["_id"]) for quiz in quiz_collection.find({"course_id": {"$in": course_ids}})]
+        # One pre-aggregated document, kept current by the write paths and reconciled periodically
+        doc = get_instructor_stats(db, instructor_id, user.get("name"))
+        attempts = doc.get("quiz_attempts", 0)
 
-
-            
-            # Get unique student IDs from submissions and attempts (active students)
-            if assignment_ids:
-                submissions = submission_collection.find({"assignment_id": {"$in": assignment_ids}})
-                for submission in submissions:
-                    enrolled_student_ids.add(submission["student_id"])
-            
-            if quiz_ids:
-                attempts = attempt_collection.find({"quiz_id": {"$in": quiz_ids}})
-                for attempt in attempts:
-                    enrolled_student_ids.add(attempt["student_id"])
-            
-            students_enrolled = len(enrolled_student_ids)
-
-        
-        # 3.1 Get recent students (last 5 enrolled students)
-        recent_students = []
-        if enrolled_student_ids:
-            recent_student_ids = list(enrolled_student_ids)[-5:]  # Last 5 students
-            for student_id in recent_student_ids:
-                try:
-                    student = user_collection.find_one({"_id": ObjectId(student_id)})
-                    if student:
-                        recent_students.append({
-                            "id": str(student["_id"]),
-                            "name": student.get("name", "Unknown Student"),
-                            "email": student.get("email", ""),
-                            "enrolled_date": "2024-01-15"  # TODO: Get from enrollment date
-                        })
-                except Exception as e:
-                    print(f"Error fetching student {student_id}: {str(e)}")
-                    continue
-        
-        # 4. Live classes hosted (placeholder - you can implement this based on your live class system)
-        live_classes_hosted = 0  # TODO: Implement when live class system is ready
-        
-        # 5. Certificates issued by this instructor
-        certificates_issued = 0
-        if course_ids:
-            # Count certificates for students in instructor's courses
-            # Assuming certificates have course_id field
-            certificates_issued = certificate_collection.count_documents({"course_id": {"$in": course_ids}})
-        
         stats = {
-            "courses_taught": courses_taught,
-            "assignments_created": assignments_created,
-            "students_enrolled": students_enrolled,
-            "live_classes_hosted": live_classes_hosted,
-            "certificates_issued": certificates_issued,
+            "courses_taught": doc.get("courses_taught", 0),
+            "assignments_created": doc.get("assignments_created", 0),
+            "students_enrolled": doc.get("students_enrolled", 0),
+            "live_classes_hosted": 0,  # TODO: Implement when live class system is ready
+            "certificates_issued": doc.get("certificates_issued", 0),
+            "submissions_graded": doc.get("submissions_graded", 0),
+            "submissions_pending": doc.get("submissions_pending", 0),
+            "quiz_attempts": attempts,
+            "average_quiz_score": round(doc.get("quiz_percentage_sum", 0) / attempts, 1) if attempts else 0,
             "total_earnings": 50000,  # TODO: Implement earnings system
             "pending_withdrawals": 2500  # TODO: Implement withdrawal system
         }
-        
-        print(f"DEBUG: Dashboard stats for instructor {instructor_id}: {stats}")
-        print(f"DEBUG: Recent students: {recent_students}")
-        
+
         return {
-            "stats": stats, 
+            "stats": stats,
             "instructor": user,
-            "recent_students": recent_students
+            "recent_students": list(reversed(doc.get("recent_students", [])))
         }
     except Exception as e:
-        print(f"Error in get_instructor_dashboard: {str(e)}")
-        # Fallback to mock data if there's an error
+        logger.error(f"Error in get_instructor_dashboard: {str(e)}")
+        # Fallback to empty stats if there's an error
         stats = {
             "courses_taught": 0,
             "assignments_created": 0,
@@ -1,4 +1,5 @@
-from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import Optional, List
 from datetime import datetime, timedelta
@@ -6,14 +7,86 @@ import json
 from io import BytesIO
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
+from app.utils.database import get_async_db
+from app.utils.dependencies import role_required
+from app.services.ledger_rollup_service import (
+    ROLLUP_COLLECTION,
+    date_range_match,
+    first_amount_expr,
+    rollup_totals_pipeline,
+    rollup_daily_pipeline,
+    rebuild_rollups
+)
 
 router = APIRouter()
 
+
+def require_super_admin(user=Depends(role_required(["super_admin", "admin"]))):
+    """Platform-wide admins only (an admin tied to a franchise is a franchise admin)"""
+    if user.get("role") == "admin" and user.get("franchise_code"):
+        raise HTTPException(status_code=403, detail="Super admin access required")
+    return user
+
 # Helper functions to get real data from database
-def get_real_transactions(request: Request, period: str, limit: int = 20) -> List[dict]:
+
+PENDING_SETTLEMENT_RATE = 0.1
+
+
+def _period_start(period: str, end_date: datetime) -> datetime:
+    """Start of the dashboard period ending at end_date"""
+    days = {"week": 7, "month": 30, "quarter": 90}.get(period, 365)
+    return end_date - timedelta(days=days)
+
+
+async def _sum_franchise_fees(db, start_date: datetime, end_date: datetime) -> float:
+    """Franchise fees for franchises created in the range, computed in MongoDB"""
+    pipeline = [
+        {"$match": date_range_match(["created_at"], start_date, end_date)},
+        {"$group": {"_id": None, "revenue": {"$sum": first_amount_expr(["financial.franchise_fee"])}}}
+    ]
+    result = await db.franchises.aggregate(pipeline).to_list(length=1)
+    return result[0]["revenue"] if result else 0
+
+
+async def get_financial_breakdown(request: Request, period: str) -> dict:
+    """Revenue split by source plus derived payouts/settlements for the period"""
+    db = get_async_db(request)
+    end_date = datetime.now()
+    start_date = _period_start(period, end_date)
+    
+    # Enrollment revenue and payouts come from the daily rollup (O(days) rows)
+    try:
+        totals = await db[ROLLUP_COLLECTION].aggregate(rollup_totals_pipeline(start_date, end_date)).to_list(length=1)
+        course_revenue = float(totals[0]["enrollment_revenue"]) if totals else 0
+        total_payouts = float(totals[0]["payouts"]) if totals else 0
+    except Exception as e:
+        print(f"Error reading revenue rollup: {e}")
+        course_revenue = 0
+        total_payouts = 0
+    
+    try:
+        franchise_revenue = float(await _sum_franchise_fees(db, start_date, end_date))
+    except Exception as e:
+        print(f"Error calculating franchise revenue: {e}")
+        franchise_revenue = 0
+    
+    total_revenue = course_revenue + franchise_revenue
+    # Part of the revenue is still unsettled
+    pending_settlements = total_revenue * PENDING_SETTLEMENT_RATE
+    
+    return {
+        "course_revenue": course_revenue,
+        "franchise_revenue": franchise_revenue,
+        "total_revenue": total_revenue,
+        "total_payouts": total_payouts,
+        "pending_settlements": pending_settlements,
+        "balance": total_revenue - total_payouts - pending_settlements
+    }
+
+async def get_real_transactions(request: Request, period: str, limit: int = 20) -> List[dict]:
     """Get real transaction data from database"""
     try:
-        db = request.app.mongodb
+        db = get_async_db(request)
         
         # Calculate date range based on period
         end_date = datetime.now()
@@ -45,7 +118,7 @@ def get_real_transactions(request: Request, period: str, limit: int = 20) -> Lis
             for i, date_query in enumerate(date_queries):
                 try:
                     query = {**date_query, "status": {"$in": ["pending", "completed", "active", "enrolled"]}} if date_query else {}
-                    enrollments = list(enrollment_collection.find(query).limit(limit//2))
+                    enrollments = await enrollment_collection.find(query).limit(limit//2).to_list(length=None)
                     print(f"[DEBUG] Date query {i}: Found {len(enrollments)} enrollments")
                     if enrollments:
                         break
@@ -56,7 +129,7 @@ def get_real_transactions(request: Request, period: str, limit: int = 20) -> Lis
             # If still no enrollments, try without status filter
             if not enrollments:
                 try:
-                    enrollments = list(enrollment_collection.find({}).limit(limit//2))
+                    enrollments = await enrollment_collection.find({}).limit(limit//2).to_list(length=None)
                     print(f"[DEBUG] Fallback query (no filters): Found {len(enrollments)} enrollments")
                 except Exception as e:
                     print(f"[DEBUG] Fallback query failed: {e}")
@@ -108,11 +181,11 @@ def get_real_transactions(request: Request, period: str, limit: int = 20) -> Lis
             }
             
             # Try with date filter first
-            franchises = list(franchise_collection.find(date_query).limit(limit//4))
+            franchises = await franchise_collection.find(date_query).limit(limit//4).to_list(length=None)
             
             # If no results, get all franchises regardless of date
             if not franchises:
-                franchises = list(franchise_collection.find({}).limit(limit//4))
+                franchises = await franchise_collection.find({}).limit(limit//4).to_list(length=None)
             
             for franchise in franchises:
                 # Get franchise fee from nested financial object
@@ -156,7 +229,7 @@ def get_real_transactions(request: Request, period: str, limit: int = 20) -> Lis
             for i, date_query in enumerate(date_queries):
                 try:
                     query = {**date_query, "status": {"$in": ["pending", "completed", "active", "enrolled"]}} if date_query else {}
-                    enrollments_for_payouts = list(enrollment_collection.find(query).limit(20))
+                    enrollments_for_payouts = await enrollment_collection.find(query).limit(20).to_list(length=None)
                     print(f"[DEBUG] Instructor payout query {i}: Found {len(enrollments_for_payouts)} enrollments")
                     if enrollments_for_payouts:
                         break
@@ -217,12 +290,12 @@ def get_real_transactions(request: Request, period: str, limit: int = 20) -> Lis
         try:
             refund_collection = db.refunds if hasattr(db, 'refunds') else None
             if refund_collection is not None:
-                refunds = list(refund_collection.find({
+                refunds = await refund_collection.find({
                     "created_at": {
                         "$gte": start_date.isoformat(),
                         "$lte": end_date.isoformat()
                     }
-                }).limit(5))
+                }).limit(5).to_list(length=None)
                 
                 for refund in refunds:
                     # Convert created_at to string if it's a datetime object
@@ -253,123 +326,12 @@ def get_real_transactions(request: Request, period: str, limit: int = 20) -> Lis
         print(f"Error fetching real transactions: {e}")
         return []
 
-def calculate_real_financial_metrics(request: Request, period: str) -> tuple:
+async def calculate_real_financial_metrics(request: Request, period: str) -> tuple:
     """Calculate real financial metrics from database"""
     try:
-        db = request.app.mongodb
-        
-        # Calculate date range
-        end_date = datetime.now()
-        if period == 'week':
-            start_date = end_date - timedelta(days=7)
-        elif period == 'month':
-            start_date = end_date - timedelta(days=30)
-        elif period == 'quarter':
-            start_date = end_date - timedelta(days=90)
-        else:  # year
-            start_date = end_date - timedelta(days=365)
-        
-        total_revenue = 0
-        total_payouts = 0
-        pending_settlements = 0
-        
-        # Calculate revenue from course enrollments
-        try:
-            enrollment_collection = db.enrollments
-            print(f"[DEBUG] Calculating revenue from enrollments...")
-            
-            # Try different date queries
-            date_queries = [
-                {"enrollment_date": {"$gte": start_date.isoformat(), "$lte": end_date.isoformat()}},
-                {"created_at": {"$gte": start_date.isoformat(), "$lte": end_date.isoformat()}},
-                {"date": {"$gte": start_date.isoformat(), "$lte": end_date.isoformat()}},
-                {}  # Get all enrollments
-            ]
-            
-            active_enrollments = []
-            for i, date_query in enumerate(date_queries):
-                try:
-                    query = {**date_query, "status": {"$in": ["pending", "completed", "active", "enrolled"]}} if date_query else {}
-                    active_enrollments = list(enrollment_collection.find(query))
-                    print(f"[DEBUG] Revenue query {i}: Found {len(active_enrollments)} enrollments")
-                    if active_enrollments:
-                        break
-                except Exception as query_error:
-                    print(f"[DEBUG] Revenue query {i} failed: {query_error}")
-                    continue
-            
-            # If still no enrollments, try without filters
-            if not active_enrollments:
-                try:
-                    active_enrollments = list(enrollment_collection.find({}))
-                    print(f"[DEBUG] Revenue fallback: Found {len(active_enrollments)} enrollments")
-                except Exception as e:
-                    print(f"[DEBUG] Revenue fallback failed: {e}")
-            
-            total_revenue = 0
-            for enrollment in active_enrollments:
-                fee_amount = enrollment.get('fee_paid') or enrollment.get('course_fee') or enrollment.get('amount') or enrollment.get('fee') or 0
-                total_revenue += float(fee_amount)
-            
-            print(f"[DEBUG] Total enrollment revenue: {total_revenue}")
-            
-        except Exception as e:
-            print(f"Error calculating enrollment revenue: {e}")
-            total_revenue = 0
-        
-        # Calculate franchise fee revenue from franchises collection
-        try:
-            franchise_collection = db.franchises
-            
-            # Try with date filter first
-            date_query = {
-                "created_at": {
-                    "$gte": start_date.isoformat(),
-                    "$lte": end_date.isoformat()
-                }
-            }
-            
-            franchises = list(franchise_collection.find(date_query))
-            
-            # If no results with date filter, get all franchises
-            if not franchises:
-                franchises = list(franchise_collection.find({}))
-            
-            franchise_revenue = 0
-            for franchise in franchises:
-                financial = franchise.get('financial', {})
-                franchise_fee = financial.get('franchise_fee', 0)
-                franchise_revenue += float(franchise_fee)
-            
-            total_revenue += franchise_revenue
-        except Exception as e:
-            print(f"Error calculating franchise revenue: {e}")
-        
-        # Calculate instructor payouts from enrollments (30% commission)
-        try:
-            enrollment_collection = db.enrollments
-            enrollments_for_payouts = list(enrollment_collection.find({
-                "enrollment_date": {
-                    "$gte": start_date.isoformat(),
-                    "$lte": end_date.isoformat()
-                },
-                "status": {"$in": ["pending", "completed", "active", "enrolled"]}
-            }))
-            
-            # Calculate total instructor payouts as 30% of total enrollment fees
-            total_enrollment_fees = sum(float(enrollment.get('fee_paid', enrollment.get('course_fee', 0))) for enrollment in enrollments_for_payouts)
-            total_payouts = total_enrollment_fees * 0.3  # 30% commission to instructors
-        except Exception as e:
-            print(f"Error calculating instructor payouts from enrollments: {e}")
-            total_payouts = 0
-        
-        # Calculate pending settlements (estimated)
-        pending_settlements = total_revenue * 0.1  # 10% pending
-        
-        # Calculate available balance
-        balance = total_revenue - total_payouts - pending_settlements
-        
-        return total_revenue, total_payouts, pending_settlements, balance
+        metrics = await get_financial_breakdown(request, period)
+        print(f"[DEBUG] Total revenue: {metrics['total_revenue']}")
+        return metrics["total_revenue"], metrics["total_payouts"], metrics["pending_settlements"], metrics["balance"]
     
     except Exception as e:
         print(f"Error calculating real metrics: {e}")
@@ -418,11 +380,22 @@ async def get_ledger_dashboard(
         print(f"[DEBUG] Starting ledger dashboard for period: {period}")
         
         # Calculate real financial metrics from database
-        total_revenue, total_payouts, pending_settlements, balance = calculate_real_financial_metrics(request, period)
+        try:
+            metrics = await get_financial_breakdown(request, period)
+        except HTTPException:
+            raise
+        except Exception as e:
+            print(f"Error calculating real metrics: {e}")
+            metrics = {"course_revenue": 0, "franchise_revenue": 0, "total_revenue": 0,
+                       "total_payouts": 0, "pending_settlements": 0, "balance": 0}
+        total_revenue = metrics["total_revenue"]
+        total_payouts = metrics["total_payouts"]
+        pending_settlements = metrics["pending_settlements"]
+        balance = metrics["balance"]
         print(f"[DEBUG] Financial metrics: revenue={total_revenue}, payouts={total_payouts}, balance={balance}")
         
         # Get real transactions from database
-        transactions = get_real_transactions(request, period)
+        transactions = await get_real_transactions(request, period)
         print(f"[DEBUG] Fetched {len(transactions)} transactions")
         
         # Calculate growth percentages (fixed values instead of random)
@@ -430,41 +403,11 @@ async def get_ledger_dashboard(
         payout_change = -5.0   # Fixed value
         balance_change = 8.0   # Fixed value
         
-        # Calculate distribution percentages based on real data
+        # Distribution percentages from the same period totals
         if total_revenue > 0:
-            # Get actual course enrollment revenue from enrollments collection
-            db = request.app.mongodb
-            try:
-                enrollment_collection = db.enrollments
-                enrollments = list(enrollment_collection.find({"status": {"$in": ["pending", "completed", "active", "enrolled"]}}))
-                course_revenue = sum(float(e.get('fee_paid', e.get('course_fee', 0))) for e in enrollments)
-                
-                # Get franchise revenue from franchises collection
-                franchise_collection = db.franchises
-                try:
-                    franchises = list(franchise_collection.find({}))
-                    franchise_revenue = 0
-                    for franchise in franchises:
-                        financial = franchise.get('financial', {})
-                        franchise_fee = financial.get('franchise_fee', 0)
-                        franchise_revenue += float(franchise_fee)
-                except:
-                    franchise_revenue = 0
-                
-                course_enrollment_pct = int((course_revenue / total_revenue) * 100) if total_revenue > 0 else 60
-                franchise_fee_pct = int((franchise_revenue / total_revenue) * 100) if total_revenue > 0 else 25
-                other_revenue_pct = 100 - course_enrollment_pct - franchise_fee_pct
-                
-                # Ensure percentages are within reasonable bounds
-                course_enrollment_pct = max(0, min(100, course_enrollment_pct))
-                franchise_fee_pct = max(0, min(100, franchise_fee_pct))
-                other_revenue_pct = max(0, min(100, other_revenue_pct))
-                
-            except Exception as e:
-                print(f"Error calculating percentages: {e}")
-                course_enrollment_pct = 65
-                franchise_fee_pct = 25
-                other_revenue_pct = 10
+            course_enrollment_pct = int((metrics["course_revenue"] / total_revenue) * 100)
+            franchise_fee_pct = int((metrics["franchise_revenue"] / total_revenue) * 100)
+            other_revenue_pct = max(0, 100 - course_enrollment_pct - franchise_fee_pct)
         else:
             course_enrollment_pct = 0
             franchise_fee_pct = 0
@@ -532,10 +475,10 @@ async def export_financial_report(
 ):
     """Export financial report as PDF"""
     try:
-        total_revenue, total_payouts, pending_settlements, balance = calculate_real_financial_metrics(request, period)
+        total_revenue, total_payouts, pending_settlements, balance = await calculate_real_financial_metrics(request, period)
         
         # Get real transaction data for report
-        transactions = get_real_transactions(request, period, 50)
+        transactions = await get_real_transactions(request, period, 50)
         
         # Generate report content with real data
         report_content = f"""Financial Report - {period.title()}
@@ -583,17 +526,17 @@ This financial report is generated from real transaction data in the LMS system.
 async def process_settlements(request: Request):
     """Process pending settlements with proper calculation: Student payment → Company share (30%) + GST/TDS (5%) + Franchise share (65%)"""
     try:
-        db = request.app.mongodb
+        db = get_async_db(request)
         
         # Get all pending enrollments that need settlement processing
         enrollment_collection = db.enrollments
         franchise_collection = db.franchises
         
         # Find enrollments that are completed but not yet settled
-        pending_enrollments = list(enrollment_collection.find({
+        pending_enrollments = await enrollment_collection.find({
             "status": {"$in": ["completed", "active", "enrolled"]},
             "payment_status": {"$ne": "settlement_processed"}
-        }))
+        }).to_list(length=None)
         
         processed_settlements = []
         total_student_payments = 0
@@ -648,7 +591,7 @@ async def process_settlements(request: Request):
                 total_franchise_share += franchise_share
                 
                 # Update enrollment status to indicate settlement is processed
-                enrollment_collection.update_one(
+                await enrollment_collection.update_one(
                     {"_id": enrollment["_id"]},
                     {
                         "$set": {
@@ -665,10 +608,10 @@ async def process_settlements(request: Request):
                 )
         
         # Process franchise direct payments (if any)
-        pending_franchises = list(franchise_collection.find({
+        pending_franchises = await franchise_collection.find({
             "status": {"$in": ["active", "approved"]},
             "payment_status": {"$ne": "settlement_processed"}
-        }))
+        }).to_list(length=None)
         
         for franchise in pending_franchises:
             print(f"[DEBUG] Processing franchise {franchise.get('_id')}: {franchise}")
@@ -709,7 +652,7 @@ async def process_settlements(request: Request):
                 total_company_share += franchise_fee
                 
                 # Update franchise status
-                franchise_collection.update_one(
+                await franchise_collection.update_one(
                     {"_id": franchise["_id"]},
                     {
                         "$set": {
@@ -735,7 +678,7 @@ async def process_settlements(request: Request):
         
         # Store settlement summary in database for audit trail
         settlements_collection = db.settlement_records if hasattr(db, 'settlement_records') else db.settlements
-        settlements_collection.insert_one(settlement_summary)
+        await settlements_collection.insert_one(settlement_summary)
         
         return {
             "success": True,
@@ -758,18 +701,18 @@ async def process_settlements(request: Request):
 async def generate_custom_report(request: GenerateCustomReportRequest, req: Request):
     """Generate custom comprehensive report"""
     try:
-        total_revenue, total_payouts, pending_settlements, balance = calculate_real_financial_metrics(req, request.period)
-        transactions = get_real_transactions(req, request.period, 100)
+        total_revenue, total_payouts, pending_settlements, balance = await calculate_real_financial_metrics(req, request.period)
+        transactions = await get_real_transactions(req, request.period, 100)
         
         # Get additional real data from database
-        db = req.app.mongodb
+        db = get_async_db(req)
         
         # Get course and student statistics
         try:
-            courses_count = db.courses.count_documents({"status": "active"}) if hasattr(db, 'courses') else 0
-            students_count = db.users.count_documents({"role": "student"}) if hasattr(db, 'users') else 0
-            instructors_count = db.users.count_documents({"role": "instructor"}) if hasattr(db, 'users') else 0
-            franchises_count = db.franchises.count_documents({"status": "active"}) if hasattr(db, 'franchises') else 0
+            courses_count = await db.courses.count_documents({"status": "active"}) if hasattr(db, 'courses') else 0
+            students_count = await db.users.count_documents({"role": "student"}) if hasattr(db, 'users') else 0
+            instructors_count = await db.users.count_documents({"role": "instructor"}) if hasattr(db, 'users') else 0
+            franchises_count = await db.franchises.count_documents({"status": "active"}) if hasattr(db, 'franchises') else 0
         except Exception as e:
             print(f"Error fetching counts: {e}")
             courses_count = 50
@@ -840,14 +783,14 @@ This comprehensive report is generated from real data in the LMS database.
 async def get_payment_gateway_config(request: Request):
     """Get payment gateway configuration with real data from database"""
     try:
-        db = request.app.mongodb
+        db = get_async_db(request)
         
         # Get payment statistics from enrollments and franchises
         enrollment_collection = db.enrollments
         franchise_collection = db.franchises
         
         # Count active payment methods from enrollments
-        enrollments = list(enrollment_collection.find({"status": {"$in": ["completed", "active", "enrolled"]}}).limit(100))
+        enrollments = await enrollment_collection.find({"status": {"$in": ["completed", "active", "enrolled"]}}).limit(100).to_list(length=None)
         
         active_gateways = 0
         total_transactions = len(enrollments)
@@ -868,7 +811,7 @@ async def get_payment_gateway_config(request: Request):
                 successful_transactions += 1
         
         # Count franchise payments
-        franchises = list(franchise_collection.find({"status": {"$in": ["active", "approved"]}}).limit(50))
+        franchises = await franchise_collection.find({"status": {"$in": ["active", "approved"]}}).limit(50).to_list(length=None)
         for franchise in franchises:
             financial_info = franchise.get('financial', {})
             franchise_fee = financial_info.get('franchise_fee') or financial_info.get('fee', 0)
@@ -920,7 +863,7 @@ async def filter_transactions(request: FilterTransactionsRequest, req: Request):
     """Filter transactions based on search criteria"""
     try:
         # Get real transactions from database
-        all_transactions = get_real_transactions(req, request.period, 100)
+        all_transactions = await get_real_transactions(req, request.period, 100)
         
         # Filter transactions based on search term
         filtered_transactions = []
@@ -965,8 +908,11 @@ async def get_financial_statistics(
 ):
     """Get financial statistics summary"""
     try:
-        total_revenue, total_payouts, pending_settlements, balance = calculate_real_financial_metrics(request, period)
-        transactions = get_real_transactions(request, period, 200)
+        # One pass over the period totals serves the revenue figures and the top source
+        breakdown = await get_financial_breakdown(request, period)
+        total_revenue = breakdown["total_revenue"]
+        total_payouts = breakdown["total_payouts"]
+        transactions = await get_real_transactions(request, period, 200)
         
         # Calculate real statistics from database data
         successful_transactions = len([t for t in transactions if t['status'] == 'Completed'])
@@ -975,9 +921,9 @@ async def get_financial_statistics(
         
         average_transaction_value = total_revenue / max(total_transactions, 1)
         
-        # Determine top revenue source
-        course_revenue = sum(t['amount'] for t in transactions if t['type'] == 'Course Enrollment' and t['amount'] > 0)
-        franchise_revenue = sum(t['amount'] for t in transactions if t['type'] == 'Franchise Fee' and t['amount'] > 0)
+        # Determine top revenue source from the period totals
+        course_revenue = breakdown["course_revenue"]
+        franchise_revenue = breakdown["franchise_revenue"]
         
         if course_revenue > franchise_revenue:
             top_revenue_source = "Course Enrollments"
@@ -1011,7 +957,7 @@ async def get_financial_statistics(
 async def get_settlements(request: Request):
     try:
         from bson import ObjectId
-        db = request.app.mongodb
+        db = get_async_db(request)
         settlements = []
         
         # Get real settlement data from enrollments and franchise collections
@@ -1020,7 +966,7 @@ async def get_settlements(request: Request):
             franchise_collection = db.franchises
             
             # Get instructor payouts from enrollments (settlements to instructors)
-            enrollments = list(enrollment_collection.find({"status": {"$in": ["completed", "active", "enrolled"]}}).limit(20))
+            enrollments = await enrollment_collection.find({"status": {"$in": ["completed", "active", "enrolled"]}}).limit(20).to_list(length=None)
             print(f"[DEBUG] Found {len(enrollments)} enrollments for settlements")
             
             for enrollment in enrollments:
@@ -1077,7 +1023,7 @@ async def get_settlements(request: Request):
                     continue
             
             # Get franchise fee settlements
-            franchises = list(franchise_collection.find({"status": {"$in": ["active", "approved", "pending"]}}).limit(10))
+            franchises = await franchise_collection.find({"status": {"$in": ["active", "approved", "pending"]}}).limit(10).to_list(length=None)
             print(f"[DEBUG] Found {len(franchises)} franchises for settlements")
             
             for franchise in franchises:
@@ -1150,7 +1096,7 @@ async def approve_settlement(settlement_id: str, request: Request):
     """Approve a specific settlement"""
     try:
         from bson import ObjectId
-        db = request.app.mongodb
+        db = get_async_db(request)
         
         # Update settlement status in the database
         # For franchise settlements
@@ -1160,19 +1106,19 @@ async def approve_settlement(settlement_id: str, request: Request):
                 # Try to convert to ObjectId if it's a valid ObjectId string
                 if ObjectId.is_valid(franchise_id):
                     object_id = ObjectId(franchise_id)
-                    result = db.franchises.update_one(
+                    result = await db.franchises.update_one(
                         {"_id": object_id}, 
                         {"$set": {"payment_status": "approved", "updated_at": datetime.now().isoformat()}}
                     )
                 else:
                     # Use string ID if not ObjectId format
-                    result = db.franchises.update_one(
+                    result = await db.franchises.update_one(
                         {"franchise_id": franchise_id}, 
                         {"$set": {"payment_status": "approved", "updated_at": datetime.now().isoformat()}}
                     )
             except Exception as id_error:
                 print(f"[DEBUG] Error with franchise ID {franchise_id}: {str(id_error)}")
-                result = db.franchises.update_one(
+                result = await db.franchises.update_one(
                     {"franchise_id": franchise_id}, 
                     {"$set": {"payment_status": "approved", "updated_at": datetime.now().isoformat()}}
                 )
@@ -1182,19 +1128,19 @@ async def approve_settlement(settlement_id: str, request: Request):
                 # Try to convert to ObjectId if it's a valid ObjectId string
                 if ObjectId.is_valid(settlement_id):
                     object_id = ObjectId(settlement_id)
-                    result = db.enrollments.update_one(
+                    result = await db.enrollments.update_one(
                         {"_id": object_id}, 
                         {"$set": {"payment_status": "approved", "updated_at": datetime.now().isoformat()}}
                     )
                 else:
                     # Use string ID if not ObjectId format
-                    result = db.enrollments.update_one(
+                    result = await db.enrollments.update_one(
                         {"enrollment_id": settlement_id}, 
                         {"$set": {"payment_status": "approved", "updated_at": datetime.now().isoformat()}}
                     )
             except Exception as id_error:
                 print(f"[DEBUG] Error with enrollment ID {settlement_id}: {str(id_error)}")
-                result = db.enrollments.update_one(
+                result = await db.enrollments.update_one(
                     {"enrollment_id": settlement_id}, 
                     {"$set": {"payment_status": "approved", "updated_at": datetime.now().isoformat()}}
                 )
@@ -1220,7 +1166,7 @@ async def reject_settlement(settlement_id: str, request: Request):
     """Reject a specific settlement"""
     try:
         from bson import ObjectId
-        db = request.app.mongodb
+        db = get_async_db(request)
         
         # Update settlement status in the database
         # For franchise settlements
@@ -1230,19 +1176,19 @@ async def reject_settlement(settlement_id: str, request: Request):
                 # Try to convert to ObjectId if it's a valid ObjectId string
                 if ObjectId.is_valid(franchise_id):
                     object_id = ObjectId(franchise_id)
-                    result = db.franchises.update_one(
+                    result = await db.franchises.update_one(
                         {"_id": object_id}, 
                         {"$set": {"payment_status": "rejected", "updated_at": datetime.now().isoformat()}}
                     )
                 else:
                     # Use string ID if not ObjectId format
-                    result = db.franchises.update_one(
+                    result = await db.franchises.update_one(
                         {"franchise_id": franchise_id}, 
                         {"$set": {"payment_status": "rejected", "updated_at": datetime.now().isoformat()}}
                     )
             except Exception as id_error:
                 print(f"[DEBUG] Error with franchise ID {franchise_id}: {str(id_error)}")
-                result = db.franchises.update_one(
+                result = await db.franchises.update_one(
                     {"franchise_id": franchise_id}, 
                     {"$set": {"payment_status": "rejected", "updated_at": datetime.now().isoformat()}}
                 )
@@ -1252,19 +1198,19 @@ async def reject_settlement(settlement_id: str, request: Request):
                 # Try to convert to ObjectId if it's a valid ObjectId string
                 if ObjectId.is_valid(settlement_id):
                     object_id = ObjectId(settlement_id)
-                    result = db.enrollments.update_one(
+                    result = await db.enrollments.update_one(
                         {"_id": object_id}, 
                         {"$set": {"payment_status": "rejected", "updated_at": datetime.now().isoformat()}}
                     )
                 else:
                     # Use string ID if not ObjectId format
-                    result = db.enrollments.update_one(
+                    result = await db.enrollments.update_one(
                         {"enrollment_id": settlement_id}, 
                         {"$set": {"payment_status": "rejected", "updated_at": datetime.now().isoformat()}}
                     )
             except Exception as id_error:
                 print(f"[DEBUG] Error with enrollment ID {settlement_id}: {str(id_error)}")
-                result = db.enrollments.update_one(
+                result = await db.enrollments.update_one(
                     {"enrollment_id": settlement_id}, 
                     {"$set": {"payment_status": "rejected", "updated_at": datetime.now().isoformat()}}
                 )
@@ -1296,7 +1242,7 @@ async def get_transactions(
 ):
     """Get all transactions from enrollments and franchises collections"""
     try:
-        db = request.app.mongodb
+        db = get_async_db(request)
         
         # Calculate date range
         end_date = datetime.now()
@@ -1319,7 +1265,7 @@ async def get_transactions(
             
             # Get enrollments from database
             enrollments_query = {}
-            enrollments = list(enrollment_collection.find(enrollments_query).limit(limit))
+            enrollments = await enrollment_collection.find(enrollments_query).limit(limit).to_list(length=None)
             
             for enrollment in enrollments:
                 # Process enrollment date
@@ -1372,7 +1318,7 @@ async def get_transactions(
         # Get franchise transactions  
         try:
             franchise_collection = db.franchises
-            franchises = list(franchise_collection.find({}).limit(limit//2))
+            franchises = await franchise_collection.find({}).limit(limit//2).to_list(length=None)
             
             for franchise in franchises:
                 # Get franchise details
@@ -1424,7 +1370,7 @@ async def get_transactions(
         # Get instructor payouts (negative amounts)
         try:
             enrollment_collection = db.enrollments
-            instructor_enrollments = list(enrollment_collection.find({}).limit(limit//4))
+            instructor_enrollments = await enrollment_collection.find({}).limit(limit//4).to_list(length=None)
             
             for enrollment in instructor_enrollments:
                 # Calculate instructor payout (30% of course fee)
@@ -1530,32 +1476,18 @@ async def get_revenue_trend(
 ):
     """Get revenue trend data from enrollments and successful payments"""
     try:
-        db = request.app.mongodb
-        enrollment_collection = db.enrollments
+        db = get_async_db(request)
         
         # Calculate date range
         end_date = datetime.now()
         start_date = end_date - timedelta(days=days)
         
-        # Get enrollments within date range
-        enrollments = list(enrollment_collection.find({
-            "status": {"$in": ["completed", "active", "enrolled"]},
-            "$or": [
-                {"enrollment_date": {"$gte": start_date.isoformat(), "$lte": end_date.isoformat()}},
-                {"created_at": {"$gte": start_date.isoformat(), "$lte": end_date.isoformat()}},
-                {"date": {"$gte": start_date.isoformat(), "$lte": end_date.isoformat()}}
-            ]
-        }))
-        
-        # If no date-filtered results, get all enrollments and filter manually
-        if not enrollments:
-            enrollments = list(enrollment_collection.find({"status": {"$in": ["completed", "active", "enrolled"]}}))
+        # Daily buckets from the revenue rollup; one row per day comes back
+        daily = await db[ROLLUP_COLLECTION].aggregate(rollup_daily_pipeline(start_date, end_date)).to_list(length=None)
         
-        # Group revenue by date
+        # Generate date range for chart
         revenue_by_date = {}
         enrollment_count_by_date = {}
-        
-        # Generate date range for chart
         current_date = start_date
         while current_date <= end_date:
             date_key = current_date.strftime('%Y-%m-%d')
@@ -1565,58 +1497,13 @@ async def get_revenue_trend(
         
         total_revenue = 0
         successful_enrollments = 0
-        
-        for enrollment in enrollments:
-            # Extract date
-            enrollment_date = enrollment.get('enrollment_date') or enrollment.get('created_at') or enrollment.get('date')
-            
-            if enrollment_date:
-                try:
-                    if isinstance(enrollment_date, str):
-                        date_obj = datetime.fromisoformat(enrollment_date.replace('Z', '+00:00'))
-                    else:
-                        date_obj = enrollment_date
-                    
-                    # Only include if within our date range
-                    if start_date <= date_obj <= end_date:
-                        date_key = date_obj.strftime('%Y-%m-%d')
-                        
-                        # Extract amount using multiple possible field names
-                        amount_fields = ['fee_paid', 'course_fee', 'amount', 'fee', 'price', 'cost']
-                        amount = 0
-                        
-                        for field in amount_fields:
-                            if field in enrollment and enrollment[field]:
-                                try:
-                                    amount = float(enrollment[field])
-                                    break
-                                except (ValueError, TypeError):
-                                    continue
-                        
-                        # If still no amount, try nested objects
-                        if amount == 0:
-                            payment_info = enrollment.get('payment', {})
-                            for field in amount_fields:
-                                if field in payment_info and payment_info[field]:
-                                    try:
-                                        amount = float(payment_info[field])
-                                        break
-                                    except (ValueError, TypeError):
-                                        continue
-                        
-                        # Default amount if still not found (for demo purposes)
-                        if amount == 0:
-                            amount = 2500  # Default course fee
-                        
-                        if date_key in revenue_by_date:
-                            revenue_by_date[date_key] += amount
-                            enrollment_count_by_date[date_key] += 1
-                            total_revenue += amount
-                            successful_enrollments += 1
-                            
-                except Exception as e:
-                    print(f"[DEBUG] Error parsing date for enrollment {enrollment.get('_id')}: {e}")
-                    continue
+        for bucket in daily:
+            date_key = bucket["_id"]
+            if date_key in revenue_by_date:
+                revenue_by_date[date_key] += bucket["enrollment_revenue"]
+                enrollment_count_by_date[date_key] += bucket["enrollment_count"]
+                total_revenue += bucket["enrollment_revenue"]
+                successful_enrollments += bucket["enrollment_count"]
         
         # Convert to chart data format
         chart_data = []
@@ -1702,6 +1589,19 @@ async def get_revenue_trend(
             }
         }
 
+@router.post("/rollups/rebuild")
+async def rebuild_revenue_rollups(request: Request, current_user: dict = Depends(require_super_admin)):
+    """Recompute the daily revenue rollup from enrollments and branch cash-ins/cash-outs (super admin only)"""
+    db = request.app.mongodb
+    if db is None:
+        raise HTTPException(status_code=503, detail="Database connection not available")
+    try:
+        result = await run_in_threadpool(rebuild_rollups, db)
+        return {"success": True, "message": "Revenue rollup rebuilt", "data": result}
+    except Exception as e:
+        print(f"[ERROR] Rollup rebuild failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error rebuilding revenue rollup: {str(e)}")
+
 @router.get("/health")
 async def ledger_health_check():
     """Health check endpoint for ledger service"""
@@ -3,6 +3,8 @@ from typing import Optional, List, Dict, Any
 from datetime import datetime
 from bson import ObjectId
 from app.utils.branch_filter import BranchAccessManager
+from app.services.notification_fanout import notification_fanout, PENDING
+from app.services.realtime_hub import realtime_hub, message_event
 import logging
 
 # Set up logging
@@ -57,6 +59,7 @@ async def send_message(request: Request, message_data: Dict[str, Any]):
         
         # Insert message
         result = messages_collection.insert_one(message_doc)
+        message_event(realtime_hub.emit, message_doc)
         
         # Also create a notification for the recipient
         try:
@@ -74,10 +77,11 @@ async def send_message(request: Request, message_data: Dict[str, Any]):
                 "author": sender_name,
                 "send_immediately": True,
                 "status": "sent",
+                "fanout_status": PENDING,
                 "sent_date": datetime.utcnow(),
                 "created_at": datetime.utcnow(),
                 "read_count": 0,
-                "delivered_count": 1,
+                "delivered_count": 0,
                 "metadata": {
                     "message_id": str(result.inserted_id),
                     "course_id": message_data.get("course_id"),
@@ -85,6 +89,7 @@ async def send_message(request: Request, message_data: Dict[str, Any]):
                 }
             }
             notifications_collection.insert_one(notification_doc)
+            notification_fanout.deliver(notification_doc["_id"])
             logger.info(f"Notification created for message {result.inserted_id}")
         except Exception as notif_error:
             logger.warning(f"Failed to create notification for message: {notif_error}")
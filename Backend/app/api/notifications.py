@@ -1,9 +1,11 @@
-from fastapi import APIRouter, Request, HTTPException, Query, Path
+from fastapi import APIRouter, Request, HTTPException, Query, Path, Depends
 from typing import Optional, List
 from datetime import datetime
 import logging
 from app.schemas.notification import AdminNotificationCreate
 from app.utils.branch_filter import BranchAccessManager
+from app.utils.dependencies import role_required
+from app.services.notification_fanout import ADMIN_ROLES, recipient_in_scope
 from app.services.notification_service import (
     create_admin_notification,
     get_admin_notifications,
@@ -14,6 +16,7 @@ from app.services.notification_service import (
     get_user_notifications,
     mark_notification_as_read,
     get_notification_stats,
+    get_unread_count,
     send_admin_notification
 )
 
@@ -24,19 +27,68 @@ notification_router = APIRouter(prefix="/notifications", tags=["Notifications"])
 # Create a separate router for API endpoints that frontend expects
 api_notification_router = APIRouter(prefix="/api/notifications", tags=["API Notifications"])
 
+
+def notification_sender(user=Depends(role_required(ADMIN_ROLES))):
+    """Only admins may create notifications or send messages"""
+    return user
+
+
+def _sender_scope(user: dict) -> Optional[dict]:
+    """Franchise / branch a branch or franchise admin is limited to; None for platform admins"""
+    franchise_code = user.get("franchise_code")
+    branch_code = user.get("branch_code")
+    if user.get("role") == "super_admin" or (user.get("role") == "admin" and not franchise_code and not branch_code):
+        return None
+    if not franchise_code and not branch_code:
+        raise HTTPException(status_code=403, detail="Franchise or branch code not found")
+    return {"franchise_code": franchise_code, "branch_code": branch_code}
+
+
+def _check_recipient(db, recipient_id: Optional[str], scope: Optional[dict]):
+    if recipient_id and scope and not recipient_in_scope(db, str(recipient_id), **scope):
+        raise HTTPException(status_code=403, detail="Recipient is outside your franchise or branch")
+
+
+# Fields that decide who a notification reaches; tenant admins cannot rewrite them
+SCOPE_FIELDS = ("franchise_code", "franchise_id", "branch_code", "recipient_ids", "recipient_id", "target_user_id")
+
+
+def owned_notification(db, notification_id: str, user: dict) -> dict:
+    """The notification, if ``user`` may change it: platform admins any, tenant admins their own tenant's"""
+    notification = get_notification_by_id(db, notification_id)
+    if not notification:
+        raise HTTPException(status_code=404, detail="Notification not found")
+    scope = _sender_scope(user)
+    if scope is not None and any(
+        code and notification.get(field) != code for field, code in scope.items()
+    ):
+        raise HTTPException(status_code=403, detail="Notification belongs to another franchise or branch")
+    return notification
+
+
+def scope_notification(db, payload: AdminNotificationCreate, user: dict) -> AdminNotificationCreate:
+    """Pin a branch or franchise admin's notification to their own tenant, whatever the payload says"""
+    scope = _sender_scope(user)
+    if scope is None:
+        return payload
+    payload_dict = payload.dict()
+    payload_dict["franchise_code"] = scope["franchise_code"]
+    # A franchise admin may narrow the audience to one branch; the franchise filter still applies
+    payload_dict["branch_code"] = scope["branch_code"] or (payload_dict.get("branch_code") if scope["franchise_code"] else None)
+    _check_recipient(db, payload_dict.get("target_user_id"), scope)
+    return AdminNotificationCreate(**payload_dict)
+
 @notification_router.post("/", response_model=dict)
-def create_notification(request: Request, payload: AdminNotificationCreate):
+def create_notification(request: Request, payload: AdminNotificationCreate, user_info: dict = Depends(notification_sender)):
+    db = request.app.mongodb
+    payload = scope_notification(db, payload, user_info)
     try:
-        db = request.app.mongodb
-        # Get user info if available, otherwise use default
-        user_info = getattr(request.state, 'user', None)
-        author = user_info.get('name', 'Admin') if user_info else 'Admin'
+        author = user_info.get('name', 'Admin')
         
         # Add franchise context for multi-tenancy
-        if user_info:
-            payload_dict = payload.dict()
-            payload_dict = BranchAccessManager.add_franchise_code_to_data(payload_dict, user_info)
-            payload = AdminNotificationCreate(**payload_dict)
+        payload_dict = payload.dict()
+        payload_dict = BranchAccessManager.add_franchise_code_to_data(payload_dict, user_info)
+        payload = AdminNotificationCreate(**payload_dict)
         
         result = send_admin_notification(db, payload, author)
         return result
@@ -44,13 +96,12 @@ def create_notification(request: Request, payload: AdminNotificationCreate):
         raise HTTPException(status_code=500, detail=str(e))
 
 @notification_router.post("/admin", response_model=dict)
-def create_admin_notification_endpoint(request: Request, payload: AdminNotificationCreate):
+def create_admin_notification_endpoint(request: Request, payload: AdminNotificationCreate, user_info: dict = Depends(notification_sender)):
     """Admin-specific notification creation endpoint"""
+    db = request.app.mongodb
+    payload = scope_notification(db, payload, user_info)
     try:
-        db = request.app.mongodb
-        # Get user info if available, otherwise use default
-        user_info = getattr(request.state, 'user', None)
-        author = user_info.get('name', 'Admin') if user_info else 'Admin'
+        author = user_info.get('name', 'Admin')
         
         result = send_admin_notification(db, payload, author)
         return result
@@ -107,7 +158,8 @@ def get_notification(request: Request):
 def get_my_notifications_handler(
     request: Request,
     skip: int = Query(0, ge=0, description="Number of notifications to skip"),
-    limit: int = Query(50, ge=1, le=100, description="Number of notifications to return")
+    limit: int = Query(50, ge=1, le=100, description="Number of notifications to return"),
+    before: Optional[str] = Query(None, description="Id of the last notification received; returns the page after it")
 ):
     """Get notifications for the current user"""
     try:
@@ -118,7 +170,7 @@ def get_my_notifications_handler(
         user_info = getattr(request.state, 'user', None)
         user_id = user_info.get('user_id', 'default_user') if user_info else 'default_user'
         
-        notifications = get_user_notifications(db, user_id, skip, limit)
+        notifications = get_user_notifications(db, user_id, skip, limit, before)
         return notifications
     except Exception as e:
         logger.error(f"❌ Database connection failed for my notifications: {str(e)}")
@@ -128,7 +180,8 @@ def get_my_notifications_handler(
 def get_user_notifications_handler(
     request: Request,
     skip: int = Query(0, ge=0, description="Number of notifications to skip"),
-    limit: int = Query(50, ge=1, le=100, description="Number of notifications to return")
+    limit: int = Query(50, ge=1, le=100, description="Number of notifications to return"),
+    before: Optional[str] = Query(None, description="Id of the last notification received; returns the page after it")
 ):
     """Get notifications for the current user - Frontend expects this endpoint"""
     try:
@@ -139,12 +192,20 @@ def get_user_notifications_handler(
         user_info = getattr(request.state, 'user', None)
         user_id = user_info.get('user_id', 'default_user') if user_info else 'default_user'
         
-        notifications = get_user_notifications(db, user_id, skip, limit)
+        notifications = get_user_notifications(db, user_id, skip, limit, before)
         return notifications
     except Exception as e:
         logger.error(f"❌ Database connection failed for user notifications: {str(e)}")
         return []
 
+@notification_router.get("/unread-count", response_model=dict)
+def get_unread_count_handler(request: Request):
+    """Unread notification count of the current user (notification bell badge)"""
+    db = request.app.mongodb
+    user_info = getattr(request.state, 'user', None)
+    user_id = user_info.get('user_id', 'default_user') if user_info else 'default_user'
+    return {"unread": get_unread_count(db, user_id)}
+
 @notification_router.post("/course-approval", response_model=dict)
 def create_course_approval_notification_handler(
     request: Request,
@@ -322,11 +383,15 @@ def get_notification_handler(
 def update_notification_handler(
     request: Request,
     payload: dict,
-    notification_id: str = Path(..., description="The notification ID")
+    notification_id: str = Path(..., description="The notification ID"),
+    user_info: dict = Depends(notification_sender)
 ):
-    """Update a notification"""
+    """Update a notification (inbox copies are rewritten too)"""
+    db = request.app.mongodb
+    owned_notification(db, notification_id, user_info)
+    if _sender_scope(user_info) is not None:
+        payload = {k: v for k, v in payload.items() if k not in SCOPE_FIELDS}
     try:
-        db = request.app.mongodb
         success = update_notification(db, notification_id, payload)
         
         if success:
@@ -339,11 +404,13 @@ def update_notification_handler(
 @notification_router.delete("/{notification_id}", response_model=dict)
 def delete_notification_handler(
     request: Request,
-    notification_id: str = Path(..., description="The notification ID")
+    notification_id: str = Path(..., description="The notification ID"),
+    user_info: dict = Depends(notification_sender)
 ):
-    """Delete a notification"""
+    """Delete a notification (and retract it from every inbox)"""
+    db = request.app.mongodb
+    owned_notification(db, notification_id, user_info)
     try:
-        db = request.app.mongodb
         success = delete_notification(db, notification_id)
         
         if success:
@@ -354,7 +421,7 @@ def delete_notification_handler(
         raise HTTPException(status_code=500, detail=str(e))
 
 @notification_router.post("/message", response_model=dict)
-def send_notification_message(request: Request, payload: dict):
+def send_notification_message(request: Request, payload: dict, user_info: dict = Depends(notification_sender)):
     """Send a notification message"""
     try:
         db = request.app.mongodb
@@ -367,6 +434,7 @@ def send_notification_message(request: Request, payload: dict):
         
         if not recipient_id or not message:
             raise HTTPException(status_code=400, detail="recipient_id and message are required")
+        _check_recipient(db, recipient_id, _sender_scope(user_info))
         
         # Create notification using existing service
         notification_data = {
@@ -381,6 +449,8 @@ def send_notification_message(request: Request, payload: dict):
         result = create_notification(db, notification_data)
         return {"status": "success", "message": "Message sent successfully", "notification": result}
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to send message: {str(e)}")
 
@@ -389,12 +459,12 @@ __all__ = ["notification_router", "api_notification_router"]
 
 # API routes that frontend expects (with /api prefix)
 @api_notification_router.post("/", response_model=dict)
-def create_notification_api(request: Request, payload: AdminNotificationCreate):
+def create_notification_api(request: Request, payload: AdminNotificationCreate, user_info: dict = Depends(notification_sender)):
     """API endpoint for creating notifications (with /api prefix)"""
+    db = request.app.mongodb
+    payload = scope_notification(db, payload, user_info)
     try:
-        db = request.app.mongodb
-        user_info = getattr(request.state, 'user', None)
-        author = user_info.get('name', 'Admin') if user_info else 'Admin'
+        author = user_info.get('name', 'Admin')
         
         result = send_admin_notification(db, payload, author)
         return result
@@ -402,12 +472,12 @@ def create_notification_api(request: Request, payload: AdminNotificationCreate):
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_notification_router.post("/admin", response_model=dict)
-def create_admin_notification_api(request: Request, payload: AdminNotificationCreate):
+def create_admin_notification_api(request: Request, payload: AdminNotificationCreate, user_info: dict = Depends(notification_sender)):
     """API admin notification endpoint (with /api prefix)"""
+    db = request.app.mongodb
+    payload = scope_notification(db, payload, user_info)
     try:
-        db = request.app.mongodb
-        user_info = getattr(request.state, 'user', None)
-        author = user_info.get('name', 'Admin') if user_info else 'Admin'
+        author = user_info.get('name', 'Admin')
         
         result = send_admin_notification(db, payload, author)
         return result
@@ -452,7 +522,8 @@ def get_admin_notifications_api(
 def get_user_notifications_api(
     request: Request,
     skip: int = Query(0, ge=0, description="Number of notifications to skip"),
-    limit: int = Query(50, ge=1, le=100, description="Number of notifications to return")
+    limit: int = Query(50, ge=1, le=100, description="Number of notifications to return"),
+    before: Optional[str] = Query(None, description="Id of the last notification received; returns the page after it")
 ):
     """Get notifications for the current user - API endpoint for frontend"""
     try:
@@ -463,14 +534,22 @@ def get_user_notifications_api(
         user_info = getattr(request.state, 'user', None)
         user_id = user_info.get('user_id', 'default_user') if user_info else 'default_user'
         
-        notifications = get_user_notifications(db, user_id, skip, limit)
+        notifications = get_user_notifications(db, user_id, skip, limit, before)
         return notifications
     except Exception as e:
         logger.error(f"❌ Database connection failed for API user notifications: {str(e)}")
         return []
 
+@api_notification_router.get("/unread-count", response_model=dict)
+def get_unread_count_api(request: Request):
+    """Unread notification count of the current user - API endpoint for frontend"""
+    db = request.app.mongodb
+    user_info = getattr(request.state, 'user', None)
+    user_id = user_info.get('user_id', 'default_user') if user_info else 'default_user'
+    return {"unread": get_unread_count(db, user_id)}
+
 @api_notification_router.post("/message", response_model=dict)
-def send_notification_message_api(request: Request, payload: dict):
+def send_notification_message_api(request: Request, payload: dict, user_info: dict = Depends(notification_sender)):
     """Send a notification message - API endpoint for frontend compatibility"""
     try:
         db = request.app.mongodb
@@ -483,6 +562,7 @@ def send_notification_message_api(request: Request, payload: dict):
         
         if not recipient_id or not message:
             raise HTTPException(status_code=400, detail="recipient_id and message are required")
+        _check_recipient(db, recipient_id, _sender_scope(user_info))
         
         # Create notification using existing service
         notification_data = {
@@ -497,6 +577,8 @@ def send_notification_message_api(request: Request, payload: dict):
         result = create_notification(db, notification_data)
         return {"status": "success", "message": "Message sent successfully", "notification": result}
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to send message: {str(e)}")
 
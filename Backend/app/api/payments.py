@@ -12,6 +12,8 @@ from app.utils.payment import razorpay_client, verify_razorpay_signature, send_e
 from app.models.enrollment import get_enrollment_collection
 from app.models.course import get_course_collection
 from app.models.user import get_user_collection
+from app.services.ledger_rollup_service import apply_enrollment_change
+from app.services.instructor_stats_service import instructor_stats
 from bson import ObjectId
 from app import require_auth
 from datetime import datetime
@@ -199,6 +201,8 @@ async def enroll_free_course(request: Request, enrollment_request: FreeEnrollmen
         
         # Insert enrollment
         result = enrollment_collection.insert_one(enrollment_doc)
+        apply_enrollment_change(db, after=enrollment_doc)
+        instructor_stats.enrollment_changed(after=enrollment_doc)
         print(f"✅ Enrollment created successfully: {result.inserted_id}")
         
         return FreeEnrollmentResponse(
@@ -369,11 +373,13 @@ async def init_course_enrollment(request: Request, payload: CourseEnrollmentInit
         }
         
         result = enrollment_collection.insert_one(enrollment_doc)
+        apply_enrollment_change(db, after=enrollment_doc)
+        instructor_stats.enrollment_changed(after=enrollment_doc)
         enrollment_id = str(result.inserted_id)
         
         # Send acknowledgement email
         try:
-            await send_email_receipt(
+            send_email_receipt(
                 payload.student_email,
                 "Course enrollment initiated - SkillWallah",
                 f"Dear {payload.student_name},<br><br>"
@@ -453,21 +459,23 @@ async def verify_course_enrollment(request: Request, payload: CourseEnrollmentVe
                 current_time = datetime.now()
                 student_id = enrollment.get("student_id", ObjectId())  # Handle if not set
                 
+                success_fields = {
+                    "status": "SUCCESS",
+                    "payment_status": "completed",
+                    "payment_id": payload.payment_id,
+                    "order_id": payload.order_id,
+                    "payment_date": current_time,
+                    "updated_at": current_time,
+                    "progress": 0,
+                    "completed": False,
+                    "last_accessed": current_time,
+                    "payment_method": "razorpay"
+                }
                 enrollment_collection.update_one(
                     {"_id": ObjectId(payload.enrollment_id)},
-                    {"$set": {
-                        "status": "SUCCESS",
-                        "payment_status": "completed",
-                        "payment_id": payload.payment_id,
-                        "order_id": payload.order_id,
-                        "payment_date": current_time,
-                        "updated_at": current_time,
-                        "progress": 0,
-                        "completed": False,
-                        "last_accessed": current_time,
-                        "payment_method": "razorpay"
-                    }}
+                    {"$set": success_fields}
                 )
+                apply_enrollment_change(db, before=enrollment, after={**enrollment, **success_fields})
                 
                 # Send success email
                 try:
@@ -478,7 +486,7 @@ async def verify_course_enrollment(request: Request, payload: CourseEnrollmentVe
                         course = branch_courses.find_one({"_id": enrollment["course_id"]})
                         if course and 'course_name' in course and 'title' not in course:
                             course['title'] = course['course_name']
-                    await send_email_receipt(
+                    send_email_receipt(
                         enrollment["student_email"],
                         "Course enrollment successful - SkillWallah",
                         f"Dear {enrollment['student_name']},<br><br>"
@@ -502,10 +510,12 @@ async def verify_course_enrollment(request: Request, payload: CourseEnrollmentVe
                 
             except Exception as e:
                 # Mark payment as failed
+                failed_fields = {"status": "FAILED", "updated_at": datetime.now()}
                 enrollment_collection.update_one(
                     {"_id": ObjectId(payload.enrollment_id)},
-                    {"$set": {"status": "FAILED", "updated_at": datetime.now()}}
+                    {"$set": failed_fields}
                 )
+                apply_enrollment_change(db, before=enrollment, after={**enrollment, **failed_fields})
                 raise HTTPException(400, f"Payment verification failed: {str(e)}")
         
         raise HTTPException(400, "Unsupported payment provider")
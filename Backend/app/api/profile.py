@@ -2,6 +2,7 @@ from fastapi import APIRouter, Request, Depends, HTTPException, File, UploadFile
 from fastapi.responses import JSONResponse
 from app.utils.dependencies import get_authenticated_user
 from app.models.user import get_user_collection
+from app.services.search_service import refresh_search_terms
 from bson import ObjectId
 from datetime import datetime
 import os
@@ -168,6 +169,7 @@ async def update_student_profile(
                     {"_id": ObjectId(student_id)},
                     {"$set": updated_data}
                 )
+                refresh_search_terms(db, "branch_students", {"_id": ObjectId(student_id)})
             
             # Fetch updated branch student data
             branch_student = db.branch_students.find_one({"_id": ObjectId(student_id)})
@@ -1,15 +1,22 @@
 from fastapi import APIRouter, Request, HTTPException, Depends
 from pydantic import BaseModel
+from pymongo.errors import BulkWriteError
 from typing import Optional, List
 from app.models.user_progress import (
     get_user_progress_collection, 
     upsert_user_progress,
+    bulk_upsert_user_progress,
     get_user_course_progress,
     get_user_content_progress,
+    is_content_completed,
     get_course_completion_stats,
     get_module_completion_status,
-    get_completed_modules
+    get_completed_modules,
+    calculate_completion_percentage,
+    is_progress_heartbeat
 )
+from app.services.progress_buffer import progress_buffer
+from app.services.instructor_stats_service import instructor_stats
 from app.utils.auth import get_authenticated_user
 import logging
 
@@ -57,7 +64,32 @@ async def update_progress(request: Request, data: ProgressUpdateRequest, current
         # Allow seeking ahead - don't cap watched_duration at total_duration
         # This handles cases where user seeks forward
         
-        # Update progress in database
+        # Plain heartbeats are coalesced in memory and written in the background
+        if is_progress_heartbeat(data.watched_duration, data.total_duration, data.completed):
+            completed = progress_buffer.add(
+                current_user_id, data.course_id, data.content_id,
+                module_id=data.module_id,
+                content_type=data.content_type,
+                watched_duration=data.watched_duration,
+                total_duration=data.total_duration
+            )
+            # Heartbeats keep the stored completion state; read it once per buffered item
+            if completed is None:
+                completed = is_content_completed(db, current_user_id, data.course_id, data.content_id)
+                progress_buffer.remember_completed(current_user_id, data.course_id, data.content_id, completed)
+            return {
+                "success": True,
+                "buffered": True,
+                "progress": {
+                    "content_id": data.content_id,
+                    "completion_percentage": calculate_completion_percentage(data.watched_duration, data.total_duration),
+                    "completed": completed,
+                    "last_position": data.watched_duration
+                }
+            }
+        
+        # Completion events are written now, after any buffered heartbeat for this item
+        progress_buffer.flush(db, current_user_id, data.course_id, data.content_id)
         progress = upsert_user_progress(
             db=db,
             user_id=current_user_id,
@@ -102,6 +134,7 @@ async def mark_complete(request: Request, data: MarkCompleteRequest, current_use
         db = request.app.mongodb
         
         # Get existing progress or create new one
+        progress_buffer.flush(db, current_user_id, data.course_id, data.content_id)
         existing_progress = get_user_content_progress(db, current_user_id, data.course_id, data.content_id)
         
         if existing_progress:
@@ -151,7 +184,8 @@ async def get_course_progress(request: Request, course_id: str, current_user = D
         
         db = request.app.mongodb
         
-        # Get all progress items for this course
+        # Get all progress items for this course (including buffered heartbeats)
+        progress_buffer.flush(db, current_user_id, course_id)
         progress_items = get_user_course_progress(db, current_user_id, course_id)
         
         # Get completion stats
@@ -216,6 +250,7 @@ async def get_course_progress(request: Request, course_id: str, current_user = D
                     }
                     
                     result = db.certificates.insert_one(cert_doc)
+                    instructor_stats.certificate_issued(cert_doc)
                     logger.info(f"Certificate created with ID: {result.inserted_id}, Number: {certificate_number}")
                     
                     # Generate the actual certificate file
@@ -323,6 +358,7 @@ async def get_progress_stats(request: Request, course_id: str, current_user = De
         
         db = request.app.mongodb
         
+        progress_buffer.flush(db, current_user_id, course_id)
         stats = get_course_completion_stats(db, current_user_id, course_id)
         
         return {
@@ -350,6 +386,7 @@ async def check_module_completion(
         db = request.app.mongodb
         
         # Get completed modules
+        progress_buffer.flush(db, current_user_id, course_id)
         completed_module_ids = get_completed_modules(db, current_user_id, course_id, data.modules_data)
         
         return {
@@ -370,31 +407,44 @@ async def batch_update_progress(request: Request, data: BatchProgressUpdate, cur
             raise HTTPException(status_code=401, detail="User not authenticated")
         
         db = request.app.mongodb
-        results = []
+        if not data.updates:
+            return {"success": True, "results": []}
+        
+        # Buffered heartbeats go first so the batch is applied on top of them
+        progress_buffer.flush(db, current_user_id)
+        
+        # One ordered bulk_write; each item is an atomic pipeline upsert
+        updates = [
+            {
+                "user_id": current_user_id,
+                "course_id": update_data.course_id,
+                "module_id": update_data.module_id,
+                "content_id": update_data.content_id,
+                "content_type": update_data.content_type,
+                "watched_duration": update_data.watched_duration,
+                "total_duration": update_data.total_duration,
+                "completed": update_data.completed
+            }
+            for update_data in data.updates
+        ]
+        failed_index = len(updates)
+        error_message = None
+        try:
+            bulk_upsert_user_progress(db, updates)
+        except BulkWriteError as e:
+            write_errors = e.details.get("writeErrors") or [{}]
+            failed_index = write_errors[0].get("index", 0)
+            error_message = write_errors[0].get("errmsg", str(e))
         
-        # Process all updates
-        for update_data in data.updates:
-            try:
-                progress = upsert_user_progress(
-                    db=db,
-                    user_id=current_user_id,
-                    course_id=update_data.course_id,
-                    module_id=update_data.module_id,
-                    content_id=update_data.content_id,
-                    content_type=update_data.content_type,
-                    watched_duration=update_data.watched_duration,
-                    total_duration=update_data.total_duration,
-                    completed=update_data.completed
-                )
-                results.append({
-                    "content_id": progress["content_id"],
-                    "success": True
-                })
-            except Exception as e:
+        results = []
+        for index, update_data in enumerate(data.updates):
+            if index < failed_index:
+                results.append({"content_id": update_data.content_id, "success": True})
+            else:
                 results.append({
                     "content_id": update_data.content_id,
                     "success": False,
-                    "error": str(e)
+                    "error": error_message if index == failed_index else "Not applied (an earlier update failed)"
                 })
         
         return {
@@ -3,10 +3,12 @@ from typing import List
 from app.schemas.quiz import QuizCreate, QuizUpdate, QuestionCreate, QuizResponse, StudentQuizResponse
 from app.schemas.quiz_attempt import QuizAttemptCreate, QuizAttemptResponse, QuizGradingRequest, QuizResultsSummary
 from app.services.quiz_service import (
-    create_quiz, add_question, get_all_quizzes, get_quiz_by_id,
+    create_quiz, add_question, get_all_quizzes,
     get_quizzes_for_course, get_questions_for_quiz, update_quiz,
-    submit_quiz_attempt, get_quiz_attempts, get_quiz_statistics
+    get_quiz_attempts, get_quiz_statistics,
+    get_quiz_by_id_async, submit_quiz_attempt_async
 )
+from app.utils.database import get_async_db, fetch_all
 from app.utils.auth_helpers import get_current_user
 from app.utils.branch_filter import BranchAccessManager
 from app.models.quiz_attempt import get_quiz_attempt_collection
@@ -15,6 +17,7 @@ import re
 import io
 import json
 import traceback
+import asyncio
 from datetime import datetime
 from bson import ObjectId
 
@@ -477,11 +480,11 @@ async def get_quiz_stats(request: Request):
         }
 
 @quiz_router.get("/{quiz_id}")
-def get_quiz(request: Request, quiz_id: str, for_student: bool = False):
+async def get_quiz(request: Request, quiz_id: str, for_student: bool = False):
     """Get a specific quiz by ID"""
     try:
-        db = request.app.mongodb
-        quiz = get_quiz_by_id(db, quiz_id, for_student=for_student)
+        db = get_async_db(request)
+        quiz = await get_quiz_by_id_async(db, quiz_id, for_student=for_student)
         
         if not quiz:
             raise HTTPException(status_code=404, detail="Quiz not found")
@@ -558,8 +561,8 @@ async def submit_quiz(request: Request):
             raise HTTPException(status_code=400, detail="Answers are required")
         
         # Submit and grade the quiz
-        db = request.app.mongodb
-        result = submit_quiz_attempt(db, quiz_id, student_id, answers, time_taken)
+        db = get_async_db(request)
+        result = await submit_quiz_attempt_async(db, quiz_id, student_id, answers, time_taken)
         
         return result
         
@@ -687,7 +690,7 @@ async def get_student_attempts(request: Request, student_id: str):
 
 @quiz_router.get("/student/my-quizzes")
 async def get_student_quizzes(request: Request):
-    db = request.app.mongodb
+    db = get_async_db(request)
     
     try:
         from app.utils.auth import verify_token
@@ -717,7 +720,7 @@ async def get_student_quizzes(request: Request):
         
         # Get all enrollments for the student
         print(f"🔍 Looking for enrollments for student_id: {student_id}")
-        enrollments = list(enrollment_collection.find({"student_id": student_id}))
+        enrollments = await fetch_all(enrollment_collection.find({"student_id": student_id}))
         print(f"📚 Found {len(enrollments)} enrollments")
         
         if not enrollments:
@@ -729,7 +732,7 @@ async def get_student_quizzes(request: Request):
         print(f"📚 Enrolled course ObjectIds: {enrolled_course_ids}")
         
         # Get course details to map ObjectId to course_id strings
-        courses = list(course_collection.find({"_id": {"$in": enrolled_course_ids}}))
+        courses = await fetch_all(course_collection.find({"_id": {"$in": enrolled_course_ids}}))
         print(f"🔍 Found {len(courses)} course records")
         
         # Try multiple possible course_id field names
@@ -759,19 +762,21 @@ async def get_student_quizzes(request: Request):
         print(f"📚 Looking for quizzes with course_id in: {all_possible_course_ids}")
         
         # Only fetch published/active quizzes for students
-        quizzes = list(quiz_collection.find({
+        quizzes_cursor = quiz_collection.find({
             "course_id": {"$in": all_possible_course_ids},
             "is_published": True  # Only show published quizzes
-        }))
-        
-        print(f"📋 Found {len(quizzes)} published quizzes for enrolled courses")
+        })
         
         # Get student quiz attempts for completion status
         from app.models.quiz_attempt import get_quiz_attempt_collection
         attempt_collection = get_quiz_attempt_collection(db)
         
-        # Get all attempts for this student
-        student_attempts = list(attempt_collection.find({"student_id": str(student_id)}))
+        # Get all attempts for this student (concurrently with the quiz lookup)
+        quizzes, student_attempts = await asyncio.gather(
+            fetch_all(quizzes_cursor),
+            fetch_all(attempt_collection.find({"student_id": str(student_id)}))
+        )
+        print(f"📋 Found {len(quizzes)} published quizzes for enrolled courses")
         print(f"🎯 Found {len(student_attempts)} quiz attempts for student")
         
         # Create a map of quiz_id -> completion status
@@ -0,0 +1,124 @@
+from fastapi import APIRouter, Request, HTTPException
+from fastapi.responses import StreamingResponse
+from jose import JWTError, jwt
+from typing import Optional
+from datetime import datetime, timedelta
+import threading
+import time
+import uuid
+from app.config import settings
+from app.services.realtime_hub import realtime_hub, load_topics, event_stream
+from app.services.token_registry import token_registry, token_version
+from app.utils.auth_helpers import get_current_user
+from app.utils.database import get_async_db
+import logging
+
+logger = logging.getLogger(__name__)
+
+realtime_router = APIRouter(prefix="/api/realtime", tags=["Realtime"])
+
+TICKET_TYPE = "sse_ticket"
+# Tickets are signed with a derived key so they can never pass as access tokens
+TICKET_KEY = f"{settings.JWT_SECRET_KEY}:realtime-ticket"
+
+# Ticket ids already used to open a stream in this worker (id -> ticket expiry)
+_used_tickets = {}
+_used_lock = threading.Lock()
+
+
+def _bearer_session(request: Request) -> dict:
+    """user_id, token version and expiry of the request's access token"""
+    token = request.headers.get("Authorization", "").split(" ")[-1]
+    payload = jwt.get_unverified_claims(token)  # verified by get_current_user before this is called
+    return {"user_id": str(payload.get("user_id") or ""), "tv": token_version(payload), "exp": payload.get("exp")}
+
+
+def session_valid(session: dict) -> bool:
+    """False once the access token behind a stream is revoked or expired"""
+    if token_registry.is_revoked(session["user_id"], session["tv"]):
+        return False
+    return session["exp"] is None or time.time() < session["exp"]
+
+
+def issue_ticket(user: dict, session: dict) -> str:
+    now = datetime.utcnow()
+    return jwt.encode({
+        "typ": TICKET_TYPE,
+        "jti": uuid.uuid4().hex,
+        "sub": session["user_id"],
+        "tv": session["tv"],
+        "session_exp": session["exp"],
+        "branch_code": user.get("branch_code"),
+        "iat": now,
+        "exp": now + timedelta(seconds=settings.REALTIME_TICKET_TTL_SECONDS)
+    }, TICKET_KEY, algorithm=settings.JWT_ALGORITHM)
+
+
+def redeem_ticket(ticket: str) -> tuple:
+    """(user, session) of a valid, unused ticket; 401 otherwise"""
+    try:
+        claims = jwt.decode(ticket, TICKET_KEY, algorithms=[settings.JWT_ALGORITHM])
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Invalid or expired stream ticket")
+    if claims.get("typ") != TICKET_TYPE or not claims.get("sub"):
+        raise HTTPException(status_code=401, detail="Invalid or expired stream ticket")
+    now = time.time()
+    with _used_lock:
+        for jti in [jti for jti, expires in _used_tickets.items() if expires < now]:
+            del _used_tickets[jti]
+        if claims["jti"] in _used_tickets:
+            raise HTTPException(status_code=401, detail="Stream ticket already used")
+        _used_tickets[claims["jti"]] = claims["exp"]
+    user = {"user_id": claims["sub"], "branch_code": claims.get("branch_code")}
+    return user, {"user_id": claims["sub"], "tv": claims.get("tv", 0), "exp": claims.get("session_exp")}
+
+
+@realtime_router.post("/ticket")
+async def create_stream_ticket(request: Request):
+    """Short-lived, single-use ticket for opening the event stream
+
+    ``EventSource`` cannot send an Authorization header, and a query string ends
+    up in access logs, so the stream URL carries this ticket instead of the
+    access token.
+    """
+    user = await get_current_user(request)
+    ticket = issue_ticket(user, _bearer_session(request))
+    return {"ticket": ticket, "expires_in": settings.REALTIME_TICKET_TTL_SECONDS}
+
+
+@realtime_router.get("/stream")
+async def stream_events(request: Request, ticket: Optional[str] = None):
+    """Server-Sent Events stream of the current user's notifications, messages and live sessions
+
+    Open it with ``?ticket=`` from ``POST /api/realtime/ticket`` (or with an
+    Authorization header). The session is re-checked on every heartbeat; once
+    the access token is revoked or expired the stream sends ``unauthorized``
+    and closes. Events carry a summary only; on ``resync`` the client should
+    refetch its lists.
+    """
+    if ticket:
+        user, session = redeem_ticket(ticket)
+    else:
+        user = await get_current_user(request)
+        session = _bearer_session(request)
+    if not session_valid(session):
+        raise HTTPException(status_code=401, detail="Token has been revoked")
+
+    try:
+        topics = await load_topics(get_async_db(request), user)
+    except Exception as e:
+        logger.warning(f"[REALTIME] Could not load course topics for {user.get('user_id')}: {e}")
+        topics = await load_topics(None, user)
+    if not topics:
+        raise HTTPException(status_code=400, detail="No topics to subscribe to")
+
+    subscription = realtime_hub.subscribe(topics)
+    return StreamingResponse(
+        event_stream(subscription, settings.REALTIME_HEARTBEAT_SECONDS, request.is_disconnected,
+                     lambda: session_valid(session)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+__all__ = ["realtime_router"]
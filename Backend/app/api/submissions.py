@@ -10,6 +10,7 @@ from app.utils.auth import verify_token
 from app.models.submission import get_submission_collection
 from app.models.assignment import get_assignment_collection
 from app.models.user import get_user_collection
+from app.services.instructor_stats_service import instructor_stats
 import os
 import uuid
 from pathlib import Path
@@ -361,6 +362,7 @@ async def grade_submission(
         
         if result.modified_count == 0:
             raise HTTPException(status_code=404, detail="Submission not found or no changes made")
+        instructor_stats.submission_changed(before=submission, after={**submission, **update_data})
         
         logger.info(f"[Submissions API] Successfully graded submission {submission_id}")
         
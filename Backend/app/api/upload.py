@@ -1,6 +1,9 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Form, Request
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Form, Request, Header
 from fastapi.responses import FileResponse
+from starlette.concurrency import run_in_threadpool
 import os
+import re
+import hashlib
 import shutil
 from pathlib import Path
 import uuid
@@ -9,8 +12,11 @@ import mimetypes
 from PIL import Image
 import io
 from bson import ObjectId
-from datetime import datetime
+from datetime import datetime, timedelta
 from app.utils.auth_helpers import get_current_user
+from app.utils.database import get_async_db
+from app.utils.streaming_upload import save_upload, write_stream, hash_file_async
+from app.config import settings
 import logging
 
 upload_router = APIRouter(prefix="/upload", tags=["File Upload"])
@@ -21,6 +27,7 @@ COURSE_THUMBNAILS_DIR = UPLOAD_DIR / "courses" / "thumbnails"
 COURSE_VIDEOS_DIR = UPLOAD_DIR / "courses" / "videos"
 COURSE_PDFS_DIR = UPLOAD_DIR / "courses" / "pdfs"
 PROFILE_AVATARS_DIR = UPLOAD_DIR / "profile" / "avatars"
+RESUMABLE_UPLOADS_DIR = UPLOAD_DIR / "resumable"
 
 # File size limits
 MAX_IMAGE_SIZE = 5 * 1024 * 1024  # 5MB
@@ -43,6 +50,7 @@ COURSE_THUMBNAILS_DIR.mkdir(parents=True, exist_ok=True)
 COURSE_VIDEOS_DIR.mkdir(parents=True, exist_ok=True)
 COURSE_PDFS_DIR.mkdir(parents=True, exist_ok=True)
 PROFILE_AVATARS_DIR.mkdir(parents=True, exist_ok=True)
+RESUMABLE_UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
 
 def validate_image_file(file: UploadFile) -> bool:
     """Validate uploaded file is a valid image"""
@@ -128,6 +136,24 @@ def resize_image(image_data: bytes, max_width: int = 800, max_height: int = 600)
         # If resize fails, return original
         return image_data
 
+def _resize_stored_image(file_path: Path, max_width: int, max_height: int) -> dict:
+    """Resize an image already on disk in place (blocking - run in a thread)"""
+    with open(file_path, "rb") as f:
+        image_data = resize_image(f.read(), max_width, max_height)
+    tmp_path = file_path.with_name(f".{file_path.name}.{uuid.uuid4().hex}.part")
+    with open(tmp_path, "wb") as f:
+        f.write(image_data)
+    os.replace(tmp_path, file_path)
+    return {"path": file_path, "size": len(image_data), "sha256": hashlib.sha256(image_data).hexdigest()}
+
+async def store_image_upload(file: UploadFile, file_path: Path, resize: bool,
+                             max_width: int = 800, max_height: int = 600) -> dict:
+    """Stream an image upload to ``file_path`` and optionally resize it off the event loop"""
+    saved = await save_upload(file, file_path, MAX_IMAGE_SIZE, expected_kind="image")
+    if resize:
+        saved = await run_in_threadpool(_resize_stored_image, file_path, max_width, max_height)
+    return saved
+
 @upload_router.post("/course-thumbnail/{course_id}")
 async def upload_course_thumbnail(
     course_id: str,
@@ -143,25 +169,14 @@ async def upload_course_thumbnail(
             detail=f"Invalid file type. Allowed types: {', '.join(ALLOWED_IMAGE_EXTENSIONS)}"
         )
     
-    # Check file size
-    file.file.seek(0, 2)  # Seek to end
-    file_size = file.file.tell()
-    file.file.seek(0)  # Reset to beginning
-    
-    if file_size > MAX_IMAGE_SIZE:
+    # Reject early when the size is already known; the streamed copy enforces it either way
+    if (file.size or 0) > MAX_IMAGE_SIZE:
         raise HTTPException(
             status_code=400,
             detail=f"File too large. Maximum size: {MAX_IMAGE_SIZE // (1024*1024)}MB"
         )
     
     try:
-        # Read file content
-        file_content = await file.read()
-        
-        # Resize image if requested
-        if resize:
-            file_content = resize_image(file_content)
-        
         # Get appropriate file extension
         file_ext = get_file_extension(file.filename, file.content_type)
         
@@ -169,13 +184,13 @@ async def upload_course_thumbnail(
         filename = f"{course_id}{file_ext}"
         file_path = COURSE_THUMBNAILS_DIR / filename
         
-        # Remove existing thumbnail if it exists
-        for existing_file in COURSE_THUMBNAILS_DIR.glob(f"{course_id}.*"):
-            existing_file.unlink(missing_ok=True)
+        # Stream to disk, resizing afterwards if requested
+        saved = await store_image_upload(file, file_path, resize)
         
-        # Save new file
-        with open(file_path, "wb") as buffer:
-            buffer.write(file_content)
+        # Remove thumbnails with a different extension
+        for existing_file in COURSE_THUMBNAILS_DIR.glob(f"{course_id}.*"):
+            if existing_file != file_path:
+                existing_file.unlink(missing_ok=True)
         
         # Generate URL for the uploaded file
         thumbnail_url = f"/upload/course-thumbnail/{course_id}{file_ext}"
@@ -186,9 +201,12 @@ async def upload_course_thumbnail(
             "course_id": course_id,
             "filename": filename,
             "thumbnail_url": thumbnail_url,
-            "file_size": len(file_content)
+            "file_size": saved["size"],
+            "sha256": saved["sha256"]
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
@@ -274,21 +292,14 @@ async def upload_lesson_video(
             detail=f"Invalid file type. Allowed types: {', '.join(ALLOWED_VIDEO_EXTENSIONS)}"
         )
     
-    # Check file size
-    file.file.seek(0, 2)  # Seek to end
-    file_size = file.file.tell()
-    file.file.seek(0)  # Reset to beginning
-    
-    if file_size > MAX_VIDEO_SIZE:
+    # Reject early when the size is already known; the streamed copy enforces it either way
+    if (file.size or 0) > MAX_VIDEO_SIZE:
         raise HTTPException(
             status_code=400,
             detail=f"File too large. Maximum size: {MAX_VIDEO_SIZE // (1024*1024)}MB"
         )
     
     try:
-        # Read file content
-        file_content = await file.read()
-        
         # Get file extension
         file_ext = Path(file.filename).suffix.lower()
         if not file_ext:
@@ -298,13 +309,13 @@ async def upload_lesson_video(
         filename = f"{lesson_id}{file_ext}"
         file_path = COURSE_VIDEOS_DIR / filename
         
-        # Remove existing video if it exists
-        for existing_file in COURSE_VIDEOS_DIR.glob(f"{lesson_id}.*"):
-            existing_file.unlink(missing_ok=True)
+        # Stream new file to disk in chunks
+        saved = await save_upload(file, file_path, MAX_VIDEO_SIZE, expected_kind="video")
         
-        # Save new file
-        with open(file_path, "wb") as buffer:
-            buffer.write(file_content)
+        # Remove videos with a different extension
+        for existing_file in COURSE_VIDEOS_DIR.glob(f"{lesson_id}.*"):
+            if existing_file != file_path:
+                existing_file.unlink(missing_ok=True)
         
         # Generate URL for the uploaded file
         video_url = f"/upload/lesson-video/{filename}"
@@ -321,9 +332,12 @@ async def upload_lesson_video(
             "lesson_id": lesson_id,
             "filename": filename,
             "video_url": video_url,
-            "file_size": len(file_content)
+            "file_size": saved["size"],
+            "sha256": saved["sha256"]
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
@@ -347,6 +361,285 @@ async def get_lesson_video(filename: str):
         filename=filename
     )
 
+# Resumable lesson video uploads
+#
+#   POST   /upload/lesson-video/{lesson_id}/resumable  open a session (filename, total_size)
+#   PUT    /upload/resumable/{upload_id}                append raw bytes (Content-Range: bytes <start>-<end>/<total>)
+#   GET    /upload/resumable/{upload_id}                current offset, to resume after a dropped connection
+#   POST   /upload/resumable/{upload_id}/complete       verify, hash and move the video into place
+#   DELETE /upload/resumable/{upload_id}                abort
+#
+# Sessions live in MongoDB so any worker can accept the next part.
+UPLOAD_SESSIONS_COLLECTION = "upload_sessions"
+RESUMABLE_CHUNK_SIZE = 8 * 1024 * 1024  # suggested part size for clients
+UPLOAD_LOCK_SECONDS = 15 * 60
+CONTENT_RANGE_RE = re.compile(r"^bytes\s+(\d+)-(\d*)/(\d+|\*)$")
+
+def _partial_upload_path(upload_id: str) -> Path:
+    return RESUMABLE_UPLOADS_DIR / f"{upload_id}.part"
+
+def _upload_session_status(session: dict) -> dict:
+    return {
+        "upload_id": session["_id"],
+        "lesson_id": session["lesson_id"],
+        "filename": session["filename"],
+        "status": session["status"],
+        "offset": session["received"],
+        "total_size": session["total_size"],
+        "chunk_size": RESUMABLE_CHUNK_SIZE,
+        "expires_at": session["expires_at"].isoformat()
+    }
+
+async def _purge_expired_upload_sessions(async_db):
+    """Drop abandoned sessions and their partial files"""
+    sessions = async_db[UPLOAD_SESSIONS_COLLECTION]
+    expired = await sessions.find(
+        {"expires_at": {"$lt": datetime.utcnow()}, "status": {"$ne": "finalizing"}}, {"_id": 1}
+    ).to_list(length=100)
+    if not expired:
+        return
+    for session in expired:
+        _partial_upload_path(session["_id"]).unlink(missing_ok=True)
+    await sessions.delete_many({"_id": {"$in": [session["_id"] for session in expired]}})
+
+@upload_router.post("/lesson-video/{lesson_id}/resumable")
+async def start_resumable_video_upload(
+    lesson_id: str,
+    request: Request,
+    filename: str = Form(...),
+    total_size: int = Form(...),
+    content_type: Optional[str] = Form(None),
+    sha256: Optional[str] = Form(None)
+):
+    """Open a resumable upload session for a large lesson video"""
+    
+    file_ext = Path(filename).suffix.lower()
+    if file_ext not in ALLOWED_VIDEO_EXTENSIONS or (content_type and content_type not in ALLOWED_VIDEO_MIME_TYPES):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid file type. Allowed types: {', '.join(ALLOWED_VIDEO_EXTENSIONS)}"
+        )
+    
+    if total_size <= 0 or total_size > settings.RESUMABLE_UPLOAD_MAX_BYTES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid file size. Maximum size: {settings.RESUMABLE_UPLOAD_MAX_BYTES // (1024*1024)}MB"
+        )
+    
+    async_db = get_async_db(request)
+    await _purge_expired_upload_sessions(async_db)
+    
+    now = datetime.utcnow()
+    session = {
+        "_id": uuid.uuid4().hex,
+        "kind": "lesson_video",
+        "lesson_id": lesson_id,
+        "filename": filename,
+        "file_ext": file_ext,
+        "content_type": content_type,
+        "total_size": total_size,
+        "received": 0,
+        "sha256": sha256.lower() if sha256 else None,
+        "status": "uploading",
+        "created_at": now,
+        "updated_at": now,
+        "expires_at": now + timedelta(hours=settings.UPLOAD_SESSION_TTL_HOURS)
+    }
+    _partial_upload_path(session["_id"]).touch()
+    await async_db[UPLOAD_SESSIONS_COLLECTION].insert_one(session)
+    
+    return {
+        "success": True,
+        "message": "Upload session created",
+        **_upload_session_status(session)
+    }
+
+@upload_router.get("/resumable/{upload_id}")
+async def get_resumable_upload(upload_id: str, request: Request):
+    """Report how many bytes of a resumable upload have been stored"""
+    
+    async_db = get_async_db(request)
+    session = await async_db[UPLOAD_SESSIONS_COLLECTION].find_one({"_id": upload_id})
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    
+    return {"success": True, **_upload_session_status(session)}
+
+@upload_router.put("/resumable/{upload_id}")
+async def upload_resumable_part(
+    upload_id: str,
+    request: Request,
+    content_range: Optional[str] = Header(None)
+):
+    """Append the raw request body to a resumable upload
+    
+    The body is streamed straight to the partial file. Without a Content-Range
+    header the part is appended at the current offset. If the connection drops
+    mid-part, the bytes that arrived are kept and GET reports the new offset.
+    """
+    
+    async_db = get_async_db(request)
+    sessions = async_db[UPLOAD_SESSIONS_COLLECTION]
+    session = await sessions.find_one({"_id": upload_id})
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    if session["status"] != "uploading":
+        raise HTTPException(status_code=409, detail=f"Upload is {session['status']}")
+    
+    offset = session["received"]
+    if content_range:
+        match = CONTENT_RANGE_RE.match(content_range.strip())
+        if not match:
+            raise HTTPException(status_code=400, detail="Invalid Content-Range header")
+        if int(match.group(1)) != offset:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Upload offset mismatch: expected {offset}",
+                headers={"Upload-Offset": str(offset)}
+            )
+    
+    partial_path = _partial_upload_path(upload_id)
+    if offset and not partial_path.exists():
+        raise HTTPException(status_code=410, detail="Partial upload is gone. Please restart the upload")
+    
+    # Claim the session so two requests cannot write the same region
+    now = datetime.utcnow()
+    lock_id = uuid.uuid4().hex
+    claimed = await sessions.find_one_and_update(
+        {
+            "_id": upload_id,
+            "status": "uploading",
+            "received": offset,
+            "$or": [{"lock_until": None}, {"lock_until": {"$lt": now}}]
+        },
+        {"$set": {"lock_id": lock_id, "lock_until": now + timedelta(seconds=UPLOAD_LOCK_SECONDS)}}
+    )
+    if not claimed:
+        raise HTTPException(status_code=409, detail="Another part of this upload is in progress")
+    
+    written = 0
+    try:
+        written = await write_stream(
+            request.stream(), partial_path, offset=offset,
+            max_bytes=session["total_size"] - offset, expected_kind="video"
+        )
+    finally:
+        update = {
+            "$set": {
+                "updated_at": datetime.utcnow(),
+                "expires_at": datetime.utcnow() + timedelta(hours=settings.UPLOAD_SESSION_TTL_HOURS)
+            },
+            "$unset": {"lock_id": "", "lock_until": ""}
+        }
+        if written:
+            update["$inc"] = {"received": written}
+        await sessions.update_one({"_id": upload_id, "lock_id": lock_id}, update)
+    
+    received = offset + written
+    return {
+        "success": True,
+        "upload_id": upload_id,
+        "offset": received,
+        "total_size": session["total_size"],
+        "complete": received == session["total_size"]
+    }
+
+@upload_router.post("/resumable/{upload_id}/complete")
+async def complete_resumable_upload(upload_id: str, request: Request):
+    """Verify a fully received upload and publish it as the lesson video"""
+    
+    from pymongo import ReturnDocument
+    
+    async_db = get_async_db(request)
+    sessions = async_db[UPLOAD_SESSIONS_COLLECTION]
+    session = await sessions.find_one_and_update(
+        {
+            "_id": upload_id,
+            "status": "uploading",
+            "lock_until": None,
+            "$expr": {"$eq": ["$received", "$total_size"]}
+        },
+        {"$set": {"status": "finalizing", "updated_at": datetime.utcnow()}},
+        return_document=ReturnDocument.AFTER
+    )
+    if not session:
+        current = await sessions.find_one({"_id": upload_id})
+        if not current:
+            raise HTTPException(status_code=404, detail="Upload session not found")
+        raise HTTPException(
+            status_code=409,
+            detail=f"Upload is not ready to complete ({current['status']}, {current['received']}/{current['total_size']} bytes)"
+        )
+    
+    partial_path = _partial_upload_path(upload_id)
+    filename = f"{session['lesson_id']}{session['file_ext']}"
+    file_path = COURSE_VIDEOS_DIR / filename
+    
+    try:
+        digest = await hash_file_async(partial_path)
+        if session.get("sha256") and session["sha256"] != digest:
+            partial_path.unlink(missing_ok=True)
+            await sessions.update_one({"_id": upload_id}, {"$set": {"status": "failed", "updated_at": datetime.utcnow()}})
+            raise HTTPException(status_code=422, detail="Checksum mismatch. Please restart the upload")
+        os.replace(partial_path, file_path)
+    except HTTPException:
+        raise
+    except Exception as e:
+        await sessions.update_one({"_id": upload_id}, {"$set": {"status": "uploading"}})
+        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+    
+    # Remove videos with a different extension
+    for existing_file in COURSE_VIDEOS_DIR.glob(f"{session['lesson_id']}.*"):
+        if existing_file != file_path:
+            existing_file.unlink(missing_ok=True)
+    
+    video_url = f"/upload/lesson-video/{filename}"
+    
+    # Update lesson in database with video URL
+    if hasattr(request.app, 'mongodb'):
+        from app.services.lesson_service import update_lesson_video_url
+        update_lesson_video_url(request.app.mongodb, session["lesson_id"], video_url)
+    
+    await sessions.update_one(
+        {"_id": upload_id},
+        {"$set": {
+            "status": "completed",
+            "sha256": digest,
+            "video_url": video_url,
+            "updated_at": datetime.utcnow()
+        }}
+    )
+    
+    return {
+        "success": True,
+        "message": "Video uploaded successfully",
+        "upload_id": upload_id,
+        "lesson_id": session["lesson_id"],
+        "filename": filename,
+        "video_url": video_url,
+        "file_size": session["total_size"],
+        "sha256": digest
+    }
+
+@upload_router.delete("/resumable/{upload_id}")
+async def abort_resumable_upload(upload_id: str, request: Request):
+    """Abort a resumable upload and discard what was received"""
+    
+    async_db = get_async_db(request)
+    session = await async_db[UPLOAD_SESSIONS_COLLECTION].find_one_and_delete(
+        {"_id": upload_id, "status": {"$ne": "finalizing"}}
+    )
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    
+    _partial_upload_path(upload_id).unlink(missing_ok=True)
+    
+    return {
+        "success": True,
+        "message": "Upload aborted",
+        "upload_id": upload_id
+    }
+
 @upload_router.post("/lesson-pdf/{lesson_id}")
 async def upload_lesson_pdf(
     lesson_id: str,
@@ -362,33 +655,26 @@ async def upload_lesson_pdf(
             detail=f"Invalid file type. Allowed types: {', '.join(ALLOWED_PDF_EXTENSIONS)}"
         )
     
-    # Check file size
-    file.file.seek(0, 2)  # Seek to end
-    file_size = file.file.tell()
-    file.file.seek(0)  # Reset to beginning
-    
-    if file_size > MAX_PDF_SIZE:
+    # Reject early when the size is already known; the streamed copy enforces it either way
+    if (file.size or 0) > MAX_PDF_SIZE:
         raise HTTPException(
             status_code=400,
             detail=f"File too large. Maximum size: {MAX_PDF_SIZE // (1024*1024)}MB"
         )
     
     try:
-        # Read file content
-        file_content = await file.read()
-        
         # Create filename with lesson_id and original filename
         original_filename = file.filename or "document.pdf"
         filename = f"{lesson_id}_{original_filename}"
         file_path = COURSE_PDFS_DIR / filename
         
-        # Remove existing PDF if it exists
-        for existing_file in COURSE_PDFS_DIR.glob(f"{lesson_id}_*"):
-            existing_file.unlink(missing_ok=True)
+        # Stream new file to disk in chunks
+        saved = await save_upload(file, file_path, MAX_PDF_SIZE, expected_kind="pdf")
         
-        # Save new file
-        with open(file_path, "wb") as buffer:
-            buffer.write(file_content)
+        # Remove previously uploaded PDFs for this lesson
+        for existing_file in COURSE_PDFS_DIR.glob(f"{lesson_id}_*"):
+            if existing_file != file_path:
+                existing_file.unlink(missing_ok=True)
         
         # Generate URL for the uploaded file
         pdf_url = f"/upload/lesson-pdf/{filename}"
@@ -406,9 +692,12 @@ async def upload_lesson_pdf(
             "filename": filename,
             "original_filename": original_filename,
             "pdf_url": pdf_url,
-            "file_size": len(file_content)
+            "file_size": saved["size"],
+            "sha256": saved["sha256"]
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
@@ -442,25 +731,14 @@ async def upload_avatar(
             detail=f"Invalid file type. Allowed types: {', '.join(ALLOWED_IMAGE_EXTENSIONS)}"
         )
     
-    # Check file size
-    file.file.seek(0, 2)  # Seek to end
-    file_size = file.file.tell()
-    file.file.seek(0)  # Reset to beginning
-    
-    if file_size > MAX_IMAGE_SIZE:
+    # Reject early when the size is already known; the streamed copy enforces it either way
+    if (file.size or 0) > MAX_IMAGE_SIZE:
         raise HTTPException(
             status_code=400,
             detail=f"File too large. Maximum size: {MAX_IMAGE_SIZE // (1024*1024)}MB"
         )
     
     try:
-        # Read file content
-        file_content = await file.read()
-        
-        # Resize image if requested (smaller for avatars)
-        if resize:
-            file_content = resize_image(file_content, max_width=400, max_height=400)
-        
         # Get appropriate file extension
         file_ext = get_file_extension(file.filename, file.content_type)
         
@@ -472,9 +750,8 @@ async def upload_avatar(
         
         file_path = PROFILE_AVATARS_DIR / filename
         
-        # Save new file
-        with open(file_path, "wb") as buffer:
-            buffer.write(file_content)
+        # Stream to disk, resizing afterwards if requested (smaller for avatars)
+        saved = await store_image_upload(file, file_path, resize, max_width=400, max_height=400)
         
         # Generate URL for the uploaded file
         avatar_url = f"/upload/avatar/{filename}"
@@ -486,9 +763,12 @@ async def upload_avatar(
             "avatar_url": avatar_url,
             "url": avatar_url,  # Alternative key for compatibility
             "file_url": avatar_url,  # Another alternative key
-            "file_size": len(file_content)
+            "file_size": saved["size"],
+            "sha256": saved["sha256"]
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
@@ -2,10 +2,13 @@
 Video serving API for course thumbnails and media files
 """
 import os
+import stat
 import mimetypes
+import anyio
+from email.utils import formatdate, parsedate_to_datetime
 from fastapi import APIRouter, HTTPException, Request, Response
 from fastapi.responses import FileResponse, StreamingResponse
-from typing import Optional
+from typing import AsyncIterator, List, Optional, Tuple
 
 router = APIRouter()
 
@@ -28,63 +31,206 @@ def get_video_mime_type(filename: str) -> str:
     _, ext = os.path.splitext(filename.lower())
     return VIDEO_MIME_TYPES.get(ext, 'video/mp4')
 
+# Size of each async read while streaming; bounds per-request memory
+STREAM_CHUNK_SIZE = 256 * 1024
+MULTIPART_BOUNDARY = "SKILLWALLAH_BYTERANGES"
+
+
+def build_etag(stat_result: os.stat_result) -> str:
+    """Strong validator derived from size and modification time"""
+    return f'"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+
+
+def _etag_matches(header_value: str, etag: str) -> bool:
+    """Weak comparison used by If-None-Match"""
+    if header_value.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in header_value.split(",")]
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def is_not_modified(request: Request, etag: str, mtime: float) -> bool:
+    """True when the client's cached copy is still current (304)"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(mtime) <= since
+    return False
+
+
+def if_range_allows(request: Request, etag: str, last_modified: str) -> bool:
+    """If-Range: honour Range only when the validator still matches (strong comparison)"""
+    if_range = request.headers.get("if-range")
+    if not if_range:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        return if_range == etag
+    return if_range == last_modified
+
+
+def parse_range_header(range_header: str, file_size: int) -> Optional[List[Tuple[int, int]]]:
+    """Parse ``bytes=`` ranges into inclusive (start, end) pairs
+
+    Supports ``a-b``, open-ended ``a-`` and suffix ``-n`` specs, several per
+    header. Returns None when the header is malformed (the Range is ignored)
+    and an empty list when no range is satisfiable (416).
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec.strip():
+        return None
+
+    ranges = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start_str, sep, end_str = part.partition("-")
+        if not sep:
+            return None
+        try:
+            if start_str == "":
+                suffix = int(end_str)
+                if suffix <= 0:
+                    continue
+                start, end = max(file_size - suffix, 0), file_size - 1
+            else:
+                start = int(start_str)
+                if end_str:
+                    end = int(end_str)
+                    if end < start:
+                        return None
+                    end = min(end, file_size - 1)
+                else:
+                    end = file_size - 1
+        except ValueError:
+            return None
+        if start < file_size and start >= 0:
+            ranges.append((start, end))
+
+    # Merge overlapping/adjacent ranges so a client can't ask for the same bytes many times
+    ranges.sort()
+    merged = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+async def iter_file_range(file_path: str, start: int, end: int) -> AsyncIterator[bytes]:
+    """Read bytes start..end (inclusive) in chunks without blocking the event loop"""
+    remaining = end - start + 1
+    async with await anyio.open_file(file_path, "rb") as f:
+        await f.seek(start)
+        while remaining > 0:
+            chunk = await f.read(min(STREAM_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _part_header(start: int, end: int, file_size: int, mime_type: str) -> bytes:
+    return (
+        f"--{MULTIPART_BOUNDARY}\r\n"
+        f"Content-Type: {mime_type}\r\n"
+        f"Content-Range: bytes {start}-{end}/{file_size}\r\n\r\n"
+    ).encode("latin-1")
+
+
+async def iter_multipart_ranges(file_path: str, ranges: List[Tuple[int, int]], file_size: int, mime_type: str) -> AsyncIterator[bytes]:
+    for start, end in ranges:
+        yield _part_header(start, end, file_size, mime_type)
+        async for chunk in iter_file_range(file_path, start, end):
+            yield chunk
+        yield b"\r\n"
+    yield f"--{MULTIPART_BOUNDARY}--\r\n".encode("latin-1")
+
+
+def multipart_length(ranges: List[Tuple[int, int]], file_size: int, mime_type: str) -> int:
+    length = sum(len(_part_header(s, e, file_size, mime_type)) + (e - s + 1) + 2 for s, e in ranges)
+    return length + len(f"--{MULTIPART_BOUNDARY}--\r\n")
+
+
 @router.get("/video-serve/{filename}")
-async def serve_video(filename: str, request: Request, range_header: Optional[str] = None):
+async def serve_video(filename: str, request: Request):
     """
     Serve video files with proper MIME types and range support for streaming
+    
+    Supports single, multiple and suffix byte ranges, ETag/Last-Modified
+    validation (304) and If-Range. Bodies are streamed in chunks from disk.
     """
-    # Construct file path
-    uploads_dir = os.path.join(os.getcwd(), "uploads", "courses")
-    file_path = os.path.join(uploads_dir, filename)
+    # Construct file path (never outside the uploads directory)
+    uploads_dir = os.path.realpath(os.path.join(os.getcwd(), "uploads", "courses"))
+    file_path = os.path.realpath(os.path.join(uploads_dir, filename))
+    if not file_path.startswith(uploads_dir + os.sep):
+        raise HTTPException(status_code=404, detail="Video file not found")
     
     # Check if file exists
-    if not os.path.exists(file_path):
+    try:
+        stat_result = os.stat(file_path)
+    except OSError:
+        raise HTTPException(status_code=404, detail="Video file not found")
+    if not stat.S_ISREG(stat_result.st_mode):
         raise HTTPException(status_code=404, detail="Video file not found")
     
     # Get file info
-    file_size = os.path.getsize(file_path)
+    file_size = stat_result.st_size
     mime_type = get_video_mime_type(filename)
+    etag = build_etag(stat_result)
+    last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+    validators = {"ETag": etag, "Last-Modified": last_modified, "Accept-Ranges": "bytes"}
+    
+    if is_not_modified(request, etag, stat_result.st_mtime):
+        return Response(status_code=304, headers=validators)
     
     # Handle range requests for video streaming
-    range_header = request.headers.get('Range')
-    if range_header:
-        # Parse range header
-        try:
-            start_str = range_header.replace('bytes=', '').split('-')[0]
-            start = int(start_str) if start_str else 0
-            end = file_size - 1  # Default to end of file
+    range_header = request.headers.get("range")
+    if range_header and if_range_allows(request, etag, last_modified):
+        ranges = parse_range_header(range_header, file_size)
+        if ranges is not None:
+            if not ranges:
+                return Response(status_code=416, headers={**validators, "Content-Range": f"bytes */{file_size}"})
             
-            # Read the range of bytes
-            with open(file_path, 'rb') as f:
-                f.seek(start)
-                chunk_size = min(1024 * 1024, end - start + 1)  # 1MB chunks
-                data = f.read(chunk_size)
+            if len(ranges) == 1:
+                start, end = ranges[0]
+                return StreamingResponse(
+                    iter_file_range(file_path, start, end),
+                    status_code=206,
+                    media_type=mime_type,
+                    headers={
+                        **validators,
+                        "Content-Range": f"bytes {start}-{end}/{file_size}",
+                        "Content-Length": str(end - start + 1)
+                    }
+                )
             
-            # Return partial content response
-            response = Response(
-                content=data,
+            return StreamingResponse(
+                iter_multipart_ranges(file_path, ranges, file_size, mime_type),
                 status_code=206,
+                media_type=f"multipart/byteranges; boundary={MULTIPART_BOUNDARY}",
                 headers={
-                    'Content-Range': f'bytes {start}-{start + len(data) - 1}/{file_size}',
-                    'Accept-Ranges': 'bytes',
-                    'Content-Length': str(len(data)),
-                    'Content-Type': mime_type
+                    **validators,
+                    "Content-Length": str(multipart_length(ranges, file_size, mime_type))
                 }
             )
-            return response
-            
-        except (ValueError, IndexError):
-            # Invalid range header, serve full file
-            pass
     
     # Serve full file
     return FileResponse(
         path=file_path,
         media_type=mime_type,
         filename=filename,
+        stat_result=stat_result,
         headers={
-            'Accept-Ranges': 'bytes',
+            **validators,
             'Content-Length': str(file_size)
         }
     )
-
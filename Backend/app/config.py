@@ -21,6 +21,72 @@ class Settings:
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 525600))  # 365 days default
     REFRESH_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("REFRESH_TOKEN_EXPIRE_MINUTES", 525600))  # 365 days
 
+    # Cache limits (see app/utils/cache.py)
+    CACHE_MAX_ENTRIES: int = int(os.getenv("CACHE_MAX_ENTRIES", 10000))
+    CACHE_MAX_BYTES: int = int(os.getenv("CACHE_MAX_BYTES", 64 * 1024 * 1024))
+    CACHE_SWEEP_INTERVAL_SECONDS: int = int(os.getenv("CACHE_SWEEP_INTERVAL_SECONDS", 60))
+    # "memory" = per-worker LRU, "shared" = SQLite file shared by all workers on the host;
+    # the shared file must live in a directory only the service user can write (e.g. /var/lib/skillwallah)
+    CACHE_BACKEND: str = os.getenv("CACHE_BACKEND", "memory")
+    CACHE_SHARED_PATH: str = os.getenv("CACHE_SHARED_PATH", "")
+
+    # Latency budgets (ms) reported in Server-Timing headers (see app/utils/timing.py)
+    STUDENT_LIST_LATENCY_BUDGET_MS: int = int(os.getenv("STUDENT_LIST_LATENCY_BUDGET_MS", 250))
+
+    # Process pool size for bulk certificate/marksheet rendering (0 = one per CPU)
+    DOCUMENT_RENDER_WORKERS: int = int(os.getenv("DOCUMENT_RENDER_WORKERS", 0))
+
+    # Write-behind buffer for progress heartbeats (see app/services/progress_buffer.py)
+    PROGRESS_FLUSH_INTERVAL_SECONDS: float = float(os.getenv("PROGRESS_FLUSH_INTERVAL_SECONDS", 5))
+    PROGRESS_BUFFER_MAX_PENDING: int = int(os.getenv("PROGRESS_BUFFER_MAX_PENDING", 5000))
+
+    # bcrypt thread pool (0 workers = one per CPU); logins beyond max pending get 503
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", 0))
+    PASSWORD_HASH_MAX_PENDING: int = int(os.getenv("PASSWORD_HASH_MAX_PENDING", 256))
+
+    # In-memory franchise/branch directory (see app/services/tenant_directory.py); also reloaded on change streams
+    TENANT_DIRECTORY_TTL_SECONDS: int = int(os.getenv("TENANT_DIRECTORY_TTL_SECONDS", 300))
+
+    # How often each worker pulls token revocations (password resets, disabled logins) into memory
+    TOKEN_REVOCATION_SYNC_SECONDS: float = float(os.getenv("TOKEN_REVOCATION_SYNC_SECONDS", 2))
+
+    # Instructor dashboard counters (see app/services/instructor_stats_service.py)
+    INSTRUCTOR_STATS_FLUSH_SECONDS: float = float(os.getenv("INSTRUCTOR_STATS_FLUSH_SECONDS", 5))
+    INSTRUCTOR_STATS_MAX_AGE_SECONDS: int = int(os.getenv("INSTRUCTOR_STATS_MAX_AGE_SECONDS", 900))
+
+    # Inbox rows written per insert_many when fanning out a notification (see app/services/notification_fanout.py)
+    NOTIFICATION_FANOUT_BATCH_SIZE: int = int(os.getenv("NOTIFICATION_FANOUT_BATCH_SIZE", 1000))
+
+    # Server-Sent Events push channel (see app/services/realtime_hub.py)
+    REALTIME_HEARTBEAT_SECONDS: float = float(os.getenv("REALTIME_HEARTBEAT_SECONDS", 15))
+    REALTIME_QUEUE_SIZE: int = int(os.getenv("REALTIME_QUEUE_SIZE", 100))
+    # Lifetime of the single-use ticket that opens a stream (POST /api/realtime/ticket)
+    REALTIME_TICKET_TTL_SECONDS: int = int(os.getenv("REALTIME_TICKET_TTL_SECONDS", 60))
+
+    # Outgoing mail (SMTP_SERVER=localhost SMTP_PORT=8025 SMTP_REQUIRE_TLS=false with a local aiosmtpd works too)
+    SMTP_SERVER: str = os.getenv("SMTP_SERVER", "smtp.gmail.com")
+    SMTP_PORT: int = int(os.getenv("SMTP_PORT", "587"))
+    SMTP_USERNAME: str = os.getenv("SMTP_USERNAME", "arzumehreen050@gmail.com")
+    SMTP_PASSWORD: str = os.getenv("SMTP_PASSWORD", "cpus ctsa fdtm dmqs")
+    FROM_EMAIL: str = os.getenv("FROM_EMAIL", SMTP_USERNAME)
+    FROM_NAME: str = os.getenv("FROM_NAME", "Skill Wallah LMS")
+    # STARTTLS is mandatory when SMTP credentials are set; "false" only for a plain local test server
+    SMTP_REQUIRE_TLS: bool = os.getenv("SMTP_REQUIRE_TLS", "true").lower() != "false"
+
+    # Email outbox senders (see app/services/email_outbox.py)
+    EMAIL_POOL_SIZE: int = int(os.getenv("EMAIL_POOL_SIZE", 2))
+    EMAIL_BATCH_SIZE: int = int(os.getenv("EMAIL_BATCH_SIZE", 20))
+    EMAIL_MAX_ATTEMPTS: int = int(os.getenv("EMAIL_MAX_ATTEMPTS", 5))
+    EMAIL_CONNECTION_MAX_AGE_SECONDS: int = int(os.getenv("EMAIL_CONNECTION_MAX_AGE_SECONDS", 300))
+    EMAIL_OUTBOX_RETENTION_DAYS: int = int(os.getenv("EMAIL_OUTBOX_RETENTION_DAYS", 30))
+
+    # Resumable (multi-part) lesson video uploads
+    RESUMABLE_UPLOAD_MAX_BYTES: int = int(os.getenv("RESUMABLE_UPLOAD_MAX_BYTES", 5 * 1024 * 1024 * 1024))
+    UPLOAD_SESSION_TTL_HOURS: int = int(os.getenv("UPLOAD_SESSION_TTL_HOURS", 24))
+
+    # Materialized course content trees are rebuilt when older than this, even if never invalidated
+    COURSE_CONTENT_TREE_MAX_AGE_SECONDS: int = int(os.getenv("COURSE_CONTENT_TREE_MAX_AGE_SECONDS", 900))
+
     # Upload Directory
     UPLOAD_DIR: str = os.getenv("UPLOAD_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "uploads"))
 
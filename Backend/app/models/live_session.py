@@ -1,10 +1,11 @@
 from pymongo import IndexModel, ASCENDING, DESCENDING
 
 def get_live_session_collection(db):
-    """Get the live sessions collection with proper indexing"""
-    collection = db["live_sessions"]
-    
-    # Create indexes for better performance
+    """Get the live sessions collection"""
+    return db["live_sessions"]
+
+def ensure_live_session_indexes(db):
+    """Create the live session indexes (once at startup, not on every request)"""
     indexes = [
         IndexModel([("course_id", ASCENDING)]),
         IndexModel([("scheduled_time", ASCENDING)]),
@@ -14,9 +15,7 @@ def get_live_session_collection(db):
     ]
     
     try:
-        collection.create_indexes(indexes)
+        get_live_session_collection(db).create_indexes(indexes)
     except Exception as e:
         # Index creation might fail if they already exist, which is fine
         pass
-    
-    return collection
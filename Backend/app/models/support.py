@@ -159,6 +159,7 @@ def create_support_reply(db, reply_data):
 
 def get_support_analytics(db, date_filter=None):
     """Get support analytics data with optional date filtering"""
+    from app.services.stats_engine import run_stats_sync, count, group_count
     collection = get_support_ticket_collection(db)
     
     # Build date query if date filter provided
@@ -174,32 +175,35 @@ def get_support_analytics(db, date_filter=None):
         elif date_filter.get('end_date'):
             date_query["created_date"] = {"$lte": date_filter['end_date']}
     
-    # Basic counts
-    total_tickets = collection.count_documents(date_query)
-    open_tickets = collection.count_documents({**date_query, "status": "open"})
-    in_progress_tickets = collection.count_documents({**date_query, "status": "in_progress"})
-    pending_tickets = collection.count_documents({**date_query, "status": "pending"})
-    resolved_tickets = collection.count_documents({**date_query, "status": "resolved"})
-    closed_tickets = collection.count_documents({**date_query, "status": "closed"})
-    high_priority_tickets = collection.count_documents({**date_query, "priority": "high"})
-    medium_priority_tickets = collection.count_documents({**date_query, "priority": "medium"})
-    low_priority_tickets = collection.count_documents({**date_query, "priority": "low"})
-    
-    # Recent tickets (last 7 days if no date filter)
+    # All counts in one pass over the filtered tickets
+    stats = {
+        "total": count(),
+        "by_status": group_count("$status"),
+        "by_priority": group_count("$priority"),
+        "by_category": group_count("$category")
+    }
     if not date_filter:
-        week_ago = datetime.utcnow() - timedelta(days=7)
-        recent_tickets = collection.count_documents({"created_date": {"$gte": week_ago}})
-    else:
-        recent_tickets = total_tickets
+        # Recent tickets (last 7 days if no date filter)
+        stats["recent"] = count({"created_date": {"$gte": datetime.utcnow() - timedelta(days=7)}})
+    tickets = run_stats_sync(db, {
+        "tickets": {"collection": collection.name, "match": date_query, "stats": stats}
+    })["tickets"]
+    
+    total_tickets = tickets["total"]
+    by_status = tickets["by_status"]
+    by_priority = tickets["by_priority"]
+    open_tickets = by_status.get("open", 0)
+    in_progress_tickets = by_status.get("in_progress", 0)
+    pending_tickets = by_status.get("pending", 0)
+    resolved_tickets = by_status.get("resolved", 0)
+    closed_tickets = by_status.get("closed", 0)
+    high_priority_tickets = by_priority.get("high", 0)
+    medium_priority_tickets = by_priority.get("medium", 0)
+    low_priority_tickets = by_priority.get("low", 0)
+    recent_tickets = tickets.get("recent", total_tickets)
     
     # Category distribution
-    category_pipeline = [
-        {"$match": date_query},
-        {"$group": {"_id": "$category", "count": {"$sum": 1}}},
-        {"$sort": {"count": -1}}
-    ]
-    categories = list(collection.aggregate(category_pipeline))
-    category_data = [{"category": cat["_id"], "count": cat["count"]} for cat in categories]
+    category_data = [{"category": category, "count": n} for category, n in tickets["by_category"].items()]
     
     return {
         "total_tickets": total_tickets,
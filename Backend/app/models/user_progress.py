@@ -1,14 +1,23 @@
 from datetime import datetime
-from pymongo import IndexModel, ASCENDING, DESCENDING
+from pymongo import IndexModel, ASCENDING, DESCENDING, UpdateOne, ReturnDocument
 from bson import ObjectId
 import uuid
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Content counts as completed once this much of it has been watched
+COMPLETION_THRESHOLD = 95.0
+
+# Indexes are created once per process, not on every progress write
+_indexes_ready = False
+
 def get_user_progress_collection(db):
     """Get the user_progress collection with proper indexing"""
+    global _indexes_ready
     collection = db["user_progress"]
+    if _indexes_ready:
+        return collection
     
     # Create indexes for better performance
     indexes = [
@@ -25,126 +34,178 @@ def get_user_progress_collection(db):
     
     try:
         collection.create_indexes(indexes)
+        _indexes_ready = True
     except Exception as e:
         # Index creation might fail if they already exist, which is fine
         pass
     
     return collection
 
+def build_progress_update(user_id, course_id, module_id, content_id,
+                          content_type="video", watched_duration=0.0, total_duration=0.0,
+                          completed=None, now=None):
+    """Filter and aggregation-pipeline update for one progress report
+    
+    The pipeline decides against the stored document itself, so the whole
+    upsert is one atomic ``find_one_and_update``/``UpdateOne(upsert=True)``:
+    
+    - completion is only granted at ``COMPLETION_THRESHOLD``% or more; an
+      explicit completion request below it is rejected and resets completion
+    - an explicit ``completed=False`` resets completion on existing progress
+    - otherwise existing completion is left alone
+    - ``completed_at`` is set once, when progress first becomes completed
+    - ``max_position_reached`` only grows
+    - new documents are completed iff they start at or past the threshold
+    """
+    now = now or datetime.utcnow()
+    completion_percentage = calculate_completion_percentage(watched_duration, total_duration)
+    reached_threshold = completion_percentage >= COMPLETION_THRESHOLD
+    
+    # Auto-complete if watched 95% or more (even if completed is None)
+    if completed is None and reached_threshold:
+        completed = True
+    
+    is_new = {"$eq": [{"$type": "$created_at"}, "missing"]}
+    new_completed_at = now if reached_threshold else None
+    
+    if completed and reached_threshold:
+        completed_expr = {"$literal": True}
+        completed_at_expr = {"$cond": [{"$eq": ["$completed", True]}, "$completed_at", now]}
+    elif completed is not None:
+        if completed:
+            logger.warning(f"Rejecting completion for {content_id} - only {completion_percentage:.1f}% (need >= {COMPLETION_THRESHOLD:.0f}%)")
+        completed_expr = {"$cond": [is_new, reached_threshold, False]}
+        completed_at_expr = {"$cond": [is_new, new_completed_at, None]}
+    else:
+        completed_expr = {"$cond": [is_new, False, "$completed"]}
+        completed_at_expr = {"$cond": [is_new, None, "$completed_at"]}
+    
+    query = {
+        "user_id": user_id,
+        "course_id": course_id,
+        "content_id": content_id
+    }
+    pipeline = [{"$set": {
+        "_id": {"$ifNull": ["$_id", str(uuid.uuid4())]},
+        "module_id": {"$ifNull": ["$module_id", {"$literal": module_id}]},
+        "content_type": {"$ifNull": ["$content_type", {"$literal": content_type}]},
+        "watched_duration": {"$literal": watched_duration},
+        "total_duration": {"$literal": total_duration},
+        "completion_percentage": completion_percentage,
+        "completed": completed_expr,
+        "created_at": {"$ifNull": ["$created_at", now]},
+        "updated_at": now,
+        "completed_at": completed_at_expr,
+        "notes": {"$ifNull": ["$notes", None]},
+        "last_position": {"$literal": watched_duration},
+        "max_position_reached": {"$cond": [
+            is_new,
+            {"$literal": watched_duration},
+            {"$max": [{"$ifNull": ["$max_position_reached", 0]}, {"$literal": watched_duration}]}
+        ]}
+    }}]
+    return query, pipeline
+
 def upsert_user_progress(db, user_id, course_id, module_id, content_id, 
                         content_type="video", watched_duration=0.0, total_duration=0.0, 
                         completed=None):
-    """Insert or update user progress with optimized logic"""
+    """Insert or update user progress in a single atomic round trip"""
     collection = get_user_progress_collection(db)
-    from datetime import datetime
     
-    # Calculate completion percentage
-    completion_percentage = (watched_duration / total_duration) * 100 if total_duration > 0 else 0.0
+    query, pipeline = build_progress_update(
+        user_id, course_id, module_id, content_id,
+        content_type=content_type,
+        watched_duration=watched_duration,
+        total_duration=total_duration,
+        completed=completed
+    )
+    progress = collection.find_one_and_update(
+        query,
+        pipeline,
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
     
-    # Auto-complete if watched 95% or more (even if completed is None)
-    if completion_percentage >= 95.0:
-        if completed is None:
-            completed = True
+    if progress.get("completed") and progress.get("completed_at") == progress.get("updated_at"):
+        logger.info(f"Content {content_id} marked as COMPLETED ({progress['completion_percentage']:.1f}%)")
     
+    return progress
+
+def bulk_upsert_user_progress(db, updates):
+    """Apply many progress reports with one ordered ``bulk_write``
+    
+    ``updates`` are dicts with the keyword arguments of ``upsert_user_progress``
+    (minus ``db``). Returns the pymongo BulkWriteResult.
+    """
+    collection = get_user_progress_collection(db)
     now = datetime.utcnow()
+    operations = []
+    for update in updates:
+        query, pipeline = build_progress_update(now=now, **update)
+        operations.append(UpdateOne(query, pipeline, upsert=True))
+    return collection.bulk_write(operations, ordered=True)
+
+def calculate_completion_percentage(watched_duration, total_duration):
+    return (watched_duration / total_duration) * 100 if total_duration > 0 else 0.0
+
+def is_progress_heartbeat(watched_duration, total_duration, completed=None):
+    """True when an update cannot change completion state and may be buffered
     
-    # Check if progress already exists
-    existing_progress = collection.find_one({
-        "user_id": user_id,
-        "course_id": course_id,
-        "content_id": content_id
-    })
+    Explicit completion requests and updates at or past the completion
+    threshold are completion events and must be written immediately.
+    """
+    if completed is not None:
+        return False
+    return calculate_completion_percentage(watched_duration, total_duration) < COMPLETION_THRESHOLD
+
+def build_heartbeat_operations(entry):
+    """bulk_write operations for one coalesced heartbeat
     
-    if existing_progress:
-        # Update existing progress
-        # Track the maximum position reached (for seeking ahead)
-        max_position = max(
-            existing_progress.get("max_position_reached", 0),
-            watched_duration
-        )
-        
-        update_data = {
-            "watched_duration": watched_duration,
-            "total_duration": total_duration,
-            "completion_percentage": completion_percentage,
-            "updated_at": now,
-            "last_position": watched_duration,
-            "max_position_reached": max_position  # Track farthest point reached
-        }
-        
-        # Update module_id if provided and not set
-        if module_id and not existing_progress.get("module_id"):
-            update_data["module_id"] = module_id
-        
-        # VALIDATE: Only mark as completed if percentage >= 95%
-        # This prevents incorrect completion from frontend bugs
-        if completed is not None and completed:
-            # Frontend requested completion - validate it
-            if completion_percentage >= 95.0:
-                update_data["completed"] = True
-                if not existing_progress.get("completed"):
-                    update_data["completed_at"] = now
-                logger.info(f"Content {content_id} marked as COMPLETED (validated: {completion_percentage:.1f}%)")
-            else:
-                # Reject invalid completion request
-                logger.warning(f"Rejecting completion for {content_id} - only {completion_percentage:.1f}% (need >= 95%)")
-                update_data["completed"] = False
-                update_data["completed_at"] = None
-        elif completed is not None and not completed:
-            # Explicitly marking as not completed
-            update_data["completed"] = False
-            update_data["completed_at"] = None
-        # Auto-complete based on percentage
-        elif completion_percentage >= 95.0 and not existing_progress.get("completed"):
-            update_data["completed"] = True
-            update_data["completed_at"] = now
-            logger.info(f"Content {content_id} AUTO-COMPLETED at {completion_percentage:.1f}%")
-        
-        collection.update_one(
-            {"_id": existing_progress["_id"]},
-            {"$set": update_data}
-        )
-        
-        # Return updated document
-        return collection.find_one({"_id": existing_progress["_id"]})
-    else:
-        # Create new progress
-        # VALIDATE: Only mark as completed if percentage >= 95%
-        is_completed = False
-        completed_timestamp = None
-        
-        if completed and completion_percentage >= 95.0:
-            is_completed = True
-            completed_timestamp = now
-            logger.info(f"New content {content_id} created as COMPLETED (validated: {completion_percentage:.1f}%)")
-        elif completed and completion_percentage < 95.0:
-            logger.warning(f"Rejecting completion for new content {content_id} - only {completion_percentage:.1f}% (need >= 95%)")
-        elif completion_percentage >= 95.0:
-            is_completed = True
-            completed_timestamp = now
-            logger.info(f"New content {content_id} AUTO-COMPLETED at {completion_percentage:.1f}%")
-        
-        new_progress = {
-            "_id": str(uuid.uuid4()),
-            "user_id": user_id,
-            "course_id": course_id,
-            "module_id": module_id,
-            "content_id": content_id,
-            "content_type": content_type,
-            "watched_duration": watched_duration,
-            "total_duration": total_duration,
-            "completion_percentage": completion_percentage,
-            "completed": is_completed,
-            "created_at": now,
-            "updated_at": now,
-            "completed_at": completed_timestamp,
-            "notes": None,
-            "last_position": watched_duration,
-            "max_position_reached": watched_duration  # Track farthest point reached
-        }
-        
-        collection.insert_one(new_progress)
-        return new_progress
+    ``entry`` holds the latest position/durations for a (user, course, content)
+    plus the farthest position seen while buffered. Heartbeats never touch the
+    completion fields of an existing document, and ``max_position_reached``
+    only ever grows.
+    """
+    key = {
+        "user_id": entry["user_id"],
+        "course_id": entry["course_id"],
+        "content_id": entry["content_id"]
+    }
+    watched_duration = entry["watched_duration"]
+    total_duration = entry["total_duration"]
+    
+    operations = [UpdateOne(
+        key,
+        {
+            "$set": {
+                "watched_duration": watched_duration,
+                "total_duration": total_duration,
+                "completion_percentage": calculate_completion_percentage(watched_duration, total_duration),
+                "updated_at": entry["updated_at"],
+                "last_position": watched_duration
+            },
+            "$max": {"max_position_reached": entry["max_position_reached"]},
+            "$setOnInsert": {
+                "_id": str(uuid.uuid4()),
+                "module_id": entry.get("module_id"),
+                "content_type": entry.get("content_type", "video"),
+                "completed": False,
+                "created_at": entry["created_at"],
+                "completed_at": None,
+                "notes": None
+            }
+        },
+        upsert=True
+    )]
+    
+    # Fill in module_id on documents created without one
+    if entry.get("module_id"):
+        operations.append(UpdateOne(
+            {**key, "module_id": None},
+            {"$set": {"module_id": entry["module_id"]}}
+        ))
+    
+    return operations
 
 def get_user_course_progress(db, user_id, course_id):
     """Get all progress for a user in a specific course"""
@@ -165,6 +226,17 @@ def get_user_content_progress(db, user_id, course_id, content_id):
         "content_id": content_id
     })
 
+def is_content_completed(db, user_id, course_id, content_id):
+    """Stored completion state of a content item (False if never started)"""
+    collection = get_user_progress_collection(db)
+    
+    progress = collection.find_one({
+        "user_id": user_id,
+        "course_id": course_id,
+        "content_id": content_id
+    }, {"completed": 1, "_id": 0})
+    return bool(progress and progress.get("completed"))
+
 def get_course_completion_stats(db, user_id, course_id):
     """Get overall completion statistics for a course"""
     collection = get_user_progress_collection(db)
@@ -50,6 +50,7 @@ class NotificationCreate(NotificationBase):
     # Multi-tenancy fields
     franchise_code: Optional[str] = None
     franchise_id: Optional[str] = None
+    branch_code: Optional[str] = None  # Limits the audience to one branch
 
 class AdminNotificationCreate(NotificationBase):
     author: Optional[str] = "Admin"
@@ -61,6 +62,7 @@ class AdminNotificationCreate(NotificationBase):
     # Multi-tenancy fields
     franchise_code: Optional[str] = None
     franchise_id: Optional[str] = None
+    branch_code: Optional[str] = None  # Limits the audience to one branch
 
 class NotificationUpdate(BaseModel):
     title: Optional[str] = None
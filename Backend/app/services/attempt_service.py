@@ -3,6 +3,7 @@ from bson import ObjectId
 from fastapi.encoders import jsonable_encoder
 from app.models.attempt import get_attempt_collection
 from app.models.quiz import get_question_collection
+from app.services.instructor_stats_service import instructor_stats
 
 
 def submit_quiz_attempt(db, payload):
@@ -42,6 +43,7 @@ def submit_quiz_attempt(db, payload):
     # Insert into DB
     collection = get_attempt_collection(db)
     result = collection.insert_one(attempt_doc)
+    instructor_stats.attempt_recorded(attempt_doc)
 
     return {
         "success": True,
@@ -1,6 +1,9 @@
 from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
 from app.utils.security import hash_password, verify_password
+from app.services.password_service import password_hasher
 from app.utils.jwt_handler import create_access_token, create_refresh_token
+from app.services.token_registry import revoke_user_tokens
 from app.models.user import get_user_collection
 from bson import ObjectId
 from datetime import datetime
@@ -126,17 +129,33 @@ def login_user(db, login_data):
         print(f"[DEBUG] Auth service - User status: {user.get('status')}")
         print(f"[DEBUG] Auth service - User is_active: {user.get('is_active')}")
     
-    # Debug password verification
-    if user:
-        print(f"[DEBUG] Auth service - Plain password length: {len(login_data.password)}")
-        print(f"[DEBUG] Auth service - Hashed password length: {len(user['password'])}")
-        print(f"[DEBUG] Auth service - Hashed password format: {user['password'][:50]}...")
-        password_valid = verify_password(login_data.password, user["password"])
-        print(f"[DEBUG] Auth service - Password verification result: {password_valid}")
-    
-    if not user or not verify_password(login_data.password, user["password"]):
-        print(f"[DEBUG] Auth service - Login failed: User exists={bool(user)}, Password valid={bool(user and verify_password(login_data.password, user['password']))}")
+    # Verify once - bcrypt is expensive
+    password_valid = bool(user) and verify_password(login_data.password, user["password"])
+    print(f"[DEBUG] Auth service - Password verification result: {password_valid}")
+    
+    if not password_valid:
+        print(f"[DEBUG] Auth service - Login failed: User exists={bool(user)}")
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+
+    return issue_login_tokens(db, user)
+
+async def login_user_async(db, login_data, user=None):
+    """``login_user`` for async handlers: only the bcrypt check runs on the password hashing pool
+
+    The lookup and the last_login update / token minting run on the regular
+    threadpool, so database latency never holds a hashing slot. Pass ``user``
+    when the handler has already fetched it.
+    """
+    if user is None:
+        user = await run_in_threadpool(get_user_collection(db).find_one, {"email": login_data.email})
+    password_valid = bool(user) and await password_hasher.verify(login_data.password, user.get("password"))
+    if not password_valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    return await run_in_threadpool(issue_login_tokens, db, user)
+
+def issue_login_tokens(db, user):
+    """Record the login and mint the token pair for an authenticated ``user``"""
+    user_collection = get_user_collection(db)
 
     # Check if user account is active (COMMENTED OUT - Allow all users to login)
     # user_status = user.get("status", "active")  # Default to active if not set
@@ -236,7 +255,8 @@ def send_password_reset(db, email):
         email_service.send_email(
             to_emails=[email],
             subject=subject,
-            body=body
+            body=body,
+            category="password_reset"
         )
         
         print(f"[DEBUG] Password reset OTP sent successfully to {email}")
@@ -333,6 +353,9 @@ def reset_password_with_otp(db, new_password, request=None):
             }
         )
         
+        # Old tokens must stop working (auth cache and signed claims alike)
+        revoke_user_tokens(db, user["_id"], "password reset")
+        
         print(f"[DEBUG] Password reset successfully for user: {user['email']}")
         return {"success": True, "message": "Password reset successfully"}
         
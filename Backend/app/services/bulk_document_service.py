@@ -0,0 +1,515 @@
+"""
+Bulk certificate and marksheet generation
+
+A bulk request creates one job document in ``document_jobs`` and renders every
+student's document in a process pool, so PIL work runs on all cores and never
+blocks the event loop. Pool workers are spawned, not forked: the API process
+runs background threads (cache sweeper, flushers, watchers, email senders,
+Motor I/O) and a forked child could inherit one of their locks mid-acquire. Job progress lives in MongoDB so any API worker can
+answer progress polls; the finished images are bundled into one zip.
+
+A job only lives in the worker that started it. Rendered items are not
+persisted and their numbers are already reserved, so a job cut off by a
+restart or crash cannot be resumed: jobs whose ``heartbeat_at`` is older than
+``JOB_STALE_SECONDS`` are marked failed at startup and periodically after
+that (``start_job_recovery``), so polls stop waiting and the user can retry.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+import zipfile
+import logging
+
+from fastapi.concurrency import run_in_threadpool
+from app.config import settings
+from app.services.document_render import render_certificate, render_marksheet
+
+logger = logging.getLogger("uvicorn")
+
+JOBS_COLLECTION = "document_jobs"
+JOB_DIR = os.path.join(settings.UPLOAD_DIR, "bulk_jobs")
+MARKSHEET_TEMPLATE = "uploads/Marksheet/marksheet.jpeg"
+MAX_JOB_ERRORS = 50
+# A queued/running job whose worker has not reported for this long was interrupted
+JOB_STALE_SECONDS = 600
+INTERRUPTED_ERROR = "Interrupted by a server restart; please start the job again"
+
+_render_pool: Optional[ProcessPoolExecutor] = None
+# Runs first in every spawned worker: registers a bare ``app`` package so that
+# unpickling ``app.services.document_render`` tasks imports only the render
+# modules and not app/__init__.py (settings, database clients, routers)
+_WORKER_BOOTSTRAP = (
+    "import sys, types\n"
+    "package = types.ModuleType('app')\n"
+    f"package.__path__ = [{os.path.dirname(os.path.dirname(os.path.abspath(__file__)))!r}]\n"
+    "sys.modules.setdefault('app', package)\n"
+)
+# Keep references to running jobs so they are not garbage collected mid-run
+_running_jobs: set = set()
+_recovery_thread: Optional[threading.Thread] = None
+_recovery_stop = threading.Event()
+
+
+# ------------------- Process pool -------------------
+
+def get_render_pool() -> ProcessPoolExecutor:
+    """Shared process pool for document rendering (created on first use)"""
+    global _render_pool
+    if _render_pool is None:
+        workers = settings.DOCUMENT_RENDER_WORKERS or os.cpu_count() or 1
+        _render_pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=exec,
+            initargs=(_WORKER_BOOTSTRAP,)
+        )
+        logger.info(f"[BULK DOCS] Started render pool with {workers} workers")
+    return _render_pool
+
+
+def shutdown_render_pool():
+    global _render_pool
+    if _render_pool is not None:
+        _render_pool.shutdown(wait=False, cancel_futures=True)
+        _render_pool = None
+
+
+# ------------------- Marksheet totals -------------------
+
+def calculate_marksheet_totals(subjects_results: List[dict]) -> Dict[str, Any]:
+    """Total/obtained marks, percentage, grade and result for a list of subject results
+
+    Accepts both the old (full_marks/obtained_marks) and the new
+    (theory_*/practical_*) subject formats.
+    """
+    total_full_marks = 0
+    total_obtained_marks = 0
+    for subject in subjects_results:
+        theory_max = float(subject.get("theory_max", subject.get("full_marks", 0)))
+        theory_marks = float(subject.get("theory_marks", subject.get("obtained_marks", 0)))
+        practical_max = float(subject.get("practical_max", 0))
+        practical_marks = float(subject.get("practical_marks", 0))
+        total_full_marks += theory_max + practical_max
+        total_obtained_marks += theory_marks + practical_marks
+
+    percentage = (total_obtained_marks / total_full_marks * 100) if total_full_marks > 0 else 0
+
+    result = None
+    if percentage >= 90:
+        grade = "A+"
+    elif percentage >= 80:
+        grade = "A"
+    elif percentage >= 70:
+        grade = "B+"
+    elif percentage >= 60:
+        grade = "B"
+    elif percentage >= 50:
+        grade = "C+"
+    elif percentage >= 40:
+        grade = "C"
+    elif percentage >= 33:
+        grade = "D"
+    else:
+        grade = "F"
+        result = "fail"
+
+    return {
+        "total_marks": total_full_marks,
+        "obtained_marks": total_obtained_marks,
+        "percentage": percentage,
+        "grade": grade,
+        "result": result
+    }
+
+
+# ------------------- Job documents -------------------
+
+def new_job_id() -> str:
+    return uuid.uuid4().hex
+
+
+async def create_job(async_db, job_id: str, kind: str, current_user: dict, params: dict, total: int) -> dict:
+    now = datetime.utcnow()
+    job = {
+        "_id": job_id,
+        "kind": kind,
+        "status": "queued",
+        "total": total,
+        "completed": 0,
+        "succeeded": 0,
+        "failed": 0,
+        "errors": [],
+        "params": params,
+        "franchise_code": current_user.get("franchise_code"),
+        "branch_code": current_user.get("branch_code") or current_user.get("franchise_code"),
+        "created_by": current_user.get("user_id") or current_user.get("email"),
+        "created_at": now,
+        "heartbeat_at": now,
+        "zip_path": None
+    }
+    await async_db[JOBS_COLLECTION].insert_one(job)
+    return job
+
+
+async def get_job(async_db, job_id: str) -> Optional[dict]:
+    return await async_db[JOBS_COLLECTION].find_one({"_id": job_id})
+
+
+def serialize_job(job: dict) -> dict:
+    total = job.get("total") or 0
+    return {
+        "job_id": job["_id"],
+        "kind": job.get("kind"),
+        "status": job.get("status"),
+        "total": total,
+        "completed": job.get("completed", 0),
+        "succeeded": job.get("succeeded", 0),
+        "failed": job.get("failed", 0),
+        "progress": round(job.get("completed", 0) / total * 100, 1) if total else 100.0,
+        "errors": job.get("errors", []),
+        "created_at": job["created_at"].isoformat() if isinstance(job.get("created_at"), datetime) else job.get("created_at"),
+        "finished_at": job["finished_at"].isoformat() if isinstance(job.get("finished_at"), datetime) else job.get("finished_at"),
+        "download_ready": bool(job.get("zip_path"))
+    }
+
+
+def start_job(coro):
+    """Run a job coroutine in the background of this worker"""
+    task = asyncio.create_task(coro)
+    _running_jobs.add(task)
+    task.add_done_callback(_running_jobs.discard)
+    return task
+
+
+def _write_zip(zip_path: str, files: List[tuple]):
+    os.makedirs(os.path.dirname(zip_path), exist_ok=True)
+    # PNG/JPEG output is already compressed, so store it as-is
+    with zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_STORED) as archive:
+        for file_path, arcname in files:
+            if os.path.exists(file_path):
+                archive.write(file_path, arcname)
+
+
+async def _run_renders(async_db, job_id: str, renderer, items: List[dict], collection: str):
+    """Render ``items`` in the process pool, then bulk insert records and build the zip
+
+    Each item holds ``data`` (renderer input), ``output_path`` (absolute),
+    ``file_path`` (value stored on the record), ``arcname`` and ``record``.
+    """
+    jobs = async_db[JOBS_COLLECTION]
+    started_at = datetime.utcnow()
+    await jobs.update_one({"_id": job_id}, {"$set": {"status": "running", "started_at": started_at, "heartbeat_at": started_at}})
+
+    loop = asyncio.get_running_loop()
+    pool = get_render_pool()
+    completed = succeeded = failed = 0
+    errors = []
+    records = []
+    files = []
+    last_flush = time.monotonic()
+
+    async def render(item):
+        try:
+            ok = await loop.run_in_executor(pool, renderer, item["data"], item["output_path"])
+            return item, ok, None
+        except Exception as e:
+            return item, False, str(e)
+
+    try:
+        for next_done in asyncio.as_completed([render(item) for item in items]):
+            item, ok, error = await next_done
+            completed += 1
+            if ok:
+                succeeded += 1
+                record = item["record"]
+                record["file_path"] = item["file_path"]
+                records.append(record)
+                files.append((item["output_path"], item["arcname"]))
+            else:
+                failed += 1
+                if len(errors) < MAX_JOB_ERRORS:
+                    errors.append({"student_id": item["record"].get("student_id"), "error": error or "Rendering failed"})
+
+            # Flush progress about once a second rather than on every document
+            if time.monotonic() - last_flush >= 1 or completed == len(items):
+                await jobs.update_one({"_id": job_id}, {"$set": {
+                    "completed": completed, "succeeded": succeeded, "failed": failed, "errors": errors,
+                    "heartbeat_at": datetime.utcnow()
+                }})
+                last_flush = time.monotonic()
+
+        if records:
+            await async_db[collection].insert_many(records, ordered=False)
+
+        zip_path = os.path.join(JOB_DIR, f"{job_id}.zip")
+        await run_in_threadpool(_write_zip, zip_path, files)
+
+        await jobs.update_one({"_id": job_id}, {"$set": {
+            "status": "completed",
+            "zip_path": zip_path,
+            "finished_at": datetime.utcnow()
+        }})
+        logger.info(f"[BULK DOCS] Job {job_id} finished: {succeeded} generated, {failed} failed")
+    except Exception as e:
+        logger.error(f"[BULK DOCS] Job {job_id} failed: {e}")
+        await jobs.update_one({"_id": job_id}, {"$set": {
+            "status": "failed",
+            "errors": errors + [{"error": str(e)}],
+            "finished_at": datetime.utcnow()
+        }})
+
+
+# ------------------- Interrupted jobs -------------------
+
+def recover_interrupted_jobs(db, now: Optional[datetime] = None) -> int:
+    """Mark queued/running jobs whose worker stopped reporting as failed; returns how many"""
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(seconds=JOB_STALE_SECONDS)
+    result = db[JOBS_COLLECTION].update_many(
+        {
+            "status": {"$in": ["queued", "running"]},
+            "$or": [
+                {"heartbeat_at": {"$lt": cutoff}},
+                {"heartbeat_at": None, "created_at": {"$lt": cutoff}}  # jobs created before heartbeats
+            ]
+        },
+        {"$set": {"status": "failed", "finished_at": now}, "$push": {"errors": {"error": INTERRUPTED_ERROR}}}
+    )
+    if result.modified_count:
+        logger.warning(f"[BULK DOCS] Marked {result.modified_count} interrupted jobs as failed")
+    return result.modified_count
+
+
+def start_job_recovery(db):
+    """Fail interrupted jobs now and every ``JOB_STALE_SECONDS`` (a quick restart leaves them fresh at startup)"""
+    global _recovery_thread
+    if db is None or (_recovery_thread is not None and _recovery_thread.is_alive()):
+        return
+    _recovery_stop.clear()
+
+    def _run():
+        while True:
+            try:
+                recover_interrupted_jobs(db)
+            except Exception as e:
+                logger.warning(f"[BULK DOCS] Job recovery error: {e}")
+            if _recovery_stop.wait(JOB_STALE_SECONDS):
+                break
+
+    _recovery_thread = threading.Thread(target=_run, name="document-job-recovery", daemon=True)
+    _recovery_thread.start()
+
+
+def stop_job_recovery():
+    global _recovery_thread
+    _recovery_stop.set()
+    _recovery_thread = None
+
+
+# ------------------- Certificates -------------------
+
+def build_certificate_items(students: List[dict], options: dict, context: dict, first_number: int) -> List[dict]:
+    """Per-student certificate records and renderer input, numbered from ``first_number``
+
+    ``first_number`` starts a block reserved with ``allocate_branch_certificate_numbers``.
+    """
+    franchise_code = context["franchise_code"]
+    cert_dir = os.path.join("uploads", "Certificate", "generated", franchise_code)
+    os.makedirs(cert_dir, exist_ok=True)
+
+    now = datetime.now()
+    issue_date = options.get("issue_date") or now.strftime("%Y-%m-%d")
+    completion_date = options.get("completion_date") or now.strftime("%Y-%m-%d")
+    certificate_type = options.get("certificate_type", "completion")
+    grade = options.get("grade", "")
+    branch_names = context.get("branch_names", {})
+
+    items = []
+    for offset, student in enumerate(students):
+        student_id = str(student["_id"])
+        student_branch_code = student.get("branch_code", franchise_code)
+        sequence = first_number + offset
+        certificate_number = f"CERT{student_branch_code[-4:]}{sequence:03d}"
+        branch_name = branch_names.get(student_branch_code, "SkillWallah EdTech")
+        course_name = student.get("course", "N/A")
+        course_duration = student.get("course_duration", "")
+
+        image_filename = f"certificate_{student_id}_{certificate_number}.png"
+        file_path = os.path.join(cert_dir, image_filename)
+
+        record = {
+            "student_id": student_id,
+            "student_name": student.get("student_name"),
+            "student_registration": student.get("registration_number"),
+            "course_id": options.get("course_id") or "",
+            "course_name": course_name,
+            "certificate_type": certificate_type,
+            "grade": grade,
+            "issue_date": issue_date,
+            "completion_date": completion_date,
+            "certificate_number": certificate_number,
+            "status": "generated",
+            "branch_code": student_branch_code,
+            "franchise_code": franchise_code,
+            "created_at": datetime.utcnow(),
+            "created_by": context.get("user_id"),
+            "bulk_job_id": context["job_id"]
+        }
+        data = {
+            "student_name": student.get("student_name"),
+            "student_registration": student.get("registration_number"),
+            "course_name": course_name,
+            "course_duration": course_duration or options.get("duration", ""),
+            "duration": options.get("duration") or course_duration,
+            "certificate_number": certificate_number,
+            "certificate_type": certificate_type,
+            "grade": grade,
+            "issue_date": issue_date,
+            "completion_date": completion_date,
+            "start_date": student.get("admission_date"),
+            "branch_name": branch_name,
+            "branch_code": student_branch_code,
+            "father_name": student.get("father_name", ""),
+            "date_of_birth": student.get("date_of_birth"),
+            "percentage": options.get("percentage", ""),
+            "atc_code": options.get("atc_code") or student_branch_code,
+            "center_name": options.get("center_name") or branch_name,
+            "center_address": options.get("center_address", ""),
+            "photo_url": student.get("photo_path"),
+            "student_photo": student.get("photo_path"),
+            "sr_number": f"00{sequence:05d}",
+            "mca_registration_number": options.get("mca_registration_number", "U85300UP2020NPL136478"),
+            "unique_certificate_id": certificate_number,
+            "unique_batch_id": f"BATCH-{context['job_id'][:8].upper()}"
+        }
+        items.append({
+            "data": data,
+            "output_path": os.path.abspath(file_path),
+            "file_path": file_path,
+            "arcname": image_filename,
+            "record": record
+        })
+    return items
+
+
+async def run_certificate_job(async_db, job_id: str, items: List[dict]):
+    await _run_renders(async_db, job_id, render_certificate, items, "branch_certificates")
+
+
+# ------------------- Marksheets -------------------
+
+def marksheet_subjects(student: dict, options: dict) -> List[dict]:
+    """Subject results for ``student``: ``options["entries"][student_id]``, else the shared ``options["subjects_results"]``"""
+    entry = (options.get("entries") or {}).get(str(student["_id"])) or {}
+    return (entry.get("subjects_results") or entry.get("subjects")
+            or options.get("subjects_results") or options.get("subjects") or [])
+
+
+def build_marksheet_items(students: List[dict], course: dict, options: dict, context: dict, first_number: int) -> List[dict]:
+    """Per-student marksheet records and renderer input; students without subject results are skipped
+
+    Numbers are ``MS-<branch>-<context["year"]>-NNNN`` from ``first_number``,
+    the start of a block reserved with ``allocate_branch_marksheet_numbers``.
+    """
+    branch_code = context["branch_code"]
+    branch = context.get("branch") or {}
+    branch_name = branch.get("centre_info", {}).get("centre_name", "Unknown Branch")
+    gen_dir = os.path.join(settings.UPLOAD_DIR, "Marksheet", "generated")
+    os.makedirs(gen_dir, exist_ok=True)
+
+    entries = options.get("entries") or {}
+    issue_date = options.get("issue_date") or datetime.now().strftime("%d/%m/%Y")
+    course_name = course.get("title") or course.get("course_name")
+    year = context["year"]
+
+    items = []
+    sequence = first_number
+    for student in students:
+        student_id = str(student["_id"])
+        entry = entries.get(student_id) or {}
+        subjects_results = marksheet_subjects(student, options)
+        if not subjects_results:
+            continue
+
+        totals = calculate_marksheet_totals(subjects_results)
+        result = totals["result"] or entry.get("result") or options.get("result", "pass")
+        percentage = round(totals["percentage"], 2)
+        marksheet_number = f"MS-{branch_code}-{year}-{sequence:04d}"
+        sequence += 1
+        photo_url = student.get("photo_url") or student.get("photo") or student.get("student_photo") or ""
+
+        image_filename = f"marksheet_{marksheet_number}.png"
+        now_iso = datetime.utcnow().isoformat()
+        record = {
+            "student_id": student_id,
+            "student_name": student.get("student_name"),
+            "student_registration": student.get("registration_number"),
+            "course_id": options.get("course_id"),
+            "course_name": course_name,
+            "semester": options.get("semester"),
+            "session_year": options.get("session_year"),
+            "branch_code": branch_code,
+            "branch_name": branch_name,
+            "marksheet_number": marksheet_number,
+            "photo_url": photo_url,
+            "student_photo": photo_url,
+            "father_name": student.get("father_name", ""),
+            "mother_name": student.get("mother_name", ""),
+            "atc_name": options.get("atc_name") or branch_name,
+            "atc_address": options.get("atc_address") or "",
+            "course_code": options.get("course_code") or course.get("course_code", ""),
+            "sr_number": marksheet_number,
+            "join_date": student.get("date_of_admission", ""),
+            "issue_date": issue_date,
+            "subjects_results": subjects_results,
+            "subjects": subjects_results,
+            "total_marks": totals["total_marks"],
+            "obtained_marks": totals["obtained_marks"],
+            "percentage": percentage,
+            "grade": entry.get("grade") or totals["grade"],
+            "result": result,
+            "status": options.get("status", "draft"),
+            "bulk_job_id": context["job_id"],
+            "created_at": now_iso,
+            "updated_at": now_iso
+        }
+        data = {
+            "student_name": student.get("student_name"),
+            "father_name": record["father_name"],
+            "mother_name": record["mother_name"],
+            "student_registration": student.get("registration_number"),
+            "course_name": options.get("course_code") or course_name,
+            "course_code": record["course_code"],
+            "atc_name": record["atc_name"],
+            "atc_address": options.get("atc_address") or branch.get("address", ""),
+            "sr_number": marksheet_number,
+            "mca_reg_no": options.get("mca_registration_number") or branch.get("mca_reg_no", ""),
+            "join_date": record["join_date"],
+            "issue_date": issue_date,
+            "subjects_results": subjects_results,
+            "total_marks": totals["total_marks"],
+            "obtained_marks": totals["obtained_marks"],
+            "percentage": percentage,
+            "grade": record["grade"],
+            "result": result,
+            "photo_url": photo_url,
+            "template_path": MARKSHEET_TEMPLATE
+        }
+        items.append({
+            "data": data,
+            "output_path": os.path.join(gen_dir, image_filename),
+            "file_path": f"uploads/Marksheet/generated/{image_filename}",
+            "arcname": image_filename,
+            "record": record
+        })
+    return items
+
+
+async def run_marksheet_job(async_db, job_id: str, items: List[dict]):
+    await _run_renders(async_db, job_id, render_marksheet, items, "branch_marksheets")
@@ -0,0 +1,97 @@
+"""
+Atomic sequence counters
+
+Certificate, marksheet, course and registration numbers used to be derived by
+sorting or counting existing documents and adding one. That is a scan per
+issue, and two requests issuing at the same moment read the same "last" number
+and hand out duplicates. Each number series now has a document in ``counters``
+(keyed e.g. ``certificate:20250101`` or ``registration:BR001:2025``) advanced
+with a single ``find_one_and_update($inc)``, which MongoDB serializes per
+document.
+
+A counter that does not exist yet is seeded once from the highest number
+already issued (``$max``, so a late seed can never move a live counter
+backwards). Bulk jobs reserve a whole block with ``allocate_block`` and number
+their items locally.
+"""
+from datetime import datetime
+from typing import Callable, Optional
+import logging
+import re
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger("uvicorn")
+
+COUNTERS = "counters"
+
+Seed = Optional[Callable[[], int]]
+
+
+def _seed_counter(db, key: str, seed: Seed):
+    start = seed() if seed else 0
+    try:
+        db[COUNTERS].update_one(
+            {"_id": key},
+            {"$max": {"seq": start}, "$setOnInsert": {"created_at": datetime.utcnow()}},
+            upsert=True
+        )
+        logger.info(f"[COUNTERS] Seeded {key} at {start}")
+    except DuplicateKeyError:
+        # Another request created the counter first; it seeded from the same data
+        pass
+
+
+def allocate_block(db, key: str, count: int = 1, seed: Seed = None) -> int:
+    """Reserve ``count`` consecutive numbers in series ``key`` and return the first one
+
+    ``seed`` returns the highest number already in use and is only called the
+    first time the series is touched.
+    """
+    if count < 1:
+        raise ValueError("count must be at least 1")
+
+    def _inc():
+        return db[COUNTERS].find_one_and_update(
+            {"_id": key},
+            {"$inc": {"seq": count}, "$set": {"updated_at": datetime.utcnow()}},
+            projection={"seq": 1},
+            return_document=ReturnDocument.AFTER
+        )
+
+    counter = _inc()
+    if counter is None:
+        _seed_counter(db, key, seed)
+        counter = _inc()
+    return counter["seq"] - count + 1
+
+
+def next_sequence(db, key: str, seed: Seed = None) -> int:
+    """Next number in series ``key``"""
+    return allocate_block(db, key, 1, seed)
+
+
+def peek_sequence(db, key: str, seed: Seed = None) -> int:
+    """Number the next ``next_sequence`` call would return, without consuming it (preview only)"""
+    counter = db[COUNTERS].find_one({"_id": key}, {"seq": 1})
+    if counter is not None:
+        return counter["seq"] + 1
+    return (seed() if seed else 0) + 1
+
+
+def observe_sequence(db, key: str, value: int):
+    """Record that ``value`` was issued outside the counter (e.g. typed in by hand) so it is never handed out again"""
+    # No upsert: a counter that does not exist yet will be seeded from the stored documents
+    db[COUNTERS].update_one({"_id": key}, {"$max": {"seq": value}})
+
+
+def max_numeric_suffix(collection, field: str, prefix: str, extra_filter: Optional[dict] = None) -> int:
+    """Highest N among ``field`` values of the form ``<prefix>N`` (0 if none) - used to seed counters"""
+    pattern = re.compile(f"^{re.escape(prefix)}(\\d+)$")
+    query = {field: {"$regex": pattern.pattern}, **(extra_filter or {})}
+    highest = 0
+    for doc in collection.find(query, {field: 1, "_id": 0}):
+        match = pattern.match(str(doc.get(field, "")))
+        if match:
+            highest = max(highest, int(match.group(1)))
+    return highest
@@ -0,0 +1,403 @@
+"""
+Materialized course content trees
+
+The player's content endpoint used to look the course up in several ways
+across ``courses`` and ``branch_courses``, load its modules and match every
+lecture and PDF against every module on each page view. The assembled response
+is now stored per course in ``course_content_trees`` together with a version
+number and an ETag, so a repeat view is one indexed read (or a 304).
+
+Writers of lectures, PDFs, modules, paper sets and study materials call
+``mark_course_content_stale``; it flags the affected trees and bumps their
+``generation`` so a rebuild that raced with the change is not saved. Stale,
+missing or expired trees are rebuilt on the next read.
+"""
+from datetime import datetime, timedelta
+from typing import Optional
+import hashlib
+import json
+import logging
+from bson import ObjectId
+from fastapi import HTTPException
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError
+from app.config import settings
+from app.utils.serializers import serialize_document
+
+logger = logging.getLogger("uvicorn")
+
+COURSE_CONTENT_TREES = "course_content_trees"
+
+
+def _find_one_by_id(collection, course_id):
+    try:
+        return collection.find_one({"_id": ObjectId(course_id)})
+    except Exception:
+        return collection.find_one({"_id": course_id})
+
+
+def find_course(db, course_id):
+    """Return ``(course, is_branch_course)`` for any id form the frontend uses"""
+    course = db["courses"].find_one({"id": course_id}) or _find_one_by_id(db["courses"], course_id)
+    if course:
+        return course, False
+
+    branch_courses = db["branch_courses"]
+    course = _find_one_by_id(branch_courses, course_id) or branch_courses.find_one({"id": course_id})
+    if not course:
+        raise HTTPException(status_code=404, detail="Course not found")
+
+    # Normalize field names for branch_courses
+    if 'course_name' in course and 'title' not in course:
+        course['title'] = course['course_name']
+    return course, True
+
+
+def _file_content(item: dict, content_type: str) -> dict:
+    return {
+        "type": content_type,
+        "title": item.get("original_name", item.get("filename")),
+        "filename": item.get("filename"),
+        "file_path": item.get("file_path"),
+        "file_size": item.get("file_size"),
+        "upload_date": item.get("upload_date"),
+        "sequence_number": item.get("sequence_number")
+    }
+
+
+def _index_by_module(items: list):
+    """Positions of items per module id and per lowercased module name"""
+    by_id, by_name = {}, {}
+    for position, item in enumerate(items):
+        if item.get("module_id") is not None:
+            by_id.setdefault(item["module_id"], []).append(position)
+        by_name.setdefault((item.get("module_name") or "").lower(), []).append(position)
+    return by_id, by_name
+
+
+def _items_for_module(items: list, index, module_id: str, module_name: str) -> list:
+    by_id, by_name = index
+    positions = set(by_id.get(module_id, [])) | set(by_name.get(module_name, []))
+    return [items[position] for position in sorted(positions)]
+
+
+def _branch_course_filter(course_name: str, course_id: str, branch_filter: dict) -> dict:
+    return {
+        "$or": [
+            {"course_name": course_name, **branch_filter},
+            {"course_id": course_id, **branch_filter},
+            {"course_name": {"$regex": course_name.strip(), "$options": "i"}, **branch_filter}
+        ]
+    }
+
+
+def build_course_content(db, course_id: str) -> dict:
+    """Assemble the content response for a course (the expensive path)"""
+    course, is_branch_course = find_course(db, course_id)
+    course_name = course.get('course_name', course.get('title')) if is_branch_course else None
+    branch_code = course.get('branch_code') if is_branch_course else None
+    franchise_code = course.get('franchise_code') if is_branch_course else None
+
+    paper_sets = []
+    course_questions = []
+
+    # Get course lectures and PDFs
+    course_lectures = course.get("lectures", [])
+    course_pdfs = course.get("pdfs", [])
+
+    # Get modules for this course
+    course_obj_id = course.get("id", course.get("_id"))
+    modules = list(db["modules"].find({"course_id": course_obj_id}).sort("order", 1))
+
+    # Organize content by modules: an item belongs to a module by id or by (case-insensitive) name
+    lecture_index = _index_by_module(course_lectures)
+    pdf_index = _index_by_module(course_pdfs)
+    organized_modules = []
+    for module in modules:
+        module_id_str = str(module["_id"])
+        module_name = (module.get("name") or "").lower()
+
+        module_content = [
+            _file_content(lecture, "video")
+            for lecture in _items_for_module(course_lectures, lecture_index, module_id_str, module_name)
+        ] + [
+            _file_content(pdf, "pdf")
+            for pdf in _items_for_module(course_pdfs, pdf_index, module_id_str, module_name)
+        ]
+
+        # Sort content by sequence number
+        module_content.sort(key=lambda x: x.get("sequence_number", 0))
+
+        organized_modules.append({
+            "id": module_id_str,
+            "name": module.get("name"),
+            "title": module.get("name"),
+            "description": module.get("description"),
+            "order": module.get("order", 0),
+            "content": module_content
+        })
+
+    # Handle content without modules (fallback)
+    assigned_lecture_ids = set()
+    assigned_pdf_ids = set()
+    for module in organized_modules:
+        for content in module["content"]:
+            if content["type"] == "video":
+                assigned_lecture_ids.add(content["filename"])
+            else:
+                assigned_pdf_ids.add(content["filename"])
+
+    unassigned_content = [
+        _file_content(lecture, "video")
+        for lecture in course_lectures if lecture.get("filename") not in assigned_lecture_ids
+    ] + [
+        _file_content(pdf, "pdf")
+        for pdf in course_pdfs if pdf.get("filename") not in assigned_pdf_ids
+    ]
+
+    # For branch courses, also fetch study materials, video classes, and syllabi
+    if is_branch_course and course_name:
+        branch_filter = {"status": "active"}
+        if branch_code:
+            branch_filter["branch_code"] = branch_code
+        if franchise_code:
+            branch_filter["franchise_code"] = franchise_code
+        content_filter = _branch_course_filter(course_name, course_id, branch_filter)
+
+        study_materials = list(db.branch_study_materials.find(content_filter))
+        for idx, material in enumerate(study_materials):
+            material_type = material.get("material_type", "document")
+            file_url = material.get("file_url", "")
+
+            # Determine content type based on material_type or file extension
+            if material_type in ["video", "recording"] or (file_url and any(ext in file_url.lower() for ext in ['.mp4', '.webm', '.mov', '.avi'])):
+                content_type = "video"
+            else:
+                content_type = "pdf"
+
+            unassigned_content.append({
+                "type": content_type,
+                "title": material.get("material_name", f"Study Material {idx+1}"),
+                "filename": material.get("file_url", "").split("/")[-1] if material.get("file_url") else "",
+                "file_path": material.get("file_url", ""),
+                "file_size": material.get("file_size"),
+                "upload_date": material.get("created_at"),
+                "sequence_number": idx,
+                "description": material.get("description", ""),
+                "external_link": material.get("external_link")
+            })
+
+        video_classes = list(db.video_classes.find(content_filter))
+        for idx, video in enumerate(video_classes):
+            unassigned_content.append({
+                "type": "video",
+                "title": video.get("title", video.get("class_name", f"Video Class {idx+1}")),
+                "filename": video.get("file_url", "").split("/")[-1] if video.get("file_url") else "",
+                "file_path": video.get("file_url", ""),
+                "file_size": video.get("file_size"),
+                "upload_date": video.get("created_at"),
+                "sequence_number": len(study_materials) + idx,
+                "description": video.get("description", ""),
+                "external_link": video.get("video_url") or video.get("youtube_url") or video.get("external_link"),
+                "duration": video.get("duration")
+            })
+
+        syllabi = list(db.branch_syllabi.find(content_filter))
+        for idx, syllabus in enumerate(syllabi):
+            unassigned_content.append({
+                "type": "pdf",
+                "title": syllabus.get("syllabus_name", syllabus.get("title", f"Syllabus {idx+1}")),
+                "filename": syllabus.get("file_url", "").split("/")[-1] if syllabus.get("file_url") else "",
+                "file_path": syllabus.get("file_url", ""),
+                "file_size": syllabus.get("file_size"),
+                "upload_date": syllabus.get("created_at"),
+                "sequence_number": len(study_materials) + len(video_classes) + idx,
+                "description": syllabus.get("description", "")
+            })
+
+        # Fetch paper sets (quizzes/tests) for this course
+        paper_sets = list(db.branch_paper_sets.find({
+            "$or": [
+                {"courseName": course_name, "branchCode": branch_code, "franchiseCode": franchise_code},
+                {"courseName": course_name.strip(), "branchCode": branch_code},
+                {"courseName": {"$regex": course_name.strip(), "$options": "i"}, "branchCode": branch_code},
+                {"course_name": course_name, "branch_code": branch_code},
+                {"course_id": course_id}
+            ],
+            "status": {"$ne": "deleted"}
+        }))
+
+        # Fetch questions for this course (and for its linked paper sets)
+        course_questions = list(db.questions.find({
+            "$or": [
+                {"course": course_name, "branch_code": branch_code},
+                {"course": course_name, "franchise_code": franchise_code},
+                {"course": course_name.strip(), "branch_code": branch_code},
+                {"course": {"$regex": course_name.strip(), "$options": "i"}, "branch_code": branch_code},
+                {"course_name": course_name, "branch_code": branch_code},
+                {"course_id": course_id, "branch_code": branch_code},
+                {"paper_set_id": {"$in": [str(ps.get("_id")) for ps in paper_sets]}} if paper_sets else {"_id": None}
+            ]
+        }))
+
+    # Add unassigned content as a general module if exists
+    if unassigned_content:
+        unassigned_content.sort(key=lambda x: x.get("sequence_number", 0))
+        organized_modules.append({
+            "id": "general",
+            "name": "Course Materials",
+            "title": "Course Materials",
+            "description": "General course materials",
+            "order": 999,
+            "content": unassigned_content
+        })
+
+    quizzes_data = [
+        {
+            "id": str(ps.get("_id")),
+            "name": ps.get("paperName", ps.get("paper_name", "Unnamed Test")),
+            "questions": ps.get("numberOfQuestions", ps.get("total_questions", 0)),
+            "duration": ps.get("timeLimit", ps.get("duration", 0)),
+            "marks": ps.get("perQuestionMark", ps.get("marks_per_question", 0)),
+            "total_marks": ps.get("totalMarks", ps.get("total_marks", 0)),
+            "status": ps.get("status", "active"),
+            "available_from": ps.get("availableFrom"),
+            "available_to": ps.get("availableTo"),
+            "course_name": ps.get("courseName", ps.get("course_name")),
+            "description": ps.get("description", "")
+        }
+        for ps in paper_sets
+    ]
+
+    questions_data = [
+        {
+            "id": str(q.get("_id")),
+            "question_text": q.get("question_text", ""),
+            "option_a": q.get("option_a", ""),
+            "option_b": q.get("option_b", ""),
+            "option_c": q.get("option_c", ""),
+            "option_d": q.get("option_d", ""),
+            "correct_answer": q.get("correct_answer", ""),
+            "marks": q.get("marks", 1),
+            "negative_marks": q.get("negative_marks", 0),
+            "difficulty": q.get("difficulty", "medium"),
+            "subject": q.get("subject", ""),
+            "explanation": q.get("explanation", ""),
+            "paper_set_id": q.get("paper_set_id"),
+            "course": q.get("course", q.get("course_name", ""))
+        }
+        for q in course_questions
+    ]
+
+    payload = serialize_document({
+        "course": serialize_document(course),
+        "modules": organized_modules,
+        "total_modules": len(organized_modules),
+        "total_content": sum(len(m["content"]) for m in organized_modules),
+        "quizzes": quizzes_data,
+        "total_quizzes": len(quizzes_data),
+        "questions": questions_data,
+        "total_questions": len(questions_data)
+    })
+
+    course_refs = {course_id, str(course["_id"])}
+    if course.get("id"):
+        course_refs.add(str(course["id"]))
+
+    return {
+        "payload": payload,
+        "course_refs": sorted(course_refs),
+        "course_name": course_name,
+        "branch_code": branch_code,
+        "franchise_code": franchise_code
+    }
+
+
+def _is_fresh(tree: dict) -> bool:
+    if tree.get("stale"):
+        return False
+    max_age = settings.COURSE_CONTENT_TREE_MAX_AGE_SECONDS
+    built_at = tree.get("built_at")
+    return not max_age or (built_at is not None and datetime.utcnow() - built_at < timedelta(seconds=max_age))
+
+
+def rebuild_course_content_tree(db, course_id: str, current: Optional[dict] = None) -> dict:
+    """Build the tree and store it unless it was invalidated meanwhile"""
+    generation = current.get("generation", 0) if current else 0
+    version = current.get("version", 0) if current else 0
+
+    built = build_course_content(db, course_id)
+    digest = hashlib.sha1(json.dumps(built["payload"], sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    # An unchanged rebuild (e.g. on expiry) keeps its ETag so clients still get 304s
+    if not current or current.get("digest") != digest:
+        version += 1
+    tree = {
+        **built,
+        "version": version,
+        "digest": digest,
+        "etag": f'"v{version}-{digest[:16]}"',
+        "stale": False,
+        "built_at": datetime.utcnow()
+    }
+
+    try:
+        db[COURSE_CONTENT_TREES].update_one(
+            {"_id": course_id, "generation": generation},
+            {"$set": tree},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # Invalidated while we were building - serve this build, let the next read rebuild
+        logger.info(f"[CONTENT TREE] {course_id} changed during rebuild; not cached")
+    except Exception as e:
+        logger.warning(f"[CONTENT TREE] Failed to store tree for {course_id}: {e}")
+
+    return {"_id": course_id, "generation": generation, **tree}
+
+
+def get_course_content_tree(db, course_id: str) -> dict:
+    """Stored tree for ``course_id``, rebuilt first if stale, missing or expired"""
+    tree = db[COURSE_CONTENT_TREES].find_one({"_id": course_id})
+    if tree and _is_fresh(tree):
+        return tree
+    return rebuild_course_content_tree(db, course_id, tree)
+
+
+def get_course_content_etag(db, course_id: str) -> Optional[str]:
+    """ETag of a fresh stored tree without loading its payload (None if a rebuild is due)"""
+    tree = db[COURSE_CONTENT_TREES].find_one(
+        {"_id": course_id},
+        {"etag": 1, "stale": 1, "built_at": 1}
+    )
+    return tree["etag"] if tree and _is_fresh(tree) else None
+
+
+def etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    if not if_none_match or not etag:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or any((tag[2:] if tag.startswith("W/") else tag) == etag for tag in candidates)
+
+
+def mark_course_content_stale(db, course_ref=None, branch_code: Optional[str] = None):
+    """Flag trees for a course (any id form) and/or every course of a branch for rebuild"""
+    clauses = []
+    if course_ref is not None:
+        clauses.append({"course_refs": str(course_ref)})
+    if branch_code:
+        clauses.append({"branch_code": branch_code})
+    if not clauses:
+        return
+    try:
+        db[COURSE_CONTENT_TREES].update_many(
+            {"$or": clauses},
+            {"$set": {"stale": True}, "$inc": {"generation": 1}}
+        )
+    except Exception as e:
+        logger.warning(f"[CONTENT TREE] Failed to invalidate trees ({course_ref}, {branch_code}): {e}")
+
+
+def ensure_content_tree_indexes(db):
+    trees = db[COURSE_CONTENT_TREES]
+    trees.create_index([("course_refs", ASCENDING)], background=True)
+    trees.create_index([("branch_code", ASCENDING)], background=True)
@@ -6,6 +6,8 @@ import os
 from pathlib import Path
 from app.models.course import get_course_collection
 from app.utils.serializers import serialize_document
+from app.services.counter_service import next_sequence, max_numeric_suffix
+from app.services.search_service import apply_search, ranked_pipeline, search_fields, refresh_search_terms
 
 def serialize_and_fix_course(course_doc):
     """Serialize course document and fix Windows file paths in image fields"""
@@ -164,9 +166,12 @@ def create_course(db, course_data):
         while len(title_prefix) < 4:
             title_prefix += 'X'
         
-        # Find the next available number for this prefix
-        course_count = collection.count_documents({"course_id": {"$regex": f"^{title_prefix}"}})
-        course_number = f"{course_count + 1:03d}"  # 3-digit format (001, 002, etc.)
+        # Next number for this prefix from its counter (seeded once from existing course_ids)
+        course_sequence = next_sequence(
+            db, f"course:{title_prefix}",
+            seed=lambda: max_numeric_suffix(collection, "course_id", title_prefix)
+        )
+        course_number = f"{course_sequence:03d}"  # 3-digit format (001, 002, etc.)
         
         # Generate final course_id
         course_id = f"{title_prefix}{course_number}"
@@ -205,7 +210,7 @@ def create_course(db, course_data):
         if not course_dict.get("original_price"):
             course_dict["original_price"] = course_dict.get("price", 0.0)
         
-        result = collection.insert_one(course_dict)
+        result = collection.insert_one(search_fields("courses", course_dict))
         
         # Add the ObjectId to course_dict for notification
         course_dict["_id"] = result.inserted_id
@@ -239,6 +244,7 @@ def get_all_courses(db, filters: Optional[CourseFilter] = None, skip: int = 0, l
         
         # Start with branch filter for multi-tenancy (SECURITY: Apply first!)
         query = branch_filter.copy() if branch_filter else {}
+        search_words = []
         
         # Build additional filter query
         if filters:
@@ -256,11 +262,8 @@ def get_all_courses(db, filters: Optional[CourseFilter] = None, skip: int = 0, l
                 else:
                     query["price"] = {"$lte": filters.max_price}
             if filters.search:
-                query["$or"] = [
-                    {"title": {"$regex": filters.search, "$options": "i"}},
-                    {"description": {"$regex": filters.search, "$options": "i"}},
-                    {"tags": {"$in": [filters.search]}}
-                ]
+                # Indexed prefix search (title, course_id, tags, description, category)
+                search_words = apply_search(query, filters.search)
             if filters.instructor:
                 query["instructor"] = filters.instructor
         
@@ -270,11 +273,16 @@ def get_all_courses(db, filters: Optional[CourseFilter] = None, skip: int = 0, l
         total_count = collection.count_documents(query)
         print(f"[DEBUG] Total courses in database: {total_count}")
         
-        # Get courses with pagination and sorting
-        courses = list(collection.find(query)
-                      .sort("created_date", -1)
-                      .skip(skip)
-                      .limit(limit))
+        # Get courses with pagination and sorting (best matches first when searching)
+        if search_words:
+            courses = list(collection.aggregate(
+                ranked_pipeline(query, search_words, {"created_date": -1}, skip, limit)
+            ))
+        else:
+            courses = list(collection.find(query)
+                          .sort("created_date", -1)
+                          .skip(skip)
+                          .limit(limit))
         
         print(f"[DEBUG] Retrieved {len(courses)} courses from database")
         
@@ -381,6 +389,7 @@ def update_course(db, course_id, updates):
             
             if result.modified_count == 0:
                 return {"success": True, "message": "No changes made to course"}
+            refresh_search_terms(db, "courses", {"_id": ObjectId(course_id)})
             
             # Create notification if status changed to "Pending"
             notification_result = None
@@ -551,6 +560,8 @@ def bulk_update_courses(db, course_ids: List[str], updates: dict):
             {"_id": {"$in": object_ids}},
             {"$set": update_data}
         )
+        if result.modified_count:
+            refresh_search_terms(db, "courses", {"_id": {"$in": object_ids}})
         
         return {
             "success": True,
@@ -0,0 +1,399 @@
+"""
+Persistent email outbox with a pooled SMTP sender
+
+Every email (password reset OTPs, welcome mails, payment receipts) used to
+open a new SMTP connection, run STARTTLS and log in, synchronously on the
+request path - a second or more per request, and the mail was lost if the
+server hiccuped. Handlers now ``enqueue_email`` (one insert into
+``email_outbox``) and return; background senders deliver the queue:
+
+- messages are claimed atomically in batches of ``EMAIL_BATCH_SIZE``
+  (``queued`` -> ``sending``), so several workers can share one outbox
+- each sender sends its batch over a pooled connection that stays logged in
+  between batches (``EMAIL_POOL_SIZE`` connections, re-checked with NOOP and
+  recycled after ``EMAIL_CONNECTION_MAX_AGE_SECONDS``)
+- temporary failures are retried with exponential backoff up to
+  ``EMAIL_MAX_ATTEMPTS``; permanent rejections (5xx) fail at once
+- the outcome is recorded on the message: ``status`` (sent / failed),
+  ``attempts``, ``last_error``, ``sent_at`` / ``failed_at``
+- bodies hold OTPs and reset links, so they are removed once a message is
+  sent or has failed for good, and every message expires
+  ``EMAIL_OUTBOX_RETENTION_DAYS`` after it was queued, whatever its status
+
+Whenever credentials are configured the connection must be upgraded with
+STARTTLS (certificate verified) before AUTH; a server that does not offer it is
+refused rather than sent the password in clear text. A local stand-in such as
+``aiosmtpd`` (``SMTP_SERVER=localhost SMTP_PORT=8025``) runs the whole path
+with ``SMTP_REQUIRE_TLS=false``. Before ``start()`` (scripts, tests without a
+database) ``enqueue_email`` sends directly.
+"""
+from datetime import datetime, timedelta
+from email.mime.base import MIMEBase
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email import encoders
+from typing import List, Optional
+import os
+import smtplib
+import ssl
+import threading
+import time
+import logging
+from pymongo import ASCENDING, ReturnDocument
+from app.config import settings
+
+logger = logging.getLogger("uvicorn")
+
+OUTBOX = "email_outbox"
+
+QUEUED = "queued"
+SENDING = "sending"
+SENT = "sent"
+FAILED = "failed"
+
+# A message still "sending" after this long belongs to a sender that died mid-batch
+SENDING_LEASE = timedelta(minutes=5)
+
+# Dropped from a message once it reaches a final status
+BODY_FIELDS = ("body", "html_body")
+
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 3600
+
+
+def build_message(from_header: str, to_emails: List[str], subject: str, body: str,
+                  html_body: Optional[str] = None, attachments: Optional[List[str]] = None) -> MIMEMultipart:
+    """The MIME message for an outbox entry"""
+    msg = MIMEMultipart('alternative')
+    msg['Subject'] = subject
+    msg['From'] = from_header
+    msg['To'] = ', '.join(to_emails)
+    if body:
+        msg.attach(MIMEText(body, 'plain', 'utf-8'))
+    if html_body:
+        msg.attach(MIMEText(html_body, 'html', 'utf-8'))
+    for file_path in attachments or []:
+        if os.path.isfile(file_path):
+            with open(file_path, "rb") as attachment:
+                part = MIMEBase('application', 'octet-stream')
+                part.set_payload(attachment.read())
+                encoders.encode_base64(part)
+                part.add_header('Content-Disposition', f'attachment; filename= {os.path.basename(file_path)}')
+                msg.attach(part)
+    return msg
+
+
+def retry_delay(attempts: int) -> float:
+    """Backoff before attempt ``attempts + 1``: 30 s, 60 s, 120 s ... capped at an hour"""
+    return min(RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0), RETRY_MAX_SECONDS)
+
+
+def is_permanent(error: Exception) -> bool:
+    """True for rejections that will not succeed on retry (bad recipient, refused content)"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    code = getattr(error, "smtp_code", None)
+    return isinstance(code, int) and 500 <= code < 600 and not isinstance(error, smtplib.SMTPAuthenticationError)
+
+
+# ------------------- Connection pool -------------------
+
+class SMTPPool:
+    """Logged-in SMTP connections reused across batches"""
+
+    def __init__(self, host: str, port: int, username: str = "", password: str = "",
+                 size: int = 2, max_age_seconds: float = 300, timeout: float = 30, require_tls: bool = True):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.require_tls = require_tls
+        self.max_age_seconds = max_age_seconds
+        self.timeout = timeout
+        self._idle: List[tuple] = []
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self.opened = 0
+
+    def _connect(self) -> smtplib.SMTP:
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        server.ehlo()
+        if server.has_extn("starttls"):
+            server.starttls(context=ssl.create_default_context())
+            server.ehlo()
+        elif self.username and self.require_tls:
+            self._close(server)
+            raise smtplib.SMTPNotSupportedError(
+                f"{self.host}:{self.port} does not offer STARTTLS; refusing to send credentials in clear text "
+                "(SMTP_REQUIRE_TLS=false allows it for a local test server)"
+            )
+        if self.username and server.has_extn("auth"):
+            server.login(self.username, self.password)
+        with self._lock:
+            self.opened += 1
+        return server
+
+    def acquire(self) -> smtplib.SMTP:
+        """A live connection (an idle one if it still answers NOOP, else a new one)"""
+        self._slots.acquire()
+        try:
+            while True:
+                with self._lock:
+                    entry = self._idle.pop() if self._idle else None
+                if entry is None:
+                    return self._connect()
+                server, opened_at = entry
+                if time.monotonic() - opened_at < self.max_age_seconds:
+                    try:
+                        if server.noop()[0] == 250:
+                            server._pool_opened_at = opened_at
+                            return server
+                    except OSError:
+                        pass  # includes SMTPException
+                self._close(server)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, server: smtplib.SMTP, broken: bool = False):
+        if broken:
+            self._close(server)
+        else:
+            opened_at = getattr(server, "_pool_opened_at", None) or time.monotonic()
+            server._pool_opened_at = opened_at
+            with self._lock:
+                self._idle.append((server, opened_at))
+        self._slots.release()
+
+    @staticmethod
+    def _close(server: smtplib.SMTP):
+        try:
+            server.quit()
+        except Exception:
+            try:
+                server.close()
+            except Exception:
+                pass
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for server, _ in idle:
+            self._close(server)
+
+    def idle_connections(self) -> int:
+        with self._lock:
+            return len(self._idle)
+
+
+# ------------------- Outbox -------------------
+
+class EmailOutbox:
+    """Durable email queue delivered by background sender threads"""
+
+    def __init__(self, pool: SMTPPool, from_email: str, from_name: str,
+                 senders: int = 2, batch_size: int = 20, max_attempts: int = 5, poll_seconds: float = 5):
+        self.pool = pool
+        self.from_email = from_email
+        self.from_name = from_name
+        self.senders = senders
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.poll_seconds = poll_seconds
+        self._db = None
+        self._threads: List[threading.Thread] = []
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._sent = 0
+        self._failed = 0
+        self._retried = 0
+
+    @property
+    def from_header(self) -> str:
+        return f"{self.from_name} <{self.from_email}>"
+
+    # Enqueueing
+
+    def enqueue(self, to_emails: List[str], subject: str, body: str = "", html_body: Optional[str] = None,
+                attachments: Optional[List[str]] = None, category: Optional[str] = None) -> Optional[str]:
+        """Queue an email and return its outbox id (sent directly when the outbox is not running)"""
+        to_emails = [email for email in to_emails if email]
+        if not to_emails:
+            return None
+        if self._db is None:
+            self.send_now(to_emails, subject, body, html_body, attachments)
+            return None
+        now = datetime.utcnow()
+        result = self._db[OUTBOX].insert_one({
+            "to": to_emails,
+            "subject": subject,
+            "body": body,
+            "html_body": html_body,
+            "attachments": attachments or [],
+            "category": category,
+            "status": QUEUED,
+            "attempts": 0,
+            "next_attempt_at": now,
+            "created_at": now
+        })
+        self._wake.set()
+        return str(result.inserted_id)
+
+    def send_now(self, to_emails: List[str], subject: str, body: str = "", html_body: Optional[str] = None,
+                 attachments: Optional[List[str]] = None):
+        """Send synchronously over a pooled connection (no outbox record)"""
+        message = build_message(self.from_header, to_emails, subject, body, html_body, attachments)
+        server = self.pool.acquire()
+        try:
+            server.sendmail(self.from_email, to_emails, message.as_string())
+        except Exception:
+            self.pool.release(server, broken=True)
+            raise
+        self.pool.release(server)
+
+    # Delivery
+
+    def _claim_batch(self, db) -> List[dict]:
+        now = datetime.utcnow()
+        batch = []
+        for _ in range(self.batch_size):
+            doc = db[OUTBOX].find_one_and_update(
+                {"$or": [
+                    {"status": QUEUED, "next_attempt_at": {"$lte": now}},
+                    {"status": SENDING, "lease_until": {"$lt": now}}
+                ]},
+                {"$set": {"status": SENDING, "lease_until": now + SENDING_LEASE}, "$inc": {"attempts": 1}},
+                sort=[("next_attempt_at", ASCENDING)],
+                return_document=ReturnDocument.AFTER
+            )
+            if doc is None:
+                break
+            batch.append(doc)
+        return batch
+
+    def _record(self, db, doc: dict, error: Optional[Exception] = None):
+        now = datetime.utcnow()
+        unset = {"lease_until": ""}
+        if error is None:
+            update = {"status": SENT, "sent_at": now, "last_error": None}
+            counter = "_sent"
+        elif is_permanent(error) or doc["attempts"] >= self.max_attempts:
+            update = {"status": FAILED, "failed_at": now, "last_error": str(error)}
+            counter = "_failed"
+            logger.error(f"[EMAIL] Giving up on {doc['_id']} to {doc['to']} after {doc['attempts']} attempts: {error}")
+        else:
+            update = {"status": QUEUED, "next_attempt_at": now + timedelta(seconds=retry_delay(doc["attempts"])), "last_error": str(error)}
+            counter = "_retried"
+        if update["status"] != QUEUED:
+            unset.update({field: "" for field in BODY_FIELDS})
+        db[OUTBOX].update_one({"_id": doc["_id"]}, {"$set": update, "$unset": unset})
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _send_batch(self, db, batch: List[dict]):
+        try:
+            server = self.pool.acquire()
+        except Exception as e:
+            logger.warning(f"[EMAIL] SMTP connection failed: {e}")
+            for doc in batch:
+                self._record(db, doc, e)
+            return
+        broken = False
+        for doc in batch:
+            if broken:
+                # Connection dropped mid-batch: the rest goes back to the queue without a retry delay
+                db[OUTBOX].update_one(
+                    {"_id": doc["_id"]},
+                    {"$set": {"status": QUEUED, "next_attempt_at": datetime.utcnow()}, "$inc": {"attempts": -1}, "$unset": {"lease_until": ""}}
+                )
+                continue
+            try:
+                message = build_message(self.from_header, doc["to"], doc["subject"], doc.get("body", ""), doc.get("html_body"), doc.get("attachments"))
+                server.sendmail(self.from_email, doc["to"], message.as_string())
+                self._record(db, doc)
+            except smtplib.SMTPServerDisconnected as e:
+                broken = True
+                self._record(db, doc, e)
+            except smtplib.SMTPException as e:
+                # Rejected by the server; the connection itself is still usable
+                self._record(db, doc, e)
+            except OSError as e:
+                broken = True
+                self._record(db, doc, e)
+            except Exception as e:
+                self._record(db, doc, e)
+        self.pool.release(server, broken=broken)
+
+    def run_once(self, db=None) -> int:
+        """Claim and send one batch; returns its size"""
+        db = db if db is not None else self._db
+        batch = self._claim_batch(db)
+        if batch:
+            self._send_batch(db, batch)
+        return len(batch)
+
+    def start(self, db):
+        self._db = db
+        if db is None or any(thread.is_alive() for thread in self._threads):
+            return
+        self._stop.clear()
+
+        def _run():
+            while not self._stop.is_set():
+                try:
+                    if self.run_once(db):
+                        continue
+                except Exception as e:
+                    logger.warning(f"[EMAIL] Sender error: {e}")
+                self._wake.wait(self.poll_seconds)
+                self._wake.clear()
+
+        self._threads = [
+            threading.Thread(target=_run, name=f"email-sender-{i}", daemon=True)
+            for i in range(max(self.senders, 1))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+        self.pool.close_all()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "sent": self._sent,
+                "failed": self._failed,
+                "retried": self._retried,
+                "connections_opened": self.pool.opened,
+                "idle_connections": self.pool.idle_connections()
+            }
+
+
+email_outbox = EmailOutbox(
+    SMTPPool(
+        settings.SMTP_SERVER, settings.SMTP_PORT, settings.SMTP_USERNAME, settings.SMTP_PASSWORD,
+        size=settings.EMAIL_POOL_SIZE, max_age_seconds=settings.EMAIL_CONNECTION_MAX_AGE_SECONDS,
+        require_tls=settings.SMTP_REQUIRE_TLS
+    ),
+    settings.FROM_EMAIL, settings.FROM_NAME,
+    senders=settings.EMAIL_POOL_SIZE, batch_size=settings.EMAIL_BATCH_SIZE, max_attempts=settings.EMAIL_MAX_ATTEMPTS
+)
+
+
+def enqueue_email(to_emails: List[str], subject: str, body: str = "", html_body: Optional[str] = None,
+                  attachments: Optional[List[str]] = None, category: Optional[str] = None) -> Optional[str]:
+    return email_outbox.enqueue(to_emails, subject, body, html_body, attachments, category)
+
+
+def ensure_email_outbox_indexes(db):
+    db[OUTBOX].create_index([("status", ASCENDING), ("next_attempt_at", ASCENDING)], background=True)
+    # Sent, failed and abandoned messages alike (a retry schedule ends within hours)
+    db[OUTBOX].create_index(
+        [("created_at", ASCENDING)], expireAfterSeconds=settings.EMAIL_OUTBOX_RETENTION_DAYS * 86400, background=True
+    )
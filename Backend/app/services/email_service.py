@@ -1,75 +1,28 @@
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email import encoders
-import os
 from typing import List, Optional, Dict, Any
 from datetime import datetime
+from app.config import settings
+from app.services.email_outbox import enqueue_email
+import logging
+
+logger = logging.getLogger("uvicorn")
 
 class EmailService:
     def __init__(self):
-        # SMTP Configuration - You can set these via environment variables
-        self.smtp_server = os.getenv("SMTP_SERVER", "smtp.gmail.com")
-        self.smtp_port = int(os.getenv("SMTP_PORT", "587"))
-        self.smtp_username = os.getenv("SMTP_USERNAME", "arzumehreen050@gmail.com")
-        self.smtp_password = os.getenv("SMTP_PASSWORD", "cpus ctsa fdtm dmqs")
-        self.from_email = os.getenv("FROM_EMAIL", self.smtp_username)
-        self.from_name = os.getenv("FROM_NAME", "Skill Wallah LMS")
+        # SMTP configuration lives in settings; the outbox senders hold the connections
+        self.smtp_server = settings.SMTP_SERVER
+        self.smtp_port = settings.SMTP_PORT
+        self.from_email = settings.FROM_EMAIL
+        self.from_name = settings.FROM_NAME
 
     def send_email(self, to_emails: List[str], subject: str, body: str, 
-                   html_body: Optional[str] = None, attachments: Optional[List[str]] = None) -> bool:
-       
+                   html_body: Optional[str] = None, attachments: Optional[List[str]] = None,
+                   category: Optional[str] = None) -> bool:
+        """Queue an email in the outbox; delivery and retries happen in the background"""
         try:
-            
-            # Create message container
-            msg = MIMEMultipart('alternative')
-            msg['Subject'] = subject
-            msg['From'] = f"{self.from_name} <{self.from_email}>"
-            msg['To'] = ', '.join(to_emails)
-            
-            # Add body to email
-            text_part = MIMEText(body, 'plain', 'utf-8')
-            msg.attach(text_part)
-            
-            # Add HTML body if provided
-            if html_body:
-                html_part = MIMEText(html_body, 'html', 'utf-8')
-                msg.attach(html_part)
-            
-            # Add attachments if provided
-            if attachments:
-                for file_path in attachments:
-                    if os.path.isfile(file_path):
-                        with open(file_path, "rb") as attachment:
-                            part = MIMEBase('application', 'octet-stream')
-                            part.set_payload(attachment.read())
-                            encoders.encode_base64(part)
-                            part.add_header(
-                                'Content-Disposition',
-                                f'attachment; filename= {os.path.basename(file_path)}'
-                            )
-                            msg.attach(part)
-            
-            server = smtplib.SMTP(self.smtp_server, self.smtp_port)
-            server.starttls()  # Enable security
-            
-            print(f"[DEBUG] EmailService: Logging in with username: {self.smtp_username}")
-            server.login(self.smtp_username, self.smtp_password)
-            
-            # Send email
-            text = msg.as_string()
-            print(f"[DEBUG] EmailService: Sending email...")
-            server.sendmail(self.from_email, to_emails, text)
-            server.quit()
-            
-            print(f"[DEBUG] EmailService: Email sent successfully to {to_emails}")
+            enqueue_email(to_emails, subject, body, html_body, attachments, category)
             return True
-            
         except Exception as e:
-            print(f"[DEBUG] EmailService: Failed to send email: {str(e)}")
-            import traceback
-            print(f"[DEBUG] EmailService: Full error traceback: {traceback.format_exc()}")
+            logger.error(f"[EMAIL] Failed to queue email to {to_emails}: {e}")
             return False
 
     def send_welcome_email(self, user_email: str, user_name: str, user_role: str) -> bool:
@@ -7,6 +7,7 @@ import logging
 import requests
 from io import BytesIO
 from PIL import Image, ImageDraw, ImageFont
+from app.utils.render_assets import load_template, load_font
 
 logger = logging.getLogger(__name__)
 
@@ -64,19 +65,17 @@ def generate_id_card_image(student_data: dict, branch_info: dict, output_path: s
         
         logger.info(f"[ID CARD] Using template: {template_path}")
         
-        # Load template image
-        template = Image.open(template_path)
-        template = template.convert("RGBA")
-        id_card = template.copy()
+        # Load template image (cached per process, returned as a fresh copy)
+        id_card = load_template(template_path, "RGBA")
         draw = ImageDraw.Draw(id_card)
         
-        logger.info(f"[ID CARD] Template loaded. Size: {template.size}")
+        logger.info(f"[ID CARD] Template loaded. Size: {id_card.size}")
         
         # Try to load fonts
         try:
-            font_name = ImageFont.truetype("arial.ttf", 16)
-            font_label = ImageFont.truetype("arial.ttf", 12)
-            font_small = ImageFont.truetype("arial.ttf", 10)
+            font_name = load_font("arial.ttf", 16)
+            font_label = load_font("arial.ttf", 12)
+            font_small = load_font("arial.ttf", 10)
         except:
             font_name = ImageFont.load_default()
             font_label = ImageFont.load_default()
@@ -0,0 +1,426 @@
+"""
+Pre-aggregated instructor dashboard statistics
+
+The instructor dashboard used to find the instructor's courses with five
+queries, load every enrollment, submission and quiz attempt of those courses
+into Python and look students up one by one. Each instructor now has one
+``instructor_stats`` document:
+
+- ``enrollments``, ``students_enrolled`` (distinct, tracked in
+  ``instructor_students``) and the five most recent students
+- ``submissions_total`` / ``submissions_graded`` / ``submissions_pending``
+- ``quiz_attempts`` and ``quiz_percentage_sum`` (average = sum / attempts)
+- ``certificates_issued``
+- ``courses_taught`` and ``assignments_created`` (refreshed by reconcile only)
+
+Write paths report the document before and after the write
+(``enrollment_changed``, ``submission_changed``, ``attempt_recorded``,
+``certificate_issued``). Events are queued in memory and a background thread
+resolves each one to its instructor (assignment/quiz -> course -> instructor)
+and applies them as ``$inc`` updates, so callers - sync or async - never wait on
+it. ``reconcile_instructor`` recomputes a document from the source collections;
+the dashboard runs it when a document is missing or older than
+``INSTRUCTOR_STATS_MAX_AGE_SECONDS``, and ``python -m
+app.services.instructor_stats_service`` reconciles every instructor.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+import threading
+import logging
+from bson import ObjectId
+from pymongo import UpdateOne
+from app.config import settings
+from app.services.stats_engine import run_stats_sync, count, total, rows
+
+logger = logging.getLogger("uvicorn")
+
+STATS_COLLECTION = "instructor_stats"
+STUDENTS_COLLECTION = "instructor_students"
+RECENT_STUDENTS = 5
+INSTRUCTOR_PREFIX = "instructor_"
+
+COUNTER_FIELDS = [
+    "enrollments", "submissions_total", "submissions_graded", "submissions_pending",
+    "quiz_attempts", "quiz_percentage_sum", "certificates_issued"
+]
+
+# (kind, id) of the document an event belongs to: "course", "assignment" or "quiz"
+Ref = Tuple[str, str]
+
+
+def _id_forms(value) -> list:
+    """``value`` as stored by the different writers: string and ObjectId"""
+    forms = [str(value)]
+    if ObjectId.is_valid(str(value)):
+        forms.append(ObjectId(str(value)))
+    return forms
+
+
+def instructor_id_of(course: Optional[dict]) -> Optional[str]:
+    """The instructor user id a course belongs to (None if it has no usable reference)"""
+    if not course:
+        return None
+    for field in ("instructor_id", "instructor", "created_by"):
+        value = str(course.get(field) or "")
+        if value.startswith(INSTRUCTOR_PREFIX):
+            value = value[len(INSTRUCTOR_PREFIX):]
+        if ObjectId.is_valid(value):
+            return value
+    return None
+
+
+# ------------------- Contributions -------------------
+
+def _is_graded(submission: dict) -> bool:
+    return submission.get("grade") is not None or str(submission.get("status") or "").lower() == "graded"
+
+
+def enrollment_contribution(enrollment: Optional[dict]):
+    if not enrollment or not enrollment.get("course_id"):
+        return None
+    return ("course", str(enrollment["course_id"])), {"enrollments": 1}
+
+
+def submission_contribution(submission: Optional[dict]):
+    if not submission or not submission.get("assignment_id"):
+        return None
+    graded = _is_graded(submission)
+    return ("assignment", str(submission["assignment_id"])), {
+        "submissions_total": 1,
+        "submissions_graded": int(graded),
+        "submissions_pending": int(not graded)
+    }
+
+
+def attempt_contribution(attempt: Optional[dict]):
+    if not attempt or not attempt.get("quiz_id"):
+        return None
+    try:
+        percentage = float(attempt.get("percentage") or 0)
+    except (TypeError, ValueError):
+        percentage = 0.0
+    return ("quiz", str(attempt["quiz_id"])), {"quiz_attempts": 1, "quiz_percentage_sum": percentage}
+
+
+def certificate_contribution(certificate: Optional[dict]):
+    if not certificate:
+        return None
+    if certificate.get("course_id"):
+        ref = ("course", str(certificate["course_id"]))
+    elif certificate.get("quiz_id"):
+        ref = ("quiz", str(certificate["quiz_id"]))
+    else:
+        return None
+    return ref, {"certificates_issued": 1}
+
+
+def _recent_student(enrollment: dict) -> dict:
+    return {
+        "id": str(enrollment.get("student_id") or enrollment.get("user_id") or ""),
+        "name": enrollment.get("student_name") or "Unknown Student",
+        "email": enrollment.get("email") or enrollment.get("student_email") or "",
+        "enrolled_date": enrollment.get("enrollment_date") or enrollment.get("created_at")
+    }
+
+
+# ------------------- Incremental recorder -------------------
+
+class InstructorStatsRecorder:
+    """Queue of stat changes applied to ``instructor_stats`` in the background"""
+
+    def __init__(self, max_pending: int = 5000, cache_size: int = 10000):
+        self._lock = threading.Lock()
+        self._pending: List[tuple] = []
+        self._max_pending = max_pending
+        self._owners: Dict[Ref, Optional[str]] = {}
+        self._cache_size = cache_size
+        self._db = None
+        self._flusher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+
+    def _queue(self, contribution, sign: int, student: Optional[dict] = None):
+        if contribution is None:
+            return
+        ref, increments = contribution
+        with self._lock:
+            self._pending.append((ref, {field: sign * value for field, value in increments.items()}, student))
+            pending = len(self._pending)
+        if pending >= self._max_pending:
+            self._wake.set()
+
+    def _change(self, before, after):
+        if before == after:
+            return
+        if before:
+            self._queue(before, -1)
+        if after:
+            self._queue(after, 1)
+
+    # Write-path hooks: pass before=None for inserts and after=None for deletes
+
+    def enrollment_changed(self, before: dict = None, after: dict = None):
+        before_c, after_c = enrollment_contribution(before), enrollment_contribution(after)
+        if before is None and after_c is not None:
+            self._queue(after_c, 1, student=_recent_student(after))
+        else:
+            self._change(before_c, after_c)
+
+    def submission_changed(self, before: dict = None, after: dict = None):
+        self._change(submission_contribution(before), submission_contribution(after))
+
+    def attempt_recorded(self, attempt: dict):
+        self._queue(attempt_contribution(attempt), 1)
+
+    def certificate_issued(self, certificate: dict):
+        self._queue(certificate_contribution(certificate), 1)
+
+    # Resolution and flushing
+
+    def _owner(self, db, ref: Ref) -> Optional[str]:
+        """Instructor of the course behind ``ref`` (memoized; ownership rarely changes)"""
+        if ref in self._owners:
+            return self._owners[ref]
+        kind, ref_id = ref
+        course_id = ref_id
+        if kind in ("assignment", "quiz"):
+            source = db["assignments" if kind == "assignment" else "quizzes"].find_one(
+                {"_id": {"$in": _id_forms(ref_id)}}, {"course_id": 1}
+            )
+            course_id = source.get("course_id") if source else None
+        owner = None
+        if course_id:
+            course = db["courses"].find_one(
+                {"_id": {"$in": _id_forms(course_id)}},
+                {"instructor_id": 1, "instructor": 1, "created_by": 1}
+            )
+            owner = instructor_id_of(course)
+        if len(self._owners) >= self._cache_size:
+            self._owners.clear()
+        self._owners[ref] = owner
+        return owner
+
+    def flush(self, db=None) -> int:
+        """Apply queued events and return how many were applied"""
+        db = db if db is not None else self._db
+        if db is None:
+            return 0
+        with self._lock:
+            events, self._pending = self._pending, []
+        if not events:
+            return 0
+
+        increments: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(int))
+        students: Dict[str, List[dict]] = defaultdict(list)
+        try:
+            for ref, deltas, student in events:
+                instructor_id = self._owner(db, ref)
+                if instructor_id is None:
+                    continue
+                for field, value in deltas.items():
+                    increments[instructor_id][field] += value
+                if student and student["id"]:
+                    students[instructor_id].append(student)
+
+            now = datetime.utcnow()
+            for instructor_id, new_students in students.items():
+                for student in new_students:
+                    result = db[STUDENTS_COLLECTION].update_one(
+                        {"_id": f"{instructor_id}:{student['id']}"},
+                        {"$setOnInsert": {"instructor_id": instructor_id, "student_id": student["id"], "first_seen": now}},
+                        upsert=True
+                    )
+                    if result.upserted_id is not None:
+                        increments[instructor_id]["students_enrolled"] += 1
+
+            operations = []
+            for instructor_id in set(increments) | set(students):
+                update = {
+                    "$inc": dict(increments[instructor_id]),
+                    "$set": {"updated_at": now},
+                    "$setOnInsert": {"instructor_id": instructor_id}
+                }
+                if students.get(instructor_id):
+                    update["$push"] = {"recent_students": {"$each": students[instructor_id], "$slice": -RECENT_STUDENTS}}
+                if not update["$inc"]:
+                    del update["$inc"]
+                operations.append(UpdateOne({"_id": instructor_id}, update, upsert=True))
+            if operations:
+                db[STATS_COLLECTION].bulk_write(operations, ordered=False)
+        except Exception as e:
+            # Dropped rather than retried: a partial retry could double count; reconcile repairs drift
+            logger.error(f"[INSTRUCTOR STATS] Failed to apply {len(events)} events: {e}")
+            return 0
+        return len(events)
+
+    def start(self, db, interval_seconds: float = 5.0):
+        self._db = db
+        if db is None or (self._flusher is not None and self._flusher.is_alive()):
+            return
+        self._stop.clear()
+
+        def _run():
+            while not self._stop.is_set():
+                self._wake.wait(interval_seconds)
+                self._wake.clear()
+                try:
+                    self.flush()
+                except Exception as e:
+                    logger.warning(f"[INSTRUCTOR STATS] Flusher error: {e}")
+
+        self._flusher = threading.Thread(target=_run, name="instructor-stats", daemon=True)
+        self._flusher.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._flusher is not None:
+            self._flusher.join(timeout=5)
+            self._flusher = None
+        self.flush()
+
+
+instructor_stats = InstructorStatsRecorder()
+
+
+# ------------------- Reconcile -------------------
+
+def _instructor_courses_query(instructor_id: str, instructor_name: Optional[str] = None) -> dict:
+    clauses = [
+        {"instructor": {"$in": _id_forms(instructor_id) + [f"{INSTRUCTOR_PREFIX}{instructor_id}"]}},
+        {"instructor_id": {"$in": _id_forms(instructor_id)}},
+        {"created_by": {"$in": _id_forms(instructor_id)}}
+    ]
+    if instructor_name:
+        clauses.append({"instructor_name": instructor_name})
+    return {"$or": clauses}
+
+
+def _all_forms(ids) -> list:
+    return [form for value in ids for form in _id_forms(value)]
+
+
+def reconcile_instructor(db, instructor_id: str, instructor_name: Optional[str] = None) -> dict:
+    """Recompute an instructor's stats document from the source collections
+
+    Increments applied while this runs may be overwritten; the next reconcile
+    picks them up again.
+    """
+    instructor_id = str(instructor_id)
+    if instructor_name is None:
+        user = db["users"].find_one({"_id": {"$in": _id_forms(instructor_id)}}, {"name": 1})
+        instructor_name = user.get("name") if user else None
+
+    course_ids = [str(c["_id"]) for c in db["courses"].find(_instructor_courses_query(instructor_id, instructor_name), {"_id": 1})]
+    course_forms = _all_forms(course_ids)
+    assignment_ids = [str(a["_id"]) for a in db["assignments"].find({"course_id": {"$in": course_forms}}, {"_id": 1})]
+    quiz_ids = [str(q["_id"]) for q in db["quizzes"].find({"course_id": {"$in": course_forms}}, {"_id": 1})]
+
+    stats = run_stats_sync(db, {
+        "enrollments": {"collection": "enrollments", "match": {"course_id": {"$in": course_forms}}, "stats": {
+            "total": count(),
+            "students": rows([{"$group": {"_id": {"$ifNull": ["$student_id", "$user_id"]}}}]),
+            "recent": rows([{"$sort": {"enrollment_date": -1}}, {"$limit": RECENT_STUDENTS}])
+        }},
+        "submissions": {"collection": "submissions", "match": {"assignment_id": {"$in": _all_forms(assignment_ids)}}, "stats": {
+            "total": count(),
+            "graded": count({"$or": [{"grade": {"$ne": None}}, {"status": {"$in": ["graded", "Graded"]}}]})
+        }},
+        "attempts": {"collection": "quiz_attempts", "match": {"quiz_id": {"$in": _all_forms(quiz_ids)}}, "stats": {
+            "total": count(),
+            "percentage_sum": total({"$convert": {"input": "$percentage", "to": "double", "onError": 0, "onNull": 0}})
+        }},
+        "certificates": {"collection": "certificates", "match": {"$or": [
+            {"course_id": {"$in": course_forms}},
+            {"quiz_id": {"$in": _all_forms(quiz_ids)}}
+        ]}, "stats": {"total": count()}}
+    })
+
+    student_ids = [str(s["_id"]) for s in stats["enrollments"]["students"] if s["_id"]]
+    now = datetime.utcnow()
+    db[STUDENTS_COLLECTION].delete_many({"instructor_id": instructor_id})
+    if student_ids:
+        db[STUDENTS_COLLECTION].insert_many([
+            {"_id": f"{instructor_id}:{student_id}", "instructor_id": instructor_id, "student_id": student_id, "first_seen": now}
+            for student_id in student_ids
+        ], ordered=False)
+
+    submissions = stats["submissions"]
+    doc = {
+        "instructor_id": instructor_id,
+        "courses_taught": len(course_ids),
+        "assignments_created": len(assignment_ids),
+        "enrollments": stats["enrollments"]["total"],
+        "students_enrolled": len(student_ids),
+        "recent_students": [_recent_student(e) for e in reversed(stats["enrollments"]["recent"])],
+        "submissions_total": submissions["total"],
+        "submissions_graded": submissions["graded"],
+        "submissions_pending": submissions["total"] - submissions["graded"],
+        "quiz_attempts": stats["attempts"]["total"],
+        "quiz_percentage_sum": stats["attempts"]["percentage_sum"],
+        "certificates_issued": stats["certificates"]["total"],
+        "reconciled_at": now,
+        "updated_at": now
+    }
+    db[STATS_COLLECTION].update_one({"_id": instructor_id}, {"$set": doc}, upsert=True)
+    logger.info(f"[INSTRUCTOR STATS] Reconciled {instructor_id}: {len(course_ids)} courses, {doc['enrollments']} enrollments")
+    return {"_id": instructor_id, **doc}
+
+
+def reconcile_all(db) -> int:
+    """Reconcile every instructor (backfill or repair)"""
+    reconciled = 0
+    for user in db["users"].find({"role": "instructor"}, {"name": 1}):
+        try:
+            reconcile_instructor(db, str(user["_id"]), user.get("name"))
+            reconciled += 1
+        except Exception as e:
+            logger.warning(f"[INSTRUCTOR STATS] Reconcile failed for {user['_id']}: {e}")
+    return reconciled
+
+
+_reconciling = set()
+_reconciling_lock = threading.Lock()
+
+
+def _reconcile_in_background(db, instructor_id: str, instructor_name: Optional[str]):
+    with _reconciling_lock:
+        if instructor_id in _reconciling:
+            return
+        _reconciling.add(instructor_id)
+
+    def _run():
+        try:
+            reconcile_instructor(db, instructor_id, instructor_name)
+        except Exception as e:
+            logger.warning(f"[INSTRUCTOR STATS] Background reconcile failed for {instructor_id}: {e}")
+        finally:
+            with _reconciling_lock:
+                _reconciling.discard(instructor_id)
+
+    threading.Thread(target=_run, name="instructor-stats-reconcile", daemon=True).start()
+
+
+def get_instructor_stats(db, instructor_id: str, instructor_name: Optional[str] = None) -> dict:
+    """The instructor's stats document - built on first use, refreshed in the background when stale"""
+    instructor_id = str(instructor_id)
+    doc = db[STATS_COLLECTION].find_one({"_id": instructor_id})
+    if doc is None or doc.get("reconciled_at") is None:
+        return reconcile_instructor(db, instructor_id, instructor_name)
+    max_age = timedelta(seconds=settings.INSTRUCTOR_STATS_MAX_AGE_SECONDS)
+    if doc["reconciled_at"] < datetime.utcnow() - max_age:
+        _reconcile_in_background(db, instructor_id, instructor_name)
+    return doc
+
+
+def ensure_instructor_stats_indexes(db):
+    db[STUDENTS_COLLECTION].create_index([("instructor_id", 1)], background=True)
+
+
+if __name__ == "__main__":
+    from pymongo import MongoClient
+
+    client = MongoClient(settings.MONGO_URI, serverSelectionTimeoutMS=10000)
+    print({"reconciled": reconcile_all(client[settings.DB_NAME])})
+    client.close()
@@ -0,0 +1,352 @@
+"""
+Daily revenue rollups for the ledger
+
+One document per day x franchise x branch holds enrollment revenue, enrollment
+count, instructor payouts and branch cash-ins/cash-outs. Writers call
+``apply_enrollment_change`` / ``apply_cash_change`` with the document before and
+after the write, so the rollup is kept current with ``$inc`` updates and ledger
+charts read O(days) rows instead of scanning enrollments.
+
+``rebuild_rollups`` recomputes everything from the source collections (backfill
+or repair); run it with ``python -m app.services.ledger_rollup_service``.
+"""
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger("uvicorn")
+
+ROLLUP_COLLECTION = "ledger_daily_rollups"
+
+# Enrollment statuses that count as revenue (compared case-insensitively)
+REVENUE_STATUSES = ["completed", "active", "enrolled", "success"]
+ENROLLMENT_DATE_FIELDS = ["enrollment_date", "created_at", "date"]
+ENROLLMENT_AMOUNT_FIELDS = ["fee_paid", "course_fee", "amount", "fee", "amount_paid"]
+INSTRUCTOR_COMMISSION_RATE = 0.3
+
+# kind -> (collection name, per-branch collection prefix, date field)
+CASH_SOURCES = {
+    "cash_in": ("cashins", "branch_cashins_", "income_date"),
+    "cash_out": ("cashouts", "branch_cashouts_", "expense_date"),
+}
+
+ROLLUP_FIELDS = ["enrollment_revenue", "enrollment_count", "payouts", "cash_in", "cash_out"]
+
+
+def get_rollup_collection(db):
+    return db[ROLLUP_COLLECTION]
+
+
+# ------------------- Aggregation expressions -------------------
+
+def date_range_match(fields: List[str], start_date: datetime, end_date: datetime) -> dict:
+    """Index-friendly $match on any of ``fields`` falling in the range
+
+    Dates are stored either as ISO strings or as BSON dates depending on the
+    writer, so both representations are matched.
+    """
+    clauses = []
+    for field in fields:
+        clauses.append({field: {"$gte": start_date.isoformat(), "$lte": end_date.isoformat()}})
+        clauses.append({field: {"$gte": start_date, "$lte": end_date}})
+    return {"$or": clauses}
+
+
+def first_date_expr(fields: List[str]) -> dict:
+    """Aggregation expression: first present date field, parsed to a BSON date
+
+    Missing, null and empty-string fields are skipped, as ``_parse_day`` callers do.
+    """
+    value = None
+    for field in reversed(fields):
+        value = {"$cond": [{"$eq": [{"$ifNull": [f"${field}", ""]}, ""]}, value, f"${field}"]}
+    return {
+        "$convert": {
+            "input": value,
+            "to": "date",
+            "onError": None,
+            "onNull": None
+        }
+    }
+
+
+def first_amount_expr(paths: List[str], default: float = 0) -> dict:
+    """Aggregation expression: first positive numeric value among ``paths``"""
+    expr = default
+    for path in reversed(paths):
+        expr = {
+            "$let": {
+                "vars": {"v": {"$convert": {"input": f"${path}", "to": "double", "onError": 0, "onNull": 0}}},
+                "in": {"$cond": [{"$gt": ["$$v", 0]}, "$$v", expr]}
+            }
+        }
+    return expr
+
+
+def day_start(value: datetime) -> datetime:
+    """Midnight (UTC, naive) of the given datetime"""
+    return datetime(value.year, value.month, value.day)
+
+
+# ------------------- Contributions of single documents -------------------
+
+def _parse_day(value) -> Optional[datetime]:
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return day_start(value)
+
+
+def _first_amount(doc: dict, fields: List[str]) -> float:
+    for field in fields:
+        try:
+            amount = float(doc.get(field) or 0)
+        except (TypeError, ValueError):
+            continue
+        if amount > 0:
+            return amount
+    return 0.0
+
+
+def _rollup_key(day: datetime, franchise_code, branch_code) -> Tuple[datetime, str, str]:
+    return day, franchise_code or "", branch_code or ""
+
+
+def enrollment_contribution(enrollment: Optional[dict]) -> Optional[Tuple[tuple, Dict[str, float]]]:
+    """Rollup key and increments for one enrollment, or None if it is not revenue"""
+    if not enrollment:
+        return None
+    if str(enrollment.get("status") or "").lower() not in REVENUE_STATUSES:
+        return None
+
+    day = None
+    for field in ENROLLMENT_DATE_FIELDS:
+        if enrollment.get(field):
+            day = _parse_day(enrollment[field])
+            break
+    if day is None:
+        return None
+
+    amount = _first_amount(enrollment, ENROLLMENT_AMOUNT_FIELDS)
+    key = _rollup_key(day, enrollment.get("franchise_code"), enrollment.get("branch_code"))
+    return key, {
+        "enrollment_revenue": amount,
+        "enrollment_count": 1,
+        "payouts": amount * INSTRUCTOR_COMMISSION_RATE
+    }
+
+
+def cash_contribution(kind: str, record: Optional[dict]) -> Optional[Tuple[tuple, Dict[str, float]]]:
+    """Rollup key and increments for one cash-in/cash-out record"""
+    if not record:
+        return None
+    date_field = CASH_SOURCES[kind][2]
+    day = _parse_day(record.get(date_field)) or _parse_day(record.get("created_at"))
+    if day is None:
+        return None
+    key = _rollup_key(day, record.get("franchise_code"), record.get("branch_code"))
+    return key, {kind: _first_amount(record, ["amount"])}
+
+
+# ------------------- Incremental updates -------------------
+
+def _rollup_id(key: tuple) -> str:
+    day, franchise_code, branch_code = key
+    return f"{day.strftime('%Y-%m-%d')}|{franchise_code}|{branch_code}"
+
+
+def _rollup_doc(key: tuple) -> dict:
+    day, franchise_code, branch_code = key
+    return {
+        "_id": _rollup_id(key),
+        "day": day.strftime("%Y-%m-%d"),
+        "date": day,
+        "franchise_code": franchise_code,
+        "branch_code": branch_code
+    }
+
+
+def _apply(db, contribution, sign: int):
+    key, increments = contribution
+    doc = _rollup_doc(key)
+    get_rollup_collection(db).update_one(
+        {"_id": doc.pop("_id")},
+        {
+            "$inc": {field: sign * value for field, value in increments.items()},
+            "$set": {"updated_at": datetime.utcnow()},
+            "$setOnInsert": doc
+        },
+        upsert=True
+    )
+
+
+def _apply_change(db, before, after):
+    if before == after:
+        return
+    if before:
+        _apply(db, before, -1)
+    if after:
+        _apply(db, after, 1)
+
+
+def apply_enrollment_change(db, before: dict = None, after: dict = None):
+    """Move an enrollment's contribution from its old state to its new one
+
+    Pass ``before=None`` for inserts and ``after=None`` for deletes. Rollup
+    failures are logged and never fail the write that triggered them; a
+    rebuild repairs any drift.
+    """
+    try:
+        _apply_change(db, enrollment_contribution(before), enrollment_contribution(after))
+    except Exception as e:
+        logger.warning(f"[LedgerRollup] Failed to apply enrollment change: {e}")
+
+
+def apply_cash_change(db, kind: str, before: dict = None, after: dict = None):
+    """Same as ``apply_enrollment_change`` for cash-ins ("cash_in") and cash-outs ("cash_out")"""
+    try:
+        _apply_change(db, cash_contribution(kind, before), cash_contribution(kind, after))
+    except Exception as e:
+        logger.warning(f"[LedgerRollup] Failed to apply {kind} change: {e}")
+
+
+# ------------------- Read pipelines -------------------
+
+def rollup_range_match(start_date: datetime, end_date: datetime, franchise_code: str = None, branch_code: str = None) -> dict:
+    """$match stage selecting rollup rows for the days covering the range"""
+    match = {"date": {"$gte": day_start(start_date), "$lte": end_date}}
+    if franchise_code:
+        match["franchise_code"] = franchise_code
+    if branch_code:
+        match["branch_code"] = branch_code
+    return {"$match": match}
+
+
+def rollup_totals_pipeline(start_date: datetime, end_date: datetime, **scope) -> list:
+    return [
+        rollup_range_match(start_date, end_date, **scope),
+        {"$group": {"_id": None, **{field: {"$sum": f"${field}"} for field in ROLLUP_FIELDS}}}
+    ]
+
+
+def rollup_daily_pipeline(start_date: datetime, end_date: datetime, **scope) -> list:
+    return [
+        rollup_range_match(start_date, end_date, **scope),
+        {"$group": {"_id": "$day", **{field: {"$sum": f"${field}"} for field in ROLLUP_FIELDS}}},
+        {"$sort": {"_id": 1}}
+    ]
+
+
+# ------------------- Rebuild -------------------
+
+def _enrollment_rebuild_pipeline() -> list:
+    return [
+        {"$project": {
+            "status": {"$toLower": {"$ifNull": ["$status", ""]}},
+            "day_date": first_date_expr(ENROLLMENT_DATE_FIELDS),
+            "amount": first_amount_expr(ENROLLMENT_AMOUNT_FIELDS),
+            "franchise_code": {"$ifNull": ["$franchise_code", ""]},
+            "branch_code": {"$ifNull": ["$branch_code", ""]}
+        }},
+        {"$match": {"status": {"$in": REVENUE_STATUSES}, "day_date": {"$ne": None}}},
+        {"$group": {
+            "_id": {
+                "day": {"$dateTrunc": {"date": "$day_date", "unit": "day"}},
+                "franchise_code": "$franchise_code",
+                "branch_code": "$branch_code"
+            },
+            "enrollment_revenue": {"$sum": "$amount"},
+            "enrollment_count": {"$sum": 1}
+        }}
+    ]
+
+
+def _cash_rebuild_pipeline(kind: str) -> list:
+    date_field = CASH_SOURCES[kind][2]
+    return [
+        {"$project": {
+            "day_date": {"$ifNull": [
+                {"$convert": {"input": f"${date_field}", "to": "date", "onError": None, "onNull": None}},
+                {"$convert": {"input": "$created_at", "to": "date", "onError": None, "onNull": None}}
+            ]},
+            "amount": first_amount_expr(["amount"]),
+            "franchise_code": {"$ifNull": ["$franchise_code", ""]},
+            "branch_code": {"$ifNull": ["$branch_code", ""]}
+        }},
+        {"$match": {"day_date": {"$ne": None}}},
+        {"$group": {
+            "_id": {
+                "day": {"$dateTrunc": {"date": "$day_date", "unit": "day"}},
+                "franchise_code": "$franchise_code",
+                "branch_code": "$branch_code"
+            },
+            kind: {"$sum": "$amount"}
+        }}
+    ]
+
+
+def rebuild_rollups(db) -> dict:
+    """Recompute all rollups from enrollments and cash-in/cash-out collections
+
+    Rows are built in a scratch collection and swapped in with a rename, so
+    readers never see a half-built rollup. Incremental updates that land while
+    the rebuild runs are lost; run it when writes are quiet or run it twice.
+    """
+    rows: Dict[str, dict] = {}
+
+    def merge(group: dict, values: dict):
+        key = _rollup_key(group["day"], group["franchise_code"], group["branch_code"])
+        row = rows.setdefault(_rollup_id(key), {**_rollup_doc(key), **{field: 0 for field in ROLLUP_FIELDS}})
+        for field, value in values.items():
+            row[field] += value
+
+    for result in db.enrollments.aggregate(_enrollment_rebuild_pipeline(), allowDiskUse=True):
+        revenue = result["enrollment_revenue"]
+        merge(result["_id"], {
+            "enrollment_revenue": revenue,
+            "enrollment_count": result["enrollment_count"],
+            "payouts": revenue * INSTRUCTOR_COMMISSION_RATE
+        })
+
+    collection_names = db.list_collection_names()
+    for kind, (shared_name, branch_prefix, _) in CASH_SOURCES.items():
+        sources = [name for name in collection_names if name == shared_name or name.startswith(branch_prefix)]
+        for name in sources:
+            for result in db[name].aggregate(_cash_rebuild_pipeline(kind), allowDiskUse=True):
+                merge(result["_id"], {kind: result[kind]})
+
+    now = datetime.utcnow()
+    scratch = db[f"{ROLLUP_COLLECTION}_rebuild"]
+    scratch.drop()
+    if rows:
+        scratch.insert_many([{**row, "updated_at": now} for row in rows.values()], ordered=False)
+        scratch.rename(ROLLUP_COLLECTION, dropTarget=True)
+    else:
+        get_rollup_collection(db).delete_many({})
+    ensure_rollup_indexes(db)
+
+    logger.info(f"[LedgerRollup] Rebuilt {len(rows)} daily rollup rows")
+    return {"rows": len(rows), "rebuilt_at": now.isoformat()}
+
+
+def ensure_rollup_indexes(db):
+    collection = get_rollup_collection(db)
+    collection.create_index([("date", 1)], background=True)
+    collection.create_index([("franchise_code", 1), ("branch_code", 1), ("date", 1)], background=True)
+
+
+if __name__ == "__main__":
+    from pymongo import MongoClient
+    from app.config import settings
+
+    client = MongoClient(settings.MONGO_URI, serverSelectionTimeoutMS=10000)
+    print(rebuild_rollups(client[settings.DB_NAME]))
+    client.close()
@@ -4,6 +4,7 @@ from datetime import datetime
 from app.models.module import get_module_collection
 from app.models.lesson import get_lesson_collection
 from app.utils.serializers import serialize_document
+from app.services.course_content_service import mark_course_content_stale
 
 def create_module(db, course_id, payload):
     """Create a new module for a course"""
@@ -67,6 +68,7 @@ def create_module(db, course_id, payload):
     
     print(f"Creating module document: {module_doc}")
     result = collection.insert_one(module_doc)
+    mark_course_content_stale(db, course_ref=course_ref_id)
     
     created_module = collection.find_one({"_id": result.inserted_id})
     from app.utils.serializers import serialize_document
@@ -131,13 +133,15 @@ def update_module(db, module_id, updates):
                 detail=f"A module with order {update_data['order']} already exists in this course"
             )
     
-    result = collection.update_one(
+    module = collection.find_one_and_update(
         {"_id": ObjectId(module_id)},
-        {"$set": update_data}
+        {"$set": update_data},
+        projection={"course_id": 1}
     )
     
-    if result.matched_count == 0:
+    if not module:
         raise HTTPException(status_code=404, detail="Module not found")
+    mark_course_content_stale(db, course_ref=module.get("course_id"))
     
     return {"success": True, "message": "Module updated successfully"}
 
@@ -150,10 +154,11 @@ def delete_module(db, module_id):
     lesson_collection.delete_many({"module_id": ObjectId(module_id)})
     
     # Then delete the module
-    result = module_collection.delete_one({"_id": ObjectId(module_id)})
+    module = module_collection.find_one_and_delete({"_id": ObjectId(module_id)}, projection={"course_id": 1})
     
-    if result.deleted_count == 0:
+    if not module:
         raise HTTPException(status_code=404, detail="Module not found")
+    mark_course_content_stale(db, course_ref=module.get("course_id"))
     
     return {"success": True, "message": "Module and all its lessons deleted successfully"}
 
@@ -0,0 +1,397 @@
+"""
+Notification fan-out into per-user inboxes
+
+Opening the notification bell used to page over every ``sent`` notification in
+the system and join ``user_notifications`` for read flags, so each user saw
+every broadcast regardless of its audience and the cost grew with the whole
+notification history. Notifications are now delivered once, in the background:
+
+- the recipients of a notification are resolved from ``users`` and
+  ``branch_students`` by audience (all / students / instructors / admins or an
+  explicit id list), scoped to its ``franchise_code`` / ``branch_code``
+- each recipient gets an inbox row in ``user_notifications`` (unique per user
+  and notification), written with unordered ``insert_many`` in batches of
+  ``NOTIFICATION_FANOUT_BATCH_SIZE``
+- ``notification_counters`` holds each user's unread count, incremented for the
+  rows actually inserted and decremented when a row is marked read
+
+The bell is then one query on ``(user_id, _id)`` paged by cursor plus one
+counter lookup, however many rows the inbox collection holds. A notification
+carries ``fanout_status`` (pending -> running -> done) so deliveries are claimed
+by one worker and resumed after a restart; the unique index makes a resumed
+delivery idempotent.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+import threading
+import time
+import logging
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from app.config import settings
+from app.services.realtime_hub import realtime_hub, notification_event
+
+logger = logging.getLogger("uvicorn")
+
+INBOX = "user_notifications"
+COUNTERS = "notification_counters"
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+
+# A delivery still "running" after this long is assumed to belong to a dead worker (or to have failed)
+STALE_DELIVERY = timedelta(minutes=10)
+# How often the worker re-queues pending and stale deliveries it was not told about
+SWEEP_INTERVAL_SECONDS = 60
+
+ADMIN_ROLES = ["admin", "super_admin", "branch_admin", "franchise_admin"]
+AUDIENCE_ROLES = {
+    "all": None,
+    "students": ["student"],
+    "instructors": ["instructor"],
+    "admins": ADMIN_ROLES
+}
+
+# Notification fields copied into each inbox row
+INBOX_FIELDS = ("title", "message", "type", "priority", "category", "author", "recipient_type", "course_id", "course_title", "image_url")
+
+
+# ------------------- Recipient resolution -------------------
+
+def explicit_recipients(notification: dict) -> Optional[List[str]]:
+    """User ids named on the notification itself, or None for an audience broadcast"""
+    ids = notification.get("recipient_ids")
+    if not ids:
+        single = notification.get("recipient_id") or notification.get("target_user_id")
+        ids = [single] if single else None
+    return [str(user_id) for user_id in ids] if ids else None
+
+
+def _audience_queries(notification: dict) -> List[Tuple[str, dict]]:
+    """(collection, filter) pairs whose documents are the notification's audience"""
+    audience = notification.get("recipient_type") or "all"
+    audience = getattr(audience, "value", audience)  # RecipientType from a schema
+    scope = {}
+    if notification.get("franchise_code"):
+        scope["franchise_code"] = notification["franchise_code"]
+    if notification.get("branch_code"):
+        scope["branch_code"] = notification["branch_code"]
+
+    queries = []
+    if audience not in AUDIENCE_ROLES:
+        return queries
+    roles = AUDIENCE_ROLES[audience]
+    user_filter = {"is_active": {"$ne": False}, **scope}
+    if roles:
+        user_filter["role"] = {"$in": roles}
+    queries.append(("users", user_filter))
+    # Branch students log in from their own collection
+    if roles is None or "student" in roles:
+        queries.append(("branch_students", {"login_enabled": {"$ne": False}, **scope}))
+    return queries
+
+
+def iter_recipients(db, notification: dict, batch_size: int = 1000) -> Iterator[List[str]]:
+    """Recipient user ids of ``notification`` in batches"""
+    explicit = explicit_recipients(notification)
+    if explicit is not None:
+        for start in range(0, len(explicit), batch_size):
+            yield explicit[start:start + batch_size]
+        return
+    for collection, query in _audience_queries(notification):
+        batch = []
+        for doc in db[collection].find(query, {"_id": 1}).batch_size(batch_size):
+            batch.append(str(doc["_id"]))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+def count_recipients(db, notification: dict) -> int:
+    """Number of users ``notification`` will be delivered to"""
+    explicit = explicit_recipients(notification)
+    if explicit is not None:
+        return len(explicit)
+    return sum(db[collection].count_documents(query) for collection, query in _audience_queries(notification))
+
+
+def recipient_in_scope(db, user_id: str, franchise_code: Optional[str] = None, branch_code: Optional[str] = None) -> bool:
+    """Whether ``user_id`` belongs to the franchise / branch a scoped sender may notify"""
+    ids = [user_id, ObjectId(user_id)] if ObjectId.is_valid(user_id) else [user_id]
+    scope = {"recipient_type": "all", "franchise_code": franchise_code, "branch_code": branch_code}
+    return any(
+        db[collection].count_documents({**query, "_id": {"$in": ids}}, limit=1)
+        for collection, query in _audience_queries(scope)
+    )
+
+
+# ------------------- Inbox and counters -------------------
+
+def inbox_row(notification: dict, user_id: str, now: datetime) -> dict:
+    row = {field: notification[field] for field in INBOX_FIELDS if notification.get(field) is not None}
+    row.update({
+        "user_id": user_id,
+        "notification_id": str(notification["_id"]),
+        "custom_notification_id": notification.get("notification_id"),
+        "is_read": False,
+        "read_at": None,
+        "created_at": now
+    })
+    return row
+
+
+def _bump_unread(db, user_ids: List[str], delta: int):
+    if user_ids:
+        db[COUNTERS].bulk_write(
+            [UpdateOne({"_id": user_id}, {"$inc": {"unread": delta}}, upsert=True) for user_id in user_ids],
+            ordered=False
+        )
+
+
+def deliver_batch(db, notification: dict, user_ids: List[str]) -> int:
+    """Insert inbox rows for ``user_ids`` and count them as unread; returns rows inserted"""
+    if not user_ids:
+        return 0
+    now = datetime.utcnow()
+    rows = [inbox_row(notification, user_id, now) for user_id in user_ids]
+    failed = set()
+    try:
+        db[INBOX].insert_many(rows, ordered=False)
+    except BulkWriteError as e:
+        for error in e.details.get("writeErrors", []):
+            if error.get("code") != 11000:
+                raise
+            failed.add(error["index"])
+    inserted = [user_id for index, user_id in enumerate(user_ids) if index not in failed]
+    for index, row in enumerate(rows):
+        if index not in failed:
+            notification_event(realtime_hub.emit, row)
+    if failed:
+        # Already delivered (resumed run) or a bare read marker from before fan-out: fill in the content
+        content = {field: value for field, value in rows[0].items() if field in INBOX_FIELDS or field == "custom_notification_id"}
+        db[INBOX].update_many(
+            {"notification_id": str(notification["_id"]), "user_id": {"$in": [user_ids[i] for i in failed]}, "title": {"$exists": False}},
+            {"$set": content}
+        )
+    _bump_unread(db, inserted, 1)
+    return len(inserted)
+
+
+def unread_count(db, user_id: str) -> int:
+    """Unread inbox rows of ``user_id`` - one counter lookup once seeded"""
+    counter = db[COUNTERS].find_one({"_id": user_id})
+    if counter is not None and counter.get("seeded"):
+        return max(counter.get("unread", 0), 0)
+    # First lookup for this user: count the rows delivered before counters existed
+    unread = db[INBOX].count_documents({"user_id": user_id, "is_read": False})
+    try:
+        db[COUNTERS].update_one(
+            {"_id": user_id, "seeded": {"$ne": True}},
+            {"$set": {"unread": unread, "seeded": True}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        pass  # seeded concurrently
+    return unread
+
+
+def mark_read(db, user_id: str, query: dict) -> Optional[dict]:
+    """Mark the user's unread row matching ``query`` as read; returns the row, None if there was none"""
+    row = db[INBOX].find_one_and_update(
+        {**query, "user_id": user_id, "is_read": False},
+        {"$set": {"is_read": True, "read_at": datetime.utcnow()}}
+    )
+    if row is not None:
+        db[COUNTERS].update_one({"_id": user_id}, {"$inc": {"unread": -1}})
+    return row
+
+
+def list_inbox(db, user_id: str, limit: int = 50, before: Optional[str] = None, skip: int = 0) -> List[dict]:
+    """Newest-first inbox rows of ``user_id``; page with ``before`` = id of the last row seen"""
+    query = {"user_id": user_id, "title": {"$exists": True}}
+    if before and ObjectId.is_valid(before):
+        query["_id"] = {"$lt": ObjectId(before)}
+        skip = 0
+    return list(db[INBOX].find(query).sort("_id", DESCENDING).skip(skip).limit(limit))
+
+
+# ------------------- Background worker -------------------
+
+class NotificationFanout:
+    """Delivers and retracts notifications on a background thread"""
+
+    def __init__(self, batch_size: int = 1000):
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._jobs: List[Tuple[str, str]] = []
+        self._db = None
+        self._worker: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._delivered = 0
+        self._failed_retractions: set = set()
+
+    def _submit(self, action: str, notification_id):
+        with self._lock:
+            self._jobs.append((action, str(notification_id)))
+        self._wake.set()
+
+    def deliver(self, notification_id):
+        """Fan out a ``sent`` notification whose ``fanout_status`` is pending"""
+        self._submit("deliver", notification_id)
+
+    def retract(self, notification_id):
+        """Remove a deleted notification from every inbox"""
+        self._submit("retract", notification_id)
+
+    def _claim(self, db, notification_id: str) -> Optional[dict]:
+        stale = datetime.utcnow() - STALE_DELIVERY
+        return db["notifications"].find_one_and_update(
+            {
+                "_id": ObjectId(notification_id),
+                "status": "sent",
+                "$or": [
+                    {"fanout_status": PENDING},
+                    {"fanout_status": RUNNING, "fanout_started_at": {"$lt": stale}}
+                ]
+            },
+            {"$set": {"fanout_status": RUNNING, "fanout_started_at": datetime.utcnow()}},
+            return_document=ReturnDocument.AFTER
+        )
+
+    def run_delivery(self, db, notification_id: str) -> int:
+        notification = self._claim(db, notification_id)
+        if notification is None:
+            return 0  # not pending, or claimed by another worker
+        recipients = delivered = 0
+        for user_ids in iter_recipients(db, notification, self.batch_size):
+            recipients += len(user_ids)
+            delivered += deliver_batch(db, notification, user_ids)
+        db["notifications"].update_one(
+            {"_id": notification["_id"]},
+            {"$set": {
+                "fanout_status": DONE,
+                "recipient_count": recipients,
+                "delivered_count": recipients,
+                "updated_at": datetime.utcnow()
+            }}
+        )
+        with self._lock:
+            self._delivered += delivered
+        logger.info(f"[NOTIFY] Delivered {notification.get('notification_id', notification_id)} to {recipients} users ({delivered} new)")
+        return delivered
+
+    def run_retraction(self, db, notification_id: str) -> int:
+        unread: Dict[str, int] = {}
+        for row in db[INBOX].find({"notification_id": notification_id, "is_read": False}, {"user_id": 1}):
+            unread[row["user_id"]] = unread.get(row["user_id"], 0) + 1
+        user_ids = list(unread)
+        for start in range(0, len(user_ids), self.batch_size):
+            batch = user_ids[start:start + self.batch_size]
+            db[COUNTERS].bulk_write(
+                [UpdateOne({"_id": user_id}, {"$inc": {"unread": -unread[user_id]}}) for user_id in batch],
+                ordered=False
+            )
+        result = db[INBOX].delete_many({"notification_id": notification_id})
+        return result.deleted_count
+
+    def _sweep(self, db):
+        """Queue deliveries left pending, failed or interrupted, and retry failed retractions
+
+        A failed delivery stays ``running`` and is retried once it is stale, so
+        ``STALE_DELIVERY`` doubles as the retry delay.
+        """
+        stale = datetime.utcnow() - STALE_DELIVERY
+        for doc in db["notifications"].find({"status": "sent", "$or": [
+            {"fanout_status": PENDING},
+            {"fanout_status": RUNNING, "fanout_started_at": {"$lt": stale}}
+        ]}, {"_id": 1}):
+            self.deliver(doc["_id"])
+        with self._lock:
+            retractions, self._failed_retractions = self._failed_retractions, set()
+        for notification_id in retractions:
+            self.retract(notification_id)
+
+    def _resume(self, db):
+        """Queue deliveries left pending or interrupted, and legacy sent notifications"""
+        self._sweep(db)
+        # Sent before fan-out existed: deliver, unless the creator already wrote inbox rows itself
+        for doc in db["notifications"].find({"status": "sent", "fanout_status": {"$exists": False}}, {"_id": 1}):
+            delivered = db[INBOX].find_one({"notification_id": {"$in": [str(doc["_id"]), doc["_id"]]}, "title": {"$exists": True}}, {"_id": 1})
+            db["notifications"].update_one({"_id": doc["_id"]}, {"$set": {"fanout_status": DONE if delivered else PENDING}})
+            if not delivered:
+                self.deliver(doc["_id"])
+
+    def _drain(self):
+        while True:
+            with self._lock:
+                if not self._jobs:
+                    return
+                action, notification_id = self._jobs.pop(0)
+            try:
+                if action == "deliver":
+                    self.run_delivery(self._db, notification_id)
+                else:
+                    self.run_retraction(self._db, notification_id)
+            except Exception as e:
+                # A delivery is left "running" and re-queued by _sweep once stale
+                logger.error(f"[NOTIFY] {action} failed for {notification_id}: {e}")
+                if action == "retract":
+                    with self._lock:
+                        self._failed_retractions.add(notification_id)
+
+    def start(self, db, batch_size: Optional[int] = None):
+        self._db = db
+        if batch_size is not None:
+            self.batch_size = batch_size
+        if db is None or (self._worker is not None and self._worker.is_alive()):
+            return
+        self._stop.clear()
+
+        def _run():
+            try:
+                self._resume(db)
+            except Exception as e:
+                logger.warning(f"[NOTIFY] Could not resume pending deliveries: {e}")
+            last_sweep = time.monotonic()
+            while not self._stop.is_set():
+                self._drain()
+                self._wake.wait(SWEEP_INTERVAL_SECONDS)
+                self._wake.clear()
+                if time.monotonic() - last_sweep >= SWEEP_INTERVAL_SECONDS:
+                    last_sweep = time.monotonic()
+                    try:
+                        self._sweep(db)
+                    except Exception as e:
+                        logger.warning(f"[NOTIFY] Stale delivery sweep failed: {e}")
+
+        self._worker = threading.Thread(target=_run, name="notification-fanout", daemon=True)
+        self._worker.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._worker is not None:
+            self._worker.join(timeout=5)
+            self._worker = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"queued": len(self._jobs), "delivered": self._delivered}
+
+
+notification_fanout = NotificationFanout(settings.NOTIFICATION_FANOUT_BATCH_SIZE)
+
+
+def ensure_notification_indexes(db):
+    db[INBOX].create_index([("user_id", ASCENDING), ("_id", DESCENDING)], background=True)
+    db[INBOX].create_index([("notification_id", ASCENDING)], background=True)
+    try:
+        db[INBOX].create_index([("user_id", ASCENDING), ("notification_id", ASCENDING)], unique=True, background=True)
+    except OperationFailure as e:
+        # Duplicate read markers from before fan-out; deliveries still work, just without the guard
+        logger.warning(f"[NOTIFY] Unique inbox index not created: {e}")
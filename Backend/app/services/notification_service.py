@@ -10,6 +10,9 @@ from app.schemas.notification import (
     RecipientType
 )
 from app.utils.notification_utils import generate_notification_id
+from app.services.notification_fanout import (
+    notification_fanout, count_recipients, list_inbox, mark_read, unread_count, INBOX, INBOX_FIELDS, PENDING, DONE
+)
 from bson import ObjectId
 from datetime import datetime
 from typing import List, Optional, Dict
@@ -24,13 +27,17 @@ def create_admin_notification(db, notification_data: AdminNotificationCreate, au
         # Generate unique notification ID
         notification_id = generate_notification_id(db)
         
-        # Calculate recipient count (simplified)
-        recipient_count = get_recipient_count(notification_data.recipient_type)
+        payload = notification_data.dict()
+        recipient_count = get_recipient_count(
+            db, payload.get("recipient_type"), payload.get("franchise_code"), payload.get("branch_code"),
+            payload.get("recipient_ids") or ([payload["target_user_id"]] if payload.get("target_user_id") else None)
+        )
         
         notification_doc = {
-            **notification_data.dict(),
+            **payload,
             "notification_id": notification_id,
             "status": NotificationStatus.sent if notification_data.send_immediately else NotificationStatus.draft,
+            "fanout_status": PENDING if notification_data.send_immediately else None,
             "author": author,
             "recipient_count": recipient_count,
             "delivered_count": 0,
@@ -43,6 +50,8 @@ def create_admin_notification(db, notification_data: AdminNotificationCreate, au
         }
         
         result = notification_collection.insert_one(notification_doc)
+        if notification_data.send_immediately:
+            notification_fanout.deliver(result.inserted_id)
         
         logger.info(f"✅ Created admin notification: {result.inserted_id}")
         
@@ -120,12 +129,24 @@ def update_notification(db, notification_id: str, update_data: Dict) -> bool:
         update_doc = {k: v for k, v in update_data.items() if v is not None}
         update_doc["updated_at"] = datetime.utcnow()
         
-        result = notification_collection.update_one(
+        before = notification_collection.find_one_and_update(
             {"_id": ObjectId(notification_id)},
             {"$set": update_doc}
         )
+        if before is None:
+            return False
         
-        return result.modified_count > 0
+        if before.get("fanout_status") == DONE:
+            # Inbox rows carry a copy of the content
+            content = {k: v for k, v in update_doc.items() if k in INBOX_FIELDS}
+            if content:
+                db[INBOX].update_many({"notification_id": notification_id}, {"$set": content})
+        elif update_doc.get("status") == NotificationStatus.sent and before.get("fanout_status") is None:
+            # Draft or scheduled notification being sent
+            notification_collection.update_one({"_id": before["_id"]}, {"$set": {"fanout_status": PENDING}})
+            notification_fanout.deliver(before["_id"])
+        
+        return True
         
     except Exception as e:
         logger.error(f"❌ Error updating notification {notification_id}: {e}")
@@ -137,6 +158,8 @@ def delete_notification(db, notification_id: str) -> bool:
         notification_collection = get_notification_collection(db)
         
         result = notification_collection.delete_one({"_id": ObjectId(notification_id)})
+        if result.deleted_count:
+            notification_fanout.retract(notification_id)
         
         return result.deleted_count > 0
         
@@ -144,102 +167,60 @@ def delete_notification(db, notification_id: str) -> bool:
         logger.error(f"❌ Error deleting notification {notification_id}: {e}")
         return False
 
-def get_user_notifications(db, user_id: str, skip: int = 0, limit: int = 50) -> List[Dict]:
-    """Get notifications for a specific user"""
+def get_user_notifications(db, user_id: str, skip: int = 0, limit: int = 50, before: Optional[str] = None) -> List[Dict]:
+    """Get notifications for a specific user from their inbox, newest first
+
+    Pass the ``id`` of the last notification received as ``before`` to get the next page.
+    """
     try:
-        notification_collection = get_notification_collection(db)
-        user_notifications_collection = db["user_notifications"]
-        
-        # First try to get all sent notifications (admin notifications that should be shown to users)
-        sent_notifications = list(
-            notification_collection.find(
-                {"status": "sent"}
-            ).sort("created_at", -1).skip(skip).limit(limit)
-        )
-        
-        # If no sent notifications found, fall back to getting user's personal notifications
-        if not sent_notifications:
-            logger.info(f"No sent notifications found, falling back to user notifications for {user_id}")
-            user_notifications = list(
-                user_notifications_collection.find(
-                    {"user_id": user_id}
-                ).sort("created_at", -1).skip(skip).limit(limit)
-            )
-            
-            # Convert to expected format
-            result = []
-            for notification in user_notifications:
-                notification_data = {
-                    "id": str(notification["_id"]),
-                    "_id": str(notification["_id"]),
-                    "notification_id": notification.get("notification_id", str(notification["_id"])),
-                    "title": notification.get("title", "Notification"),
-                    "message": notification.get("message", "You have a new notification"),
-                    "type": notification.get("type", "info"),
-                    "priority": notification.get("priority", "medium"),
-                    "is_read": notification.get("is_read", False),
-                    "created_at": notification.get("created_at"),
-                    "sent_date": notification.get("read_at") or notification.get("created_at"),
-                    "author": notification.get("author", "System"),
-                    "recipient_type": "user"
-                }
-                result.append(notification_data)
-            
-            return result
-        
-        # Get user's read status for these notifications
-        notification_ids = [str(notif["_id"]) for notif in sent_notifications]
-        read_statuses = list(
-            user_notifications_collection.find(
-                {"user_id": user_id, "notification_id": {"$in": notification_ids}}
-            )
-        )
-        
-        # Create a map of read statuses
-        read_status_map = {notif["notification_id"]: notif.get("is_read", False) for notif in read_statuses}
-        
-        # Combine notification data with read status
         result = []
-        for notification in sent_notifications:
-            notif_id = str(notification["_id"])
-            notification_data = {
-                "id": notif_id,
-                "_id": notif_id,
-                "notification_id": notification.get("notification_id", notif_id),
-                "title": notification.get("title", ""),
-                "message": notification.get("message", ""),
+        for notification in list_inbox(db, user_id, limit, before, skip):
+            row_id = str(notification["_id"])
+            result.append({
+                "id": row_id,
+                "_id": row_id,
+                "notification_id": notification.get("custom_notification_id") or str(notification.get("notification_id", row_id)),
+                "title": notification.get("title", "Notification"),
+                "message": notification.get("message", "You have a new notification"),
                 "type": notification.get("type", "info"),
                 "priority": notification.get("priority", "medium"),
-                "is_read": read_status_map.get(notif_id, False),
+                "is_read": notification.get("is_read", False),
                 "created_at": notification.get("created_at"),
-                "sent_date": notification.get("sent_date"),
-                "author": notification.get("author", "Admin"),
-                "recipient_type": notification.get("recipient_type", "all")
-            }
-            result.append(notification_data)
-        
+                "sent_date": notification.get("created_at"),
+                "author": notification.get("author", "System"),
+                "recipient_type": notification.get("recipient_type", "user")
+            })
         return result
         
     except Exception as e:
         logger.error(f"❌ Error fetching user notifications for {user_id}: {e}")
         return []
 
+def get_unread_count(db, user_id: str) -> int:
+    """Number of unread notifications of a user"""
+    try:
+        return unread_count(db, user_id)
+    except Exception as e:
+        logger.error(f"❌ Error counting unread notifications for {user_id}: {e}")
+        return 0
+
 def mark_notification_as_read(db, user_id: str, notification_id: str) -> bool:
-    """Mark a user notification as read"""
+    """Mark a user notification as read (by inbox row id, notification id or custom id like not001)"""
     try:
-        user_notifications_collection = db["user_notifications"]
-        
-        result = user_notifications_collection.update_one(
-            {"_id": ObjectId(notification_id), "user_id": user_id},
-            {
-                "$set": {
-                    "is_read": True,
-                    "read_at": datetime.utcnow()
-                }
-            }
-        )
-        
-        return result.modified_count > 0
+        matches = [{"notification_id": notification_id}, {"custom_notification_id": notification_id}]
+        if ObjectId.is_valid(notification_id):
+            matches.append({"_id": ObjectId(notification_id)})
+        
+        row = mark_read(db, user_id, {"$or": matches})
+        if row is None:
+            return False
+        
+        if ObjectId.is_valid(str(row.get("notification_id"))):
+            get_notification_collection(db).update_one(
+                {"_id": ObjectId(str(row["notification_id"]))},
+                {"$inc": {"read_count": 1}, "$set": {"updated_at": datetime.utcnow()}}
+            )
+        return True
         
     except Exception as e:
         logger.error(f"❌ Error marking notification as read: {e}")
@@ -281,16 +262,15 @@ def get_notification_stats(db) -> Dict:
             "average_click_rate": 0.0
         }
 
-def get_recipient_count(recipient_type: str) -> int:
-    """Get the count of recipients based on recipient type (simplified)"""
-    # Simplified recipient count - in production, this would query the user collection
-    counts = {
-        "all": 1000,
-        "students": 800,
-        "instructors": 50,
-        "admins": 5
-    }
-    return counts.get(recipient_type, 0)
+def get_recipient_count(db, recipient_type: str, franchise_code: Optional[str] = None,
+                        branch_code: Optional[str] = None, recipient_ids: Optional[List[str]] = None) -> int:
+    """Get the count of recipients a notification for ``recipient_type`` will reach"""
+    return count_recipients(db, {
+        "recipient_type": recipient_type,
+        "franchise_code": franchise_code,
+        "branch_code": branch_code,
+        "recipient_ids": recipient_ids
+    })
 
 def send_admin_notification(db, notification_data: AdminNotificationCreate, author: str = "Admin") -> Dict:
     """Send an admin notification - main function used by API"""
@@ -328,8 +308,9 @@ def create_course_approval_notification(db, course_id: str, instructor_id: str,
             "course_title": course_title,
             "approved": approved,
             "reason": reason if reason else None,
+            "fanout_status": PENDING,
             "recipient_count": 1,
-            "delivered_count": 1,
+            "delivered_count": 0,
             "read_count": 0,
             "open_rate": 0.0,
             "click_rate": 0.0,
@@ -339,27 +320,10 @@ def create_course_approval_notification(db, course_id: str, instructor_id: str,
         }
         
         result = notification_collection.insert_one(notification_doc)
+        notification_fanout.deliver(result.inserted_id)
         
         logger.info(f"✅ Created course {'approval' if approved else 'rejection'} notification for instructor {instructor_id}: {result.inserted_id}")
         
-        # Also create a user-specific notification record
-        user_notifications_collection = db["user_notifications"]
-        user_notification_doc = {
-            "user_id": instructor_id,
-            "notification_id": str(result.inserted_id),
-            "title": title,
-            "message": message,
-            "type": notification_type,
-            "priority": "high",
-            "course_id": course_id,
-            "is_read": False,
-            "created_at": datetime.utcnow(),
-            "author": "Admin"
-        }
-        
-        user_result = user_notifications_collection.insert_one(user_notification_doc)
-        logger.info(f"✅ Created user notification record: {user_result.inserted_id}")
-        
         return {
             "success": True,
             "notification_id": str(result.inserted_id),
@@ -0,0 +1,177 @@
+"""
+Password hashing off the event loop
+
+bcrypt deliberately burns 100-300 ms of CPU per call; run inline in an async
+handler it stalls every other request on the worker, so a 9 am login burst is
+processed one student at a time. All hashing and verification goes through one
+bounded thread pool instead (bcrypt releases the GIL, so throughput scales with
+cores). At most ``PASSWORD_HASH_MAX_PENDING`` operations may be queued or
+running; beyond that callers get a 503 with Retry-After rather than piling up
+behind the burst. Plain-text passwords found at login are re-hashed in the
+background after the response has been sent.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+import asyncio
+import hmac
+import os
+import threading
+import time
+import logging
+import bcrypt
+from fastapi import HTTPException
+from pymongo.collection import Collection
+from app.config import settings
+from app.utils.security import truncate_password
+
+logger = logging.getLogger("uvicorn")
+
+BCRYPT_PREFIXES = ("$2b$", "$2a$", "$2y$")
+
+
+def is_bcrypt_hash(value: Optional[str]) -> bool:
+    return bool(value) and value.startswith(BCRYPT_PREFIXES)
+
+
+def _hash_sync(password: str) -> str:
+    return bcrypt.hashpw(truncate_password(password).encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+
+
+def _verify_sync(password: str, hashed_password: str) -> bool:
+    return bcrypt.checkpw(truncate_password(password).encode("utf-8"), hashed_password.encode("utf-8"))
+
+
+class PasswordHasher:
+    """Bounded thread pool for bcrypt with queue-depth metrics"""
+
+    def __init__(self, workers: int = 0, max_pending: int = 256):
+        self.workers = workers or min(32, os.cpu_count() or 1)
+        self.max_pending = max_pending
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._running = 0
+        self._peak_pending = 0
+        self._completed = 0
+        self._rejected = 0
+        self._wait_seconds = 0.0
+        self._run_seconds = 0.0
+        self._upgrades = set()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+            return self._executor
+
+    async def run(self, fn, *args):
+        """Run a bcrypt call on the pool - keep database I/O out of ``fn``, it would hold a hashing slot"""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._rejected += 1
+                raise HTTPException(
+                    status_code=503,
+                    detail="Server is busy. Please try again in a moment.",
+                    headers={"Retry-After": "1"}
+                )
+            self._pending += 1
+            self._peak_pending = max(self._peak_pending, self._pending)
+        queued_at = time.perf_counter()
+
+        def _job():
+            started = time.perf_counter()
+            with self._lock:
+                self._running += 1
+                self._wait_seconds += started - queued_at
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._completed += 1
+                    self._run_seconds += time.perf_counter() - started
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._get_executor(), _job)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+        """bcrypt hash of ``password`` computed on the pool"""
+        return await self.run(_hash_sync, password)
+
+    async def verify(self, password: str, stored_password: Optional[str]) -> bool:
+        """Check ``password`` against a bcrypt hash or a legacy plain-text value
+
+        Plain-text comparison is cheap and constant-time, so it never touches the pool.
+        A malformed hash counts as a mismatch.
+        """
+        if not password or not stored_password:
+            return False
+        if not is_bcrypt_hash(stored_password):
+            return hmac.compare_digest(password.encode("utf-8"), stored_password.encode("utf-8"))
+        try:
+            return await self.run(_verify_sync, password, stored_password)
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.warning(f"[PASSWORD] bcrypt verification failed: {e}")
+            return False
+
+    def schedule_upgrade(self, collection, document_id, password: str, field: str = "password_hash"):
+        """Replace a plain-text password with a bcrypt hash in the background
+
+        ``collection`` may be a pymongo or Motor collection. Failures are only
+        logged - the next login simply tries again.
+        """
+        task = asyncio.get_running_loop().create_task(
+            self._upgrade(collection, document_id, password, field)
+        )
+        self._upgrades.add(task)
+        task.add_done_callback(self._upgrades.discard)
+
+    async def _upgrade(self, collection, document_id, password: str, field: str):
+        try:
+            new_hash = await self.hash(password)
+            update = ({"_id": document_id}, {"$set": {field: new_hash}})
+            if isinstance(collection, Collection):
+                await asyncio.get_running_loop().run_in_executor(None, lambda: collection.update_one(*update))
+            else:
+                await collection.update_one(*update)
+            logger.info(f"[PASSWORD] Upgraded plain-text password to bcrypt for {document_id}")
+        except Exception as e:
+            logger.warning(f"[PASSWORD] Password upgrade failed for {document_id}: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            completed = self._completed or 1
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": self._pending,
+                "running": self._running,
+                "queued": max(self._pending - self._running, 0),
+                "peak_pending": self._peak_pending,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "avg_wait_ms": round(self._wait_seconds * 1000 / completed, 2),
+                "avg_run_ms": round(self._run_seconds * 1000 / completed, 2)
+            }
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+
+password_hasher = PasswordHasher(settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_MAX_PENDING)
+
+
+async def hash_password_async(password: str) -> str:
+    return await password_hasher.hash(password)
+
+
+async def verify_password_async(password: str, stored_password: Optional[str]) -> bool:
+    return await password_hasher.verify(password, stored_password)
@@ -0,0 +1,175 @@
+"""
+Write-behind buffer for video progress heartbeats
+
+The player reports its position every few seconds, and writing each report
+straight to ``user_progress`` costs several round trips per tick. Plain
+heartbeats (updates that cannot change completion state) are coalesced here per
+(user, course, content) - latest position wins, ``max_position_reached`` keeps
+the farthest point - and a background thread writes them with one unordered
+``bulk_write`` every few seconds. Completion events bypass the buffer; callers
+flush the item's pending heartbeat first (``flush(db, user_id, ...)``) so the
+document never moves backwards. ``stop()`` flushes whatever is left on shutdown.
+
+Each pending item also remembers the stored completion state
+(``remember_completed``), so heartbeat responses can report it with one read
+per item and flush interval instead of one per heartbeat. It is never written.
+"""
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import threading
+import logging
+from app.models.user_progress import build_heartbeat_operations
+from app.config import settings
+
+logger = logging.getLogger("uvicorn")
+
+ProgressKey = Tuple[str, str, str]
+
+
+class ProgressBuffer:
+    """Per-process coalescing buffer flushed to MongoDB in the background"""
+
+    def __init__(self, max_pending: int = 5000):
+        self._lock = threading.Lock()
+        self._pending: Dict[ProgressKey, dict] = {}
+        self._max_pending = max_pending
+        self._db = None
+        self._flusher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending)
+
+    def add(self, user_id, course_id, content_id, module_id=None, content_type="video",
+            watched_duration=0.0, total_duration=0.0) -> Optional[bool]:
+        """Record a heartbeat; it reaches the database on the next flush
+
+        Returns the item's remembered completion state, or None if not known yet.
+        """
+        key = (user_id, course_id, content_id)
+        now = datetime.utcnow()
+        with self._lock:
+            entry = self._pending.get(key)
+            if entry is None:
+                self._pending[key] = {
+                    "user_id": user_id,
+                    "course_id": course_id,
+                    "content_id": content_id,
+                    "module_id": module_id,
+                    "content_type": content_type,
+                    "watched_duration": watched_duration,
+                    "total_duration": total_duration,
+                    "max_position_reached": watched_duration,
+                    "completed": None,
+                    "created_at": now,
+                    "updated_at": now
+                }
+            else:
+                entry["watched_duration"] = watched_duration
+                entry["total_duration"] = total_duration
+                entry["max_position_reached"] = max(entry["max_position_reached"], watched_duration)
+                entry["module_id"] = entry["module_id"] or module_id
+                entry["updated_at"] = now
+            completed = self._pending[key]["completed"]
+            pending = len(self._pending)
+
+        if pending >= self._max_pending:
+            self._wake.set()
+        return completed
+
+    def remember_completed(self, user_id, course_id, content_id, completed: bool):
+        """Attach the stored completion state to the item's pending heartbeat"""
+        with self._lock:
+            entry = self._pending.get((user_id, course_id, content_id))
+            if entry is not None:
+                entry["completed"] = completed
+
+    def _take(self, user_id=None, course_id=None, content_id=None) -> List[dict]:
+        with self._lock:
+            if user_id is None:
+                entries = list(self._pending.values())
+                self._pending.clear()
+                return entries
+            keys = [
+                key for key in self._pending
+                if key[0] == user_id
+                and (course_id is None or key[1] == course_id)
+                and (content_id is None or key[2] == content_id)
+            ]
+            return [self._pending.pop(key) for key in keys]
+
+    def _requeue(self, entries: List[dict]):
+        """Put entries back after a failed flush without overriding newer heartbeats"""
+        with self._lock:
+            for entry in entries:
+                key = (entry["user_id"], entry["course_id"], entry["content_id"])
+                newer = self._pending.get(key)
+                if newer is None:
+                    self._pending[key] = entry
+                else:
+                    newer["max_position_reached"] = max(newer["max_position_reached"], entry["max_position_reached"])
+                    newer["module_id"] = newer["module_id"] or entry.get("module_id")
+                    if newer.get("completed") is None:
+                        newer["completed"] = entry.get("completed")
+                    newer["created_at"] = entry["created_at"]
+
+    def flush(self, db=None, user_id=None, course_id=None, content_id=None) -> int:
+        """Write pending heartbeats and return how many items were flushed
+
+        With ``user_id`` (optionally narrowed by course/content) only that
+        user's items are written - used before completion events and reads.
+        """
+        db = db if db is not None else self._db
+        if db is None:
+            return 0
+
+        entries = self._take(user_id, course_id, content_id)
+        if not entries:
+            return 0
+
+        operations = []
+        for entry in entries:
+            operations.extend(build_heartbeat_operations(entry))
+
+        try:
+            db["user_progress"].bulk_write(operations, ordered=False)
+        except Exception as e:
+            logger.error(f"[PROGRESS] Failed to flush {len(entries)} progress updates: {e}")
+            self._requeue(entries)
+            return 0
+        return len(entries)
+
+    def start(self, db, interval_seconds: float = 5.0):
+        """Start the background flusher for ``db``"""
+        self._db = db
+        if db is None or (self._flusher is not None and self._flusher.is_alive()):
+            return
+        self._stop.clear()
+
+        def _run():
+            while not self._stop.is_set():
+                self._wake.wait(interval_seconds)
+                self._wake.clear()
+                try:
+                    self.flush()
+                except Exception as e:
+                    logger.warning(f"[PROGRESS] Flusher error: {e}")
+
+        self._flusher = threading.Thread(target=_run, name="progress-flusher", daemon=True)
+        self._flusher.start()
+
+    def stop(self):
+        """Stop the flusher and write everything still buffered"""
+        self._stop.set()
+        self._wake.set()
+        if self._flusher is not None:
+            self._flusher.join(timeout=5)
+            self._flusher = None
+        flushed = self.flush()
+        if flushed:
+            logger.info(f"[PROGRESS] Flushed {flushed} buffered progress updates on shutdown")
+
+
+progress_buffer = ProgressBuffer(settings.PROGRESS_BUFFER_MAX_PENDING)
@@ -4,6 +4,7 @@ from typing import List, Dict, Any
 import traceback
 from app.models.quiz import get_quiz_collection, get_question_collection
 from app.models.quiz_attempt import get_quiz_attempt_collection
+from app.services.instructor_stats_service import instructor_stats
 
 def create_quiz(db, payload):
     """Create a new quiz with embedded questions"""
@@ -116,6 +117,58 @@ def get_all_quizzes(db):
         print(f"Error fetching quizzes: {str(e)}")
         return []
 
+def _format_quiz(quiz: Dict[str, Any], for_student: bool = False) -> Dict[str, Any]:
+    """Serialize a quiz document, hiding answers when it is for a student"""
+    # Convert ObjectId fields to strings
+    quiz["_id"] = str(quiz["_id"])
+    quiz["id"] = str(quiz["_id"])
+    
+    if isinstance(quiz.get("course_id"), ObjectId):
+        quiz["course_id"] = str(quiz["course_id"])
+        
+    if isinstance(quiz.get("created_by"), ObjectId):
+        quiz["created_by"] = str(quiz["created_by"])
+    
+    # Ensure required fields exist
+    quiz.setdefault('total_questions', len(quiz.get('questions', [])))
+    quiz.setdefault('total_points', sum(q.get('points', 1) for q in quiz.get('questions', [])))
+    quiz.setdefault('is_active', True)
+    quiz.setdefault('passing_score', 70)
+    quiz.setdefault('randomize_questions', False)
+    quiz.setdefault('show_results_immediately', True)
+    
+    # If this is for a student, remove correct answers and sensitive data
+    if for_student and quiz.get('questions'):
+        student_questions = []
+        for i, question in enumerate(quiz['questions']):
+            student_question = {
+                'index': i,
+                'type': question.get('type'),
+                'question': question.get('question'),
+                'points': question.get('points', 1)
+            }
+            
+            # Add options for MCQ but not correct answer
+            if question.get('type') == 'mcq' and question.get('options'):
+                student_question['options'] = question['options']
+            
+            # For subjective questions, don't include expected_answer
+            if question.get('type') == 'subjective':
+                # Don't include expected_answer for students
+                pass
+            
+            student_questions.append(student_question)
+        
+        quiz['questions'] = student_questions
+    
+    # Ensure dates are properly formatted
+    if quiz.get('created_at') and not isinstance(quiz['created_at'], str):
+        quiz['created_at'] = quiz['created_at'].isoformat() if hasattr(quiz['created_at'], 'isoformat') else str(quiz['created_at'])
+    if quiz.get('updated_at') and not isinstance(quiz['updated_at'], str):
+        quiz['updated_at'] = quiz['updated_at'].isoformat() if hasattr(quiz['updated_at'], 'isoformat') else str(quiz['updated_at'])
+    
+    return quiz
+
 def get_quiz_by_id(db, quiz_id: str, for_student: bool = False):
     """Get a specific quiz by ID"""
     try:
@@ -126,55 +179,20 @@ def get_quiz_by_id(db, quiz_id: str, for_student: bool = False):
         if not quiz:
             return None
         
-        # Convert ObjectId fields to strings
-        quiz["_id"] = str(quiz["_id"])
-        quiz["id"] = str(quiz["_id"])
-        
-        if isinstance(quiz.get("course_id"), ObjectId):
-            quiz["course_id"] = str(quiz["course_id"])
-            
-        if isinstance(quiz.get("created_by"), ObjectId):
-            quiz["created_by"] = str(quiz["created_by"])
-        
-        # Ensure required fields exist
-        quiz.setdefault('total_questions', len(quiz.get('questions', [])))
-        quiz.setdefault('total_points', sum(q.get('points', 1) for q in quiz.get('questions', [])))
-        quiz.setdefault('is_active', True)
-        quiz.setdefault('passing_score', 70)
-        quiz.setdefault('randomize_questions', False)
-        quiz.setdefault('show_results_immediately', True)
-        
-        # If this is for a student, remove correct answers and sensitive data
-        if for_student and quiz.get('questions'):
-            student_questions = []
-            for i, question in enumerate(quiz['questions']):
-                student_question = {
-                    'index': i,
-                    'type': question.get('type'),
-                    'question': question.get('question'),
-                    'points': question.get('points', 1)
-                }
-                
-                # Add options for MCQ but not correct answer
-                if question.get('type') == 'mcq' and question.get('options'):
-                    student_question['options'] = question['options']
-                
-                # For subjective questions, don't include expected_answer
-                if question.get('type') == 'subjective':
-                    # Don't include expected_answer for students
-                    pass
-                
-                student_questions.append(student_question)
-            
-            quiz['questions'] = student_questions
+        return _format_quiz(quiz, for_student)
+    except Exception as e:
+        print(f"Error fetching quiz {quiz_id}: {str(e)}")
+        return None
+
+async def get_quiz_by_id_async(async_db, quiz_id: str, for_student: bool = False):
+    """Async (Motor) variant of get_quiz_by_id"""
+    try:
+        quiz = await get_quiz_collection(async_db).find_one({"_id": ObjectId(quiz_id)})
         
-        # Ensure dates are properly formatted
-        if quiz.get('created_at') and not isinstance(quiz['created_at'], str):
-            quiz['created_at'] = quiz['created_at'].isoformat() if hasattr(quiz['created_at'], 'isoformat') else str(quiz['created_at'])
-        if quiz.get('updated_at') and not isinstance(quiz['updated_at'], str):
-            quiz['updated_at'] = quiz['updated_at'].isoformat() if hasattr(quiz['updated_at'], 'isoformat') else str(quiz['updated_at'])
+        if not quiz:
+            return None
         
-        return quiz
+        return _format_quiz(quiz, for_student)
     except Exception as e:
         print(f"Error fetching quiz {quiz_id}: {str(e)}")
         return None
@@ -283,79 +301,85 @@ def update_quiz(db, quiz_id, payload):
         print(f"Error updating quiz {quiz_id}: {str(e)}")
         return {"success": False, "error": str(e)}
 
-def submit_quiz_attempt(db, quiz_id: str, student_id: str, answers: List[Dict], time_taken: int = None):
+def _grade_quiz_attempt(quiz: Dict[str, Any], quiz_id: str, student_id: str, answers: List[Dict], time_taken: int = None) -> Dict[str, Any]:
+    """Grade the submitted answers and build the attempt document"""
+    graded_answers = []
+    total_points_earned = 0
+    total_possible_points = 0
+    
+    quiz_questions = quiz.get('questions', [])
+    
+    for answer in answers:
+        question_index = answer.get('question_index', 0)
+        student_answer = answer.get('student_answer')
+        
+        if question_index < len(quiz_questions):
+            question = quiz_questions[question_index]
+            question_points = question.get('points', 1)
+            total_possible_points += question_points
+            
+            # Grade the answer based on question type
+            is_correct, points_earned = grade_answer(question, student_answer)
+            
+            graded_answer = {
+                'question_index': question_index,
+                'student_answer': student_answer,
+                'is_correct': is_correct,
+                'points_earned': points_earned,
+                'question_type': question.get('type'),
+                'correct_answer': question.get('correct_answer') if question.get('type') != 'subjective' else None
+            }
+            
+            graded_answers.append(graded_answer)
+            total_points_earned += points_earned
+    
+    # Calculate percentage and pass status
+    percentage = (total_points_earned / total_possible_points * 100) if total_possible_points > 0 else 0
+    passing_score = quiz.get('passing_score', 70)
+    is_passed = percentage >= passing_score
+    
+    return {
+        'quiz_id': ObjectId(quiz_id),
+        'student_id': ObjectId(student_id) if isinstance(student_id, str) else student_id,
+        'answers': graded_answers,
+        'score': total_points_earned,
+        'total_questions': len(quiz_questions),
+        'total_points': total_possible_points,
+        'points_earned': total_points_earned,
+        'percentage': round(percentage, 2),
+        'time_taken': time_taken,
+        'is_passed': is_passed,
+        'reviewed': False,  # Will be True after manual review for subjective questions
+        'submitted_at': datetime.utcnow()
+    }
+
+def _attempt_summary(attempt_id, attempt_data: Dict[str, Any]) -> Dict[str, Any]:
+    score = attempt_data['points_earned']
+    total = attempt_data['total_points']
+    percentage = attempt_data['percentage']
+    return {
+        'success': True,
+        'attempt_id': str(attempt_id),
+        'score': score,
+        'total_points': total,
+        'percentage': percentage,
+        'is_passed': attempt_data['is_passed'],
+        'answers': attempt_data['answers'],
+        'message': f'Quiz submitted successfully. Score: {score}/{total} ({percentage:.1f}%)'
+    }
+
+async def submit_quiz_attempt_async(async_db, quiz_id: str, student_id: str, answers: List[Dict], time_taken: int = None):
     """Submit and grade a quiz attempt"""
     try:
-        # Get the quiz
-        quiz = get_quiz_by_id(db, quiz_id)
+        quiz = await get_quiz_by_id_async(async_db, quiz_id)
         if not quiz:
             raise Exception("Quiz not found")
         
-        # Grade the answers
-        graded_answers = []
-        total_points_earned = 0
-        total_possible_points = 0
-        
-        quiz_questions = quiz.get('questions', [])
+        attempt_data = _grade_quiz_attempt(quiz, quiz_id, student_id, answers, time_taken)
+        result = await get_quiz_attempt_collection(async_db).insert_one(attempt_data)
+        instructor_stats.attempt_recorded(attempt_data)
         
-        for answer in answers:
-            question_index = answer.get('question_index', 0)
-            student_answer = answer.get('student_answer')
-            
-            if question_index < len(quiz_questions):
-                question = quiz_questions[question_index]
-                question_points = question.get('points', 1)
-                total_possible_points += question_points
-                
-                # Grade the answer based on question type
-                is_correct, points_earned = grade_answer(question, student_answer)
-                
-                graded_answer = {
-                    'question_index': question_index,
-                    'student_answer': student_answer,
-                    'is_correct': is_correct,
-                    'points_earned': points_earned,
-                    'question_type': question.get('type'),
-                    'correct_answer': question.get('correct_answer') if question.get('type') != 'subjective' else None
-                }
-                
-                graded_answers.append(graded_answer)
-                total_points_earned += points_earned
-        
-        # Calculate percentage and pass status
-        percentage = (total_points_earned / total_possible_points * 100) if total_possible_points > 0 else 0
-        passing_score = quiz.get('passing_score', 70)
-        is_passed = percentage >= passing_score
-        
-        # Create attempt document
-        attempt_data = {
-            'quiz_id': ObjectId(quiz_id),
-            'student_id': ObjectId(student_id) if isinstance(student_id, str) else student_id,
-            'answers': graded_answers,
-            'score': total_points_earned,
-            'total_questions': len(quiz_questions),
-            'total_points': total_possible_points,
-            'points_earned': total_points_earned,
-            'percentage': round(percentage, 2),
-            'time_taken': time_taken,
-            'is_passed': is_passed,
-            'reviewed': False,  # Will be True after manual review for subjective questions
-            'submitted_at': datetime.utcnow()
-        }
-        
-        # Save attempt
-        result = get_quiz_attempt_collection(db).insert_one(attempt_data)
-        
-        return {
-            'success': True,
-            'attempt_id': str(result.inserted_id),
-            'score': total_points_earned,
-            'total_points': total_possible_points,
-            'percentage': round(percentage, 2),
-            'is_passed': is_passed,
-            'answers': graded_answers,
-            'message': f'Quiz submitted successfully. Score: {total_points_earned}/{total_possible_points} ({percentage:.1f}%)'
-        }
+        return _attempt_summary(result.inserted_id, attempt_data)
         
     except Exception as e:
         print(f"Error submitting quiz attempt: {str(e)}")
@@ -0,0 +1,339 @@
+"""
+Push channel for notifications, messages and live sessions
+
+The frontend polled ``/notifications``, ``/messages/inbox`` and
+``/api/live-sessions/student/live-now`` on timers, so almost every one of
+those requests returned what the client already had. Clients now keep one
+Server-Sent Events stream open (``/api/realtime/stream``) and refetch only
+when told something changed.
+
+The hub is an in-process pub/sub keyed by topic:
+
+- ``user:<id>`` - inbox notifications and direct messages
+- ``branch:<code>`` / ``course:<id>`` - live session status changes
+
+Each connection subscribes to its user's topics and gets a bounded queue
+(``REALTIME_QUEUE_SIZE``). A slow client never holds up publishers: when its
+queue is full the queued events are dropped and replaced by a single
+``resync`` event, telling the client to refetch over REST. Idle streams carry a
+heartbeat comment every ``REALTIME_HEARTBEAT_SECONDS`` so proxies keep them open.
+
+Events are fed from a MongoDB change stream on ``user_notifications``,
+``messages`` and ``live_sessions``, so every worker sees writes made by every
+other worker (replica sets / Atlas). A stream that breaks (network blip,
+failover) is reopened from its last resume token with exponential backoff;
+meanwhile, and on deployments without change streams, the write paths' ``emit``
+calls publish directly, which reaches the clients of the writing worker only.
+"""
+from typing import Dict, Iterable, List, Optional, Set
+import asyncio
+import itertools
+import json
+import threading
+import logging
+from app.config import settings
+
+logger = logging.getLogger("uvicorn")
+
+RESYNC = "resync"
+UNAUTHORIZED = "unauthorized"
+
+# Change stream reconnect backoff
+WATCH_RETRY_BASE_SECONDS = 1
+WATCH_RETRY_MAX_SECONDS = 60
+
+
+def user_topic(user_id) -> str:
+    return f"user:{user_id}"
+
+
+def branch_topic(branch_code) -> str:
+    return f"branch:{branch_code}"
+
+
+def course_topic(course_id) -> str:
+    return f"course:{course_id}"
+
+
+def format_sse(event: dict) -> str:
+    """One Server-Sent Events frame"""
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(event['data'], default=str)}\n\n"
+
+
+class Subscription:
+    """One connected client: its topics and bounded event queue"""
+
+    def __init__(self, hub: "RealtimeHub", topics: Set[str], loop: asyncio.AbstractEventLoop, max_queue: int):
+        self.hub = hub
+        self.topics = topics
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.dropped = 0
+
+    def offer(self, event: dict):
+        """Queue ``event`` (runs on the subscriber's loop); overflow collapses into a resync"""
+        if self.queue.full():
+            self.dropped += self.queue.qsize()
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.hub.count_overflow()
+            self.queue.put_nowait({"id": event["id"], "event": RESYNC, "data": {"reason": "overflow"}})
+            return
+        self.queue.put_nowait(event)
+
+    async def next_event(self, timeout: float) -> Optional[dict]:
+        """The next event, or None if nothing arrived within ``timeout`` seconds"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class RealtimeHub:
+    """Topic -> subscriptions registry, safe to publish to from any thread"""
+
+    def __init__(self, max_queue: int = 100):
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._topics: Dict[str, Set[Subscription]] = {}
+        self._ids = itertools.count(1)
+        self._published = 0
+        self._overflows = 0
+        self._db = None
+        self._watcher: Optional[threading.Thread] = None
+        self._stream = None
+        self._stop = threading.Event()
+
+    # ------------------- Subscriptions -------------------
+
+    def subscribe(self, topics: Iterable[str]) -> Subscription:
+        subscription = Subscription(self, set(topics), asyncio.get_running_loop(), self.max_queue)
+        with self._lock:
+            for topic in subscription.topics:
+                self._topics.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            for topic in subscription.topics:
+                subscribers = self._topics.get(topic)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._topics[topic]
+
+    def count_overflow(self):
+        with self._lock:
+            self._overflows += 1
+
+    # ------------------- Publishing -------------------
+
+    def publish(self, topics: Iterable[str], event: str, data: dict) -> int:
+        """Deliver ``event`` to every subscription of any of ``topics``; returns how many"""
+        with self._lock:
+            targets: Set[Subscription] = set()
+            for topic in topics:
+                targets |= self._topics.get(topic, set())
+            if not targets:
+                return 0
+            payload = {"id": next(self._ids), "event": event, "data": data}
+            self._published += 1
+        for subscription in targets:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, payload)
+            except RuntimeError:
+                pass  # loop closed while the client was disconnecting
+        return len(targets)
+
+    def emit(self, topics: Iterable[str], event: str, data: dict):
+        """Publish from a write path - skipped while the change stream delivers the same write"""
+        if self._stream is None:
+            self.publish(topics, event, data)
+
+    # ------------------- Change stream feed -------------------
+
+    def _dispatch(self, change: dict):
+        collection = change["ns"]["coll"]
+        doc = change.get("fullDocument") or {}
+        if collection == "user_notifications" and change["operationType"] == "insert":
+            notification_event(self.publish, doc)
+        elif collection == "messages" and change["operationType"] == "insert":
+            message_event(self.publish, doc)
+        elif collection == "live_sessions":
+            if change["operationType"] == "delete":
+                # Deleted sessions no longer carry their course; every live view resyncs
+                self.publish_all(RESYNC, {"reason": "live_session_deleted", "session_id": str(change["documentKey"]["_id"])})
+            elif doc:
+                live_session_event(self.publish, doc, self._db)
+
+    def publish_all(self, event: str, data: dict) -> int:
+        with self._lock:
+            topics = [topic for topic in self._topics if not topic.startswith("user:")]
+        return self.publish(topics, event, data)
+
+    def start(self, db):
+        """Follow the change stream in the background (no-op without replica set)"""
+        self._db = db
+        if db is None or (self._watcher is not None and self._watcher.is_alive()):
+            return
+        self._stop.clear()
+
+        def _watch():
+            # Read-flag updates on inboxes and messages are not pushed, so only their inserts are watched
+            pipeline = [{"$match": {"$or": [
+                {"ns.coll": {"$in": ["user_notifications", "messages"]}, "operationType": "insert"},
+                {"ns.coll": "live_sessions", "operationType": {"$in": ["insert", "update", "replace", "delete"]}}
+            ]}}]
+            resume_token = None
+            failures = 0
+            while not self._stop.is_set():
+                try:
+                    with db.watch(pipeline, full_document="updateLookup", resume_after=resume_token) as stream:
+                        self._stream = stream
+                        failures = 0
+                        for change in stream:
+                            resume_token = stream.resume_token
+                            try:
+                                self._dispatch(change)
+                            except Exception as e:
+                                logger.warning(f"[REALTIME] Could not dispatch change: {e}")
+                except Exception as e:
+                    if self._stop.is_set():
+                        break
+                    if getattr(e, "code", None) == 40573:
+                        # Change streams need a replica set; a standalone server never offers them
+                        logger.info(f"[REALTIME] Change stream unavailable, publishing from this worker's writes only: {e}")
+                        break
+                    if getattr(e, "code", None) == 286:
+                        resume_token = None  # ChangeStreamHistoryLost: the token fell off the oplog
+                    failures += 1
+                    delay = min(WATCH_RETRY_BASE_SECONDS * 2 ** (failures - 1), WATCH_RETRY_MAX_SECONDS)
+                    logger.warning(f"[REALTIME] Change stream interrupted, reconnecting in {delay}s: {e}")
+                    self._stream = None  # publish this worker's own writes while the stream is down
+                    self._stop.wait(delay)
+                finally:
+                    self._stream = None
+
+        self._watcher = threading.Thread(target=_watch, name="realtime-hub", daemon=True)
+        self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
+        stream = self._stream
+        if stream is not None:
+            try:
+                stream.close()
+            except Exception:
+                pass
+        self._watcher = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            connections = set()
+            for subscribers in self._topics.values():
+                connections |= subscribers
+            return {
+                "connections": len(connections),
+                "topics": len(self._topics),
+                "published": self._published,
+                "overflows": self._overflows,
+                "change_stream": self._stream is not None
+            }
+
+
+realtime_hub = RealtimeHub(settings.REALTIME_QUEUE_SIZE)
+
+
+# ------------------- Events -------------------
+
+def notification_event(publish, row: dict):
+    """A new inbox row of ``user_notifications``"""
+    if not row.get("user_id"):
+        return
+    publish([user_topic(row["user_id"])], "notification", {
+        "id": str(row.get("_id", "")),
+        "notification_id": row.get("custom_notification_id") or str(row.get("notification_id", "")),
+        "title": row.get("title"),
+        "message": row.get("message"),
+        "type": row.get("type"),
+        "priority": row.get("priority"),
+        "created_at": row.get("created_at")
+    })
+
+
+def message_event(publish, message: dict):
+    """A new direct message"""
+    if not message.get("recipient_id"):
+        return
+    publish([user_topic(message["recipient_id"])], "message", {
+        "id": str(message.get("_id", "")),
+        "sender_id": message.get("sender_id"),
+        "sender_name": message.get("sender_name"),
+        "subject": message.get("subject"),
+        "priority": message.get("priority"),
+        "sent_at": message.get("sent_at")
+    })
+
+
+def live_session_event(publish, session: dict, db=None):
+    """A live session created or changed status"""
+    course_id = str(session.get("course_id") or "")
+    topics = [course_topic(course_id)]
+    branch_code = session.get("branch_code")
+    if "branch_code" not in session and db is not None and course_id:
+        from bson import ObjectId
+
+        course = db["branch_courses"].find_one(
+            {"_id": ObjectId(course_id) if ObjectId.is_valid(course_id) else course_id}, {"branch_code": 1}
+        )
+        branch_code = course.get("branch_code") if course else None
+    if branch_code:
+        topics.append(branch_topic(branch_code))
+    publish(topics, "live_session", {
+        "session_id": str(session.get("_id", "")),
+        "course_id": course_id,
+        "course_title": session.get("course_title"),
+        "channel_name": session.get("channel_name"),
+        "status": session.get("status")
+    })
+
+
+async def load_topics(async_db, user: dict) -> List[str]:
+    """Topics a connected user listens to: their own, their branch and their enrolled courses"""
+    from bson import ObjectId
+
+    user_id = str(user.get("user_id") or "")
+    topics = [user_topic(user_id)]
+    if user.get("branch_code"):
+        topics.append(branch_topic(user["branch_code"]))
+    if async_db is not None and user_id:
+        student_ids = [user_id] + ([ObjectId(user_id)] if ObjectId.is_valid(user_id) else [])
+        enrollments = await async_db.enrollments.find({"student_id": {"$in": student_ids}}, {"course_id": 1}).to_list(length=None)
+        for enrollment in enrollments:
+            if enrollment.get("course_id"):
+                topics.append(course_topic(enrollment["course_id"]))
+    return topics
+
+
+async def event_stream(subscription: Subscription, heartbeat_seconds: float, is_disconnected, session_valid=None):
+    """SSE body: a ``ready`` event, then events and heartbeats until the client goes away
+
+    ``session_valid`` is checked on every heartbeat; when it fails the client is
+    sent ``unauthorized`` and the stream ends.
+    """
+    hub = subscription.hub
+    try:
+        yield format_sse({"id": 0, "event": "ready", "data": {"topics": sorted(subscription.topics)}})
+        while True:
+            event = await subscription.next_event(heartbeat_seconds)
+            if await is_disconnected():
+                break
+            if event is None:
+                if session_valid is not None and not session_valid():
+                    yield format_sse({"id": 0, "event": UNAUTHORIZED, "data": {"reason": "session_ended"}})
+                    break
+                yield ": heartbeat\n\n"
+            else:
+                yield format_sse(event)
+    finally:
+        hub.unsubscribe(subscription)
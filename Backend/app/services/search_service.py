@@ -0,0 +1,202 @@
+"""
+Prefix search over courses, students and study materials
+
+Admin search boxes used to send an unanchored case-insensitive ``$regex`` over
+several fields, which no index can serve - every keystroke scanned the whole
+collection. Searchable documents now carry their own small inverted index:
+
+- ``search_terms``: every word of the searchable fields plus each of its
+  prefixes (up to ``MAX_PREFIX`` characters), lower-cased. Identifiers such as
+  registration numbers, e-mails and phone numbers are also indexed in compact
+  form, so "BR00124" finds "BR001_24_001".
+- ``search_words``: the whole words of the primary fields (names, titles,
+  registration numbers), used for ranking.
+
+A query matches when every one of its words is in ``search_terms`` (multikey
+index, combined with the tenant fields), and results are ranked by how many
+query words hit a primary field exactly. Writers keep the fields in sync with
+``search_fields`` (new documents) or ``refresh_search_terms`` (after updates);
+documents written before this existed are indexed by a background backfill at
+startup.
+"""
+from typing import Iterable, List, Optional
+import re
+import threading
+import logging
+from pymongo import ASCENDING, UpdateOne
+
+logger = logging.getLogger("uvicorn")
+
+SEARCH_VERSION = 1
+MAX_PREFIX = 20
+MAX_TERMS = 600
+COMPACT_MAX_LENGTH = 40
+BACKFILL_BATCH_SIZE = 500
+
+SEARCH_SPECS = {
+    "courses": {
+        "primary": ("title", "course_id", "tags"),
+        "secondary": ("description", "category")
+    },
+    "branch_students": {
+        "primary": ("student_name", "registration_number"),
+        "secondary": ("email_id", "father_name", "contact_no")
+    },
+    "branch_study_materials": {
+        "primary": ("material_name",),
+        "secondary": ("description", "tags", "course_name", "subject_name")
+    }
+}
+
+_WORD_SPLIT = re.compile(r"[^0-9a-z]+")
+
+
+def _values(value) -> List[str]:
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple, set)):
+        return [str(item) for item in value if item is not None]
+    return [str(value)]
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased alphanumeric words of ``text``"""
+    return [word for word in _WORD_SPLIT.split(text.lower()) if word]
+
+
+def query_words(text: Optional[str]) -> List[str]:
+    """Distinct words of a search box query, clipped to the indexed prefix length"""
+    words = []
+    for word in tokenize(text or ""):
+        word = word[:MAX_PREFIX]
+        if word not in words:
+            words.append(word)
+    return words
+
+
+def _field_words(value: str) -> List[str]:
+    words = tokenize(value)
+    if 1 < len(words) and len(value) <= COMPACT_MAX_LENGTH:
+        words.append("".join(words))
+    return words
+
+
+def build_search_fields(collection_name: str, doc: dict) -> dict:
+    """``search_terms``/``search_words`` for ``doc`` according to the collection's spec"""
+    spec = SEARCH_SPECS[collection_name]
+    terms = set()
+    primary_words = set()
+    for field in spec["primary"] + spec["secondary"]:
+        for value in _values(doc.get(field)):
+            words = _field_words(value)
+            if field in spec["primary"]:
+                primary_words.update(words)
+            for word in words:
+                if len(terms) >= MAX_TERMS:
+                    break
+                for end in range(1, min(len(word), MAX_PREFIX) + 1):
+                    terms.add(word[:end])
+    return {
+        "search_terms": sorted(terms),
+        "search_words": sorted(primary_words),
+        "search_version": SEARCH_VERSION
+    }
+
+
+def search_fields(collection_name: str, doc: dict) -> dict:
+    """``doc`` with its search fields added - use on inserts"""
+    return {**doc, **build_search_fields(collection_name, doc)}
+
+
+def _projection(collection_name: str) -> dict:
+    spec = SEARCH_SPECS[collection_name]
+    return {field: 1 for field in spec["primary"] + spec["secondary"]}
+
+
+def refresh_search_terms(db, collection_name: str, query: dict) -> int:
+    """Recompute the search fields of the documents matching ``query`` - call after updates
+
+    Failures are only logged; the document stays searchable by its previous terms.
+    """
+    try:
+        operations = [
+            UpdateOne({"_id": doc["_id"]}, {"$set": build_search_fields(collection_name, doc)})
+            for doc in db[collection_name].find(query, _projection(collection_name))
+        ]
+        if operations:
+            db[collection_name].bulk_write(operations, ordered=False)
+        return len(operations)
+    except Exception as e:
+        logger.warning(f"[SEARCH] Failed to refresh {collection_name} search terms: {e}")
+        return 0
+
+
+def apply_search(query: dict, text: Optional[str]) -> List[str]:
+    """Add the search condition for ``text`` to ``query`` and return the query words ([] = no search)"""
+    words = query_words(text)
+    if words:
+        query["search_terms"] = {"$all": words}
+    return words
+
+
+def ranked_pipeline(query: dict, words: List[str], sort: dict, skip: int = 0, limit: int = 0) -> list:
+    """Aggregation returning the documents matching ``query`` ranked by exact primary-word hits, then ``sort``"""
+    pipeline = [
+        {"$match": query},
+        {"$addFields": {"_search_score": {"$size": {"$setIntersection": [{"$ifNull": ["$search_words", []]}, words]}}}},
+        {"$sort": {"_search_score": -1, **sort}}
+    ]
+    if skip:
+        pipeline.append({"$skip": skip})
+    if limit:
+        pipeline.append({"$limit": limit})
+    pipeline.append({"$project": {"search_terms": 0, "search_words": 0, "search_version": 0, "_search_score": 0}})
+    return pipeline
+
+
+def backfill_search_terms(db, collection_names: Optional[Iterable[str]] = None) -> int:
+    """Index documents that have no search fields yet or were indexed by an older version"""
+    total = 0
+    for collection_name in collection_names or SEARCH_SPECS:
+        collection = db[collection_name]
+        while True:
+            docs = list(collection.find(
+                {"search_version": {"$ne": SEARCH_VERSION}},
+                _projection(collection_name)
+            ).limit(BACKFILL_BATCH_SIZE))
+            if not docs:
+                break
+            collection.bulk_write([
+                UpdateOne({"_id": doc["_id"]}, {"$set": build_search_fields(collection_name, doc)})
+                for doc in docs
+            ], ordered=False)
+            total += len(docs)
+        logger.info(f"[SEARCH] {collection_name} search index up to date")
+    return total
+
+
+def start_search_backfill(db):
+    """Run ``backfill_search_terms`` in a daemon thread so startup is not delayed"""
+    if db is None:
+        return
+
+    def _run():
+        try:
+            indexed = backfill_search_terms(db)
+            if indexed:
+                logger.info(f"[SEARCH] Backfilled search terms for {indexed} documents")
+        except Exception as e:
+            logger.warning(f"[SEARCH] Backfill failed: {e}")
+
+    threading.Thread(target=_run, name="search-backfill", daemon=True).start()
+
+
+def ensure_search_indexes(db):
+    db["branch_students"].create_index(
+        [("franchise_code", ASCENDING), ("branch_code", ASCENDING), ("search_terms", ASCENDING)],
+        background=True
+    )
+    db["courses"].create_index([("search_terms", ASCENDING)], background=True)
+    db["branch_study_materials"].create_index([("search_terms", ASCENDING)], background=True)
+    for collection_name in SEARCH_SPECS:
+        db[collection_name].create_index([("search_version", ASCENDING)], background=True)
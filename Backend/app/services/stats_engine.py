@@ -0,0 +1,123 @@
+"""
+Single-pass dashboard statistics
+
+Dashboards used to issue one ``count_documents`` per card - ten against
+``support_tickets`` with the same date filter, six or more per branch or
+franchise dashboard - each a separate round trip and index scan. A dashboard
+now declares what it needs per collection::
+
+    {
+        "students": {
+            "collection": "branch_students",
+            "match": {"branch_code": code},
+            "stats": {
+                "total": count(),
+                "active": count({"admission_status": "active"}),
+                "by_status": group_count("$status"),
+                "recent": rows([{"$sort": {"admission_date": -1}}, {"$limit": 5}])
+            }
+        },
+        ...
+    }
+
+Each entry is compiled into a single ``$match`` + ``$facet`` aggregation, so a
+collection is read once per dashboard however many cards it feeds, and the
+aggregations of different collections run concurrently (Motor) or back to back
+(pymongo). Results come back as ``{entry: {stat: value}}``.
+"""
+from typing import Any, Dict, Iterable, List, Optional
+import asyncio
+import logging
+
+logger = logging.getLogger("uvicorn")
+
+
+# ------------------- Stat definitions -------------------
+
+def count(match: Optional[dict] = None) -> dict:
+    """Number of documents matching ``match`` (within the entry's base match)"""
+    return {"kind": "count", "match": match or {}}
+
+
+def group_count(field: str, match: Optional[dict] = None, limit: Optional[int] = None) -> dict:
+    """``{value: count}`` of ``field`` (e.g. ``"$status"``), most frequent first"""
+    return {"kind": "group", "field": field, "match": match or {}, "limit": limit}
+
+
+def total(expression: Any, match: Optional[dict] = None) -> dict:
+    """``$sum`` of ``expression`` over the matching documents (0 if none)"""
+    return {"kind": "sum", "expression": expression, "match": match or {}}
+
+
+def rows(pipeline: List[dict]) -> dict:
+    """Documents produced by an arbitrary sub-pipeline (keep it small: ``$limit``)"""
+    return {"kind": "rows", "pipeline": pipeline}
+
+
+def bucket_total(buckets: Dict[Any, int], *values: str) -> int:
+    """Sum of the ``group_count`` buckets whose key matches one of ``values`` case-insensitively"""
+    wanted = {value.upper() for value in values}
+    return sum(n for key, n in buckets.items() if str(key).upper() in wanted)
+
+
+# ------------------- Compilation -------------------
+
+def _facet(stat: dict) -> List[dict]:
+    stages = [{"$match": stat["match"]}] if stat.get("match") else []
+    kind = stat["kind"]
+    if kind == "count":
+        return stages + [{"$count": "n"}]
+    if kind == "group":
+        stages += [{"$group": {"_id": stat["field"], "n": {"$sum": 1}}}, {"$sort": {"n": -1}}]
+        if stat.get("limit"):
+            stages.append({"$limit": stat["limit"]})
+        return stages
+    if kind == "sum":
+        return stages + [{"$group": {"_id": None, "n": {"$sum": stat["expression"]}}}]
+    if kind == "rows":
+        # $facet rejects an empty sub-pipeline
+        return stat["pipeline"] or [{"$match": {}}]
+    raise ValueError(f"Unknown stat kind: {kind}")
+
+
+def compile_pipeline(spec: dict) -> List[dict]:
+    """The ``$match`` + ``$facet`` aggregation of one entry"""
+    pipeline = [{"$match": spec["match"]}] if spec.get("match") else []
+    pipeline.append({"$facet": {name: _facet(stat) for name, stat in spec["stats"].items()}})
+    return pipeline
+
+
+def read_result(spec: dict, documents: Iterable[dict]) -> Dict[str, Any]:
+    """Turn the single ``$facet`` output document into ``{stat: value}``"""
+    facets = next(iter(documents), None) or {}
+    result = {}
+    for name, stat in spec["stats"].items():
+        values = facets.get(name, [])
+        if stat["kind"] in ("count", "sum"):
+            result[name] = values[0]["n"] if values else 0
+        elif stat["kind"] == "group":
+            result[name] = {bucket["_id"]: bucket["n"] for bucket in values}
+        else:
+            result[name] = values
+    return result
+
+
+# ------------------- Execution -------------------
+
+async def run_stats(db, specs: Dict[str, dict]) -> Dict[str, Dict[str, Any]]:
+    """Run every entry on the Motor database ``db`` concurrently, one aggregation each"""
+
+    async def _run(spec):
+        cursor = db[spec["collection"]].aggregate(compile_pipeline(spec))
+        return read_result(spec, await cursor.to_list(length=1))
+
+    results = await asyncio.gather(*(_run(spec) for spec in specs.values()))
+    return dict(zip(specs.keys(), results))
+
+
+def run_stats_sync(db, specs: Dict[str, dict]) -> Dict[str, Dict[str, Any]]:
+    """Same as ``run_stats`` for the synchronous pymongo database"""
+    return {
+        name: read_result(spec, db[spec["collection"]].aggregate(compile_pipeline(spec)))
+        for name, spec in specs.items()
+    }
@@ -1,6 +1,8 @@
 from fastapi import HTTPException
 from bson import ObjectId
+from pymongo import ReturnDocument
 from app.models.submission import get_submission_collection
+from app.services.instructor_stats_service import instructor_stats
 from datetime import datetime
 
 def create_submission(db, payload):
@@ -23,6 +25,7 @@ def create_submission(db, payload):
     submission_data["feedback"] = None
     
     result = collection.insert_one(submission_data)
+    instructor_stats.submission_changed(after=submission_data)
     return {
         "success": True, 
         "submission_id": str(result.inserted_id),
@@ -35,17 +38,21 @@ def get_submissions_by_assignment(db, assignment_id):
 
 def update_submission(db, submission_id, updates):
     collection = get_submission_collection(db)
-    result = collection.update_one(
+    changes = updates.dict(exclude_unset=True)
+    before = collection.find_one_and_update(
         {"_id": ObjectId(submission_id)},
-        {"$set": updates.dict(exclude_unset=True)}
+        {"$set": changes},
+        return_document=ReturnDocument.BEFORE
     )
-    if result.matched_count == 0:
+    if before is None:
         raise HTTPException(status_code=404, detail="Submission not found")
+    instructor_stats.submission_changed(before=before, after={**before, **changes})
     return {"success": True, "message": "Submission updated"}
 
 def delete_submission(db, submission_id):
     collection = get_submission_collection(db)
-    result = collection.delete_one({"_id": ObjectId(submission_id)})
-    if result.deleted_count == 0:
+    deleted = collection.find_one_and_delete({"_id": ObjectId(submission_id)})
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Submission not found")
+    instructor_stats.submission_changed(before=deleted)
     return {"success": True, "message": "Submission deleted"}
@@ -1,6 +1,7 @@
 from datetime import datetime, timedelta
 from typing import Dict, Any, List
 import logging
+from app.services.stats_engine import run_stats, count, group_count, rows, bucket_total
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -9,79 +10,74 @@ logger = logging.getLogger(__name__)
 async def get_super_admin_dashboard_stats(db) -> Dict[str, Any]:
     """
     Aggregates all statistics for the Super Admin Dashboard.
+    ``db`` is the Motor (async) database.
     """
     try:
-        # --- Franchise Stats ---
-        franchises_collection = db.franchises
-        total_franchises = franchises_collection.count_documents({})
-        
-        # Optimize: Aggregation for status counts (1 query instead of 3)
-        f_agg = list(franchises_collection.aggregate([
-            {"$group": {"_id": "$status", "count": {"$sum": 1}}}
-        ]))
-        
-        # Helper to sum counts for multiple case variations
-        def get_count(agg_list, status_variants):
-            return sum(item["count"] for item in agg_list if str(item.get("_id")).upper() in status_variants)
+        # One aggregation per collection, all collections in parallel
+        franchise_enquiry_filter = {"$or": [{"category": "franchise"}, {"type": "franchise"}, {"partnership_type": "franchise"}]}
+        stats = await run_stats(db, {
+            "franchises": {"collection": "franchises", "stats": {
+                "total": count(),
+                "by_status": group_count("$status"),
+                # Revenue from franchise fees (franchises are few)
+                "fees": rows([{"$project": {"financial.franchise_fee": 1, "created_at": 1}}])
+            }},
+            "partnership_requests": {"collection": "partnership_requests", "stats": {
+                "total": count(),
+                "franchise": count(franchise_enquiry_filter),
+                "by_status": group_count("$status")
+            }},
+            # Fallback source when there are no partnership requests
+            "enquiry": {"collection": "enquiry", "stats": {
+                "total": count(),
+                "franchise": count({"category": "franchise"}),
+                "by_status": group_count("$status")
+            }},
+            "agreements": {"collection": "agreements", "stats": {
+                "total": count(),
+                "by_status": group_count("$status"),
+                "recent": rows([{"$sort": {"created_at": -1}}, {"$limit": 5}])
+            }},
+            "enrollments": {"collection": "enrollments", "stats": {
+                "pending_settlements": count({
+                    "status": {"$in": ["completed", "active", "enrolled"]},
+                    "payment_status": {"$ne": "settlement_processed"}
+                })
+            }},
+            "users": {"collection": "users", "match": {"role": "franchise_admin"}, "stats": {
+                "recent_admins": rows([{"$sort": {"created_at": -1}}, {"$limit": 5}])
+            }}
+        })
 
-        active_franchises = get_count(f_agg, ["ACTIVE"])
-        pending_franchises = get_count(f_agg, ["PENDING"])
-        rejected_franchises = get_count(f_agg, ["REJECTED"])
+        # --- Franchise Stats ---
+        total_franchises = stats["franchises"]["total"]
+        f_agg = stats["franchises"]["by_status"]
+        active_franchises = bucket_total(f_agg, "ACTIVE")
+        pending_franchises = bucket_total(f_agg, "PENDING")
+        rejected_franchises = bucket_total(f_agg, "REJECTED")
 
         # --- Franchise Admin Stats ---
         # User clarification: "Every franchise have one admin"
         total_franchise_admins = total_franchises
-        users_collection = db.users
 
         # --- Enquiries Stats ---
-        partnership_requests_collection = db.partnership_requests
-        enquiry_collection = db.enquiry
-        
-        req_count = partnership_requests_collection.count_documents({})
-        
-        if req_count > 0:
-            active_collection = partnership_requests_collection
-            total_enquiries = req_count
-            
-            # Optimized counts
-            # Franchise enquiries (complex OR query, keep as count for safety or optimize if needed)
-            franchise_enquiries = active_collection.count_documents({
-                "$or": [{"category": "franchise"}, {"type": "franchise"}, {"partnership_type": "franchise"}]
-            })
-            
-            # Status aggregation
-            e_agg = list(active_collection.aggregate([
-                {"$group": {"_id": "$status", "count": {"$sum": 1}}}
-            ]))
-            
-            pending_enquiries = get_count(e_agg, ["PENDING"])
-            resolved_enquiries = get_count(e_agg, ["RESOLVED", "APPROVED"])
+        if stats["partnership_requests"]["total"] > 0:
+            enquiries = stats["partnership_requests"]
+            resolved_statuses = ("RESOLVED", "APPROVED")
         else:
-            # Fallback
-            active_collection = enquiry_collection
-            total_enquiries = active_collection.count_documents({})
-            franchise_enquiries = active_collection.count_documents({"category": "franchise"})
-            
-            # Status aggregation
-            e_agg = list(active_collection.aggregate([
-                {"$group": {"_id": "$status", "count": {"$sum": 1}}}
-            ]))
-            
-            pending_enquiries = get_count(e_agg, ["PENDING"])
-            resolved_enquiries = get_count(e_agg, ["RESOLVED"])
+            enquiries = stats["enquiry"]
+            resolved_statuses = ("RESOLVED",)
+        total_enquiries = enquiries["total"]
+        franchise_enquiries = enquiries["franchise"]
+        pending_enquiries = bucket_total(enquiries["by_status"], "PENDING")
+        resolved_enquiries = bucket_total(enquiries["by_status"], *resolved_statuses)
 
         # --- Agreement Stats ---
-        agreements_collection = db.agreements
-        total_agreements = agreements_collection.count_documents({})
-        
-        # Aggregation for status
-        a_agg = list(agreements_collection.aggregate([
-            {"$group": {"_id": "$status", "count": {"$sum": 1}}}
-        ]))
-        
-        pending_agreements = get_count(a_agg, ["PENDING"])
-        active_agreements = get_count(a_agg, ["ACTIVE"])
-        expired_agreements = get_count(a_agg, ["EXPIRED"])
+        total_agreements = stats["agreements"]["total"]
+        a_agg = stats["agreements"]["by_status"]
+        pending_agreements = bucket_total(a_agg, "PENDING")
+        active_agreements = bucket_total(a_agg, "ACTIVE")
+        expired_agreements = bucket_total(a_agg, "EXPIRED")
         
         expiring_soon_agreements = 0 
 
@@ -89,11 +85,9 @@ async def get_super_admin_dashboard_stats(db) -> Dict[str, Any]:
         current_date = datetime.now()
         start_of_month = datetime(current_date.year, current_date.month, 1)
         
-        # 1. Revenue from Enrollments
-        enrollments_collection = db.enrollments
-        
+        # 1. Revenue from Enrollments (fees are stored in mixed types, so they are summed here)
         # Optimize: Projection to fetch ONLY needed fields
-        valid_enrollments_cursor = enrollments_collection.find(
+        valid_enrollments_cursor = db.enrollments.find(
             {"status": {"$in": ["pending", "completed", "active", "enrolled"]}},
             {"fee_paid": 1, "course_fee": 1, "amount": 1, "fee": 1, "enrollment_date": 1, "created_at": 1, "date": 1}
         )
@@ -101,7 +95,7 @@ async def get_super_admin_dashboard_stats(db) -> Dict[str, Any]:
         total_revenue = 0.0
         monthly_revenue = 0.0
         
-        for enrollment in valid_enrollments_cursor:
+        async for enrollment in valid_enrollments_cursor:
             try:
                 # Extract fee
                 raw_fee = enrollment.get('fee_paid') or enrollment.get('course_fee') or enrollment.get('amount') or enrollment.get('fee') or 0
@@ -140,13 +134,7 @@ async def get_super_admin_dashboard_stats(db) -> Dict[str, Any]:
                 continue
 
         # 2. Revenue from Franchises
-        # Optimize: Projection
-        franchises_cursor = franchises_collection.find(
-            {}, 
-            {"financial": 1, "created_at": 1}
-        )
-        
-        for franchise in franchises_cursor:
+        for franchise in stats["franchises"]["fees"]:
             try:
                 financial = franchise.get('financial', {})
                 raw_fee = financial.get('franchise_fee') or 0
@@ -181,20 +169,13 @@ async def get_super_admin_dashboard_stats(db) -> Dict[str, Any]:
                 continue
         
         # Pending Settlements calculation
-        pending_settlements_count = enrollments_collection.count_documents({
-             "status": {"$in": ["completed", "active", "enrolled"]},
-             "payment_status": {"$ne": "settlement_processed"}
-        })
+        pending_settlements_count = stats["enrollments"]["pending_settlements"]
         
         # --- Recent Activities ---
         recent_activities = []
         
         # New Franchise Admins
-        recent_users_cursor = users_collection.find(
-            {"role": "franchise_admin"}
-        ).sort("created_at", -1).limit(5)
-        
-        for user in recent_users_cursor:
+        for user in stats["users"]["recent_admins"]:
             recent_activities.append({
                 "id": str(user.get("_id")),
                 "type": "franchise_admin_registration",
@@ -205,8 +186,7 @@ async def get_super_admin_dashboard_stats(db) -> Dict[str, Any]:
             })
             
         # New Agreements
-        recent_agreements_cursor = agreements_collection.find({}).sort("created_at", -1).limit(5)
-        for agreement in recent_agreements_cursor:
+        for agreement in stats["agreements"]["recent"]:
              recent_activities.append({
                 "id": str(agreement.get("_id")),
                 "type": "agreement_activity",
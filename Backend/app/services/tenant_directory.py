@@ -0,0 +1,343 @@
+"""
+In-memory tenant directory
+
+Resolving a branch admin's context used to cost a ``franchises`` lookup plus an
+``$or`` query over ``branches`` on every auth cache miss, and
+``MultiTenantManager.get_branch_context`` then tried up to four more query
+patterns to find the same branch code again. Franchises and branches are few
+and change rarely, so the whole directory is loaded once at startup:
+
+- franchise_code -> franchise metadata (id, name, owner)
+- franchise_code -> its branches, branch_code -> franchise_code
+- admin_id / created_by user id -> branch
+
+Lookups reproduce the queries they replaced, field precedence and match order
+included: ``branch_code_for`` is MultiTenantManager's ladder (franchise field
+patterns tried in turn, ``centre_info`` codes first) and ``admin_branch_code``
+is the branch-admin auth lookup (first branch in natural order whose top-level
+``franchise_code``, ``admin_id`` or ``created_by`` matches, top-level code
+fields only, falling back to the franchise code).
+
+and lookups on the request path never touch the database. The directory is
+reloaded when a change stream reports a write to either collection (replica
+sets / Atlas), when a writer in this process calls ``invalidate()``, and in any
+case every ``TENANT_DIRECTORY_TTL_SECONDS``. A code that is not in the
+directory yet (created by another worker a moment ago) is looked up once and
+merged in; unknown codes are remembered briefly so bad tokens cannot hammer
+the database.
+"""
+from typing import Dict, List, Optional
+import threading
+import time
+import logging
+from app.config import settings
+
+logger = logging.getLogger("uvicorn")
+
+MISS_TTL_SECONDS = 30
+
+BRANCH_PROJECTION = {
+    "franchise_code": 1, "centre_info": 1, "franchiseCode": 1, "franchise": 1,
+    "branch_code": 1, "branchCode": 1, "code": 1, "centreCode": 1, "centre_code": 1,
+    "centerCode": 1, "center_code": 1, "branch_id": 1, "branchId": 1,
+    "centre_id": 1, "centreId": 1, "center_id": 1, "centerId": 1,
+    "admin_id": 1, "created_by": 1, "status": 1
+}
+FRANCHISE_PROJECTION = {"franchise_code": 1, "franchise_name": 1, "owner": 1, "status": 1}
+
+# Top-level code fields the branch-admin auth lookup reads, in its priority order
+_ADMIN_BRANCH_CODE_FIELDS = (
+    "branchCode", "branch_code", "centreCode", "centre_code", "centerCode", "center_code", "code",
+    "branch_id", "branchId", "centre_id", "centreId", "center_id", "centerId"
+)
+
+
+def branch_code_of(branch_doc: dict) -> Optional[str]:
+    """Branch code as MultiTenantManager reads it: ``centre_info`` first, then the top-level fields"""
+    centre_info = branch_doc.get("centre_info") or {}
+    for value in (centre_info.get("branch_code"), centre_info.get("code"),
+                  branch_doc.get("branch_code"), branch_doc.get("code"), branch_doc.get("branchCode")):
+        if value:
+            return value
+    return None
+
+
+def admin_branch_code_of(branch_doc: dict) -> Optional[str]:
+    """Branch code as branch-admin auth reads it: top-level fields only (None if there are none)"""
+    for field in _ADMIN_BRANCH_CODE_FIELDS:
+        if branch_doc.get(field):
+            return branch_doc[field]
+    return None
+
+
+def franchise_codes_of(branch_doc: dict) -> List[tuple]:
+    """(rank, franchise_code) for every franchise field of a branch; rank is the order the patterns were tried in"""
+    centre_info = branch_doc.get("centre_info") or {}
+    values = (branch_doc.get("franchise_code"), centre_info.get("franchise_code"),
+              branch_doc.get("franchiseCode"), branch_doc.get("franchise"))
+    return [(rank, value) for rank, value in enumerate(values) if value]
+
+
+def _branch_entry(branch_doc: dict, order: int) -> dict:
+    return {
+        "id": str(branch_doc["_id"]),
+        "order": order,
+        "branch_code": branch_code_of(branch_doc),
+        "admin_branch_code": admin_branch_code_of(branch_doc),
+        "franchise_code": branch_doc.get("franchise_code"),
+        "status": branch_doc.get("status")
+    }
+
+
+def _index_branch(doc: dict, entry: dict, branches_by_franchise: Dict[str, List[tuple]],
+                  franchise_by_branch: Dict[str, str]):
+    seen = set()
+    for rank, franchise_code in franchise_codes_of(doc):
+        if franchise_code in seen:
+            continue
+        seen.add(franchise_code)
+        branches_by_franchise.setdefault(franchise_code, []).append((rank, entry))
+        for code in (entry["branch_code"], entry["admin_branch_code"]):
+            if code:
+                franchise_by_branch.setdefault(code, franchise_code)
+
+
+def _sorted_branches(ranked: List[tuple]) -> List[tuple]:
+    return sorted(ranked, key=lambda item: (item[0], item[1]["order"]))
+
+
+def _franchise_entry(franchise_doc: dict) -> dict:
+    owner = franchise_doc.get("owner") or {}
+    return {
+        "franchise_id": str(franchise_doc["_id"]),
+        "franchise_code": franchise_doc.get("franchise_code"),
+        "franchise_name": franchise_doc.get("franchise_name"),
+        "owner_name": owner.get("name"),
+        "owner_email": owner.get("email"),
+        "status": franchise_doc.get("status")
+    }
+
+
+class TenantDirectory:
+    """Process-local copy of franchises and branches with background refresh"""
+
+    def __init__(self, ttl_seconds: float = 300):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._db = None
+        self._franchises: Dict[str, dict] = {}
+        self._branches_by_franchise: Dict[str, List[tuple]] = {}
+        self._franchise_by_branch: Dict[str, str] = {}
+        self._branch_by_user: Dict[str, dict] = {}
+        self._misses: Dict[str, float] = {}
+        self._loaded_at: Optional[float] = None
+        self._branch_count = 0
+        self._hits = 0
+        self._db_lookups = 0
+        self._refresher: Optional[threading.Thread] = None
+        self._watcher: Optional[threading.Thread] = None
+        self._stream = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+
+    # ------------------- Loading -------------------
+
+    def load(self, db=None):
+        """(Re)load the whole directory and swap it in atomically"""
+        db = db if db is not None else self._db
+        if db is None:
+            return
+        franchises = {}
+        for doc in db["franchises"].find({}, FRANCHISE_PROJECTION):
+            if doc.get("franchise_code"):
+                franchises[doc["franchise_code"]] = _franchise_entry(doc)
+
+        branches_by_franchise: Dict[str, List[tuple]] = {}
+        franchise_by_branch: Dict[str, str] = {}
+        branch_by_user: Dict[str, dict] = {}
+        branch_count = 0
+        for order, doc in enumerate(db["branches"].find({}, BRANCH_PROJECTION)):
+            branch_count = order + 1
+            entry = _branch_entry(doc, order)
+            _index_branch(doc, entry, branches_by_franchise, franchise_by_branch)
+            for user_field in ("admin_id", "created_by"):
+                # Token user ids are strings; the auth query never matched ObjectId values
+                if isinstance(doc.get(user_field), str):
+                    branch_by_user.setdefault(doc[user_field], entry)
+        branches_by_franchise = {code: _sorted_branches(ranked) for code, ranked in branches_by_franchise.items()}
+
+        with self._lock:
+            self._franchises = franchises
+            self._branches_by_franchise = branches_by_franchise
+            self._franchise_by_branch = franchise_by_branch
+            self._branch_by_user = branch_by_user
+            self._branch_count = branch_count
+            self._misses = {}
+            self._loaded_at = time.monotonic()
+        logger.info(f"[TENANTS] Loaded {len(franchises)} franchises and {len(franchise_by_branch)} branches")
+
+    def _load_franchise(self, franchise_code: str, db) -> Optional[dict]:
+        """Fetch one franchise and its branches that are not in the directory yet"""
+        with self._lock:
+            self._db_lookups += 1
+        doc = db["franchises"].find_one({"franchise_code": franchise_code}, FRANCHISE_PROJECTION)
+        ranked: Dict[str, List[tuple]] = {}
+        franchise_by_branch: Dict[str, str] = {}
+        # Branches missing from the last full load were created after it, i.e. later in natural order
+        for order, branch in enumerate(db["branches"].find({"$or": [
+            {"franchise_code": franchise_code},
+            {"centre_info.franchise_code": franchise_code},
+            {"franchiseCode": franchise_code},
+            {"franchise": franchise_code}
+        ]}, BRANCH_PROJECTION), start=self._branch_count):
+            _index_branch(branch, _branch_entry(branch, order), ranked, franchise_by_branch)
+        with self._lock:
+            self._branches_by_franchise[franchise_code] = _sorted_branches(ranked.get(franchise_code, []))
+            for code, owner in franchise_by_branch.items():
+                self._franchise_by_branch.setdefault(code, owner)
+            if doc is None:
+                self._misses[franchise_code] = time.monotonic() + MISS_TTL_SECONDS
+                return None
+            entry = _franchise_entry(doc)
+            self._franchises[franchise_code] = entry
+            return entry
+
+    def _known_missing(self, franchise_code: str) -> bool:
+        expires = self._misses.get(franchise_code)
+        return expires is not None and expires > time.monotonic()
+
+    # ------------------- Lookups -------------------
+
+    def get_franchise(self, franchise_code: Optional[str], db=None) -> Optional[dict]:
+        """Franchise metadata for ``franchise_code`` (None if there is no such franchise)"""
+        if not franchise_code:
+            return None
+        with self._lock:
+            entry = self._franchises.get(franchise_code)
+            if entry is not None or self._known_missing(franchise_code):
+                self._hits += 1
+                return entry
+        db = db if db is not None else self._db
+        if db is None:
+            return None
+        return self._load_franchise(franchise_code, db)
+
+    def _ranked_branches(self, franchise_code: Optional[str], db=None) -> List[tuple]:
+        if not franchise_code:
+            return []
+        with self._lock:
+            branches = self._branches_by_franchise.get(franchise_code)
+            if branches is not None:
+                self._hits += 1
+                return list(branches)
+        self.get_franchise(franchise_code, db)
+        with self._lock:
+            return list(self._branches_by_franchise.get(franchise_code, []))
+
+    def branches_of(self, franchise_code: Optional[str], db=None) -> List[dict]:
+        """Branches of a franchise, in the order MultiTenantManager's query patterns found them"""
+        return [entry for _, entry in self._ranked_branches(franchise_code, db)]
+
+    def branch_code_for(self, franchise_code: Optional[str], db=None) -> Optional[str]:
+        """Branch code MultiTenantManager resolves for ``franchise_code`` (first matching pattern, first branch)"""
+        branches = self.branches_of(franchise_code, db)
+        return branches[0]["branch_code"] if branches else None
+
+    def admin_branch_code(self, franchise_code: str, user_id: Optional[str] = None, db=None) -> Optional[str]:
+        """Branch code injected into a branch-admin's token context
+
+        The first branch in natural order whose top-level ``franchise_code`` is
+        ``franchise_code`` or whose ``admin_id`` / ``created_by`` is ``user_id``;
+        ``franchise_code`` itself if that branch has no top-level code field, and
+        None if there is no such branch.
+        """
+        candidates = [entry for rank, entry in self._ranked_branches(franchise_code, db) if rank == 0]
+        if user_id:
+            with self._lock:
+                branch = self._branch_by_user.get(str(user_id))
+            if branch:
+                candidates.append(branch)
+        if not candidates:
+            return None
+        branch = min(candidates, key=lambda entry: entry["order"])
+        return branch["admin_branch_code"] or franchise_code
+
+    def franchise_for_branch(self, branch_code: Optional[str]) -> Optional[str]:
+        with self._lock:
+            return self._franchise_by_branch.get(branch_code)
+
+    # ------------------- Refresh -------------------
+
+    def invalidate(self):
+        """Reload soon - call after writing to ``franchises`` or ``branches``"""
+        self._wake.set()
+
+    def start(self, db, ttl_seconds: Optional[float] = None):
+        """Load the directory and keep it fresh in the background"""
+        self._db = db
+        if ttl_seconds is not None:
+            self.ttl_seconds = ttl_seconds
+        if db is None or (self._refresher is not None and self._refresher.is_alive()):
+            return
+        try:
+            self.load(db)
+        except Exception as e:
+            logger.warning(f"[TENANTS] Initial load failed, falling back to lookups: {e}")
+        self._stop.clear()
+
+        def _refresh():
+            while not self._stop.is_set():
+                self._wake.wait(self.ttl_seconds)
+                self._wake.clear()
+                if self._stop.is_set():
+                    break
+                try:
+                    self.load()
+                except Exception as e:
+                    logger.warning(f"[TENANTS] Refresh failed: {e}")
+
+        def _watch():
+            pipeline = [{"$match": {"ns.coll": {"$in": ["franchises", "branches"]}}}]
+            try:
+                with db.watch(pipeline) as stream:
+                    self._stream = stream
+                    for _ in stream:
+                        self._wake.set()
+            except Exception as e:
+                if not self._stop.is_set():
+                    logger.info(f"[TENANTS] Change stream unavailable, refreshing every {self.ttl_seconds}s: {e}")
+            finally:
+                self._stream = None
+
+        self._refresher = threading.Thread(target=_refresh, name="tenant-directory", daemon=True)
+        self._refresher.start()
+        self._watcher = threading.Thread(target=_watch, name="tenant-directory-watch", daemon=True)
+        self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        stream = self._stream
+        if stream is not None:
+            try:
+                stream.close()
+            except Exception:
+                pass
+        if self._refresher is not None:
+            self._refresher.join(timeout=1)
+            self._refresher = None
+        self._watcher = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "franchises": len(self._franchises),
+                "branches": len(self._franchise_by_branch),
+                "age_seconds": round(time.monotonic() - self._loaded_at, 1) if self._loaded_at else None,
+                "hits": self._hits,
+                "db_lookups": self._db_lookups,
+                "change_stream": self._stream is not None
+            }
+
+
+tenant_directory = TenantDirectory(settings.TENANT_DIRECTORY_TTL_SECONDS)
@@ -0,0 +1,189 @@
+"""
+Per-user token versions for stateless JWT authentication
+
+Access tokens live for a year, so resolving every request from the database
+(or a per-token cache entry that other workers keep for minutes) was the only
+way to make a password reset or a disabled login stick. Tokens now carry a
+signed session context in a ``ctx`` claim::
+
+    {"v": CLAIMS_VERSION, "tv": <user's token version>, "role": ...,
+     "franchise_code": ..., "branch_code": ...}
+
+and ``user_token_versions`` holds a version counter for the (few) users whose
+tokens were ever revoked. The counters are mirrored in memory and re-synced
+every ``TOKEN_REVOCATION_SYNC_SECONDS``, so checking a token is a dict lookup:
+a token is revoked when its ``tv`` is below the user's current version (tokens
+without a ``ctx`` count as version 0). ``revoke_user_tokens`` bumps the
+counter, applies it locally at once and drops the user's auth cache entries;
+other workers pick it up on their next sync.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+import threading
+import time
+import logging
+from pymongo import ASCENDING, ReturnDocument
+from app.config import settings
+
+logger = logging.getLogger("uvicorn")
+
+TOKEN_VERSIONS = "user_token_versions"
+CLAIMS_VERSION = 1
+
+# Overlap between sync windows so writes committed slightly out of order are not missed
+SYNC_OVERLAP = timedelta(seconds=5)
+
+
+class TokenRegistry:
+    """In-memory mirror of per-user token versions"""
+
+    def __init__(self, sync_seconds: float = 2.0):
+        self.sync_seconds = sync_seconds
+        self._lock = threading.Lock()
+        self._versions: Dict[str, int] = {}
+        self._synced_until: Optional[datetime] = None
+        self._last_sync: Optional[float] = None
+        self._db = None
+        self._syncer: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def version(self, user_id) -> int:
+        with self._lock:
+            return self._versions.get(str(user_id), 0)
+
+    def is_revoked(self, user_id, token_version: Optional[int]) -> bool:
+        """True if a token minted at ``token_version`` for ``user_id`` has been revoked since"""
+        if not user_id:
+            return False
+        return (token_version or 0) < self.version(user_id)
+
+    def current_version(self, user_id) -> int:
+        """Authoritative version for minting a token (reads the database when available)"""
+        if self._db is not None and user_id:
+            try:
+                doc = self._db[TOKEN_VERSIONS].find_one({"_id": str(user_id)}, {"version": 1})
+                if doc:
+                    self._merge(str(user_id), doc.get("version", 0))
+                    return doc.get("version", 0)
+                return 0
+            except Exception as e:
+                logger.warning(f"[TOKENS] Version lookup failed for {user_id}: {e}")
+        return self.version(user_id)
+
+    def _merge(self, user_id: str, version: int):
+        with self._lock:
+            if version > self._versions.get(user_id, 0):
+                self._versions[user_id] = version
+
+    def revoke(self, db, user_id, reason: str = ""):
+        """Invalidate every token issued to ``user_id`` so far"""
+        from app.utils.auth_helpers import invalidate_user_auth_cache
+
+        if not user_id:
+            return
+        user_id = str(user_id)
+        db = db if db is not None else self._db
+        version = self.version(user_id) + 1
+        if db is not None:
+            try:
+                doc = db[TOKEN_VERSIONS].find_one_and_update(
+                    {"_id": user_id},
+                    {"$inc": {"version": 1}, "$set": {"updated_at": datetime.utcnow(), "reason": reason}},
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER
+                )
+                version = doc.get("version", version)
+            except Exception as e:
+                logger.error(f"[TOKENS] Failed to persist revocation for {user_id}: {e}")
+        self._merge(user_id, version)
+        invalidate_user_auth_cache(user_id)
+        logger.info(f"[TOKENS] Revoked tokens of {user_id} ({reason or 'no reason given'})")
+
+    def sync(self, db=None) -> int:
+        """Pull versions changed since the last sync"""
+        db = db if db is not None else self._db
+        if db is None:
+            return 0
+        started = datetime.utcnow()
+        query = {}
+        if self._synced_until is not None:
+            query = {"updated_at": {"$gte": self._synced_until - SYNC_OVERLAP}}
+        changed = 0
+        for doc in db[TOKEN_VERSIONS].find(query, {"version": 1}):
+            self._merge(doc["_id"], doc.get("version", 0))
+            changed += 1
+        self._synced_until = started
+        self._last_sync = time.monotonic()
+        return changed
+
+    def start(self, db, sync_seconds: Optional[float] = None):
+        self._db = db
+        if sync_seconds is not None:
+            self.sync_seconds = sync_seconds
+        if db is None or (self._syncer is not None and self._syncer.is_alive()):
+            return
+        try:
+            self.sync(db)
+        except Exception as e:
+            logger.warning(f"[TOKENS] Initial sync failed: {e}")
+        self._stop.clear()
+
+        def _run():
+            while not self._stop.wait(self.sync_seconds):
+                try:
+                    self.sync()
+                except Exception as e:
+                    logger.warning(f"[TOKENS] Sync failed: {e}")
+
+        self._syncer = threading.Thread(target=_run, name="token-registry", daemon=True)
+        self._syncer.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._syncer is not None:
+            self._syncer.join(timeout=1)
+            self._syncer = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "revoked_users": len(self._versions),
+                "sync_interval_seconds": self.sync_seconds,
+                "last_sync_age_seconds": round(time.monotonic() - self._last_sync, 1) if self._last_sync else None
+            }
+
+
+token_registry = TokenRegistry(settings.TOKEN_REVOCATION_SYNC_SECONDS)
+
+
+def with_session_claims(data: dict) -> dict:
+    """Token payload ``data`` plus the signed ``ctx`` session context and ``iat``"""
+    ctx = {
+        "v": CLAIMS_VERSION,
+        "tv": token_registry.current_version(data.get("user_id")),
+        "role": data.get("role"),
+        "franchise_code": data.get("franchise_code"),
+        "branch_code": data.get("branch_code")
+    }
+    return {**data, "iat": datetime.utcnow(), "ctx": ctx}
+
+
+def session_context(payload: dict) -> Optional[dict]:
+    """The ``ctx`` claim of a decoded token if it is in the current format"""
+    ctx = payload.get("ctx")
+    if isinstance(ctx, dict) and ctx.get("v") == CLAIMS_VERSION:
+        return ctx
+    return None
+
+
+def token_version(payload: dict) -> int:
+    ctx = payload.get("ctx")
+    return ctx.get("tv", 0) if isinstance(ctx, dict) else 0
+
+
+def revoke_user_tokens(db, user_id, reason: str = ""):
+    token_registry.revoke(db, user_id, reason)
+
+
+def ensure_token_registry_indexes(db):
+    db[TOKEN_VERSIONS].create_index([("updated_at", ASCENDING)], background=True)
@@ -35,6 +35,7 @@ from fastapi import HTTPException
 from bson import ObjectId
 from app.models.user import get_user_collection
 from app.utils.serializers import serialize_document  # Import your helper
+from app.services.token_registry import revoke_user_tokens
 from datetime import datetime
 from passlib.context import CryptContext
 import logging
@@ -105,6 +106,10 @@ def update_user(db, user_id, updates):
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="User not found")
         
+        # Role and account status are signed into issued tokens
+        if any(field in update_data and update_data[field] != existing_user.get(field) for field in ("role", "is_active", "status")):
+            revoke_user_tokens(db, user_id, "role or status changed")
+        
         updated_user = user_collection.find_one({"_id": ObjectId(user_id)}, {"password": 0})
         return {
             "success": True,
@@ -134,6 +139,7 @@ def delete_user(db, user_id):
         result = user_collection.delete_one({"_id": ObjectId(user_id)})
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="User not found")
+        revoke_user_tokens(db, user_id, "user deleted")
             
         return {
             "success": True, 
@@ -12,16 +12,46 @@ import logging
 # Setup logger
 logger = logging.getLogger("uvicorn")
 
+AUTH_CACHE_PREFIX = "auth_token:"
+
+def auth_cache_key(token: str, namespace: str = "") -> str:
+    """Cache key for a token, namespaced by user so it can be invalidated per user.
+
+    The user id is read from the unverified claims only to build the key - a
+    cached entry is only ever written after full verification of the same token,
+    and the key includes the SHA-256 of the FULL token. ``namespace`` keeps
+    resolvers that build different user dicts from the same token apart.
+    """
+    import hashlib
+    try:
+        user_id = jwt.get_unverified_claims(token).get("user_id") or "anonymous"
+    except JWTError:
+        user_id = "invalid"
+    token_hash = hashlib.sha256(token.encode()).hexdigest()
+    return f"{AUTH_CACHE_PREFIX}{user_id}:{namespace}{token_hash}"
+
+def invalidate_user_auth_cache(user_id) -> int:
+    """Drop every cached token lookup for a user (password reset, login disabled...)"""
+    from app.utils.cache import app_cache
+    if not user_id:
+        return 0
+    return app_cache.delete_prefix(f"{AUTH_CACHE_PREFIX}{user_id}:")
+
 # ------------------- User Auth -------------------
 
 async def get_current_user(request: Request):
     """
     Extract and validate JWT token from Authorization header
     Supports both regular users and franchise owners (branch admins)
-    Optimized with caching to reduce database queries
+
+    Tokens carrying the signed session context (``ctx`` claim) are resolved from
+    their claims, the tenant directory and the in-memory revocation table - no
+    database access. Only super admins and legacy tokens are looked up (cached).
     """
     from app.models.user import get_user_collection
     from app.utils.cache import app_cache
+    from app.services.tenant_directory import tenant_directory
+    from app.services.token_registry import token_registry, session_context, token_version
     from bson import ObjectId
     
     auth_header = request.headers.get("Authorization")
@@ -34,21 +64,20 @@ async def get_current_user(request: Request):
         raise HTTPException(status_code=401, detail="Unauthorized")
 
     token = auth_header.split(" ")[1]
-    
-    # Try cache first (cache for 5 minutes to reduce DB lookups)
-    # CRITICAL FIX: Use hash of FULL token. Using prefix (token[:50]) caused collisions 
-    # because JWT headers and initial payload fields are often identical.
-    import hashlib
-    token_hash = hashlib.sha256(token.encode()).hexdigest()
-    cache_key = f"auth_token:{token_hash}"
-    
-    cached_user = app_cache.get(cache_key)
-    if cached_user:
-        return cached_user
 
     try:
         payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
         user_id = payload.get("user_id")
+        
+        # Password reset / login disabled since the token was issued (memory lookup)
+        if token_registry.is_revoked(user_id, token_version(payload)):
+            raise HTTPException(status_code=401, detail="Token has been revoked")
+        claims_ctx = session_context(payload)
+        
+        # Lookups that hit the database are cached for 5 minutes
+        # CRITICAL FIX: Use hash of FULL token. Using prefix (token[:50]) caused collisions 
+        # because JWT headers and initial payload fields are often identical.
+        cache_key = auth_cache_key(token)
         role = payload.get("role")
         is_branch_admin = payload.get("is_branch_admin", False)
         is_branch_student = payload.get("is_branch_student", False)
@@ -70,41 +99,15 @@ async def get_current_user(request: Request):
         
         if is_branch_admin and franchise_code:
             # Handle franchise owner (branch admin) authentication
-            
-            # Find franchise by franchise_code instead of user_id
-            franchise = db["franchises"].find_one({"franchise_code": franchise_code})
+            # Franchise and branch come from the in-memory tenant directory - no DB round trips
+            franchise = tenant_directory.get_franchise(franchise_code, db)
             
             if not franchise:
                 raise HTTPException(status_code=401, detail="Franchise not found")
             
-            # Fetch actual branch_code from branches collection
-            branch = db["branches"].find_one({
-                "$or": [
-                    {"franchise_code": franchise_code},
-                    {"admin_id": user_id},
-                    {"created_by": user_id}
-                ]
-            })
-            
-            if branch:
-                # Check ALL possible field names for branch code including variations
-                branch_code = (
-                    branch.get("branchCode") or 
-                    branch.get("branch_code") or 
-                    branch.get("centreCode") or
-                    branch.get("centre_code") or
-                    branch.get("centerCode") or
-                    branch.get("center_code") or
-                    branch.get("code") or
-                    branch.get("branch_id") or
-                    branch.get("branchId") or
-                    branch.get("centre_id") or
-                    branch.get("centreId") or
-                    branch.get("center_id") or
-                    branch.get("centerId") or
-                    franchise_code
-                )
-            else:
+            # Actual branch_code of the franchise's branch (or the branch this user administers)
+            branch_code = tenant_directory.admin_branch_code(franchise_code, user_id, db)
+            if not branch_code:
                 # If no branch found, use franchise_code as fallback
                 branch_code = franchise_code
                 logger.warning(f"[Auth] No branch found in branches collection, using franchise_code as branch_code: {branch_code}")
@@ -113,20 +116,17 @@ async def get_current_user(request: Request):
             token_email = payload.get("email")
             token_name = payload.get("name")
             
-            
-
-            
             # Return franchise owner data with branch context
             # USE TOKEN EMAIL, NOT FRANCHISE OWNER EMAIL
-            return {
+            user_data = {
                 "user_id": user_id,  # Keep original user_id from token
-                "franchise_id": str(franchise["_id"]),
-                "name": token_name or franchise.get("owner", {}).get("name", "Franchise Admin"),
-                "email": token_email or franchise.get("owner", {}).get("email", "admin@franchise.com"),
+                "franchise_id": franchise["franchise_id"],
+                "name": token_name or franchise.get("owner_name") or "Franchise Admin",
+                "email": token_email or franchise.get("owner_email") or "admin@franchise.com",
                 "role": role,
                 "franchise_code": franchise["franchise_code"],
                 "branch_code": branch_code,  # Add actual branch_code
-                "franchise_name": franchise.get("franchise_name", "Unknown Franchise"),
+                "franchise_name": franchise.get("franchise_name") or "Unknown Franchise",
                 "is_branch_admin": True,
                 "access_scope": "branch",
                 "branch_permissions": {
@@ -136,13 +136,13 @@ async def get_current_user(request: Request):
                     "branch_code": branch_code
                 }
             }
-            
-            # Cache the user data for 5 minutes
-            app_cache.set(cache_key, user_data, ttl_seconds=300)
             return user_data
             
         elif role == "super_admin" or role == "superadmin":
             # Handle super admin authentication
+            cached_user = await app_cache.aget(cache_key)
+            if cached_user:
+                return cached_user
             # Try to find in super_admins collection
             from app.models.super_admin import find_super_admin_by_email
             
@@ -186,7 +186,7 @@ async def get_current_user(request: Request):
                 }
                 
                 # Cache for 5 minutes
-                app_cache.set(cache_key, user_data, ttl_seconds=300)
+                await app_cache.aset(cache_key, user_data, ttl_seconds=300)
                 return user_data
             else:
                 # For super_admin, allow token-based authentication without database lookup
@@ -202,7 +202,7 @@ async def get_current_user(request: Request):
                 }
                 
                 # Cache for 5 minutes
-                app_cache.set(cache_key, user_data, ttl_seconds=300)
+                await app_cache.aset(cache_key, user_data, ttl_seconds=300)
                 return user_data
 
         elif is_branch_student or role == "student":
@@ -220,14 +220,26 @@ async def get_current_user(request: Request):
                 "is_branch_admin": False,
                 "access_scope": "student"
             }
-            
-            # Cache for 5 minutes
-            app_cache.set(cache_key, user_data, ttl_seconds=300)
             return user_data
             
         else:
             # Handle regular user authentication
             
+            # Verified claims fast path - name, email and role were signed at login
+            if claims_ctx and payload.get("email") and payload.get("name"):
+                return {
+                    "user_id": user_id,
+                    "name": payload["name"],
+                    "email": payload["email"],
+                    "role": claims_ctx.get("role") or role,
+                    "is_branch_admin": False,
+                    "access_scope": "global"
+                }
+            
+            cached_user = await app_cache.aget(cache_key)
+            if cached_user:
+                return cached_user
+            
             user_collection = get_user_collection(db)
             user = user_collection.find_one({"_id": ObjectId(user_id)})
             
@@ -244,7 +256,7 @@ async def get_current_user(request: Request):
             }
             
             # Cache for 5 minutes
-            app_cache.set(cache_key, user_data, ttl_seconds=300)
+            await app_cache.aset(cache_key, user_data, ttl_seconds=300)
             return user_data
             
     except JWTError as e:
@@ -260,6 +272,8 @@ async def get_current_user(request: Request):
             raise HTTPException(status_code=401, detail="Token has expired")
         else:
             raise HTTPException(status_code=401, detail="Invalid token")
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         logger.error(f"[Auth] Unexpected error in get_current_user: {e}")
@@ -270,7 +284,8 @@ async def get_current_user(request: Request):
 
 def create_access_token(data: dict, expires_delta: timedelta = timedelta(days=7)):
     """Create access token with extended expiry for admin users - 7 days"""
-    to_encode = data.copy()
+    from app.services.token_registry import with_session_claims
+    to_encode = with_session_claims(data)
     expire = datetime.utcnow() + expires_delta
     to_encode.update({"exp": expire})
     token = jwt.encode(to_encode, settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM)
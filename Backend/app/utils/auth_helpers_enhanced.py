@@ -18,10 +18,12 @@ async def get_current_user(request: Request):
     """
     Extract and validate JWT token from Authorization header
     Supports both regular users and franchise owners (branch admins)
+    Resolved users are cached for 5 minutes, like utils/auth_helpers.get_current_user;
+    revoked tokens are rejected even when cached
     """
-    from app.models.user import get_user_collection
-    from bson import ObjectId
-    from bson.errors import InvalidId
+    from app.utils.auth_helpers import auth_cache_key
+    from app.utils.cache import app_cache
+    from app.services.token_registry import token_registry, token_version
     
     auth_header = request.headers.get("Authorization")
     logger.info(f"[Auth] Processing request for path: {request.url.path}")
@@ -40,10 +42,39 @@ async def get_current_user(request: Request):
 
     token = auth_header.split(" ")[1]
     logger.info(f"[Auth] Token extracted, length: {len(token)}")
+    
+    cache_key = auth_cache_key(token, namespace="enhanced:")
+    cached = await app_cache.aget(cache_key)
+    if cached:
+        if token_registry.is_revoked(cached["uid"], cached["tv"]):
+            await app_cache.adelete(cache_key)
+            raise HTTPException(status_code=401, detail="Token has been revoked")
+        return cached["user"]
+    
+    user_data, payload = _resolve_user(request, token)
+    await app_cache.aset(cache_key, {
+        "user": user_data,
+        "uid": payload.get("user_id"),
+        "tv": token_version(payload)
+    }, ttl_seconds=300)
+    return user_data
+
+def _resolve_user(request: Request, token: str):
+    """Verify ``token`` and build the user context (cache miss path of get_current_user)
+
+    Returns the user dict and the verified token claims.
+    """
+    from app.models.user import get_user_collection
+    from app.services.tenant_directory import tenant_directory
+    from app.services.token_registry import token_registry, session_context, token_version
+    from bson import ObjectId
+    from bson.errors import InvalidId
 
     try:
         payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
         user_id = payload.get("user_id")
+        if token_registry.is_revoked(user_id, token_version(payload)):
+            raise HTTPException(status_code=401, detail="Token has been revoked")
         role = payload.get("role")
         is_branch_admin = payload.get("is_branch_admin", False)
         franchise_code = payload.get("franchise_code")
@@ -74,7 +105,7 @@ async def get_current_user(request: Request):
                     "access_scope": "global" if role in ["admin", "super_admin", "superadmin"] else "franchise",
                     "franchise_code": franchise_code,
                     "branch_code": payload.get("branch_code")
-                }
+                }, payload
             
             # If not found in users collection, try franchises collection
             franchise = db.franchises.find_one({"_id": ObjectId(user_id)})
@@ -90,7 +121,7 @@ async def get_current_user(request: Request):
                     "access_scope": "global" if role in ["admin", "super_admin", "superadmin"] else "franchise",
                     "franchise_code": franchise.get("franchise_code"),
                     "branch_code": payload.get("branch_code")
-                }
+                }, payload
             
             # For super_admin, allow token-based authentication without database lookup
             if role in ["super_admin", "superadmin"]:
@@ -104,7 +135,7 @@ async def get_current_user(request: Request):
                     "access_scope": "global",
                     "franchise_code": franchise_code,
                     "branch_code": payload.get("branch_code")
-                }
+                }, payload
             
             logger.error(f"[Auth] User not found in any collection | user_id={user_id}")
             raise HTTPException(status_code=401, detail="User not found")
@@ -125,8 +156,8 @@ async def get_current_user(request: Request):
                 logger.error(f"[Auth] Franchise code mismatch | expected={franchise_code}, found={user.get('franchise_code')}")
                 raise HTTPException(status_code=401, detail="Franchise authentication failed")
             
-            # Find the associated franchise for additional context
-            franchise = db.franchises.find_one({"franchise_code": franchise_code})
+            # Find the associated franchise for additional context (in-memory tenant directory)
+            franchise = tenant_directory.get_franchise(franchise_code, db)
             
             if not franchise:
                 logger.error(f"[Auth] Franchise not found for code: {franchise_code}")
@@ -137,7 +168,7 @@ async def get_current_user(request: Request):
             # Return branch admin data with franchise context
             return {
                 "user_id": str(user["_id"]),
-                "franchise_id": str(franchise["_id"]),
+                "franchise_id": franchise["franchise_id"],
                 "name": user["name"],
                 "email": user["email"],
                 "role": role,
@@ -150,7 +181,7 @@ async def get_current_user(request: Request):
                     "restricted_to_franchise": True,
                     "franchise_code": franchise["franchise_code"]
                 }
-            }
+            }, payload
         elif role == "student":
             # Handle branch student authentication
             logger.info(f"[Auth] Processing student authentication")
@@ -176,11 +207,22 @@ async def get_current_user(request: Request):
                 "course": student.get("course", student.get("course_name")),
                 "batch": student.get("batch", student.get("batch_name")),
                 "access_scope": "student"
-            }
+            }, payload
         else:
             # Handle regular user authentication
             logger.info(f"[Auth] Processing regular user authentication")
             
+            # Verified claims fast path - name, email and role were signed at login
+            if session_context(payload) and payload.get("email") and payload.get("name"):
+                return {
+                    "user_id": user_id,
+                    "name": payload["name"],
+                    "email": payload["email"],
+                    "role": session_context(payload).get("role") or role,
+                    "is_branch_admin": False,
+                    "access_scope": "global"
+                }, payload
+            
             user_collection = get_user_collection(db)
             user = user_collection.find_one({"_id": ObjectId(user_id)})
             
@@ -197,7 +239,7 @@ async def get_current_user(request: Request):
                 "role": user["role"],
                 "is_branch_admin": False,
                 "access_scope": "global"
-            }
+            }, payload
             
     except JWTError as e:
         error_msg = str(e)
@@ -215,6 +257,8 @@ async def get_current_user(request: Request):
     except InvalidId as e:
         logger.error(f"[Auth] Invalid ObjectId in user_id: {e}")
         raise HTTPException(status_code=401, detail="Invalid user ID format")
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"[Auth] Unexpected error in get_current_user: {e}")
         raise HTTPException(status_code=401, detail="Authentication failed")
@@ -223,7 +267,8 @@ async def get_current_user(request: Request):
 
 def create_access_token(data: dict, expires_delta: timedelta = timedelta(days=365)):
     """Create access token with VERY LONG expiry - 365 days for persistent session"""
-    to_encode = data.copy()
+    from app.services.token_registry import with_session_claims
+    to_encode = with_session_claims(data)
     expire = datetime.utcnow() + expires_delta
     to_encode.update({"exp": expire})
     token = jwt.encode(to_encode, settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM)
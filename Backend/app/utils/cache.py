@@ -1,58 +1,550 @@
-# Simple in-memory cache for frequently accessed data
-from datetime import datetime, timedelta
-from typing import Any, Optional
+# Cache backends for frequently accessed data
+#
+# app_cache is either an in-process LRU (one per worker) or a store shared by
+# every worker on the host (SQLite file), selected with CACHE_BACKEND.
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional
+import json
+import os
+import sqlite3
+import stat
+import sys
+import threading
+import time
 import logging
+from starlette.concurrency import run_in_threadpool
+from app.config import settings
 
 logger = logging.getLogger("uvicorn")
 
-class SimpleCache:
-    """Simple in-memory cache with TTL support"""
-    
+
+def estimate_size(value: Any, _depth: int = 0) -> int:
+    """Rough deep size of a cached value in bytes (dicts/lists/strings of JSON-like data)"""
+    size = sys.getsizeof(value)
+    if _depth > 8:
+        return size
+    if isinstance(value, dict):
+        for k, v in value.items():
+            size += estimate_size(k, _depth + 1) + estimate_size(v, _depth + 1)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        for item in value:
+            size += estimate_size(item, _depth + 1)
+    return size
+
+
+def encode_value(value: Any) -> str:
+    """JSON for the shared cache; datetimes are tagged so they come back as datetimes"""
+    def _default(obj):
+        if isinstance(obj, datetime):
+            return {"$dt": obj.isoformat()}
+        raise TypeError(f"{type(obj).__name__} is not cacheable")
+    return json.dumps(value, default=_default, separators=(",", ":"))
+
+
+def decode_value(text: str) -> Any:
+    def _hook(obj):
+        if len(obj) == 1 and "$dt" in obj:
+            return datetime.fromisoformat(obj["$dt"])
+        return obj
+    return json.loads(text, object_hook=_hook)
+
+
+def open_private_file(path: str):
+    """Create ``path`` readable by this user only, or check that an existing one is ours
+
+    The shared cache holds auth entries, so a file another local user can
+    write to (or swap for a symlink) must never be used.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    try:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_EXCL | getattr(os, "O_NOFOLLOW", 0), 0o600)
+        os.close(fd)
+    except FileExistsError:
+        pass
+    for candidate in (path, path + "-wal", path + "-shm"):
+        try:
+            info = os.lstat(candidate)
+        except FileNotFoundError:
+            continue
+        if not stat.S_ISREG(info.st_mode):
+            raise PermissionError(f"{candidate} is not a regular file")
+        if hasattr(os, "geteuid") and info.st_uid != os.geteuid():
+            raise PermissionError(f"{candidate} is not owned by this process")
+        if info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+            raise PermissionError(f"{candidate} is writable by other users")
+
+
+class CacheBackend:
+    """Interface shared by all cache backends behind ``app_cache``"""
+
     def __init__(self):
-        self._cache = {}
-        self._expiry = {}
-    
+        self._sweeper: Optional[threading.Thread] = None
+        self._sweeper_stop = threading.Event()
+
+    def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl_seconds: int = None):
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def delete_prefix(self, prefix: str) -> int:
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def cleanup_expired(self) -> int:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def __contains__(self, key: str):
+        return self.get(key) is not None
+
+    # ------------------- Async access -------------------
+    # For request handlers; in-process backends never block, so these call through
+
+    async def aget(self, key: str) -> Optional[Any]:
+        return self.get(key)
+
+    async def aset(self, key: str, value: Any, ttl_seconds: int = None):
+        self.set(key, value, ttl_seconds)
+
+    async def adelete(self, key: str):
+        self.delete(key)
+
+    async def adelete_prefix(self, prefix: str) -> int:
+        return self.delete_prefix(prefix)
+
+    # ------------------- Background sweeper -------------------
+
+    def start_sweeper(self, interval_seconds: float = 60.0):
+        """Start a daemon thread that periodically drops expired entries"""
+        if self._sweeper is not None and self._sweeper.is_alive():
+            return
+        self._sweeper_stop.clear()
+
+        def _run():
+            while not self._sweeper_stop.wait(interval_seconds):
+                try:
+                    self.cleanup_expired()
+                except Exception as e:
+                    logger.warning(f"[Cache] Sweeper error: {e}")
+
+        self._sweeper = threading.Thread(target=_run, name="cache-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stop_sweeper(self):
+        """Stop the background sweeper"""
+        self._sweeper_stop.set()
+        if self._sweeper is not None:
+            self._sweeper.join(timeout=1)
+            self._sweeper = None
+
+
+class LRUCache(CacheBackend):
+    """Thread-safe in-memory cache with TTL, LRU eviction and size limits
+
+    Entries are bounded by ``max_entries`` and (approximately) ``max_bytes``;
+    the least recently used entry is evicted first. Expired entries are removed
+    on read and by a background sweeper thread (see ``start_sweeper``).
+    """
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 64 * 1024 * 1024, default_ttl: int = 300):
+        super().__init__()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        # key -> (value, expires_at, size)
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
     def get(self, key: str) -> Optional[Any]:
         """Get value from cache if not expired"""
-        if key not in self._cache:
-            return None
-        
-        # Check if expired
-        if key in self._expiry and datetime.utcnow() > self._expiry[key]:
-            self.delete(key)
-            return None
-        
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+
+            value, expires_at, _ = entry
+            if time.monotonic() > expires_at:
+                self._remove(key)
+                self._expirations += 1
+                self._misses += 1
+                return None
+
+            self._cache.move_to_end(key)
+            self._hits += 1
         logger.debug(f"[Cache] HIT: {key}")
-        return self._cache[key]
-    
-    def set(self, key: str, value: Any, ttl_seconds: int = 300):
+        return value
+
+    def set(self, key: str, value: Any, ttl_seconds: int = None):
         """Set value in cache with TTL (default 5 minutes)"""
-        self._cache[key] = value
-        self._expiry[key] = datetime.utcnow() + timedelta(seconds=ttl_seconds)
-        logger.debug(f"[Cache] SET: {key} (TTL: {ttl_seconds}s)")
-    
+        ttl = self.default_ttl if ttl_seconds is None else ttl_seconds
+        size = estimate_size(value) + sys.getsizeof(key)
+        if size > self.max_bytes:
+            logger.debug(f"[Cache] SKIP: {key} ({size} bytes exceeds max_bytes)")
+            return
+
+        with self._lock:
+            if key in self._cache:
+                self._remove(key)
+            self._cache[key] = (value, time.monotonic() + ttl, size)
+            self._bytes += size
+            self._evict_if_needed()
+        logger.debug(f"[Cache] SET: {key} (TTL: {ttl}s)")
+
     def delete(self, key: str):
         """Delete key from cache"""
-        if key in self._cache:
-            del self._cache[key]
-        if key in self._expiry:
-            del self._expiry[key]
+        with self._lock:
+            self._remove(key)
         logger.debug(f"[Cache] DEL: {key}")
-    
+
+    def delete_prefix(self, prefix: str) -> int:
+        """Delete every key starting with ``prefix`` (namespace invalidation)"""
+        with self._lock:
+            keys = [k for k in self._cache if k.startswith(prefix)]
+            for key in keys:
+                self._remove(key)
+        if keys:
+            logger.debug(f"[Cache] DEL PREFIX: {prefix} ({len(keys)} entries)")
+        return len(keys)
+
     def clear(self):
         """Clear entire cache"""
-        self._cache.clear()
-        self._expiry.clear()
+        with self._lock:
+            self._cache.clear()
+            self._bytes = 0
         logger.debug("[Cache] CLEARED")
-    
-    def cleanup_expired(self):
+
+    def cleanup_expired(self) -> int:
         """Remove expired entries"""
-        now = datetime.utcnow()
-        expired_keys = [k for k, v in self._expiry.items() if now > v]
-        for key in expired_keys:
-            self.delete(key)
+        now = time.monotonic()
+        with self._lock:
+            expired_keys = [k for k, (_, expires_at, _) in self._cache.items() if now > expires_at]
+            for key in expired_keys:
+                self._remove(key)
+            self._expirations += len(expired_keys)
         if expired_keys:
             logger.debug(f"[Cache] Cleaned up {len(expired_keys)} expired entries")
+        return len(expired_keys)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss/eviction counters and current size"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "backend": "memory",
+                "entries": len(self._cache),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "evictions": self._evictions,
+                "expirations": self._expirations
+            }
+
+    def __len__(self):
+        return len(self._cache)
+
+    # ------------------- Internals (caller holds the lock) -------------------
+
+    def _remove(self, key: str):
+        entry = self._cache.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def _evict_if_needed(self):
+        while self._cache and (len(self._cache) > self.max_entries or self._bytes > self.max_bytes):
+            key, (_, _, size) = self._cache.popitem(last=False)
+            self._bytes -= size
+            self._evictions += 1
+            logger.debug(f"[Cache] EVICT: {key}")
+
+
+class SharedFileCache(CacheBackend):
+    """Cache shared by all workers on one host, stored in a SQLite file
+
+    Every worker reads and writes the same file, so a value computed by one
+    worker is reused by the others and a delete/delete_prefix is visible to all
+    of them immediately (no separate invalidation channel needed). Values are
+    stored as JSON (never pickle: the file must not be able to run code in the
+    API) and the file is private to the service user (see ``open_private_file``).
+    Expiry uses wall-clock time so it is consistent across processes. Entry and
+    byte totals are kept in ``cache_totals`` by triggers, so size checks don't
+    scan the table. Hit/miss counters are per process.
+    """
+
+    # Recency is only rewritten when older than this, to keep reads mostly read-only
+    TOUCH_INTERVAL_SECONDS = 30
+    # How long a statement waits for another worker's write lock
+    BUSY_TIMEOUT_SECONDS = 5
+
+    def __init__(self, path: str, max_entries: int = 10000, max_bytes: int = 64 * 1024 * 1024, default_ttl: int = 300):
+        super().__init__()
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        open_private_file(path)
+        self._execute("BEGIN IMMEDIATE")
+        try:
+            self._execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " accessed_at REAL NOT NULL)"
+            )
+            self._execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache (accessed_at)")
+            self._execute("CREATE INDEX IF NOT EXISTS idx_cache_expires ON cache (expires_at)")
+            self._execute(
+                "CREATE TABLE IF NOT EXISTS cache_totals ("
+                " id INTEGER PRIMARY KEY CHECK (id = 1),"
+                " entries INTEGER NOT NULL,"
+                " bytes INTEGER NOT NULL)"
+            )
+            self._execute(
+                "CREATE TRIGGER IF NOT EXISTS cache_totals_insert AFTER INSERT ON cache BEGIN"
+                " UPDATE cache_totals SET entries = entries + 1, bytes = bytes + NEW.size WHERE id = 1; END"
+            )
+            self._execute(
+                "CREATE TRIGGER IF NOT EXISTS cache_totals_update AFTER UPDATE OF size ON cache BEGIN"
+                " UPDATE cache_totals SET bytes = bytes + NEW.size - OLD.size WHERE id = 1; END"
+            )
+            self._execute(
+                "CREATE TRIGGER IF NOT EXISTS cache_totals_delete AFTER DELETE ON cache BEGIN"
+                " UPDATE cache_totals SET entries = entries - 1, bytes = bytes - OLD.size WHERE id = 1; END"
+            )
+            self._execute(
+                "INSERT OR IGNORE INTO cache_totals (id, entries, bytes)"
+                " SELECT 1, COUNT(*), COALESCE(SUM(size), 0) FROM cache"
+            )
+            self._execute("COMMIT")
+        except Exception:
+            self._execute("ROLLBACK")
+            raise
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread; WAL lets readers proceed while a worker writes
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.BUSY_TIMEOUT_SECONDS, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _execute(self, sql: str, params: tuple = ()):
+        return self._conn().execute(sql, params)
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def get(self, key: str) -> Optional[Any]:
+        """Get value from cache if not expired"""
+        try:
+            row = self._execute(
+                "SELECT value, expires_at, accessed_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self._count("_misses")
+                return None
+
+            value, expires_at, accessed_at = row
+            now = time.time()
+            if now > expires_at:
+                self._execute("DELETE FROM cache WHERE key = ? AND expires_at < ?", (key, now))
+                self._count("_expirations")
+                self._count("_misses")
+                return None
+
+            if now - accessed_at > self.TOUCH_INTERVAL_SECONDS:
+                self._execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self._count("_hits")
+            logger.debug(f"[Cache] HIT: {key}")
+            return decode_value(value)
+        except Exception as e:
+            logger.warning(f"[Cache] Shared cache read failed for {key}: {e}")
+            self._count("_misses")
+            return None
+
+    def set(self, key: str, value: Any, ttl_seconds: int = None):
+        """Set value in cache with TTL (default 5 minutes)"""
+        ttl = self.default_ttl if ttl_seconds is None else ttl_seconds
+        try:
+            text = encode_value(value)
+        except (TypeError, ValueError) as e:
+            logger.debug(f"[Cache] SKIP: {key} ({e})")
+            return
+        size = len(text) + len(key)
+        if size > self.max_bytes:
+            logger.debug(f"[Cache] SKIP: {key} ({size} bytes exceeds max_bytes)")
+            return
+
+        now = time.time()
+        try:
+            self._execute(
+                "INSERT INTO cache (key, value, expires_at, size, accessed_at) VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at,"
+                " size = excluded.size, accessed_at = excluded.accessed_at",
+                (key, text, now + ttl, size, now)
+            )
+            self._evict_if_needed()
+            logger.debug(f"[Cache] SET: {key} (TTL: {ttl}s)")
+        except Exception as e:
+            logger.warning(f"[Cache] Shared cache write failed for {key}: {e}")
+
+    def delete(self, key: str):
+        """Delete key from cache (visible to every worker)"""
+        try:
+            self._execute("DELETE FROM cache WHERE key = ?", (key,))
+            logger.debug(f"[Cache] DEL: {key}")
+        except Exception as e:
+            logger.warning(f"[Cache] Shared cache delete failed for {key}: {e}")
+
+    def delete_prefix(self, prefix: str) -> int:
+        """Delete every key starting with ``prefix`` (uses the primary key range)"""
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1) if prefix else None
+        try:
+            if upper is None:
+                cursor = self._execute("DELETE FROM cache")
+            else:
+                cursor = self._execute("DELETE FROM cache WHERE key >= ? AND key < ?", (prefix, upper))
+        except Exception as e:
+            logger.warning(f"[Cache] Shared cache delete failed for prefix {prefix}: {e}")
+            return 0
+        removed = cursor.rowcount if cursor.rowcount is not None else 0
+        if removed:
+            logger.debug(f"[Cache] DEL PREFIX: {prefix} ({removed} entries)")
+        return removed
+
+    def clear(self):
+        """Clear entire cache (for every worker)"""
+        try:
+            self._execute("DELETE FROM cache")
+            logger.debug("[Cache] CLEARED")
+        except Exception as e:
+            logger.warning(f"[Cache] Shared cache clear failed: {e}")
+
+    # A locked file can hold a statement for the busy timeout; run it off the event loop
+
+    async def aget(self, key: str) -> Optional[Any]:
+        return await run_in_threadpool(self.get, key)
+
+    async def aset(self, key: str, value: Any, ttl_seconds: int = None):
+        await run_in_threadpool(self.set, key, value, ttl_seconds)
+
+    async def adelete(self, key: str):
+        await run_in_threadpool(self.delete, key)
+
+    async def adelete_prefix(self, prefix: str) -> int:
+        return await run_in_threadpool(self.delete_prefix, prefix)
+
+    def cleanup_expired(self) -> int:
+        """Remove expired entries"""
+        cursor = self._execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),))
+        removed = max(cursor.rowcount or 0, 0)
+        if removed:
+            self._count("_expirations", removed)
+            logger.debug(f"[Cache] Cleaned up {removed} expired entries")
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss/eviction counters (this process) and current size (shared)"""
+        entries, total_bytes = self._totals()
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "backend": "shared",
+                "path": self.path,
+                "entries": entries,
+                "bytes": total_bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "evictions": self._evictions,
+                "expirations": self._expirations
+            }
+
+    def __len__(self):
+        return self._totals()[0]
+
+    def _totals(self) -> tuple:
+        row = self._execute("SELECT entries, bytes FROM cache_totals WHERE id = 1").fetchone()
+        return row if row is not None else (0, 0)
+
+    def _evict_if_needed(self):
+        entries, total_bytes = self._totals()
+        if entries <= self.max_entries and total_bytes <= self.max_bytes:
+            return
+
+        # Expired entries go first, then the least recently used ones
+        self.cleanup_expired()
+        evicted = 0
+        while True:
+            entries, total_bytes = self._totals()
+            if not entries or (entries <= self.max_entries and total_bytes <= self.max_bytes):
+                break
+            # Evict in batches so one oversized write doesn't cost one query per row
+            batch = max(entries - self.max_entries, 1, entries // 100)
+            self._execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed_at LIMIT ?)",
+                (batch,)
+            )
+            evicted += batch
+        if evicted:
+            self._count("_evictions", evicted)
+
+
+def create_cache_backend(backend: str = None) -> CacheBackend:
+    """Build the configured cache backend ("memory" or "shared")"""
+    backend = (backend or settings.CACHE_BACKEND).lower()
+    if backend == "shared" and not settings.CACHE_SHARED_PATH:
+        logger.warning("[Cache] CACHE_BACKEND=shared needs CACHE_SHARED_PATH (an app-private file), using in-process cache")
+    elif backend == "shared":
+        path = settings.CACHE_SHARED_PATH
+        try:
+            return SharedFileCache(
+                path,
+                max_entries=settings.CACHE_MAX_ENTRIES,
+                max_bytes=settings.CACHE_MAX_BYTES
+            )
+        except Exception as e:
+            logger.warning(f"[Cache] Shared cache at {path} unavailable ({e}), falling back to in-process cache")
+
+    return LRUCache(
+        max_entries=settings.CACHE_MAX_ENTRIES,
+        max_bytes=settings.CACHE_MAX_BYTES
+    )
+
+
+# Backwards-compatible name
+SimpleCache = LRUCache
 
 # Global cache instance
-app_cache = SimpleCache()
+app_cache = create_cache_backend()
@@ -0,0 +1,164 @@
+"""
+Async MongoDB data layer (Motor)
+
+The synchronous pymongo client on ``app.mongodb`` blocks the event loop for the
+whole duration of every query. Hot routes use the Motor database exposed as
+``app.mongodb_async`` instead, so a slow aggregation only delays its own request.
+
+Without motor installed, ``app.mongodb_async`` is a thin adapter over the sync
+database that runs each query in the threadpool - same awaitable interface,
+still off the event loop, just with a thread per query instead of Motor's I/O.
+"""
+from fastapi import HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from typing import Any, List, Optional
+import logging
+
+try:
+    from motor.motor_asyncio import AsyncIOMotorClient
+    MOTOR_SUPPORT = True
+except ImportError:
+    AsyncIOMotorClient = None
+    MOTOR_SUPPORT = False
+
+logger = logging.getLogger("uvicorn")
+
+
+def create_async_client(uri: str, **kwargs):
+    """Create a Motor client for the given URI (connects lazily on first use)"""
+    if not MOTOR_SUPPORT:
+        logger.warning("[AsyncDB] motor is not installed - async data layer disabled")
+        return None
+
+    options = {"serverSelectionTimeoutMS": 5000, "maxPoolSize": 100}
+    options.update(kwargs)
+    return AsyncIOMotorClient(uri, **options)
+
+
+class ThreadedCursor:
+    """Motor-style cursor over a sync ``find``/``aggregate`` call
+
+    The pymongo call is deferred until the cursor is drained, so chained
+    ``sort``/``skip``/``limit`` calls and the query itself run in the threadpool.
+    """
+
+    def __init__(self, collection, method: str, args: tuple, kwargs: dict):
+        self._collection = collection
+        self._method = method
+        self._args = args
+        self._kwargs = kwargs
+        self._chain: List[tuple] = []
+
+    def __getattr__(self, name):
+        def chained(*args, **kwargs):
+            self._chain.append((name, args, kwargs))
+            return self
+        return chained
+
+    def _run(self, length: Optional[int]) -> List[Any]:
+        cursor = getattr(self._collection, self._method)(*self._args, **self._kwargs)
+        for name, args, kwargs in self._chain:
+            cursor = getattr(cursor, name)(*args, **kwargs)
+        if length is None:
+            return list(cursor)
+        documents = []
+        for document in cursor:
+            documents.append(document)
+            if len(documents) >= length:
+                break
+        return documents
+
+    async def to_list(self, length: Optional[int] = None) -> List[Any]:
+        return await run_in_threadpool(self._run, length)
+
+    async def __aiter__(self):
+        for document in await self.to_list():
+            yield document
+
+
+class ThreadedCollection:
+    """Awaitable facade over a sync pymongo collection"""
+
+    CURSOR_METHODS = ("find", "aggregate", "list_indexes")
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def __getattr__(self, name):
+        if name in self.CURSOR_METHODS:
+            return lambda *args, **kwargs: ThreadedCursor(self._collection, name, args, kwargs)
+        attribute = getattr(self._collection, name)
+        if not callable(attribute) or name.startswith("_"):
+            return attribute
+
+        async def call(*args, **kwargs):
+            return await run_in_threadpool(attribute, *args, **kwargs)
+        return call
+
+
+class ThreadedDatabase:
+    """Awaitable facade over a sync pymongo database (used when motor is missing)"""
+
+    def __init__(self, db):
+        self._db = db
+
+    def __getitem__(self, name) -> ThreadedCollection:
+        return ThreadedCollection(self._db[name])
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if name in ("command", "list_collection_names", "create_collection", "drop_collection"):
+            method = getattr(self._db, name)
+
+            async def call(*args, **kwargs):
+                return await run_in_threadpool(method, *args, **kwargs)
+            return call
+        if name == "name":
+            return self._db.name
+        return ThreadedCollection(self._db[name])
+
+    def get_collection(self, name, **kwargs) -> ThreadedCollection:
+        return ThreadedCollection(self._db.get_collection(name, **kwargs))
+
+
+def init_async_db(app, uri: str, db_name: str, sync_db=None):
+    """Attach the Motor client and database to the app next to the sync ones
+
+    Falls back to a threadpool adapter over ``sync_db`` when motor is not installed.
+    """
+    client = create_async_client(uri) if uri else None
+    app.mongodb_async_client = client
+    if client is not None:
+        app.mongodb_async = client[db_name]
+    elif sync_db is not None:
+        logger.warning("[AsyncDB] Serving async routes from the sync client in the threadpool")
+        app.mongodb_async = ThreadedDatabase(sync_db)
+    else:
+        app.mongodb_async = None
+    return app.mongodb_async
+
+
+def close_async_db(app):
+    """Close the Motor client on shutdown"""
+    client = getattr(app, "mongodb_async_client", None)
+    if client is not None:
+        client.close()
+        app.mongodb_async_client = None
+    app.mongodb_async = None
+
+
+def get_async_db(request: Request):
+    """Return the Motor database (or its threadpool stand-in) for this app or fail with 503"""
+    db = getattr(request.app, "mongodb_async", None)
+    if db is None:
+        raise HTTPException(
+            status_code=503,
+            detail="Database connection not available. Please try again later."
+        )
+    return db
+
+
+async def fetch_all(cursor, length: Optional[int] = None) -> List[Any]:
+    """Drain a Motor (or threaded) cursor (find or aggregate) into a list"""
+    return await cursor.to_list(length=length)
@@ -3,6 +3,14 @@ Database optimization script - adds indexes for better performance
 """
 from pymongo import ASCENDING, DESCENDING, IndexModel
 import logging
+from app.services.ledger_rollup_service import ensure_rollup_indexes
+from app.services.course_content_service import ensure_content_tree_indexes
+from app.services.search_service import ensure_search_indexes
+from app.services.token_registry import ensure_token_registry_indexes
+from app.services.instructor_stats_service import ensure_instructor_stats_indexes
+from app.services.notification_fanout import ensure_notification_indexes
+from app.models.live_session import ensure_live_session_indexes
+from app.services.email_outbox import ensure_email_outbox_indexes
 
 logger = logging.getLogger("uvicorn")
 
@@ -50,6 +58,8 @@ def create_database_indexes(db):
         enrollments.create_index([("course_id", ASCENDING)], background=True)
         enrollments.create_index([("enrolled_at", DESCENDING)], background=True)
         enrollments.create_index([("franchise_code", ASCENDING)], background=True)
+        enrollments.create_index([("status", ASCENDING), ("enrollment_date", DESCENDING)], background=True)
+        enrollments.create_index([("status", ASCENDING), ("created_at", DESCENDING)], background=True)
         logger.info("✅ Created indexes for enrollments collection")
         
         # Certificates collection indexes
@@ -65,8 +75,19 @@ def create_database_indexes(db):
         branch_students.create_index([("franchise_code", ASCENDING)], background=True)
         branch_students.create_index([("email", ASCENDING)], background=True)
         branch_students.create_index([("student_id", ASCENDING)], background=True)
+        branch_students.create_index(
+            [("franchise_code", ASCENDING), ("branch_code", ASCENDING), ("created_at", DESCENDING)],
+            background=True
+        )
         logger.info("✅ Created indexes for branch_students collection")
         
+        # Branch ID cards collection indexes (batched lookup in the student listing)
+        branch_id_cards = db["branch_id_cards"]
+        branch_id_cards.create_index([("student_id", ASCENDING)], background=True)
+        branch_id_cards.create_index([("registration_number", ASCENDING)], background=True)
+        branch_id_cards.create_index([("student_registration", ASCENDING)], background=True)
+        logger.info("✅ Created indexes for branch_id_cards collection")
+        
         # Branch courses collection indexes
         branch_courses = db["branch_courses"]
         branch_courses.create_index([("branch_code", ASCENDING)], background=True)
@@ -87,6 +108,39 @@ def create_database_indexes(db):
         branch_programs.create_index([("franchise_code", ASCENDING)], background=True)
         logger.info("✅ Created indexes for branch_programs collection")
         
+        # Resumable upload sessions (expired sessions are purged on new uploads)
+        upload_sessions = db["upload_sessions"]
+        upload_sessions.create_index([("expires_at", ASCENDING)], background=True)
+        logger.info("✅ Created indexes for upload_sessions collection")
+        
+        # Ledger daily revenue rollup indexes
+        ensure_rollup_indexes(db)
+        logger.info("✅ Created indexes for ledger_daily_rollups collection")
+        
+        # Materialized course content trees (invalidation lookups)
+        ensure_content_tree_indexes(db)
+        logger.info("✅ Created indexes for course_content_trees collection")
+        
+        # Search terms (courses, branch_students, branch_study_materials)
+        ensure_search_indexes(db)
+        logger.info("✅ Created search indexes")
+        
+        # Token revocation versions (incremental sync)
+        ensure_token_registry_indexes(db)
+        logger.info("✅ Created indexes for user_token_versions collection")
+
+        ensure_instructor_stats_indexes(db)
+        logger.info("✅ Created indexes for instructor_students collection")
+
+        ensure_notification_indexes(db)
+        logger.info("✅ Created indexes for user_notifications collection")
+
+        ensure_live_session_indexes(db)
+        logger.info("✅ Created indexes for live_sessions collection")
+
+        ensure_email_outbox_indexes(db)
+        logger.info("✅ Created indexes for email_outbox collection")
+        
         logger.info("🎉 All database indexes created successfully!")
         return True
         
@@ -1,11 +1,12 @@
 from datetime import datetime, timedelta
 from jose import jwt
 from app.config import settings
+from app.services.token_registry import with_session_claims
 
 def create_access_token(data: dict) -> str:
     # Set very long expiry - 365 days for persistent sessions
     expire = datetime.utcnow() + timedelta(days=365)
-    payload = {**data, "exp": expire}
+    payload = {**with_session_claims(data), "exp": expire}
     print(f"[JWT] Creating PERSISTENT access token with 365 days expiry: {expire}")
     return jwt.encode(payload, settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM)
 
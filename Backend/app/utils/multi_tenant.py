@@ -3,15 +3,18 @@ Multi-tenancy utilities for branch-based data isolation
 """
 from fastapi import HTTPException
 from typing import Dict, Any, Optional
+import asyncio
 import logging
+from app.services.tenant_directory import tenant_directory
 
 logger = logging.getLogger(__name__)
 
 class MultiTenantManager:
     """Handles multi-tenant data isolation for branch-based operations"""
     
-    def __init__(self, db):
+    def __init__(self, db, async_db=None):
         self.db = db
+        self.async_db = async_db
     
     def get_branch_context(self, user: Dict[str, Any]) -> Dict[str, str]:
         """Extract branch context from authenticated user with role-based access"""
@@ -51,40 +54,10 @@ class MultiTenantManager:
         if is_branch_admin:
             print(f"[MULTI_TENANT] Processing branch admin access")
             
-            # If branch_code is missing, try to find it from branches collection
+            # If branch_code is missing, take it from the franchise's branch (in-memory tenant directory)
             if not branch_code and franchise_code:
-                print(f"[MULTI_TENANT] Branch code missing, looking up from franchise: {franchise_code}")
-                
-                # Look for branch under this franchise
-                branch_doc = None
-                query_patterns = [
-                    {"franchise_code": franchise_code},
-                    {"centre_info.franchise_code": franchise_code},
-                    {"franchiseCode": franchise_code},
-                    {"franchise": franchise_code}
-                ]
-                
-                for pattern in query_patterns:
-                    print(f"[MULTI_TENANT] Trying query pattern: {pattern}")
-                    branch_doc = self.db.branches.find_one(pattern)
-                    if branch_doc:
-                        print(f"[MULTI_TENANT] Found branch document with pattern: {pattern}")
-                        break
-                
-                if branch_doc:
-                    # Extract branch_code from different possible field patterns
-                    if "centre_info" in branch_doc and "branch_code" in branch_doc["centre_info"]:
-                        branch_code = branch_doc["centre_info"]["branch_code"]
-                        print(f"[MULTI_TENANT] Found branch_code in centre_info: {branch_code}")
-                    elif "centre_info" in branch_doc and "code" in branch_doc["centre_info"]:
-                        branch_code = branch_doc["centre_info"]["code"]
-                        print(f"[MULTI_TENANT] Found code in centre_info: {branch_code}")
-                    elif "branch_code" in branch_doc:
-                        branch_code = branch_doc["branch_code"]
-                        print(f"[MULTI_TENANT] Found direct branch_code: {branch_code}")
-                    elif "branchCode" in branch_doc:
-                        branch_code = branch_doc["branchCode"]
-                        print(f"[MULTI_TENANT] Found branchCode: {branch_code}")
+                branch_code = tenant_directory.branch_code_for(franchise_code, db=self.db)
+                print(f"[MULTI_TENANT] Branch code missing, resolved from franchise {franchise_code}: {branch_code}")
             
             if branch_code:
                 print(f"[MULTI_TENANT] Branch admin access for branch: {branch_code}")
@@ -103,60 +76,13 @@ class MultiTenantManager:
         if role == "franchise_admin" or (role == "admin" and franchise_code and not is_branch_admin):
             print(f"[MULTI_TENANT] Franchise admin access for franchise: {franchise_code}")
             
-            # For franchise users, always try to get the proper branch_code from branches collection
-            if franchise_code:
-                print(f"[MULTI_TENANT] Looking for branches with franchise_code: {franchise_code}")
-                
-                # Look for branches under this franchise - try multiple query patterns
-                branch_doc = None
-                
-                # Try different field patterns for franchise_code
-                query_patterns = [
-                    {"franchise_code": franchise_code},
-                    {"centre_info.franchise_code": franchise_code},
-                    {"franchiseCode": franchise_code},
-                    {"franchise": franchise_code}
-                ]
-                
-                for pattern in query_patterns:
-                    print(f"[MULTI_TENANT] Trying query pattern: {pattern}")
-                    branch_doc = self.db.branches.find_one(pattern)
-                    if branch_doc:
-                        print(f"[MULTI_TENANT] Found branch document with pattern: {pattern}")
-                        break
-                
-                print(f"[MULTI_TENANT] Branch document found: {bool(branch_doc)}")
-                if branch_doc:
-                    print(f"[MULTI_TENANT] Branch document keys: {list(branch_doc.keys())}")
-                
-                if branch_doc:
-                    # Try different field patterns for branch_code
-                    actual_branch_code = None
-                
-                if "centre_info" in branch_doc and "branch_code" in branch_doc["centre_info"]:
-                    actual_branch_code = branch_doc["centre_info"]["branch_code"]
-                    print(f"[MULTI_TENANT] Found branch_code in centre_info: {actual_branch_code}")
-                elif "centre_info" in branch_doc and "code" in branch_doc["centre_info"]:
-                    actual_branch_code = branch_doc["centre_info"]["code"]
-                    print(f"[MULTI_TENANT] Found code in centre_info: {actual_branch_code}")
-                elif "branch_code" in branch_doc:
-                    actual_branch_code = branch_doc["branch_code"]
-                    print(f"[MULTI_TENANT] Found direct branch_code: {actual_branch_code}")
-                elif "code" in branch_doc:
-                    actual_branch_code = branch_doc["code"]
-                    print(f"[MULTI_TENANT] Found direct code: {actual_branch_code}")
-                elif "branchCode" in branch_doc:
-                    actual_branch_code = branch_doc["branchCode"]
-                    print(f"[MULTI_TENANT] Found branchCode: {actual_branch_code}")
-                    
-                if actual_branch_code and actual_branch_code != franchise_code:
-                    print(f"[MULTI_TENANT] Using branch_code from database: {actual_branch_code} for franchise: {franchise_code}")
-                    branch_code = actual_branch_code
-                else:
-                    print(f"[MULTI_TENANT] No different branch_code found, using franchise_code as fallback")
-                    branch_code = franchise_code
+            # For franchise users, always try to get the proper branch_code from the franchise's branch
+            actual_branch_code = tenant_directory.branch_code_for(franchise_code, db=self.db) if franchise_code else None
+            if actual_branch_code and actual_branch_code != franchise_code:
+                print(f"[MULTI_TENANT] Using branch_code from directory: {actual_branch_code} for franchise: {franchise_code}")
+                branch_code = actual_branch_code
             else:
-                print(f"[MULTI_TENANT] No branch document found for franchise: {franchise_code}")
+                print(f"[MULTI_TENANT] No different branch_code found, using franchise_code as fallback")
                 branch_code = franchise_code
         
             # Return context with franchise-level access
@@ -177,62 +103,20 @@ class MultiTenantManager:
                 detail="User does not have branch access"
             )
         
-        # For students/instructors, look up the actual branch_code from branches collection
+        # For students/instructors, look up the actual branch_code in the tenant directory
         # to ensure we have the correct branch_code (not franchise_code as fallback)
         final_branch_code = branch_code
         final_franchise_code = franchise_code
         
-        # If branch_code is missing or same as franchise_code, look it up from branches
+        # If branch_code is missing or same as franchise_code, look it up in the tenant directory
         if (not branch_code or branch_code == franchise_code) and franchise_code:
-            print(f"[MULTI_TENANT] Looking up branch_code for student/instructor with franchise: {franchise_code}")
-            
-            # Try to find branch document
-            branch_doc = None
-            query_patterns = [
-                {"franchise_code": franchise_code},
-                {"centre_info.franchise_code": franchise_code},
-                {"franchiseCode": franchise_code},
-                {"franchise": franchise_code}
-            ]
-            
-            for pattern in query_patterns:
-                print(f"[MULTI_TENANT] Trying query pattern: {pattern}")
-                branch_doc = self.db.branches.find_one(pattern)
-                if branch_doc:
-                    print(f"[MULTI_TENANT] Found branch document with pattern: {pattern}")
-                    break
-            
-            if branch_doc:
-                # Extract actual branch_code
-                actual_branch_code = None
-                
-                if "centre_info" in branch_doc and "branch_code" in branch_doc["centre_info"]:
-                    actual_branch_code = branch_doc["centre_info"]["branch_code"]
-                    print(f"[MULTI_TENANT] Found branch_code in centre_info: {actual_branch_code}")
-                elif "centre_info" in branch_doc and "code" in branch_doc["centre_info"]:
-                    actual_branch_code = branch_doc["centre_info"]["code"]
-                    print(f"[MULTI_TENANT] Found code in centre_info: {actual_branch_code}")
-                elif "branch_code" in branch_doc:
-                    actual_branch_code = branch_doc["branch_code"]
-                    print(f"[MULTI_TENANT] Found direct branch_code: {actual_branch_code}")
-                elif "code" in branch_doc:
-                    actual_branch_code = branch_doc["code"]
-                    print(f"[MULTI_TENANT] Found direct code: {actual_branch_code}")
-                elif "branchCode" in branch_doc:
-                    actual_branch_code = branch_doc["branchCode"]
-                    print(f"[MULTI_TENANT] Found branchCode: {actual_branch_code}")
-                
-                if actual_branch_code and actual_branch_code != franchise_code:
-                    final_branch_code = actual_branch_code
-                    print(f"[MULTI_TENANT] Updated branch_code to: {actual_branch_code}")
-                else:
-                    # Fallback
-                    final_branch_code = branch_code or franchise_code
-                    print(f"[MULTI_TENANT] No distinct branch_code found, using fallback: {final_branch_code}")
+            actual_branch_code = tenant_directory.branch_code_for(franchise_code, db=self.db)
+            if actual_branch_code and actual_branch_code != franchise_code:
+                final_branch_code = actual_branch_code
+                print(f"[MULTI_TENANT] Updated branch_code to: {actual_branch_code}")
             else:
-                # No branch found, use fallback
                 final_branch_code = branch_code or franchise_code
-                print(f"[MULTI_TENANT] No branch document found, using fallback: {final_branch_code}")
+                print(f"[MULTI_TENANT] No distinct branch_code found, using fallback: {final_branch_code}")
         else:
             # branch_code is already different from franchise_code, use it
             final_branch_code = branch_code or franchise_code
@@ -340,16 +224,7 @@ class MultiTenantManager:
         print(f"[MULTI_TENANT] Added tenant data: franchise_code={data.get('franchise_code')}, branch_code={data.get('branch_code')}")
         return data
     
-    def get_tenant_stats(self, context: Dict[str, str]) -> Dict[str, Any]:
-        """Get comprehensive statistics for the tenant"""
-        franchise_code = context["franchise_code"]
-        
-        # Get franchise info
-        franchise = self.db.franchises.find_one({"franchise_code": franchise_code})
-        if not franchise:
-            raise HTTPException(status_code=404, detail="Franchise not found")
-        
-        # Student statistics
+    def _tenant_stats_pipelines(self, franchise_code: str):
         student_pipeline = [
             {"$match": {"franchise_code": franchise_code}},
             {
@@ -359,13 +234,6 @@ class MultiTenantManager:
                 }
             }
         ]
-        
-        student_stats = {item["_id"]: item["count"] for item in self.db.branch_students.aggregate(student_pipeline)}
-        
-        # Course statistics (if courses are branch-specific)
-        course_stats = self.db.courses.count_documents({"franchise_code": franchise_code})
-        
-        # Financial statistics
         financial_pipeline = [
             {"$match": {"franchise_code": franchise_code, "admission_status": "ACTIVE"}},
             {
@@ -377,8 +245,51 @@ class MultiTenantManager:
                 }
             }
         ]
+        return student_pipeline, financial_pipeline
+    
+    def get_tenant_stats(self, context: Dict[str, str]) -> Dict[str, Any]:
+        """Get comprehensive statistics for the tenant"""
+        franchise_code = context["franchise_code"]
+        
+        # Get franchise info
+        franchise = self.db.franchises.find_one({"franchise_code": franchise_code})
+        if not franchise:
+            raise HTTPException(status_code=404, detail="Franchise not found")
+        
+        student_pipeline, financial_pipeline = self._tenant_stats_pipelines(franchise_code)
         
+        # Student statistics
+        student_stats = {item["_id"]: item["count"] for item in self.db.branch_students.aggregate(student_pipeline)}
+        
+        # Course statistics (if courses are branch-specific)
+        course_stats = self.db.courses.count_documents({"franchise_code": franchise_code})
+        
+        # Financial statistics
         financial_stats = list(self.db.branch_students.aggregate(financial_pipeline))
+        
+        return self._format_tenant_stats(franchise, franchise_code, student_stats, course_stats, financial_stats)
+    
+    async def get_tenant_stats_async(self, context: Dict[str, str]) -> Dict[str, Any]:
+        """Async variant of get_tenant_stats - runs the independent queries concurrently"""
+        if self.async_db is None:
+            return self.get_tenant_stats(context)
+        
+        franchise_code = context["franchise_code"]
+        student_pipeline, financial_pipeline = self._tenant_stats_pipelines(franchise_code)
+        
+        franchise, student_rows, course_stats, financial_stats = await asyncio.gather(
+            self.async_db.franchises.find_one({"franchise_code": franchise_code}),
+            self.async_db.branch_students.aggregate(student_pipeline).to_list(length=None),
+            self.async_db.courses.count_documents({"franchise_code": franchise_code}),
+            self.async_db.branch_students.aggregate(financial_pipeline).to_list(length=None)
+        )
+        if not franchise:
+            raise HTTPException(status_code=404, detail="Franchise not found")
+        
+        student_stats = {item["_id"]: item["count"] for item in student_rows}
+        return self._format_tenant_stats(franchise, franchise_code, student_stats, course_stats, financial_stats)
+    
+    def _format_tenant_stats(self, franchise, franchise_code, student_stats, course_stats, financial_stats) -> Dict[str, Any]:
         financial_data = financial_stats[0] if financial_stats else {
             "total_fees": 0, "total_discount": 0, "net_revenue": 0
         }
@@ -405,9 +316,8 @@ class MultiTenantManager:
             }
         }
     
-    def log_tenant_activity(self, context: Dict[str, str], action: str, details: Dict = None):
-        """Log tenant-specific activities for audit trail"""
-        log_entry = {
+    def _build_activity_entry(self, context: Dict[str, str], action: str, details: Dict = None) -> Dict[str, Any]:
+        return {
             "franchise_code": context["franchise_code"],
             "branch_code": context.get("branch_code"),
             "user_id": context.get("user_id"),
@@ -416,12 +326,28 @@ class MultiTenantManager:
             "details": details or {},
             "timestamp": "$$NOW"  # MongoDB server time
         }
+    
+    def log_tenant_activity(self, context: Dict[str, str], action: str, details: Dict = None):
+        """Log tenant-specific activities for audit trail"""
+        log_entry = self._build_activity_entry(context, action, details)
         
         try:
             self.db.audit_logs.insert_one(log_entry)
         except Exception as e:
             logger.warning(f"Failed to log activity: {e}")
     
+    async def log_tenant_activity_async(self, context: Dict[str, str], action: str, details: Dict = None):
+        """Async variant of log_tenant_activity (falls back to the sync client)"""
+        if self.async_db is None:
+            return self.log_tenant_activity(context, action, details)
+        
+        log_entry = self._build_activity_entry(context, action, details)
+        
+        try:
+            await self.async_db.audit_logs.insert_one(log_entry)
+        except Exception as e:
+            logger.warning(f"Failed to log activity: {e}")
+    
     def get_branch_students_with_isolation(self, context: Dict[str, str], filters: Dict = None, page: int = 1, limit: int = 20):
         """Get students with full tenant isolation"""
         base_filter = self.create_tenant_filter(context, filters)
@@ -475,6 +401,6 @@ class MultiTenantManager:
         return update_data
 
 # Global instance
-def get_multi_tenant_manager(db):
+def get_multi_tenant_manager(db, async_db=None):
     """Factory function to get MultiTenantManager instance"""
-    return MultiTenantManager(db)
\ No newline at end of file
+    return MultiTenantManager(db, async_db)
\ No newline at end of file
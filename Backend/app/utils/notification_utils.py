@@ -5,7 +5,7 @@ Utility functions for notification system
 from pymongo.database import Database
 from typing import Optional, Dict, Any
 from datetime import datetime
-from app.models.notification import get_notification_collection, get_user_notifications_collection
+from app.models.notification import get_notification_collection
 from app.models.user import get_user_collection
 import re
 import logging
@@ -135,14 +135,13 @@ def create_course_status_notification(db: Database, course_data: Dict[str, Any])
         
         # Get admin users
         user_collection = get_user_collection(db)
-        admin_users = list(user_collection.find({"role": "admin"}))
+        admin_users = list(user_collection.find({"role": "admin"}, {"_id": 1}))
         
         if not admin_users:
             logger.warning("No admin users found to notify")
             return {"success": False, "message": "No admin users found"}
         
         notification_collection = get_notification_collection(db)
-        user_notifications_collection = get_user_notifications_collection(db)
         
         # Generate notification ID
         notification_id = generate_notification_id(db)
@@ -154,11 +153,13 @@ def create_course_status_notification(db: Database, course_data: Dict[str, Any])
             "message": f"New course '{course_title}' is awaiting approval.",
             "type": "course_update",
             "recipient_type": "admins",
+            "recipient_ids": [str(admin["_id"]) for admin in admin_users],
             "priority": "medium",
             "status": "sent",
+            "fanout_status": "pending",
             "author": "System",
             "recipient_count": len(admin_users),
-            "delivered_count": len(admin_users),
+            "delivered_count": 0,
             "read_count": 0,
             "open_rate": 0.0,
             "click_rate": 0.0,
@@ -174,32 +175,9 @@ def create_course_status_notification(db: Database, course_data: Dict[str, Any])
         result = notification_collection.insert_one(notification_doc)
         notification_object_id = result.inserted_id
         
-        # Create individual user notifications
-        user_notification_docs = []
-        for admin in admin_users:
-            admin_id = str(admin["_id"])
-            
-            user_notification_doc = {
-                "notification_id": notification_object_id,
-                "user_id": admin_id,
-                "title": notification_doc["title"],
-                "message": notification_doc["message"],
-                "type": notification_doc["type"],
-                "priority": notification_doc["priority"],
-                "status": "sent",
-                "is_read": False,
-                "read_at": None,
-                "created_at": datetime.utcnow(),
-                "category": notification_doc["category"],
-                "course_id": notification_doc["course_id"],
-                "course_title": course_title
-            }
-            
-            user_notification_docs.append(user_notification_doc)
-        
-        # Bulk insert user notifications
-        if user_notification_docs:
-            user_notifications_collection.insert_many(user_notification_docs)
+        # Delivered to each admin's inbox by the fan-out worker
+        from app.services.notification_fanout import notification_fanout
+        notification_fanout.deliver(notification_object_id)
         
         logger.info(f"✅ Created course status notification for {len(admin_users)} admin users. Course: {course_title}")
         
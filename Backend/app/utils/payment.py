@@ -32,31 +32,14 @@ def verify_razorpay_signature(payload: bytes, signature: str, secret: str) -> bo
     ).hexdigest()
     return hmac.compare_digest(digest, signature)
 
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-
-EMAIL_HOST = "smtp.gmail.com"
-EMAIL_PORT = 587
-EMAIL_ADDRESS = "arzumehreen050@gmail.com"
-EMAIL_PASSWORD = "cpus ctsa fdtm dmqs"
+from app.services.email_outbox import enqueue_email
 
 def send_email_receipt(to_email: str, subject: str, html_body: str):
+    """Queue a receipt email in the outbox (returns immediately)"""
     try:
-        msg = MIMEMultipart("alternative")
-        msg["From"] = EMAIL_ADDRESS
-        msg["To"] = to_email
-        msg["Subject"] = subject
-        msg.attach(MIMEText(html_body, "html"))
-
-        with smtplib.SMTP(EMAIL_HOST, EMAIL_PORT) as server:
-            server.starttls()
-            server.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
-            server.sendmail(EMAIL_ADDRESS, to_email, msg.as_string())
-
-        print(f"✅ Receipt email sent to {to_email}")
+        enqueue_email([to_email], subject, html_body=html_body, category="receipt")
     except Exception as e:
-        print(f"❌ Failed to send email: {e}")
+        print(f"❌ Failed to queue receipt email: {e}")
 
 from datetime import datetime
 
@@ -0,0 +1,107 @@
+"""
+Template and font registry for certificate, marksheet and ID-card rendering
+
+Decoding a template PNG and loading TrueType fonts dominates the cost of
+rendering a single document. The registry keeps one decoded copy of each
+template and one instance of each (font, size) per process and hands out
+cheap in-memory copies of the templates. Entries are revalidated against the
+file's mtime/size on every lookup, and ``invalidate_templates`` drops them
+explicitly (e.g. after a template upload).
+"""
+from typing import Dict, Optional, Tuple
+import os
+import threading
+import logging
+from PIL import Image, ImageFont
+
+logger = logging.getLogger("uvicorn")
+
+
+def _file_signature(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class TemplateRegistry:
+    """Process-wide cache of decoded template images and loaded fonts"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (abspath, mode) -> (signature, image)
+        self._images: Dict[Tuple[str, str], tuple] = {}
+        # (path, size) -> (signature, font)
+        self._fonts: Dict[Tuple[str, int], tuple] = {}
+
+    def get_template(self, path: str, mode: str = "RGB") -> Image.Image:
+        """Return a fresh copy of the template at ``path`` converted to ``mode``
+
+        The copy is the caller's to draw on; the cached original is never handed out.
+        Raises FileNotFoundError if the file does not exist.
+        """
+        path = os.path.abspath(path)
+        signature = _file_signature(path)
+        if signature is None:
+            self.invalidate(path)
+            raise FileNotFoundError(f"Template not found: {path}")
+
+        key = (path, mode)
+        with self._lock:
+            cached = self._images.get(key)
+        if cached is None or cached[0] != signature:
+            with Image.open(path) as source:
+                image = source.convert(mode)
+            image.load()
+            with self._lock:
+                self._images[key] = (signature, image)
+            logger.info(f"[TEMPLATES] Loaded template {path} ({mode}, {image.size[0]}x{image.size[1]})")
+            cached = (signature, image)
+        return cached[1].copy()
+
+    def get_font(self, path: str, size: int) -> ImageFont.FreeTypeFont:
+        """Return a shared TrueType font; raises like ``ImageFont.truetype`` if it cannot be loaded
+
+        ``path`` may also be a bare font name ("arial.ttf") resolved by PIL, in
+        which case there is no file to revalidate against.
+        """
+        key = (path, size)
+        signature = _file_signature(path)
+        with self._lock:
+            cached = self._fonts.get(key)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        font = ImageFont.truetype(path, size)
+        with self._lock:
+            self._fonts[key] = (signature, font)
+        return font
+
+    def invalidate(self, path: str = None):
+        """Drop cached entries for one file, or everything when ``path`` is None"""
+        with self._lock:
+            if path is None:
+                self._images.clear()
+                self._fonts.clear()
+                return
+            abspath = os.path.abspath(path)
+            for key in [k for k in self._images if k[0] == abspath]:
+                del self._images[key]
+            for key in [k for k in self._fonts if k[0] in (path, abspath)]:
+                del self._fonts[key]
+
+
+template_registry = TemplateRegistry()
+
+
+def load_template(path: str, mode: str = "RGB") -> Image.Image:
+    return template_registry.get_template(path, mode)
+
+
+def load_font(path: str, size: int) -> ImageFont.FreeTypeFont:
+    return template_registry.get_font(path, size)
+
+
+def invalidate_templates(path: str = None):
+    template_registry.invalidate(path)
@@ -0,0 +1,76 @@
+"""
+Authentication policy per URL path
+
+InjectUserMiddleware used to decide whether a request needs a user by scanning
+the whole ``SAFE_PATHS`` list with ``startswith`` plus a substring scan for the
+static directories - on every request, including static files and video range
+requests. The policy is now compiled once at startup into a character trie and
+looked up by longest matching prefix, in time proportional to the path length:
+
+- ``PUBLIC``: never authenticated (static mounts, docs, health checks)
+- ``OPTIONAL``: a user is injected if a valid token is sent, failures are ignored
+- ``REQUIRED``: everything else; failures are logged, the route dependency rejects
+
+Static mounts and the docs/OpenAPI URLs are read from the application itself,
+so only the optional-auth API prefixes are kept by hand.
+"""
+from typing import Iterable
+from starlette.routing import Mount
+from starlette.staticfiles import StaticFiles
+
+PUBLIC = "public"
+OPTIONAL = "optional"
+REQUIRED = "required"
+
+# Trie node key holding the policy of the prefix ending at that node
+_POLICY = ""
+
+
+class RoutePolicyTable:
+    """Longest-prefix lookup of the auth policy of a path"""
+
+    def __init__(self, default: str = REQUIRED):
+        self.default = default
+        self._root: dict = {}
+        self._prefixes = 0
+
+    def add(self, prefix: str, policy: str):
+        node = self._root
+        for char in prefix:
+            node = node.setdefault(char, {})
+        if _POLICY not in node:
+            self._prefixes += 1
+        node[_POLICY] = policy
+
+    def policy_for(self, path: str) -> str:
+        node = self._root
+        policy = node.get(_POLICY, self.default)
+        for char in path:
+            node = node.get(char)
+            if node is None:
+                break
+            policy = node.get(_POLICY, policy)
+        return policy
+
+    def __len__(self) -> int:
+        return self._prefixes
+
+
+def compile_route_policies(app, optional_prefixes: Iterable[str], public_prefixes: Iterable[str] = ()) -> RoutePolicyTable:
+    """Build the policy table for ``app``
+
+    Static file mounts and the docs/OpenAPI URLs are public; ``optional_prefixes``
+    are the public API prefixes that still accept a token.
+    """
+    table = RoutePolicyTable()
+    for prefix in optional_prefixes:
+        table.add(prefix, OPTIONAL)
+    for prefix in public_prefixes:
+        table.add(prefix, PUBLIC)
+    for url in (app.docs_url, app.redoc_url, app.openapi_url):
+        if url:
+            table.add(url, PUBLIC)
+    for route in app.routes:
+        if isinstance(route, Mount) and isinstance(route.app, StaticFiles):
+            table.add(f"{route.path}/", PUBLIC)
+    return table
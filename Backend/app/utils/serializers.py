@@ -6,6 +6,9 @@ from typing import Any, Dict, List, Union
 from fastapi.responses import JSONResponse
 from decimal import Decimal
 
+# Internal bookkeeping fields that never leave the API (search index, see services/search_service.py)
+HIDDEN_FIELDS = frozenset({"search_terms", "search_words", "search_version"})
+
 def serialize_document(doc, id_field="_id", rename_to="id"):
     """Serialize MongoDB documents and handle ObjectId + nested objects recursively"""
     
@@ -15,6 +18,8 @@ def serialize_document(doc, id_field="_id", rename_to="id"):
     if isinstance(doc, dict):
         serialized = {}
         for key, value in doc.items():
+            if key in HIDDEN_FIELDS:
+                continue
             if isinstance(value, ObjectId):
                 serialized[key] = str(value)
             elif isinstance(value, datetime):
@@ -0,0 +1,143 @@
+"""
+Chunked upload streaming
+
+Upload handlers used to ``await file.read()`` the whole body and write it with a
+blocking ``open().write()``, so a large lecture video sat entirely in one
+worker's memory. These helpers move bytes from an ``UploadFile`` or a raw
+request stream to disk in fixed-size chunks, enforcing the size limit, checking
+the file signature on the first bytes and hashing while the data passes.
+"""
+from pathlib import Path
+from typing import AsyncIterator, Optional
+import hashlib
+import os
+import uuid
+import anyio
+from fastapi import HTTPException, UploadFile
+from starlette.requests import ClientDisconnect
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB
+SNIFF_BYTES = 16
+
+
+def sniff_file_kind(head: bytes) -> Optional[str]:
+    """Classify a file by its leading bytes: "image", "video", "pdf" or None"""
+    if head.startswith((b"\xff\xd8\xff", b"\x89PNG\r\n\x1a\n", b"GIF87a", b"GIF89a")):
+        return "image"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image"
+    if head.startswith(b"%PDF-"):
+        return "pdf"
+    # ISO base media (mp4/mov), Matroska/WebM, AVI, ASF/WMV
+    if head[4:8] in (b"ftyp", b"moov", b"mdat", b"wide", b"free", b"skip"):
+        return "video"
+    if head.startswith(b"\x1a\x45\xdf\xa3"):
+        return "video"
+    if head[:4] == b"RIFF" and head[8:12] == b"AVI ":
+        return "video"
+    if head.startswith(b"\x30\x26\xb2\x75\x8e\x66\xcf\x11"):
+        return "video"
+    return None
+
+
+def _check_kind(head: bytes, expected_kind: str):
+    if sniff_file_kind(head) != expected_kind:
+        raise HTTPException(
+            status_code=400,
+            detail=f"File content does not look like a valid {expected_kind}"
+        )
+
+
+async def iter_upload_file(file: UploadFile, chunk_size: int = UPLOAD_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """Yield an UploadFile's content in fixed-size chunks"""
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+async def write_stream(
+    chunks: AsyncIterator[bytes],
+    path: Path,
+    offset: int = 0,
+    max_bytes: Optional[int] = None,
+    expected_kind: Optional[str] = None,
+    digest=None
+) -> int:
+    """Write ``chunks`` into ``path`` starting at ``offset`` and return the number of bytes written
+
+    The file is truncated at ``offset`` first, so bytes left behind by an
+    interrupted write are discarded. More than ``max_bytes`` in this call is
+    rejected with 413. When ``expected_kind`` is given and ``offset`` is 0 the
+    leading bytes must match that kind (400). ``digest`` (a hashlib object) is
+    updated with every chunk. A client disconnect ends the write early; what was
+    received up to then stays on disk and is counted.
+    """
+    written = 0
+    head = b""
+    check_head = expected_kind is not None and offset == 0
+
+    async with await anyio.open_file(path, "wb" if offset == 0 else "r+b") as f:
+        if offset:
+            await f.seek(offset)
+            await f.truncate()
+        try:
+            async for chunk in chunks:
+                if not chunk:
+                    continue
+                if max_bytes is not None and written + len(chunk) > max_bytes:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"File too large. Maximum size: {max_bytes // (1024*1024)}MB"
+                    )
+                if check_head and len(head) < SNIFF_BYTES:
+                    head += chunk[:SNIFF_BYTES - len(head)]
+                    if len(head) >= SNIFF_BYTES:
+                        _check_kind(head, expected_kind)
+                await f.write(chunk)
+                if digest is not None:
+                    digest.update(chunk)
+                written += len(chunk)
+        except ClientDisconnect:
+            return written
+
+    if check_head and 0 < len(head) < SNIFF_BYTES:
+        _check_kind(head, expected_kind)
+    return written
+
+
+async def save_upload(file: UploadFile, dest: Path, max_bytes: int, expected_kind: Optional[str] = None) -> dict:
+    """Stream ``file`` to ``dest`` and return its size and sha256
+
+    Bytes go to a hidden sibling file that only replaces ``dest`` once the
+    whole upload has been accepted, so a rejected or failed upload never
+    clobbers the existing file.
+    """
+    digest = hashlib.sha256()
+    tmp_path = dest.with_name(f".{dest.name}.{uuid.uuid4().hex}.part")
+    try:
+        size = await write_stream(
+            iter_upload_file(file), tmp_path,
+            max_bytes=max_bytes, expected_kind=expected_kind, digest=digest
+        )
+        if size == 0:
+            raise HTTPException(status_code=400, detail="Uploaded file is empty")
+        os.replace(tmp_path, dest)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return {"path": dest, "size": size, "sha256": digest.hexdigest()}
+
+
+def hash_file(path: Path, chunk_size: int = UPLOAD_CHUNK_SIZE) -> str:
+    """sha256 of a file on disk, read in chunks (blocking - run in a thread)"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+async def hash_file_async(path: Path) -> str:
+    return await anyio.to_thread.run_sync(hash_file, path)
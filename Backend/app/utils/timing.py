@@ -0,0 +1,28 @@
+"""
+Request latency budgets
+
+Hot endpoints record how long they took in a ``Server-Timing`` header so load
+tests and benchmarks can assert on it without parsing logs, and log a warning
+when they exceed their configured budget.
+"""
+from fastapi import Response
+import logging
+import time
+
+logger = logging.getLogger("uvicorn")
+
+
+def record_latency(response: Response, name: str, started: float, budget_ms: float = None) -> float:
+    """Add ``Server-Timing: <name>;dur=<ms>`` to the response and check the budget
+
+    ``started`` is a ``time.perf_counter()`` value taken at the start of the
+    handler. Returns the elapsed time in milliseconds.
+    """
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    timing = f"{name};dur={elapsed_ms:.1f}"
+    if budget_ms:
+        timing += f", {name}-budget;dur={budget_ms:g}"
+        if elapsed_ms > budget_ms:
+            logger.warning(f"[Latency] {name} took {elapsed_ms:.1f}ms (budget {budget_ms:g}ms)")
+    response.headers["Server-Timing"] = timing
+    return elapsed_ms
@@ -0,0 +1,45 @@
+"""Single and bulk branch certificates draw from one number series"""
+from app.services.certificate_service import allocate_branch_certificate_numbers, next_branch_certificate_number
+
+
+class FakeCounters:
+    def __init__(self):
+        self.docs = {}
+
+    def update_one(self, query, update, upsert=False):
+        doc = self.docs.get(query["_id"])
+        if doc is None:
+            if not upsert:
+                return
+            doc = self.docs[query["_id"]] = {"seq": 0}
+        doc["seq"] = max(doc["seq"], update["$max"]["seq"])
+
+    def find_one_and_update(self, query, update, projection=None, return_document=None):
+        doc = self.docs.get(query["_id"])
+        if doc is not None:
+            doc["seq"] += update["$inc"]["seq"]
+        return doc
+
+
+class FakeCertificates:
+    def __init__(self, count):
+        self.count = count
+        self.counted = 0
+
+    def count_documents(self, query):
+        self.counted += 1
+        return self.count
+
+
+class FakeDB(dict):
+    def __getattr__(self, name):
+        return self[name]
+
+
+def test_single_certificates_continue_the_bulk_series():
+    db = FakeDB(counters=FakeCounters(), branch_certificates=FakeCertificates(4))
+    assert next_branch_certificate_number(db, "FR001") == 5
+    assert allocate_branch_certificate_numbers(db, "FR001", 3) == 6
+    assert next_branch_certificate_number(db, "FR001") == 9
+    assert next_branch_certificate_number(db, "FR002") == 5
+    assert db.branch_certificates.counted == 2  # seeded once per franchise
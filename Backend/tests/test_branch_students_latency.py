@@ -0,0 +1,165 @@
+"""Database work of GET /branch/students on a 100-student page
+
+The database is an in-memory fake that evaluates the handler's filters, so
+the tests check which students and ID cards a page returns and how many
+queries it costs - one for the students and one batched ID card lookup,
+however many students are on the page. Wall time is reported separately by
+the Server-Timing header against ``STUDENT_LIST_LATENCY_BUDGET_MS``.
+"""
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from bson import ObjectId
+from fastapi import Response
+
+from app.api.branch_student import get_branch_students
+
+PAGE_SIZE = 100
+
+BRANCH_ADMIN = {
+    "user_id": "admin-1",
+    "email": "admin@branch.test",
+    "role": "branch_admin",
+    "is_branch_admin": True,
+    "franchise_code": "FR001",
+    "branch_code": "BR001"
+}
+
+
+def matches(doc, query):
+    """The subset of MongoDB filters the student list uses"""
+    for field, condition in query.items():
+        if field == "$or":
+            if not any(matches(doc, branch) for branch in condition):
+                return False
+        elif isinstance(condition, dict) and "$in" in condition:
+            if field not in doc or doc[field] not in condition["$in"]:
+                return False
+        elif isinstance(condition, dict):
+            raise NotImplementedError(f"unsupported filter {condition}")
+        elif doc.get(field) != condition:
+            return False
+    return True
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def skip(self, n):
+        return FakeCursor(self.docs[n:])
+
+    def limit(self, n):
+        return FakeCursor(self.docs[:n])
+
+    def sort(self, field, direction=1):
+        return FakeCursor(sorted(self.docs, key=lambda d: d.get(field), reverse=direction < 0))
+
+    async def to_list(self, length=None):
+        return self.docs if length is None else self.docs[:length]
+
+    async def __aiter__(self):
+        for doc in self.docs:
+            yield doc
+
+
+class FakeCollection:
+    def __init__(self, docs=None):
+        self.docs = docs or []
+        self.queries = 0
+
+    def find(self, query=None, projection=None):
+        self.queries += 1
+        return FakeCursor([doc for doc in self.docs if matches(doc, query or {})])
+
+    async def insert_one(self, doc):
+        self.docs.append(doc)
+        return SimpleNamespace(inserted_id=ObjectId())
+
+
+def make_db():
+    created = datetime(2024, 1, 1)
+
+    def student(i, branch_code="BR001"):
+        return {
+            "_id": ObjectId(),
+            "registration_number": f"REG{branch_code}{i:04d}",
+            "student_name": f"Student {i}",
+            "email_id": f"student{i}@branch.test",
+            "contact_no": f"98765{i:05d}",
+            "course": "Computer Applications",
+            "batch": "2024-A",
+            "branch_code": branch_code,
+            "franchise_code": "FR001",
+            "created_at": created + timedelta(minutes=i),
+            "father_name": f"Parent {i}",
+            "photo_url": f"/uploads/students/{i}.jpg"
+        }
+
+    students = [student(i) for i in range(PAGE_SIZE)]
+    others = [student(i, "BR002") for i in range(10)]
+
+    def card(number, **link):
+        return {"_id": ObjectId(), "card_number": number, "status": "active", "created_at": created, **link}
+
+    cards = (
+        # Linked by student id (every fourth student)
+        [card(f"ID{i:04d}", student_id=str(students[i]["_id"])) for i in range(0, PAGE_SIZE, 4)]
+        # Linked by registration number only, under either field name
+        + [card(f"RN{i:04d}", registration_number=students[i]["registration_number"]) for i in range(1, PAGE_SIZE, 4)]
+        + [card(f"SR{i:04d}", student_registration=students[i]["registration_number"]) for i in range(2, PAGE_SIZE, 4)]
+        # A student id link wins over a registration link
+        + [card("LOSER", registration_number=students[0]["registration_number"])]
+        # Another branch's cards never match this page
+        + [card(f"XX{i:04d}", student_id=str(other["_id"])) for i, other in enumerate(others)]
+    )
+    return SimpleNamespace(
+        branch_students=FakeCollection(students + others),
+        branch_id_cards=FakeCollection(cards),
+        audit_logs=FakeCollection()
+    )
+
+
+def request_for(async_db):
+    return SimpleNamespace(app=SimpleNamespace(mongodb=None, mongodb_async=async_db))
+
+
+async def list_page(async_db, limit=PAGE_SIZE):
+    response = Response()
+    result = await get_branch_students(
+        request_for(async_db), response, branch_code=None, course=None, batch=None,
+        admission_year=None, search=None, page=1, limit=limit, current_user=BRANCH_ADMIN
+    )
+    return result, response
+
+
+def test_page_of_100_students_is_complete():
+    result, response = asyncio.run(list_page(make_db()))
+
+    assert result["total"] == PAGE_SIZE
+    assert {student["branch_code"] for student in result["students"]} == {"BR001"}
+    assert result["students"][0]["registration_number"] == f"REGBR001{PAGE_SIZE - 1:04d}"
+    assert response.headers["Server-Timing"].startswith("students;dur=")
+
+
+def test_id_cards_are_matched_by_id_then_registration():
+    result, _ = asyncio.run(list_page(make_db()))
+    cards = {
+        int(student["registration_number"][-4:]): student["id_card"]["card_number"]
+        for student in result["students"] if student["has_id_card"]
+    }
+
+    expected = {}
+    for i in range(PAGE_SIZE):
+        if i % 4 < 3:
+            expected[i] = f"{['ID', 'RN', 'SR'][i % 4]}{i:04d}"
+    assert cards == expected
+
+
+def test_page_costs_one_query_per_collection():
+    for limit in (10, PAGE_SIZE):
+        async_db = make_db()
+        asyncio.run(list_page(async_db, limit))
+        assert async_db.branch_students.queries == 1
+        assert async_db.branch_id_cards.queries == 1
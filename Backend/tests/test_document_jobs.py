@@ -0,0 +1,96 @@
+"""Bulk document job ownership and recovery of interrupted jobs"""
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from app.api.branch import _get_owned_document_job
+from app.services.bulk_document_service import (
+    INTERRUPTED_ERROR,
+    JOB_STALE_SECONDS,
+    JOBS_COLLECTION,
+    recover_interrupted_jobs
+)
+
+NOW = datetime(2025, 1, 1, 12)
+STALE = NOW - timedelta(seconds=JOB_STALE_SECONDS + 1)
+FRESH = NOW - timedelta(seconds=5)
+
+
+class AsyncJobs:
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def find_one(self, query):
+        return next((doc for doc in self.docs if doc["_id"] == query["_id"]), None)
+
+
+def owned(job, user):
+    request = SimpleNamespace(app=SimpleNamespace(mongodb_async={JOBS_COLLECTION: AsyncJobs([job])}))
+    return asyncio.run(_get_owned_document_job(request, job["_id"], user))
+
+
+BRANCH_JOB = {"_id": "j1", "franchise_code": "FR001", "branch_code": "BR001"}
+FRANCHISE_JOB = {"_id": "j2", "franchise_code": "FR001", "branch_code": "FR001"}
+
+
+@pytest.mark.parametrize("job, user, allowed", [
+    (BRANCH_JOB, {"franchise_code": "FR001", "branch_code": "BR001"}, True),
+    (BRANCH_JOB, {"franchise_code": "FR001", "branch_code": "BR002"}, False),
+    (BRANCH_JOB, {"franchise_code": "FR002", "branch_code": "BR001"}, False),
+    (FRANCHISE_JOB, {"franchise_code": "FR001"}, True),
+    (FRANCHISE_JOB, {"franchise_code": "FR001", "branch_code": "BR001"}, False),
+    ({"_id": "j3"}, {}, False),
+])
+def test_jobs_are_visible_to_their_branch_only(job, user, allowed):
+    if allowed:
+        assert owned(job, user) is job
+    else:
+        with pytest.raises(HTTPException) as error:
+            owned(job, user)
+        assert error.value.status_code == 403
+
+
+class Jobs:
+    """update_many for the recovery filter"""
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    def _matches(self, doc, query):
+        if doc["status"] not in query["status"]["$in"]:
+            return False
+        for branch in query["$or"]:
+            if "heartbeat_at" in branch and branch["heartbeat_at"] is None:
+                if doc.get("heartbeat_at") is None and doc["created_at"] < branch["created_at"]["$lt"]:
+                    return True
+            elif doc.get("heartbeat_at") is not None and doc["heartbeat_at"] < branch["heartbeat_at"]["$lt"]:
+                return True
+        return False
+
+    def update_many(self, query, update):
+        modified = 0
+        for doc in self.docs:
+            if self._matches(doc, query):
+                doc.update(update["$set"])
+                doc.setdefault("errors", []).append(update["$push"]["errors"])
+                modified += 1
+        return SimpleNamespace(modified_count=modified)
+
+
+def test_only_jobs_that_stopped_reporting_are_failed():
+    jobs = [
+        {"_id": "crashed", "status": "running", "created_at": STALE, "heartbeat_at": STALE},
+        {"_id": "never_started", "status": "queued", "created_at": STALE, "heartbeat_at": STALE},
+        {"_id": "legacy", "status": "running", "created_at": STALE},
+        {"_id": "live", "status": "running", "created_at": STALE, "heartbeat_at": FRESH},
+        {"_id": "done", "status": "completed", "created_at": STALE, "heartbeat_at": STALE},
+    ]
+    assert recover_interrupted_jobs({JOBS_COLLECTION: Jobs(jobs)}, NOW) == 3
+
+    status = {job["_id"]: job["status"] for job in jobs}
+    assert status == {"crashed": "failed", "never_started": "failed", "legacy": "failed",
+                      "live": "running", "done": "completed"}
+    assert jobs[0]["errors"] == [{"error": INTERRUPTED_ERROR}]
@@ -0,0 +1,121 @@
+"""Large FileResponse downloads through the old and the pure ASGI InjectUserMiddleware
+
+The test checks that both middlewares deliver the file unchanged. Run the
+module directly for the throughput comparison:
+
+    python tests/test_download_throughput.py [size_mb] [rounds]
+
+The ASGI app is driven in-process with a ``send`` that only counts bytes, so
+the figures are middleware + FileResponse cost without network or client
+buffering.
+"""
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from fastapi import FastAPI, Request
+from fastapi.responses import FileResponse
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from app import InjectUserMiddleware
+from app.utils.route_policy import PUBLIC, compile_route_policies
+
+
+class LegacyInjectUserMiddleware(BaseHTTPMiddleware):
+    """The BaseHTTPMiddleware version this middleware replaced (public-path branch)"""
+
+    async def dispatch(self, request: Request, call_next):
+        if request.app.state.route_policies.policy_for(request.url.path) == PUBLIC:
+            request.state.user = None
+        return await call_next(request)
+
+
+def build_app(middleware, file_path: str) -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(middleware)
+
+    @app.get("/download/file")
+    async def download():
+        return FileResponse(file_path, media_type="application/octet-stream")
+
+    app.state.route_policies = compile_route_policies(app, [], ["/download/"])
+    return app
+
+
+async def download(app) -> tuple:
+    """(bytes, chunks, seconds) for one GET of the file"""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": "/download/file", "raw_path": b"/download/file", "root_path": "",
+        "query_string": b"", "headers": [(b"host", b"testserver")],
+        "client": ("127.0.0.1", 1), "server": ("testserver", 80), "state": {}
+    }
+    received = {"bytes": 0, "chunks": 0}
+    requested = []
+    finished = asyncio.Event()
+
+    async def receive():
+        if not requested:
+            requested.append(True)
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await finished.wait()  # the client stays connected until the body is sent
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body" and message.get("body"):
+            received["bytes"] += len(message["body"])
+            received["chunks"] += 1
+        if message["type"] == "http.response.body" and not message.get("more_body", False):
+            finished.set()
+
+    started = time.perf_counter()
+    await app(scope, receive, send)
+    return received["bytes"], received["chunks"], time.perf_counter() - started
+
+
+def make_file(size_mb: int) -> str:
+    handle, path = tempfile.mkstemp(suffix=".bin")
+    with os.fdopen(handle, "wb") as f:
+        chunk = os.urandom(1024 * 1024)
+        for _ in range(size_mb):
+            f.write(chunk)
+    return path
+
+
+def measure(size_mb: int = 256, rounds: int = 5) -> dict:
+    """Median MB/s per middleware"""
+    path = make_file(size_mb)
+    try:
+        results = {}
+        for name, middleware in (("BaseHTTPMiddleware", LegacyInjectUserMiddleware), ("pure ASGI", InjectUserMiddleware)):
+            app = build_app(middleware, path)
+            asyncio.run(download(app))  # warm-up
+            times = [asyncio.run(download(app))[2] for _ in range(rounds)]
+            results[name] = size_mb / statistics.median(times)
+        return results
+    finally:
+        os.remove(path)
+
+
+def test_both_middlewares_deliver_the_whole_file():
+    path = make_file(4)
+    try:
+        legacy = asyncio.run(download(build_app(LegacyInjectUserMiddleware, path)))
+        direct = asyncio.run(download(build_app(InjectUserMiddleware, path)))
+        assert legacy[0] == direct[0] == 4 * 1024 * 1024
+        # FileResponse chunks reach the server's send unchanged
+        assert direct[1] == 4 * 1024 * 1024 // FileResponse.chunk_size
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    for name, rate in measure(size_mb, rounds).items():
+        print(f"{name:>20}: {rate:8.1f} MB/s ({size_mb} MB file, median of {rounds})")
@@ -0,0 +1,68 @@
+"""Outbox records: bodies are dropped at a final status and every message expires"""
+import smtplib
+
+from app.services.email_outbox import OUTBOX, EmailOutbox, ensure_email_outbox_indexes
+
+
+class FakeServer:
+    def __init__(self, errors):
+        self.errors = errors
+
+    def sendmail(self, from_email, to, message):
+        error = self.errors.get(to[0])
+        if error is not None:
+            raise error
+
+
+class FakePool:
+    def __init__(self, errors):
+        self.server = FakeServer(errors)
+
+    def acquire(self):
+        return self.server
+
+    def release(self, server, broken=False):
+        pass
+
+
+class FakeOutbox:
+    def __init__(self, docs):
+        self.docs = {doc["_id"]: doc for doc in docs}
+        self.indexes = []
+
+    def update_one(self, query, update):
+        doc = self.docs[query["_id"]]
+        doc.update(update.get("$set", {}))
+        for field in update.get("$unset", {}):
+            doc.pop(field, None)
+
+    def create_index(self, keys, **options):
+        self.indexes.append((keys, options))
+
+
+def message(_id, to, attempts=1):
+    return {"_id": _id, "to": [to], "subject": "Your OTP", "body": "OTP 123456",
+            "html_body": "<b>OTP 123456</b>", "attachments": [], "attempts": attempts}
+
+
+def test_bodies_are_removed_once_sent_or_failed():
+    outbox = EmailOutbox(FakePool({
+        "bounce@test": smtplib.SMTPRecipientsRefused({"bounce@test": (550, b"no such user")}),
+        "later@test": smtplib.SMTPResponseException(451, b"try again"),
+    }), "lms@test", "LMS", max_attempts=5)
+    docs = [message("sent", "ok@test"), message("failed", "bounce@test"), message("retry", "later@test")]
+    collection = FakeOutbox([dict(doc) for doc in docs])
+
+    outbox._send_batch({OUTBOX: collection}, docs)
+
+    sent, failed, retry = (collection.docs[_id] for _id in ("sent", "failed", "retry"))
+    assert sent["status"] == "sent" and "body" not in sent and "html_body" not in sent
+    assert failed["status"] == "failed" and "body" not in failed and "html_body" not in failed
+    assert retry["status"] == "queued" and retry["body"] == "OTP 123456"
+
+
+def test_every_message_expires_from_creation():
+    collection = FakeOutbox([])
+    ensure_email_outbox_indexes({OUTBOX: collection})
+    ttl = [keys for keys, options in collection.indexes if "expireAfterSeconds" in options]
+    assert ttl == [[("created_at", 1)]]
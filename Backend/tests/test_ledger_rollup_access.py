@@ -0,0 +1,38 @@
+"""Only platform-wide admins may rebuild the revenue rollup"""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from app.api.ledger_routes import require_super_admin
+from app.utils.dependencies import role_required
+
+ROLES = ["super_admin", "admin"]
+
+
+def check(user):
+    request = SimpleNamespace(state=SimpleNamespace(user=user))
+    resolved = asyncio.run(role_required(ROLES)(request))
+    return require_super_admin(resolved)
+
+
+@pytest.mark.parametrize("user", [
+    {"role": "super_admin", "user_id": "sa"},
+    {"role": "admin", "user_id": "a"},
+])
+def test_platform_admins_may_rebuild(user):
+    assert check(user) is user
+
+
+@pytest.mark.parametrize("user", [
+    None,
+    {"role": "student", "user_id": "s"},
+    {"role": "branch_admin", "franchise_code": "FR001", "branch_code": "BR001"},
+    {"role": "franchise_admin", "franchise_code": "FR001"},
+    {"role": "admin", "franchise_code": "FR001"},
+])
+def test_everyone_else_is_forbidden(user):
+    with pytest.raises(HTTPException) as error:
+        check(user)
+    assert error.value.status_code == 403
@@ -0,0 +1,76 @@
+"""Revenue rollup dates and the statistics summary"""
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from app.api import ledger_routes
+from app.services.ledger_rollup_service import ENROLLMENT_DATE_FIELDS, enrollment_contribution, first_date_expr
+
+MISSING = object()
+
+
+def evaluate(expr, doc):
+    """The aggregation operators ``first_date_expr`` uses"""
+    if isinstance(expr, str) and expr.startswith("$"):
+        return doc.get(expr[1:], MISSING)
+    if not isinstance(expr, dict):
+        return expr
+    op, args = next(iter(expr.items()))
+    if op == "$cond":
+        return evaluate(args[1] if evaluate(args[0], doc) else args[2], doc)
+    if op == "$eq":
+        return evaluate(args[0], doc) == evaluate(args[1], doc)
+    if op == "$ifNull":
+        value = evaluate(args[0], doc)
+        return evaluate(args[1], doc) if value is MISSING or value is None else value
+    if op == "$convert":
+        value = evaluate(args["input"], doc)
+        if value is MISSING or value is None:
+            return args["onNull"]
+        if isinstance(value, datetime):
+            return value
+        try:
+            return datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+        except ValueError:
+            return args["onError"]
+    raise NotImplementedError(op)
+
+
+@pytest.mark.parametrize("dates", [
+    {"enrollment_date": "", "created_at": datetime(2024, 3, 5, 10)},
+    {"enrollment_date": None, "created_at": "", "date": "2024-03-05T08:00:00"},
+    {"created_at": datetime(2024, 3, 5, 23, 59)},
+    {"enrollment_date": "", "created_at": ""},
+    {"enrollment_date": "not a date", "created_at": datetime(2024, 3, 5)},
+])
+def test_rebuild_and_incremental_updates_pick_the_same_day(dates):
+    enrollment = {"status": "active", "fee_paid": 100, **dates}
+    contribution = enrollment_contribution(enrollment)
+    parsed = evaluate(first_date_expr(ENROLLMENT_DATE_FIELDS), enrollment)
+
+    if contribution is None:
+        assert parsed is None
+    else:
+        assert parsed.date() == contribution[0][0].date() == datetime(2024, 3, 5).date()
+
+
+def test_summary_reads_the_period_totals_once(monkeypatch):
+    calls = []
+
+    async def breakdown(request, period):
+        calls.append(period)
+        return {"course_revenue": 800.0, "franchise_revenue": 200.0, "total_revenue": 1000.0,
+                "total_payouts": 240.0, "pending_settlements": 150.0, "balance": 610.0}
+
+    async def transactions(request, period, limit):
+        return [{"status": "Completed"}] * 3 + [{"status": "Failed"}]
+
+    monkeypatch.setattr(ledger_routes, "get_financial_breakdown", breakdown)
+    monkeypatch.setattr(ledger_routes, "get_real_transactions", transactions)
+    result = asyncio.run(ledger_routes.get_financial_statistics(None, "month"))
+
+    assert calls == ["month"]
+    assert result["data"]["averageTransactionValue"] == 250
+    assert result["data"]["topRevenueSource"] == "Course Enrollments"
+    assert result["data"]["profitMargin"] == pytest.approx(76.0)
@@ -0,0 +1,72 @@
+"""Logins hold a password-hashing slot only for the bcrypt check"""
+import asyncio
+from types import SimpleNamespace
+
+import bcrypt
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+from app.services import auth_service
+from app.services.password_service import password_hasher
+
+USER = {
+    "_id": ObjectId(), "email": "s@example.com", "name": "S", "role": "student",
+    "password": bcrypt.hashpw(b"secret", bcrypt.gensalt(4)).decode()
+}
+
+
+class FakeUsers:
+    def __init__(self):
+        self.calls = []
+
+    def find_one(self, query):
+        self.calls.append("find_one")
+        return dict(USER) if query["email"] == USER["email"] else None
+
+    def update_one(self, query, update):
+        self.calls.append("update_one")
+
+
+@pytest.fixture
+def users(monkeypatch):
+    collection = FakeUsers()
+    monkeypatch.setattr(auth_service, "get_user_collection", lambda db: collection)
+    return collection
+
+
+@pytest.fixture
+def pool_jobs(monkeypatch):
+    jobs = []
+    original = password_hasher.run
+
+    async def run(fn, *args):
+        jobs.append(fn.__name__)
+        return await original(fn, *args)
+
+    monkeypatch.setattr(password_hasher, "run", run)
+    return jobs
+
+
+def login(password, user=None):
+    credentials = SimpleNamespace(email=USER["email"], password=password)
+    return asyncio.run(auth_service.login_user_async(None, credentials, user))
+
+
+def test_only_the_bcrypt_check_runs_on_the_pool(users, pool_jobs):
+    result = login("secret")
+    assert result["user"]["email"] == USER["email"] and result["access_token"]
+    assert pool_jobs == ["_verify_sync"]
+    assert users.calls == ["find_one", "update_one"]
+
+
+def test_prefetched_user_is_not_looked_up_again(users, pool_jobs):
+    login("secret", dict(USER))
+    assert users.calls == ["update_one"]
+
+
+def test_wrong_password_is_rejected_without_a_login_update(users, pool_jobs):
+    with pytest.raises(HTTPException) as error:
+        login("wrong")
+    assert error.value.status_code == 401
+    assert users.calls == ["find_one"]
@@ -0,0 +1,130 @@
+"""Only admins may send notifications, and tenant admins only to their own tenant"""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+from app.api.notifications import notification_sender, owned_notification, scope_notification
+from app.schemas.notification import AdminNotificationCreate
+from app.services.notification_fanout import ADMIN_ROLES
+from app.utils.dependencies import role_required
+
+BRANCH_STUDENT = ObjectId()
+OTHER_STUDENT = ObjectId()
+BRANCH_NOTICE = ObjectId()
+PLATFORM_NOTICE = ObjectId()
+
+
+class FakeCollection:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find_one(self, query):
+        return next((dict(doc) for doc in self.docs if doc["_id"] == query["_id"]), None)
+
+    def count_documents(self, query, limit=0):
+        def matches(doc):
+            for field, condition in query.items():
+                if isinstance(condition, dict) and "$in" in condition:
+                    if doc.get(field) not in condition["$in"]:
+                        return False
+                elif isinstance(condition, dict) and "$ne" in condition:
+                    if doc.get(field) == condition["$ne"]:
+                        return False
+                elif doc.get(field) != condition:
+                    return False
+            return True
+        return sum(1 for doc in self.docs if matches(doc))
+
+
+DB = {
+    "users": FakeCollection([]),
+    "branch_students": FakeCollection([
+        {"_id": BRANCH_STUDENT, "franchise_code": "FR001", "branch_code": "BR001"},
+        {"_id": OTHER_STUDENT, "franchise_code": "FR002", "branch_code": "BR002"},
+    ]),
+    "notifications": FakeCollection([
+        {"_id": BRANCH_NOTICE, "franchise_code": "FR001", "branch_code": "BR001"},
+        {"_id": PLATFORM_NOTICE, "recipient_type": "all"},
+    ])
+}
+
+
+def sender(user):
+    request = SimpleNamespace(state=SimpleNamespace(user=user))
+    return notification_sender(asyncio.run(role_required(ADMIN_ROLES)(request)))
+
+
+def payload(**fields):
+    return AdminNotificationCreate(title="Holiday", message="Closed tomorrow", **fields)
+
+
+@pytest.mark.parametrize("user", [None, {"role": "student"}, {"role": "instructor", "franchise_code": "FR001"}])
+def test_non_admins_cannot_send(user):
+    with pytest.raises(HTTPException) as error:
+        sender(user)
+    assert error.value.status_code == 403
+
+
+@pytest.mark.parametrize("user", [{"role": "super_admin"}, {"role": "admin"}])
+def test_platform_admins_keep_their_audience(user):
+    requested = payload(recipient_type="all", franchise_code="FR002")
+    assert scope_notification(DB, requested, sender(user)) is requested
+
+
+def test_branch_admin_is_pinned_to_their_branch():
+    user = {"role": "branch_admin", "franchise_code": "FR001", "branch_code": "BR001"}
+    scoped = scope_notification(DB, payload(franchise_code="FR002", branch_code="BR002"), sender(user))
+    assert (scoped.franchise_code, scoped.branch_code) == ("FR001", "BR001")
+
+
+def test_franchise_admin_cannot_broadcast_platform_wide():
+    user = {"role": "admin", "franchise_code": "FR001"}
+    scoped = scope_notification(DB, payload(recipient_type="all"), sender(user))
+    assert scoped.franchise_code == "FR001"
+    assert scoped.branch_code is None
+
+
+def test_franchise_admin_may_narrow_to_a_branch():
+    user = {"role": "franchise_admin", "franchise_code": "FR001"}
+    scoped = scope_notification(DB, payload(franchise_code="FR002", branch_code="BR001"), sender(user))
+    assert (scoped.franchise_code, scoped.branch_code) == ("FR001", "BR001")
+
+
+def test_tenant_admin_without_codes_is_forbidden():
+    with pytest.raises(HTTPException) as error:
+        scope_notification(DB, payload(), sender({"role": "branch_admin"}))
+    assert error.value.status_code == 403
+
+
+def test_target_user_must_be_in_scope():
+    user = {"role": "branch_admin", "franchise_code": "FR001", "branch_code": "BR001"}
+    assert scope_notification(DB, payload(target_user_id=str(BRANCH_STUDENT)), sender(user)).target_user_id
+    with pytest.raises(HTTPException) as error:
+        scope_notification(DB, payload(target_user_id=str(OTHER_STUDENT)), sender(user))
+    assert error.value.status_code == 403
+
+
+@pytest.mark.parametrize("user, notice, allowed", [
+    ({"role": "super_admin"}, PLATFORM_NOTICE, True),
+    ({"role": "branch_admin", "franchise_code": "FR001", "branch_code": "BR001"}, BRANCH_NOTICE, True),
+    ({"role": "franchise_admin", "franchise_code": "FR001"}, BRANCH_NOTICE, True),
+    ({"role": "franchise_admin", "franchise_code": "FR001"}, PLATFORM_NOTICE, False),
+    ({"role": "branch_admin", "franchise_code": "FR001", "branch_code": "BR009"}, BRANCH_NOTICE, False),
+    ({"role": "admin", "franchise_code": "FR002"}, BRANCH_NOTICE, False),
+])
+def test_only_the_owning_tenant_may_change_a_notification(user, notice, allowed):
+    if allowed:
+        assert owned_notification(DB, str(notice), sender(user))["id"] == str(notice)
+    else:
+        with pytest.raises(HTTPException) as error:
+            owned_notification(DB, str(notice), sender(user))
+        assert error.value.status_code == 403
+
+
+def test_changing_a_missing_notification_is_not_found():
+    with pytest.raises(HTTPException) as error:
+        owned_notification(DB, str(ObjectId()), sender({"role": "super_admin"}))
+    assert error.value.status_code == 404
@@ -0,0 +1,57 @@
+"""Failed fan-out work is retried by the worker's periodic sweep"""
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from app.services.notification_fanout import NotificationFanout, PENDING, RUNNING, STALE_DELIVERY
+
+
+class FakeNotifications:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, query, projection=None):
+        def matches(doc):
+            if doc.get("status") != query["status"]:
+                return False
+            for clause in query["$or"]:
+                started = clause.get("fanout_started_at")
+                if doc.get("fanout_status") == clause["fanout_status"] and (
+                        started is None or doc["fanout_started_at"] < started["$lt"]):
+                    return True
+            return False
+        return [{"_id": doc["_id"]} for doc in self.docs if matches(doc)]
+
+
+def test_sweep_requeues_pending_and_stale_deliveries():
+    now = datetime.utcnow()
+    pending, stale, fresh = ObjectId(), ObjectId(), ObjectId()
+    db = {"notifications": FakeNotifications([
+        {"_id": pending, "status": "sent", "fanout_status": PENDING},
+        {"_id": stale, "status": "sent", "fanout_status": RUNNING, "fanout_started_at": now - STALE_DELIVERY * 2},
+        {"_id": fresh, "status": "sent", "fanout_status": RUNNING, "fanout_started_at": now - timedelta(seconds=5)},
+    ])}
+    worker = NotificationFanout()
+    worker._sweep(db)
+    assert worker._jobs == [("deliver", str(pending)), ("deliver", str(stale))]
+
+
+def test_failed_retraction_is_retried_on_the_next_sweep(monkeypatch):
+    worker = NotificationFanout()
+    attempts = []
+
+    def flaky_retraction(db, notification_id):
+        attempts.append(notification_id)
+        if len(attempts) == 1:
+            raise ConnectionError("primary stepped down")
+        return 1
+
+    monkeypatch.setattr(worker, "run_retraction", flaky_retraction)
+    worker.retract("n1")
+    worker._drain()
+    assert worker._jobs == []
+
+    worker._sweep({"notifications": FakeNotifications([])})
+    worker._drain()
+    assert attempts == ["n1", "n1"]
+    assert worker._failed_retractions == set()
@@ -0,0 +1,38 @@
+"""Buffered heartbeats report the stored completion state"""
+import asyncio
+from types import SimpleNamespace
+
+from app.api import progress as progress_api
+from app.api.progress import ProgressUpdateRequest, update_progress
+from app.services.progress_buffer import ProgressBuffer
+
+USER = {"user_id": "u1"}
+
+
+class FakeProgress:
+    def __init__(self, docs):
+        self.docs = docs
+        self.reads = 0
+
+    def find_one(self, query, projection=None):
+        self.reads += 1
+        return next((doc for doc in self.docs if all(doc.get(k) == v for k, v in query.items())), None)
+
+
+def heartbeat(db, content_id, watched=10.0):
+    request = SimpleNamespace(app=SimpleNamespace(mongodb=db))
+    data = ProgressUpdateRequest(course_id="c1", content_id=content_id, watched_duration=watched, total_duration=100.0)
+    return asyncio.run(update_progress(request, data, USER))
+
+
+def test_heartbeat_response_carries_completion(monkeypatch):
+    monkeypatch.setattr(progress_api, "progress_buffer", ProgressBuffer())
+    collection = FakeProgress([{"user_id": "u1", "course_id": "c1", "content_id": "done", "completed": True}])
+    db = {"user_progress": collection}
+
+    first = heartbeat(db, "done")
+    assert first["buffered"] and first["progress"]["completed"] is True
+    assert heartbeat(db, "done", watched=20.0)["progress"]["completed"] is True
+    assert collection.reads == 1  # remembered while the heartbeat is buffered
+
+    assert heartbeat(db, "new")["progress"]["completed"] is False
@@ -0,0 +1,163 @@
+"""Stream tickets, session re-checks and change stream reconnects of the realtime channel"""
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi import HTTPException
+from jose import jwt
+
+from app.api import realtime
+from app.config import settings
+from app.services import realtime_hub as hub_module
+from app.services.realtime_hub import RealtimeHub, event_stream, load_topics
+from app.services.token_registry import token_registry
+
+SESSION = {"user_id": "u-stream", "tv": 0, "exp": None}
+
+
+# ------------------- Tickets -------------------
+
+def test_ticket_opens_one_stream_only():
+    ticket = realtime.issue_ticket({"branch_code": "BR001"}, SESSION)
+    user, session = realtime.redeem_ticket(ticket)
+    assert user == {"user_id": "u-stream", "branch_code": "BR001"}
+    assert session == SESSION
+    with pytest.raises(HTTPException) as error:
+        realtime.redeem_ticket(ticket)
+    assert error.value.status_code == 401
+
+
+def test_tickets_and_access_tokens_are_not_interchangeable():
+    ticket = realtime.issue_ticket({}, SESSION)
+    with pytest.raises(Exception):
+        jwt.decode(ticket, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
+    access_token = jwt.encode({"user_id": "u-stream", "typ": realtime.TICKET_TYPE, "sub": "u-stream"},
+                              settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM)
+    with pytest.raises(HTTPException):
+        realtime.redeem_ticket(access_token)
+
+
+def test_session_checks_revocation_and_expiry():
+    assert realtime.session_valid(SESSION)
+    assert not realtime.session_valid({**SESSION, "exp": time.time() - 1})
+    token_registry._merge("u-revoked", 1)
+    assert not realtime.session_valid({"user_id": "u-revoked", "tv": 0, "exp": None})
+
+
+# ------------------- Stream body -------------------
+
+def test_stream_closes_when_the_session_ends():
+    async def run():
+        hub = RealtimeHub()
+        subscription = hub.subscribe(["user:u-stream"])
+        checks = iter([True, False])
+
+        async def connected():
+            return False
+
+        frames = [frame async for frame in event_stream(subscription, 0.01, connected, lambda: next(checks))]
+        return frames, hub.stats()["connections"]
+
+    frames, connections = asyncio.run(run())
+    assert frames[0].startswith("id: 0\nevent: ready")
+    assert frames[1] == ": heartbeat\n\n"
+    assert "event: unauthorized" in frames[2] and len(frames) == 3
+    assert connections == 0
+
+
+def test_topics_come_from_the_async_database():
+    class Cursor:
+        def __init__(self, docs):
+            self.docs = docs
+
+        async def to_list(self, length=None):
+            return self.docs
+
+    class Enrollments:
+        def find(self, query, projection):
+            assert "u-stream" in query["student_id"]["$in"]
+            return Cursor([{"course_id": "c1"}, {"course_id": None}])
+
+    async_db = type("AsyncDB", (), {"enrollments": Enrollments()})()
+    topics = asyncio.run(load_topics(async_db, {"user_id": "u-stream", "branch_code": "BR001"}))
+    assert topics == ["user:u-stream", "branch:BR001", "course:c1"]
+
+
+# ------------------- Change stream -------------------
+
+class Interrupted(Exception):
+    def __init__(self, code=None):
+        super().__init__(f"code {code}")
+        self.code = code
+
+
+class FakeStream:
+    def __init__(self, changes, error=None):
+        self.changes = changes
+        self.error = error
+        self.resume_token = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def close(self):
+        pass
+
+    def __iter__(self):
+        for index, change in enumerate(self.changes):
+            self.resume_token = {"_data": f"t{index}"}
+            yield change
+        if self.error is not None:
+            raise self.error
+
+
+class FakeDB:
+    def __init__(self, streams):
+        self.streams = streams
+        self.resume_tokens = []
+        self.done = threading.Event()
+
+    def watch(self, pipeline, full_document=None, resume_after=None):
+        self.resume_tokens.append(resume_after)
+        if not self.streams:
+            self.done.set()
+            raise Interrupted(40573)
+        stream = self.streams.pop(0)
+        if isinstance(stream, Exception):
+            raise stream
+        return stream
+
+
+def change(user_id):
+    return {"ns": {"coll": "user_notifications"}, "operationType": "insert",
+            "fullDocument": {"user_id": user_id, "title": "t"}}
+
+
+def test_watcher_reconnects_from_the_resume_token(monkeypatch):
+    monkeypatch.setattr(hub_module, "WATCH_RETRY_BASE_SECONDS", 0)
+    db = FakeDB([
+        FakeStream([change("a"), change("b")], error=Interrupted()),  # network blip mid-stream
+        Interrupted(),                                                # failover: reconnect refused once
+        FakeStream([change("c")], error=Interrupted()),
+    ])
+    hub = RealtimeHub()
+    dispatched = []
+    monkeypatch.setattr(hub, "_dispatch", lambda change: dispatched.append(change["fullDocument"]["user_id"]))
+    hub.start(db)
+    assert db.done.wait(5)
+    hub._watcher.join(5)
+    assert dispatched == ["a", "b", "c"]
+    assert db.resume_tokens == [None, {"_data": "t1"}, {"_data": "t1"}, {"_data": "t0"}]
+
+
+def test_standalone_server_stops_the_watcher():
+    db = FakeDB([])
+    hub = RealtimeHub()
+    hub.start(db)
+    hub._watcher.join(5)
+    assert db.resume_tokens == [None]
+    assert not hub._watcher.is_alive()
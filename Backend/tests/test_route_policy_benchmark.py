@@ -0,0 +1,69 @@
+"""RoutePolicyTable against the prefix scan it replaced in InjectUserMiddleware
+
+The test checks that both agree on which paths need no user. Run the module
+directly for the per-lookup timings:
+
+    python tests/test_route_policy_benchmark.py [iterations]
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app import PUBLIC_PATHS, SAFE_PATHS, app
+from app.utils.route_policy import REQUIRED, compile_route_policies
+
+# Entries the old SAFE_PATHS held that now come from PUBLIC_PATHS and the app's mounts
+LEGACY_SAFE_PATHS = ["/docs", "/openapi.json", "/favicon.ico", "/health", "/uploads/", "/static/", "/public/"] + SAFE_PATHS
+STATIC_DIRS = ["/uploads/", "/static/", "/public/"]
+
+PATHS = [
+    "/uploads/Certificate/generated/FR001/certificate_64f1c2_CERT0001001.png",
+    "/static/js/main.8c2f1a.js",
+    "/video-serve/64f1c2a9e3/segment-0042.ts",
+    "/api/branch-students/students",
+    "/api/utility/states/names",
+    "/api/branches/branch/login",
+    "/api/notifications/user/64f1c2a9e3b7d5a1c0f4e210",
+    "/api/branch/certificates/64f1c2a9e3b7d5a1c0f4e210/download",
+    "/api/ledger/statistics/summary",
+    "/health",
+]
+
+
+def legacy_is_safe(path: str) -> bool:
+    """The scan InjectUserMiddleware ran on every request"""
+    return any(path.startswith(safe) for safe in LEGACY_SAFE_PATHS) or any(safe.rstrip('/') in path for safe in STATIC_DIRS)
+
+
+def policy_table():
+    return compile_route_policies(app, SAFE_PATHS, PUBLIC_PATHS)
+
+
+def test_table_agrees_with_the_prefix_scan():
+    table = policy_table()
+    for path in PATHS:
+        if path == "/api/ledger/statistics/summary":
+            # The old substring check mistook "/statistics" for the /static mount
+            assert legacy_is_safe(path) and table.policy_for(path) != REQUIRED
+            continue
+        assert legacy_is_safe(path) == (table.policy_for(path) != REQUIRED), path
+    assert table.policy_for("/api/reports/statistics") == REQUIRED
+
+
+def measure(iterations: int = 20000) -> dict:
+    """Microseconds per lookup, averaged over ``PATHS``"""
+    table = policy_table()
+    results = {}
+    for name, lookup in (("prefix scan", legacy_is_safe), ("RoutePolicyTable", table.policy_for)):
+        seconds = min(timeit.repeat(lambda: [lookup(path) for path in PATHS], number=iterations, repeat=5))
+        results[name] = seconds / (iterations * len(PATHS)) * 1e6
+    return results
+
+
+if __name__ == "__main__":
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    print(f"{len(LEGACY_SAFE_PATHS)} legacy prefixes, {len(policy_table())} compiled prefixes, {len(PATHS)} paths")
+    for name, micros in measure(iterations).items():
+        print(f"{name:>18}: {micros:6.2f} us/lookup")
@@ -0,0 +1,73 @@
+"""SharedFileCache across worker processes, and under a locked file"""
+import asyncio
+import multiprocessing
+import sqlite3
+
+from app.utils.cache import SharedFileCache
+
+
+def _worker(path, commands, results):
+    """A second API worker: runs cache calls sent over ``commands``"""
+    cache = SharedFileCache(path)
+    for name, args in iter(commands.get, None):
+        results.put(getattr(cache, name)(*args))
+
+
+class Worker:
+    def __init__(self, path):
+        context = multiprocessing.get_context("fork")
+        self.commands = context.Queue()
+        self.results = context.Queue()
+        self.process = context.Process(target=_worker, args=(path, self.commands, self.results), daemon=True)
+        self.process.start()
+
+    def call(self, name, *args):
+        self.commands.put((name, args))
+        return self.results.get(timeout=10)
+
+    def close(self):
+        self.commands.put(None)
+        self.process.join(10)
+
+
+def test_writes_and_invalidations_reach_other_workers(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = SharedFileCache(path)
+    other = Worker(path)
+    try:
+        cache.set("auth_user:u1:0", {"role": "student"})
+        assert other.call("get", "auth_user:u1:0") == {"role": "student"}
+
+        other.call("set", "auth_user:u1:1", {"role": "admin"})
+        assert cache.get("auth_user:u1:1") == {"role": "admin"}
+
+        other.call("delete", "auth_user:u1:0")
+        assert cache.get("auth_user:u1:0") is None
+
+        cache.set("auth_user:u2:0", {"role": "student"})
+        assert cache.delete_prefix("auth_user:u1:") == 1
+        assert other.call("get", "auth_user:u1:1") is None
+        assert other.call("get", "auth_user:u2:0") == {"role": "student"}
+    finally:
+        other.close()
+
+
+def test_locked_file_does_not_raise(tmp_path, monkeypatch):
+    path = str(tmp_path / "cache.db")
+    cache = SharedFileCache(path)
+    cache.set("k", 1)
+    monkeypatch.setattr(SharedFileCache, "BUSY_TIMEOUT_SECONDS", 0.05)
+    cache._local.conn = None  # reconnect with the short timeout
+
+    holder = sqlite3.connect(path, isolation_level=None)
+    holder.execute("BEGIN EXCLUSIVE")
+    try:
+        cache.set("k", 2)
+        cache.delete("k")
+        assert cache.delete_prefix("k") == 0
+        cache.clear()
+        asyncio.run(cache.adelete("k"))
+        assert asyncio.run(cache.aget("k")) == 1  # WAL readers are not blocked by the writer
+    finally:
+        holder.execute("ROLLBACK")
+        holder.close()
@@ -0,0 +1,63 @@
+"""The SMTP pool never sends credentials over a connection without STARTTLS"""
+import smtplib
+import socketserver
+import threading
+
+import pytest
+
+from app.services.email_outbox import SMTPPool
+
+
+class PlainSMTPHandler(socketserver.StreamRequestHandler):
+    """A server that offers AUTH but not STARTTLS, and records every command"""
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self.reply("220 plain ESMTP")
+        for raw in self.rfile:
+            command = raw.decode().strip()
+            self.server.commands.append(command)
+            verb = command.split(" ")[0].upper()
+            if verb == "EHLO":
+                self.reply("250-plain")
+                self.reply("250 AUTH PLAIN LOGIN")
+            elif verb == "AUTH":
+                self.reply("235 ok")
+            elif verb == "QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("250 ok")
+
+
+@pytest.fixture
+def server():
+    smtp = socketserver.ThreadingTCPServer(("127.0.0.1", 0), PlainSMTPHandler)
+    smtp.daemon_threads = True
+    smtp.commands = []
+    threading.Thread(target=smtp.serve_forever, daemon=True).start()
+    yield smtp
+    smtp.shutdown()
+    smtp.server_close()
+
+
+def pool(server, **options):
+    return SMTPPool("127.0.0.1", server.server_address[1], timeout=5, **options)
+
+
+def test_credentials_without_starttls_are_refused(server):
+    with pytest.raises(smtplib.SMTPNotSupportedError):
+        pool(server, username="mailer", password="secret").acquire()
+    assert not any(command.upper().startswith("AUTH") for command in server.commands)
+
+
+def test_plain_login_needs_explicit_opt_out(server):
+    connection = pool(server, username="mailer", password="secret", require_tls=False).acquire()
+    connection.quit()
+    assert any(command.upper().startswith("AUTH") for command in server.commands)
+
+
+def test_anonymous_relay_may_stay_plain(server):
+    pool(server).acquire().quit()
@@ -0,0 +1,83 @@
+"""The tenant directory resolves the same branch codes as the queries it replaced"""
+import pytest
+from bson import ObjectId
+
+from app.services.tenant_directory import TenantDirectory
+
+
+def matches(doc, query):
+    if "$or" in query:
+        return any(matches(doc, clause) for clause in query["$or"])
+    for field, value in query.items():
+        current = doc
+        for part in field.split("."):
+            current = (current or {}).get(part)
+        if current != value:
+            return False
+    return True
+
+
+class FakeCollection:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, query, projection=None):
+        return [doc for doc in self.docs if matches(doc, query)]
+
+    def find_one(self, query, projection=None):
+        return next(iter(self.find(query)), None)
+
+
+def directory(branches, franchise_codes=("FR001",), load=True):
+    db = {
+        "franchises": FakeCollection([{"_id": ObjectId(), "franchise_code": code} for code in franchise_codes]),
+        "branches": FakeCollection([{"_id": ObjectId(), **branch} for branch in branches])
+    }
+    tenants = TenantDirectory()
+    if load:
+        tenants.load(db)
+    return tenants, db
+
+
+@pytest.mark.parametrize("load", [True, False])
+def test_created_branch_keeps_franchise_code_scope_for_admin_tokens(load):
+    # Shape written by POST /api/branch/create
+    tenants, db = directory([{"franchise_code": "FR001", "centre_info": {"branch_code": "BR-7"}}], load=load)
+    assert tenants.admin_branch_code("FR001", "u1", db) == "FR001"
+    assert tenants.branch_code_for("FR001", db) == "BR-7"
+
+
+def test_admin_lookup_reads_top_level_fields_in_auth_order():
+    tenants, db = directory([{"franchise_code": "FR001", "branch_code": "B", "branchCode": "A", "code": "C"}])
+    assert tenants.admin_branch_code("FR001", None, db) == "A"
+
+
+def test_admin_lookup_takes_first_match_in_natural_order():
+    tenants, db = directory([
+        {"franchise_code": "FR009", "admin_id": "u1", "branch_code": "MINE"},
+        {"franchise_code": "FR001", "branch_code": "FRANCHISE"},
+    ], franchise_codes=("FR001", "FR009"))
+    assert tenants.admin_branch_code("FR001", "u1", db) == "MINE"
+    assert tenants.admin_branch_code("FR001", "u2", db) == "FRANCHISE"
+
+
+def test_admin_lookup_ignores_nested_franchise_codes():
+    tenants, db = directory([{"centre_info": {"franchise_code": "FR001", "branch_code": "NESTED"}}])
+    assert tenants.admin_branch_code("FR001", None, db) is None
+    assert tenants.branch_code_for("FR001", db) == "NESTED"
+
+
+def test_multi_tenant_lookup_tries_franchise_patterns_in_turn():
+    tenants, db = directory([
+        {"franchiseCode": "FR001", "branch_code": "LEGACY"},
+        {"centre_info": {"franchise_code": "FR001", "code": "CENTRE"}},
+        {"franchise_code": "FR001", "centre_info": {"branch_code": "TOP"}},
+    ])
+    assert tenants.branch_code_for("FR001", db) == "TOP"
+    assert [branch["branch_code"] for branch in tenants.branches_of("FR001", db)] == ["TOP", "CENTRE", "LEGACY"]
+
+
+def test_unknown_franchise_has_no_branch():
+    tenants, db = directory([])
+    assert tenants.admin_branch_code("FR001", "u1", db) is None
+    assert tenants.branch_code_for("FR001", db) is None
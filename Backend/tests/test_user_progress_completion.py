@@ -0,0 +1,261 @@
+"""Completion semantics of the atomic progress upsert
+
+``build_progress_update`` expresses the completion rules as an
+aggregation-pipeline update. These tests evaluate that pipeline against an
+in-memory collection (no MongoDB needed) and check the rules the old
+read-modify-write ``upsert_user_progress`` enforced:
+
+- auto-complete at >= 95%
+- a completion request below 95% is rejected and resets completion
+- ``completed=False`` resets completion
+- ``completed_at`` is set once and then preserved
+- ``max_position_reached`` never decreases
+- ``bulk_upsert_user_progress`` applies reports in order
+"""
+from datetime import datetime, timedelta
+import copy
+import random
+
+import pytest
+
+from app.models import user_progress
+from app.models.user_progress import (
+    COMPLETION_THRESHOLD,
+    build_progress_update,
+    bulk_upsert_user_progress,
+    upsert_user_progress
+)
+
+KEY = {"user_id": "u1", "course_id": "c1", "module_id": "m1", "content_id": "v1"}
+TOTAL = 100.0
+
+
+# ------------------- Pipeline evaluator -------------------
+
+MISSING = object()
+
+
+def evaluate(expr, doc):
+    """Evaluate the subset of aggregation expressions the progress pipeline uses"""
+    if isinstance(expr, str) and expr.startswith("$"):
+        return doc.get(expr[1:], MISSING)
+    if isinstance(expr, list):
+        return [evaluate(item, doc) for item in expr]
+    if isinstance(expr, dict) and len(expr) == 1 and next(iter(expr)).startswith("$"):
+        op, args = next(iter(expr.items()))
+        if op == "$literal":
+            return args
+        if op == "$ifNull":
+            value = evaluate(args[0], doc)
+            return evaluate(args[1], doc) if value is MISSING or value is None else value
+        if op == "$cond":
+            condition, if_true, if_false = args
+            return evaluate(if_true, doc) if evaluate(condition, doc) else evaluate(if_false, doc)
+        if op == "$eq":
+            left, right = (evaluate(arg, doc) for arg in args)
+            return left == right
+        if op == "$type":
+            return "missing" if evaluate(args, doc) is MISSING else type(evaluate(args, doc)).__name__
+        if op == "$max":
+            values = [value for value in evaluate(args, doc) if value is not MISSING and value is not None]
+            return max(values) if values else None
+        raise NotImplementedError(op)
+    return expr
+
+
+def apply_pipeline(doc, pipeline):
+    for stage in pipeline:
+        (name, fields), = stage.items()
+        assert name == "$set"
+        current = dict(doc)
+        for field, expr in fields.items():
+            doc[field] = evaluate(expr, current)
+    return doc
+
+
+class FakeProgressCollection:
+    """Just enough of a pymongo collection for the progress upserts"""
+
+    def __init__(self):
+        self.docs = []
+        self.writes = []
+
+    def create_indexes(self, indexes):
+        pass
+
+    def find_one(self, query):
+        return next((d for d in self.docs if all(d.get(k) == v for k, v in query.items())), None)
+
+    def _upsert(self, query, pipeline):
+        doc = self.find_one(query)
+        if doc is None:
+            doc = dict(query)
+            self.docs.append(doc)
+        apply_pipeline(doc, pipeline)
+        self.writes.append((query["content_id"], doc["last_position"]))
+        return doc
+
+    def find_one_and_update(self, query, pipeline, upsert=False, return_document=None):
+        assert upsert
+        return copy.deepcopy(self._upsert(query, pipeline))
+
+    def bulk_write(self, operations, ordered=True):
+        assert ordered
+        for operation in operations:
+            self._upsert(operation._filter, operation._doc)
+        return len(operations)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    collection = FakeProgressCollection()
+    monkeypatch.setattr(user_progress, "_indexes_ready", True)
+    return {"user_progress": collection}
+
+
+def report(db, watched, completed=None, total=TOTAL):
+    return upsert_user_progress(db, watched_duration=watched, total_duration=total, completed=completed, **KEY)
+
+
+# ------------------- Completion rules -------------------
+
+def test_new_progress_below_threshold_is_not_completed(db):
+    progress = report(db, 50)
+    assert progress["completed"] is False
+    assert progress["completed_at"] is None
+    assert progress["created_at"] == progress["updated_at"]
+
+
+@pytest.mark.parametrize("watched", [COMPLETION_THRESHOLD, 99, TOTAL])
+def test_auto_completes_at_threshold(db, watched):
+    report(db, 10)
+    progress = report(db, watched)
+    assert progress["completed"] is True
+    assert progress["completed_at"] == progress["updated_at"]
+
+
+def test_new_progress_past_threshold_is_completed(db):
+    progress = report(db, 96)
+    assert progress["completed"] is True
+    assert progress["completed_at"] is not None
+
+
+def test_early_completion_is_rejected_and_resets_completion(db):
+    report(db, 97)
+    progress = report(db, 40, completed=True)
+    assert progress["completed"] is False
+    assert progress["completed_at"] is None
+
+
+def test_early_completion_on_new_progress_is_rejected(db):
+    progress = report(db, 40, completed=True)
+    assert progress["completed"] is False
+    assert progress["completed_at"] is None
+
+
+def test_explicit_not_completed_resets_completion(db):
+    report(db, 100)
+    progress = report(db, 100, completed=False)
+    assert progress["completed"] is False
+    assert progress["completed_at"] is None
+
+
+def test_heartbeat_below_threshold_keeps_completion(db):
+    completed = report(db, 100)
+    progress = report(db, 30)
+    assert progress["completed"] is True
+    assert progress["completed_at"] == completed["completed_at"]
+
+
+def test_completed_at_is_set_once(db):
+    first = report(db, 96)
+    later = report(db, 100, completed=True)
+    again = report(db, 98)
+    assert first["completed_at"] is not None
+    assert later["completed_at"] == first["completed_at"]
+    assert again["completed_at"] == first["completed_at"]
+    assert again["updated_at"] >= first["completed_at"]
+
+
+def test_max_position_never_decreases(db):
+    positions = [10, 60, 20, 80, 5, 70]
+    reached = [report(db, position)["max_position_reached"] for position in positions]
+    assert reached == [10, 60, 60, 80, 80, 80]
+    assert report(db, 5)["last_position"] == 5
+
+
+def test_existing_fields_are_kept(db):
+    report(db, 10)
+    db["user_progress"].docs[0]["notes"] = "keep me"
+    progress = upsert_user_progress(db, watched_duration=20, total_duration=TOTAL,
+                                    **{**KEY, "module_id": "other"})
+    assert progress["notes"] == "keep me"
+    assert progress["module_id"] == "m1"
+
+
+# ------------------- Bulk writes -------------------
+
+def test_bulk_upsert_applies_reports_in_order(db):
+    updates = [
+        {**KEY, "watched_duration": 30, "total_duration": TOTAL},
+        {**KEY, "content_id": "v2", "watched_duration": 97, "total_duration": TOTAL},
+        {**KEY, "watched_duration": 96, "total_duration": TOTAL},
+        {**KEY, "watched_duration": 50, "total_duration": TOTAL, "completed": True},
+    ]
+    bulk_upsert_user_progress(db, updates)
+
+    collection = db["user_progress"]
+    assert collection.writes == [("v1", 30), ("v2", 97), ("v1", 96), ("v1", 50)]
+    v1 = collection.find_one({"content_id": "v1"})
+    v2 = collection.find_one({"content_id": "v2"})
+    # The rejected completion came last, so v1 ends up not completed
+    assert v1["completed"] is False and v1["completed_at"] is None
+    assert v1["max_position_reached"] == 96
+    assert v2["completed"] is True
+
+
+# ------------------- Equivalence with the read-modify-write rules -------------------
+
+def legacy_upsert(existing, watched, total, completed, now):
+    """The pre-pipeline upsert_user_progress rules, as plain Python"""
+    percentage = (watched / total) * 100 if total > 0 else 0.0
+    if percentage >= 95.0 and completed is None:
+        completed = True
+    if existing is None:
+        # New documents: completed iff created at or past the threshold, whatever was requested
+        done = percentage >= 95.0
+        return {"completed": done, "completed_at": now if done else None,
+                "max_position_reached": watched, "last_position": watched}
+    doc = dict(existing, last_position=watched,
+               max_position_reached=max(existing.get("max_position_reached", 0), watched))
+    if completed:
+        if percentage >= 95.0:
+            if not existing.get("completed"):
+                doc["completed_at"] = now
+            doc["completed"] = True
+        else:
+            doc["completed"], doc["completed_at"] = False, None
+    elif completed is not None:
+        doc["completed"], doc["completed_at"] = False, None
+    return doc
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_matches_legacy_rules_on_random_sequences(seed):
+    rng = random.Random(seed)
+    collection = FakeProgressCollection()
+    expected = None
+    start = datetime(2024, 1, 1)
+    for step in range(30):
+        now = start + timedelta(seconds=step)
+        watched = rng.choice([0, 10, 50, 94, 94.9, 95, 97, 100]) + rng.random() * rng.choice([0, 1])
+        completed = rng.choice([None, None, True, False])
+        total = rng.choice([TOTAL, TOTAL, 0.0])
+
+        query, pipeline = build_progress_update(watched_duration=watched, total_duration=total,
+                                                completed=completed, now=now, **KEY)
+        actual = collection._upsert(query, pipeline)
+        expected = legacy_upsert(expected, watched, total, completed, now)
+
+        for field in ("completed", "completed_at", "max_position_reached", "last_position"):
+            assert actual[field] == expected[field], (step, field, watched, completed, total)